@@ -1,11 +1,29 @@
 import streamlit as st
+import io
+import os
+import re
+import json
 import time
 import threading
-from queue import Queue, Empty
-from datetime import datetime, timedelta
-from collections import defaultdict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import logging
-from AI.api_load import load_models
+from AI.api_load import load_models, get_model_api_key
+from AI.document_session import DocumentSession, get_document_sessions, SESSIONS_ENABLED
+from AI.prompt_cache import get_prompt_prefix_cache
+from AI.page_selection import select_pages, describe_selection
+from AI.response_cache import get_response_cache, hash_pdf_files, hash_text
+from AI.schemas import get_schema, parse_structured, build_result
+from AI.streaming import ResponseStream, MalformedStreamError, STREAMING_ENABLED
+from AI.rate_limit_backends import get_default_backend
+from AI.resilience import get_resilient_caller, CircuitOpenError
+from AI.telemetry import get_telemetry, OUTCOME_OK, OUTCOME_CACHE_HIT, OUTCOME_RATE_LIMITED, OUTCOME_ERROR
+from AI.model_executor import (
+    get_model_executor,
+    DEFAULT_REQUEST_TIMEOUT,
+    ExecutorSaturatedError,
+    ModelCallTimeoutError
+)
 
 logger = logging.getLogger(__name__)
 
@@ -13,6 +31,10 @@ class TimeoutException(Exception):
     pass
 
 
+class AnalysisError(Exception):
+    """A análise do documento falhou; a mensagem é exibida ao usuário."""
+
+
 class RateLimiter:
     """
     Rate limiter baseado nos limites reais da API Gemini.
@@ -20,26 +42,35 @@ class RateLimiter:
     Limites oficiais:
     - Gemini 2.5 Flash: 10 RPM / 250 RPD / 250.000 TPM
     - Gemini 2.5 Pro: 5 RPM / 100 RPD / 125.000 TPM
+
+    Os contadores ficam em um backend plugável (AI.rate_limit_backends),
+    escolhido por SEGSIS_RATE_LIMIT_BACKEND: memória (padrão, por processo),
+    SQLite (processos do mesmo host) ou Postgres (todas as réplicas).
     """
 
-    def __init__(self, rpm_limit=10, rpd_limit=250, name="default"):
+    def __init__(self, rpm_limit=10, rpd_limit=250, name="default", backend=None):
         """
         Args:
             rpm_limit: Requests per minute (requisições por minuto)
             rpd_limit: Requests per day (requisições por dia)
-            name: Nome do limitador (para logging)
+            name: Nome do limitador (para logging e chave no backend)
+            backend: Backend de contadores; None usa o backend padrão do processo
         """
         self.rpm_limit = rpm_limit
         self.rpd_limit = rpd_limit
         self.name = name
-
-        # Armazena timestamps de chamadas por usuário
-        self.minute_calls = defaultdict(list)
-        self.day_calls = defaultdict(list)
+        self._backend = backend
 
         self.lock = threading.Lock()
         self.unlimited_users = set()
 
+    @property
+    def backend(self):
+        # Resolvido no primeiro uso: os limitadores são criados na importação
+        if self._backend is None:
+            self._backend = get_default_backend()
+        return self._backend
+
     def add_unlimited_user(self, user_id):
         """Adiciona um usuário à lista de acesso ilimitado (admins)."""
         with self.lock:
@@ -51,75 +82,72 @@ class RateLimiter:
         with self.lock:
             self.unlimited_users.discard(user_id)
 
-    def is_allowed(self, user_id, user_role=None):
-        """
-        Verifica se o usuário pode fazer uma chamada à API.
+    def _usage(self, user_id):
+        """(espera em segundos, chamadas no minuto, chamadas no dia)."""
+        try:
+            return self.backend.usage(self.name, str(user_id), self.rpm_limit, self.rpd_limit)
+        except Exception as e:
+            logger.error(f"Falha ao consultar o backend de rate limit ({self.name}): {e}")
+            return 0.0, 0, 0
 
-        Args:
-            user_id: Identificador do usuário
-            user_role: Role do usuário ('admin', 'editor', 'viewer')
+    def try_acquire(self, user_id, user_role=None):
+        """
+        Verifica e, se permitido, registra uma chamada em uma única operação atômica.
 
         Returns:
-            bool: True se permitido, False caso contrário
+            tuple: (permitido, segundos de espera até a próxima vaga, restantes)
+                   onde restantes é {'per_minute': int, 'per_day': int} ou 'ilimitado'.
         """
-        # ✅ Super admin tem acesso ilimitado
-        if user_role == 'admin':
-            return True
+        if user_role == 'admin' or user_id in self.unlimited_users:
+            return True, 0.0, 'ilimitado'
 
-        # ✅ Verifica lista de usuários ilimitados
-        if user_id in self.unlimited_users:
-            return True
+        try:
+            allowed, wait, minute_count, day_count = self.backend.try_acquire(
+                self.name, str(user_id), self.rpm_limit, self.rpd_limit
+            )
+        except Exception as e:
+            # Backend compartilhado indisponível: não bloqueia o usuário por isso
+            logger.error(f"Falha no backend de rate limit ({self.name}), chamada liberada: {e}")
+            return True, 0.0, {'per_minute': self.rpm_limit, 'per_day': self.rpd_limit}
 
-        with self.lock:
-            now = datetime.now()
-
-            # ✅ Limpa chamadas antigas (minuto)
-            one_minute_ago = now - timedelta(minutes=1)
-            self.minute_calls[user_id] = [
-                call_time for call_time in self.minute_calls[user_id]
-                if call_time > one_minute_ago
-            ]
-
-            # ✅ Limpa chamadas antigas (dia)
-            one_day_ago = now - timedelta(days=1)
-            self.day_calls[user_id] = [
-                call_time for call_time in self.day_calls[user_id]
-                if call_time > one_day_ago
-            ]
-
-            # ✅ Verifica limite por minuto
-            if len(self.minute_calls[user_id]) >= self.rpm_limit:
+        if not allowed:
+            if minute_count >= self.rpm_limit:
                 logger.warning(
                     f"Usuário {user_id} atingiu limite RPM ({self.rpm_limit}) "
                     f"no limitador {self.name}"
                 )
-                return False
-
-            # ✅ Verifica limite por dia
-            if len(self.day_calls[user_id]) >= self.rpd_limit:
+            else:
                 logger.warning(
                     f"Usuário {user_id} atingiu limite RPD ({self.rpd_limit}) "
                     f"no limitador {self.name}"
                 )
-                return False
 
-            # ✅ Registra a chamada
-            self.minute_calls[user_id].append(now)
-            self.day_calls[user_id].append(now)
+        remaining = {
+            'per_minute': max(0, self.rpm_limit - minute_count),
+            'per_day': max(0, self.rpd_limit - day_count)
+        }
+        return allowed, wait, remaining
 
-            return True
+    def is_allowed(self, user_id, user_role=None):
+        """
+        Verifica se o usuário pode fazer uma chamada à API.
 
-    def get_wait_time_minutes(self, user_id):
-        """Calcula tempo de espera em segundos até próxima chamada permitida (limite de minuto)."""
-        with self.lock:
-            if not self.minute_calls[user_id]:
-                return 0
+        Args:
+            user_id: Identificador do usuário
+            user_role: Role do usuário ('admin', 'editor', 'viewer')
 
-            oldest_call = min(self.minute_calls[user_id])
-            elapsed = (datetime.now() - oldest_call).total_seconds()
-            wait_time = max(0, 60 - elapsed)
+        Returns:
+            bool: True se permitido, False caso contrário
+        """
+        allowed, _, _ = self.try_acquire(user_id, user_role)
+        return allowed
 
-            return int(wait_time)
+    def get_wait_time_minutes(self, user_id):
+        """Calcula tempo de espera em segundos até próxima chamada permitida (limite de minuto)."""
+        wait, minute_count, _ = self._usage(user_id)
+        if minute_count < self.rpm_limit:
+            return 0
+        return int(wait)
 
     def get_remaining_calls(self, user_id, user_role=None):
         """
@@ -131,36 +159,21 @@ class RateLimiter:
         if user_role == 'admin' or user_id in self.unlimited_users:
             return 'ilimitado'
 
-        with self.lock:
-            now = datetime.now()
-
-            # Limpa listas
-            one_minute_ago = now - timedelta(minutes=1)
-            self.minute_calls[user_id] = [
-                call_time for call_time in self.minute_calls[user_id]
-                if call_time > one_minute_ago
-            ]
-
-            one_day_ago = now - timedelta(days=1)
-            self.day_calls[user_id] = [
-                call_time for call_time in self.day_calls[user_id]
-                if call_time > one_day_ago
-            ]
-
-            return {
-                'per_minute': self.rpm_limit - len(self.minute_calls[user_id]),
-                'per_day': self.rpd_limit - len(self.day_calls[user_id])
-            }
+        _, minute_count, day_count = self._usage(user_id)
+        return {
+            'per_minute': max(0, self.rpm_limit - minute_count),
+            'per_day': max(0, self.rpd_limit - day_count)
+        }
 
     def get_usage_stats(self, user_id):
         """Retorna estatísticas de uso do usuário."""
-        with self.lock:
-            return {
-                'calls_last_minute': len(self.minute_calls[user_id]),
-                'calls_today': len(self.day_calls[user_id]),
-                'rpm_limit': self.rpm_limit,
-                'rpd_limit': self.rpd_limit
-            }
+        _, minute_count, day_count = self._usage(user_id)
+        return {
+            'calls_last_minute': minute_count,
+            'calls_today': day_count,
+            'rpm_limit': self.rpm_limit,
+            'rpd_limit': self.rpd_limit
+        }
 
 
 class PDFQA:
@@ -174,6 +187,10 @@ class PDFQA:
         'premium_ia': RateLimiter(rpm_limit=5, rpd_limit=100, name="Pro-Premium")
     }
 
+    # Usuário das chamadas feitas por threads de processamento em segundo plano
+    _thread_context = threading.local()
+    _attempts_lock = threading.Lock()
+
     def __init__(self):
         """
         Inicializa a classe carregando os dois modelos de IA (extração e auditoria)
@@ -181,60 +198,475 @@ class PDFQA:
         """
         self.extraction_model, self.audit_model = load_models()
 
-    def answer_question(self, pdf_files, question, task_type='extraction'):
+    def answer_question(self, pdf_files, question, task_type='extraction', use_cache=True,
+                        prompt_prefix=None, prefix_label=None, page_profile=None, response_schema=None,
+                        progress_callback=None):
         """
         Função principal para responder a uma pergunta, selecionando o modelo apropriado.
 
+        Respostas ficam em cache pelo conteúdo dos PDFs, texto do prompt, modelo
+        e tipo de tarefa; acertos no cache não contam para o rate limit.
+        Cada chamada é registrada na telemetria (AI.telemetry).
+
         Args:
             pdf_files (list): Lista de caminhos ou objetos de arquivo PDF.
             question (str): A pergunta ou prompt.
             task_type (str): 'extraction' para tarefas simples (padrão), 'audit' para tarefas complexas.
+            use_cache (bool): Consulta e alimenta o cache de respostas.
+            prompt_prefix (str): Parte estável do prompt, registrada como contexto em
+                cache do modelo; sem cache de contexto, é enviada antes da pergunta.
+            prefix_label (str): Identifica o prefixo (um contexto ativo por rótulo).
+            page_profile (str): Perfil de AI.page_selection; PDFs longos são reduzidos
+                às páginas relevantes para a tarefa.
+            response_schema (dict): Esquema de AI.schemas; a resposta vem em modo JSON
+                restrito ao esquema (ver answer_structured).
+            progress_callback (callable): Chamado com (fração ou None, mensagem) conforme
+                os campos chegam; a resposta é recebida em streaming. Padrão: o callback
+                definido por progress_context na thread atual.
 
         Returns:
             tuple: (response_text, duration) ou (None, 0) em caso de erro.
         """
         start_time = time.time()
+        self._thread_context.last_error = None
 
         # ✅ Obter informações do usuário
         user_email, user_role, user_plan = self._get_user_info()
 
         # ✅ Determinar qual modelo usar
-        if task_type == 'audit':
-            model_to_use = self.audit_model
-            model_name = "Gemini 2.5 Pro"
-            if not model_to_use:
-                st.error("O modelo de AUDITORIA não está disponível. Verifique sua chave 'GEMINI_AUDIT_KEY' nos secrets.")
-                return None, 0
-        else:
-            model_to_use = self.extraction_model
-            model_name = "Gemini 2.5 Flash"
-            if not model_to_use:
-                st.error("O modelo de EXTRAÇÃO não está disponível. Verifique sua chave 'GEMINI_EXTRACTION_KEY' nos secrets.")
-                return None, 0
+        model_to_use, model_name = self._select_model(task_type)
+        if not model_to_use:
+            if task_type == 'audit':
+                self._report_error("O modelo de AUDITORIA não está disponível. Verifique sua chave 'GEMINI_AUDIT_KEY' nos secrets.")
+            else:
+                self._report_error("O modelo de EXTRAÇÃO não está disponível. Verifique sua chave 'GEMINI_EXTRACTION_KEY' nos secrets.")
+            return None, 0
+
+        # Versão do prompt: hash do texto estável, antes das notas de seleção de páginas
+        prompt_version = hash_text(prompt_prefix or question)[:10]
+        telemetry_model = getattr(model_to_use, 'model_name', model_name)
+
+        if page_profile:
+            pdf_files, question = self._apply_page_selection(pdf_files, question, page_profile)
+
+        full_question = f"{prompt_prefix}\n\n{question}" if prompt_prefix else question
+
+        generation_config, cache_task = None, task_type
+        if response_schema:
+            generation_config = {"response_mime_type": "application/json", "response_schema": response_schema}
+            cache_task = f"{task_type}:schema-{hash_text(json.dumps(response_schema, sort_keys=True))[:12]}"
+
+        progress_callback = progress_callback or getattr(self._thread_context, 'progress_callback', None)
+
+        # ✅ Cache de respostas (antes do rate limit: acertos não consomem cota)
+        cache_key, cached_answer = self._lookup_cache(model_to_use, model_name, pdf_files, full_question, cache_task, use_cache)
+        if cached_answer is not None:
+            logger.info(f"Cache hit - User: {user_email}, Model: {model_name}, Task: {task_type}")
+            if progress_callback:
+                progress_callback(1.0, "Resposta obtida do cache")
+            self._record_call(telemetry_model, task_type, OUTCOME_CACHE_HIT, start_time,
+                              prompt_version=prompt_version, request_key=cache_key, user_email=user_email)
+            return cached_answer, time.time() - start_time
 
         # ✅ Rate limiting com exceção para admin
         if not self._check_rate_limit(user_email, user_role, user_plan, task_type):
+            self._record_call(telemetry_model, task_type, OUTCOME_RATE_LIMITED, start_time,
+                              prompt_version=prompt_version, request_key=cache_key, user_email=user_email)
             return None, 0
 
+        # Contexto das linhas de telemetria de cada requisição ao modelo
+        call_info = {'model': telemetry_model, 'task_type': task_type, 'prompt_version': prompt_version,
+                     'request_key': cache_key, 'user_email': user_email, 'unit_id': self._get_unit_id(),
+                     'attempts': 0}
+
+        # Novas tentativas e reservas do hedge também consomem a cota do plano
+        def reserve():
+            return self._reserve_extra_call(user_email, user_role, user_plan)
+
         try:
-            answer = self._generate_response(model_to_use, pdf_files, question)
+            request_model, request_question = model_to_use, full_question
+            if prompt_prefix:
+                cached_model = get_prompt_prefix_cache().get_model(
+                    get_model_api_key(model_to_use), model_to_use.model_name, prompt_prefix,
+                    label=prefix_label or task_type
+                )
+                if cached_model is not None:
+                    request_model, request_question = cached_model, question
+
+            stream = None
+            if progress_callback and STREAMING_ENABLED:
+                stream = ResponseStream(progress_callback, response_schema)
+            try:
+                answer = self._generate_response(request_model, pdf_files, request_question,
+                                                 generation_config=generation_config,
+                                                 stream=stream, call_info=call_info, reserve=reserve)
+            except MalformedStreamError as e:
+                # Stream abortado cedo: uma tentativa completa, sem streaming
+                logger.warning(f"Resposta em streaming malformada ({e}); repetindo sem streaming")
+                stream = None
+                answer = None
+                if reserve():
+                    answer = self._generate_response(request_model, pdf_files, request_question,
+                                                     generation_config=generation_config, call_info=call_info,
+                                                     reserve=reserve)
+                else:
+                    self._report_error("⏳ Limite de análises do plano atingido ao repetir a resposta. "
+                                       "Aguarde alguns instantes e tente novamente.")
+            self._record_call(telemetry_model, task_type, OUTCOME_OK if answer is not None else OUTCOME_ERROR,
+                              start_time, prompt_version=prompt_version, request_key=cache_key,
+                              user_email=user_email, streamed=stream is not None)
             if answer is not None:
+                self._store_cache(cache_key, answer, model_to_use, model_name, cache_task)
                 logger.info(
                     f"API call successful - User: {user_email}, "
                     f"Model: {model_name}, Duration: {time.time() - start_time:.2f}s"
                 )
                 return answer, time.time() - start_time
             else:
-                st.warning("Não foi possível obter uma resposta do modelo.")
+                if not getattr(self._thread_context, 'last_error', None):
+                    self._report_error("Não foi possível obter uma resposta do modelo.", level='warning')
                 return None, 0
         except Exception as e:
-            st.error(f"Erro inesperado ao processar a pergunta para a tarefa '{task_type}': {e}")
+            self._record_call(telemetry_model, task_type, OUTCOME_ERROR, start_time,
+                              prompt_version=prompt_version, request_key=cache_key, user_email=user_email)
+            self._report_error(f"Erro inesperado ao processar a pergunta para a tarefa '{task_type}': {e}")
             st.exception(e)
             return None, 0
 
+    def answer_structured(self, pdf_files, task, question, task_type='extraction', max_retries=1, **kwargs):
+        """
+        Pergunta em modo estruturado e devolve o resultado tipado da tarefa.
+
+        A resposta é restrita ao esquema registrado em AI.schemas e validada de
+        forma estrita; campos obrigatórios ausentes ou inválidos são pedidos de
+        novo isoladamente (até max_retries vezes), com um esquema só com eles.
 
-    def _get_user_info(self):
-        """Obtém informações do usuário para rate limiting."""
+        Args:
+            pdf_files (list): Lista de caminhos ou objetos de arquivo PDF.
+            task (str): Tarefa registrada em AI.schemas ('aso', 'treinamento', 'epi', ...).
+            question (str): O prompt da tarefa.
+            task_type (str): 'extraction' ou 'audit'.
+            max_retries (int): Novas tentativas para os campos que falharam.
+            **kwargs: Repassados a answer_question (prompt_prefix, page_profile...).
+
+        Returns:
+            tuple: (resultado tipado ou None, campos que continuaram inválidos)
+        """
+        answer, _ = self.answer_question(pdf_files, question, task_type, response_schema=get_schema(task), **kwargs)
+        if answer is None:
+            return None, []
+
+        data, failed = parse_structured(task, answer)
+        attempts = 0
+        while failed and attempts < max_retries and isinstance(data, dict):
+            attempts += 1
+            logger.info(f"Resposta estruturada '{task}' com campos inválidos {failed}; pedindo só esses campos")
+            retry_question = (
+                f"{question}\n\nResponda apenas os campos {', '.join(failed)}, "
+                f"seguindo exatamente o formato descrito acima."
+            )
+            retry_answer, _ = self.answer_question(
+                pdf_files, retry_question, task_type, response_schema=get_schema(task, only_fields=failed), **kwargs
+            )
+            if retry_answer is None:
+                break
+            retry_data, still_failed = parse_structured(task, retry_answer, only_fields=failed)
+            if retry_data is None:
+                continue
+            data.update({name: value for name, value in retry_data.items() if name not in still_failed})
+            failed = still_failed
+
+        if data is None:
+            logger.warning(f"Resposta estruturada '{task}' inválida: {answer[:200]}")
+            return None, failed
+        if failed:
+            logger.warning(f"Resposta estruturada '{task}' com campos inválidos após novas tentativas: {failed}")
+        return build_result(task, data), failed
+
+    def answer_questions_batch(self, items, task_type='extraction', use_cache=True, response_schema=None,
+                               max_parallel=None, max_wait_seconds=600, progress_callback=None):
+        """
+        Responde várias perguntas sobre PDFs respeitando os limites do plano.
+
+        Em vez de recusar quando o limite por minuto é atingido, cada item
+        aguarda a próxima janela do plano (até max_wait_seconds no total);
+        os admitidos são executados em paralelo até o limite de concorrência
+        do executor. Acertos no cache não consomem cota. Os erros ficam no
+        resultado de cada item, sem interromper os demais.
+
+        Args:
+            items (list): Lista de tuplas (pdf_files, question).
+            task_type (str): 'extraction' ou 'audit', aplicado a todos os itens.
+            use_cache (bool): Consulta e alimenta o cache de respostas.
+            response_schema (dict): Esquema de AI.schemas aplicado a todos os itens.
+            max_parallel (int): Chamadas simultâneas (padrão: limite do executor).
+            max_wait_seconds (int): Espera máxima total pela janela do plano.
+            progress_callback (callable): Chamado com (concluídos, total), na thread
+                que chamou o lote.
+
+        Returns:
+            list: Um dict por item, na mesma ordem: {'answer', 'duration', 'error'}.
+        """
+        results = [{'answer': None, 'duration': 0, 'error': None} for _ in items]
+        if not items:
+            return results
+
+        user = self._get_user_info()
+        user_email, user_role, user_plan = user
+        unit_id = self._get_unit_id()
+
+        model_to_use, model_name = self._select_model(task_type)
+        if not model_to_use:
+            for result in results:
+                result['error'] = f"Modelo indisponível para a tarefa '{task_type}'"
+            return results
+
+        rate_limiter = None
+        if user_role != 'admin':
+            rate_limiter = self._rate_limiters.get(user_plan)
+            if not rate_limiter:
+                for result in results:
+                    result['error'] = "Usuário sem plano ativo para análise com IA"
+                return results
+
+        generation_config, cache_task = None, task_type
+        if response_schema:
+            generation_config = {"response_mime_type": "application/json", "response_schema": response_schema}
+            cache_task = f"{task_type}:schema-{hash_text(json.dumps(response_schema, sort_keys=True))[:12]}"
+        telemetry_model = getattr(model_to_use, 'model_name', model_name)
+
+        finished_here = [0]
+        futures = []
+
+        def report_progress():
+            # Sempre na thread que chamou o lote (ex.: st.progress do script)
+            if progress_callback:
+                progress_callback(finished_here[0] + sum(1 for future in futures if future.done()), len(items))
+
+        def finish(index, answer=None, duration=0, error=None):
+            results[index].update(answer=answer, duration=duration, error=error)
+
+        def reserve():
+            return self._reserve_extra_call(user_email, user_role, user_plan)
+
+        def run_item(index, pdf_files, question, cache_key):
+            start_time = time.time()
+            prompt_version = hash_text(question)[:10]
+            call_info = {'model': telemetry_model, 'task_type': task_type, 'prompt_version': prompt_version,
+                         'request_key': cache_key, 'user_email': user_email, 'unit_id': unit_id,
+                         'attempts': 0}
+            try:
+                with self.user_context(user_email, user_role, user_plan, unit_id=unit_id):
+                    self.pop_last_error()
+                    answer = self._generate_response(model_to_use, pdf_files, question,
+                                                     generation_config=generation_config,
+                                                     call_info=call_info, reserve=reserve)
+                    error = None if answer is not None else (
+                        self.pop_last_error() or "Não foi possível obter uma resposta do modelo."
+                    )
+            except Exception as e:
+                logger.warning(f"Item {index} do lote falhou: {e}")
+                answer, error = None, str(e) or type(e).__name__
+            self._record_call(telemetry_model, task_type, OUTCOME_OK if answer is not None else OUTCOME_ERROR,
+                              start_time, prompt_version=prompt_version, request_key=cache_key,
+                              user_email=user_email, unit_id=unit_id)
+            if answer is not None:
+                self._store_cache(cache_key, answer, model_to_use, model_name, cache_task)
+            finish(index, answer, time.time() - start_time, error)
+
+        max_parallel = max_parallel or get_model_executor().model_concurrency
+        deadline = time.time() + max_wait_seconds
+
+        with ThreadPoolExecutor(max_workers=max_parallel, thread_name_prefix="pdfqa-batch") as pool:
+            for index, (pdf_files, question) in enumerate(items):
+                cache_key, cached_answer = self._lookup_cache(
+                    model_to_use, model_name, pdf_files, question, cache_task, use_cache
+                )
+                if cached_answer is not None:
+                    self._record_call(telemetry_model, task_type, OUTCOME_CACHE_HIT, time.time(),
+                                      prompt_version=hash_text(question)[:10], request_key=cache_key,
+                                      user_email=user_email, unit_id=unit_id)
+                    finish(index, cached_answer)
+                    finished_here[0] += 1
+                    report_progress()
+                    continue
+
+                # ✅ Aguarda a janela do plano em vez de recusar
+                error = None
+                while rate_limiter is not None:
+                    allowed, wait_seconds, remaining = rate_limiter.try_acquire(user_email, user_role)
+                    if allowed:
+                        break
+                    if isinstance(remaining, dict) and remaining['per_day'] <= 0:
+                        error = "Limite diário de análises do plano atingido"
+                        break
+                    wait_seconds = max(1.0, wait_seconds)
+                    if time.time() + wait_seconds > deadline:
+                        error = "Limite de análises do plano atingido; tempo de espera do lote esgotado"
+                        break
+                    logger.info(f"Lote de {user_email} aguardando {wait_seconds:.0f}s pela janela do plano")
+                    time.sleep(wait_seconds)
+
+                if error:
+                    self._record_call(telemetry_model, task_type, OUTCOME_RATE_LIMITED, time.time(),
+                                      prompt_version=hash_text(question)[:10], request_key=cache_key,
+                                      user_email=user_email, unit_id=unit_id)
+                    finish(index, error=error)
+                    finished_here[0] += 1
+                    report_progress()
+                    continue
+
+                futures.append(pool.submit(run_item, index, pdf_files, question, cache_key))
+                report_progress()
+
+            for _ in as_completed(futures):
+                report_progress()
+
+        logger.info(
+            f"Lote concluído - User: {user_email}, Itens: {len(items)}, "
+            f"Erros: {sum(1 for result in results if result['error'])}"
+        )
+        return results
+
+    def _select_model(self, task_type):
+        """Retorna (modelo, nome de exibição) para o tipo de tarefa."""
+        if task_type == 'audit':
+            return self.audit_model, "Gemini 2.5 Pro"
+        return self.extraction_model, "Gemini 2.5 Flash"
+
+    def _lookup_cache(self, model, model_name, pdf_files, question, task_type, use_cache):
+        """Retorna (chave, resposta em cache ou None); chave None se o cache estiver desativado."""
+        if not use_cache:
+            return None, None
+        try:
+            cache = get_response_cache()
+            cache_key = cache.make_key(
+                hash_pdf_files(pdf_files), question, getattr(model, 'model_name', model_name), task_type
+            )
+            return cache_key, cache.get(cache_key)
+        except Exception as e:
+            logger.warning(f"Cache de respostas indisponível: {e}")
+            return None, None
+
+    def _store_cache(self, cache_key, answer, model, model_name, task_type):
+        if cache_key and answer is not None:
+            get_response_cache().set(
+                cache_key, answer, model_name=getattr(model, 'model_name', model_name), task_type=task_type
+            )
+
+    def _record_call(self, model, task_type, outcome, start_time, prompt_version=None,
+                     request_key=None, user_email=None, unit_id=None, streamed=False):
+        """
+        Registra o pedido na telemetria (resultado e latência ponta a ponta; os
+        tokens ficam nas linhas de cada requisição). Falhas aqui nunca afetam a análise.
+        """
+        try:
+            get_telemetry().record(
+                model=model, task_type=task_type, outcome=outcome,
+                latency_seconds=time.time() - start_time if outcome in (OUTCOME_OK, OUTCOME_ERROR) else 0.0,
+                prompt_version=prompt_version, request_key=request_key,
+                unit_id=unit_id or self._get_unit_id(), user_email=user_email, streamed=streamed
+            )
+        except Exception as e:
+            logger.debug(f"Falha ao registrar telemetria: {e}")
+
+    @classmethod
+    def _next_attempt(cls, call_info) -> int:
+        """Número sequencial da requisição dentro do pedido (também entre threads do hedge)."""
+        with cls._attempts_lock:
+            call_info['attempts'] = call_info.get('attempts', 0) + 1
+            return call_info['attempts']
+
+    @staticmethod
+    def _record_attempt(call_info, attempt, usage, start_time, outcome, hedge=False, streamed=False):
+        """Registra uma requisição enviada ao modelo, com os tokens que ela consumiu."""
+        if call_info is None:
+            return
+        try:
+            get_telemetry().record(
+                model=call_info.get('model'), task_type=call_info.get('task_type'), outcome=outcome,
+                latency_seconds=time.time() - start_time,
+                input_tokens=usage.get('input_tokens', 0),
+                output_tokens=usage.get('output_tokens', 0),
+                cached_tokens=usage.get('cached_tokens', 0),
+                bytes_sent=usage.get('bytes_sent', 0),
+                prompt_version=call_info.get('prompt_version'), request_key=call_info.get('request_key'),
+                unit_id=call_info.get('unit_id'), user_email=call_info.get('user_email'),
+                streamed=streamed, attempt=attempt, hedge=hedge
+            )
+        except Exception as e:
+            logger.debug(f"Falha ao registrar telemetria: {e}")
+
+    @classmethod
+    @contextmanager
+    def user_context(cls, user_email, user_role, user_plan, unit_id=None):
+        """
+        Define o usuário (e a unidade) das chamadas feitas pela thread atual.
+
+        Usado pelos workers em segundo plano, que não têm acesso ao
+        st.session_state da sessão que enviou o trabalho.
+        """
+        previous = getattr(cls._thread_context, 'user', None), getattr(cls._thread_context, 'unit_id', None)
+        cls._thread_context.user = (user_email, user_role, user_plan)
+        cls._thread_context.unit_id = unit_id
+        try:
+            yield
+        finally:
+            cls._thread_context.user, cls._thread_context.unit_id = previous
+
+    @classmethod
+    def _get_unit_id(cls):
+        """Unidade das chamadas: o contexto da thread ou o st.session_state."""
+        unit_id = getattr(cls._thread_context, 'unit_id', None)
+        if unit_id:
+            return unit_id
+        try:
+            return st.session_state.get('unit_id')
+        except Exception:
+            return None
+
+    @classmethod
+    @contextmanager
+    def progress_context(cls, progress_callback):
+        """
+        Define o callback de progresso das chamadas feitas pela thread atual.
+
+        Com um callback ativo as respostas são recebidas em streaming, e o
+        callback recebe (fração ou None, mensagem) a cada campo completado.
+        Ele é chamado na thread do executor de modelos.
+        """
+        previous = getattr(cls._thread_context, 'progress_callback', None)
+        cls._thread_context.progress_callback = progress_callback
+        try:
+            yield
+        finally:
+            cls._thread_context.progress_callback = previous
+
+    @classmethod
+    def _report_error(cls, message: str, level: str = 'error'):
+        """
+        Exibe o erro na sessão e o guarda para a thread atual: em trabalhos
+        em segundo plano não há tela, e a fila grava o motivo no trabalho.
+        """
+        cls._thread_context.last_error = re.sub(r'\s+', ' ', message.replace('**', '')).strip()
+        getattr(st, level)(message)
+
+    @classmethod
+    def pop_last_error(cls) -> str | None:
+        """Último erro registrado pela thread atual (e o descarta)."""
+        message = getattr(cls._thread_context, 'last_error', None)
+        cls._thread_context.last_error = None
+        return message
+
+    @classmethod
+    def get_current_user(cls):
+        """
+        Retorna (email, role, plano) do usuário atual: o contexto da thread,
+        se definido, ou o st.session_state da sessão Streamlit.
+        """
+        thread_user = getattr(cls._thread_context, 'user', None)
+        if thread_user:
+            return thread_user
         try:
             if hasattr(st, 'session_state'):
                 user_info = st.session_state.get('user_info', {})
@@ -252,6 +684,10 @@ class PDFQA:
         except:
             return 'anonymous', 'viewer', None
 
+    def _get_user_info(self):
+        """Obtém informações do usuário para rate limiting."""
+        return self.get_current_user()
+
     def _check_rate_limit(self, user_email, user_role, user_plan, task_type):
         """
         Verifica rate limit baseado no plano do usuário.
@@ -279,7 +715,7 @@ class PDFQA:
         # ✅ Usuário sem plano não pode usar IA
         if not user_plan:
             logger.warning(f"User {user_email} has no plan - access denied")
-            st.error("""
+            self._report_error("""
             ❌ **Acesso à IA Não Disponível**
 
             Você não possui um plano ativo para usar análise com IA.
@@ -295,15 +731,20 @@ class PDFQA:
 
         if not rate_limiter:
             logger.error(f"Invalid plan '{user_plan}' for user {user_email}")
-            st.error(f"❌ Plano '{user_plan}' não configurado corretamente.")
+            self._report_error(f"❌ Plano '{user_plan}' não configurado corretamente.")
             return False
 
-        # ✅ Verifica se está permitido
-        if not rate_limiter.is_allowed(user_email, user_role):
-            # Obtém informações sobre os limites
-            remaining = rate_limiter.get_remaining_calls(user_email, user_role)
-            wait_time = rate_limiter.get_wait_time_minutes(user_email)
-            stats = rate_limiter.get_usage_stats(user_email)
+        # ✅ Verifica e reserva a chamada em uma única operação
+        allowed, wait_seconds, remaining = rate_limiter.try_acquire(user_email, user_role)
+        stats = {
+            'calls_last_minute': rate_limiter.rpm_limit - remaining['per_minute'],
+            'calls_today': rate_limiter.rpd_limit - remaining['per_day'],
+            'rpm_limit': rate_limiter.rpm_limit,
+            'rpd_limit': rate_limiter.rpd_limit
+        } if isinstance(remaining, dict) else rate_limiter.get_usage_stats(user_email)
+
+        if not allowed:
+            wait_time = int(wait_seconds)
 
             # ✅ Logging de bloqueio
             logger.warning(
@@ -363,13 +804,10 @@ class PDFQA:
             Faça upgrade para o plano **{info['upgrade']}** e tenha acesso a mais recursos!
             """
 
-            st.error(error_message)
+            self._report_error(error_message)
             return False
 
         # ✅ Mostra informações de uso para usuários próximos do limite
-        remaining = rate_limiter.get_remaining_calls(user_email, user_role)
-        stats = rate_limiter.get_usage_stats(user_email)
-
         # Aviso se estiver com poucas análises restantes no minuto
         if isinstance(remaining, dict) and remaining['per_minute'] <= 2:
             st.warning(
@@ -378,7 +816,6 @@ class PDFQA:
             )
 
         # ✅ Logging de sucesso
-        stats = rate_limiter.get_usage_stats(user_email)
         logger.info(
             f"Rate limit OK - User: {user_email}, "
             f"Usage: {stats['calls_last_minute']}/{stats['rpm_limit']} per min, "
@@ -394,51 +831,188 @@ class PDFQA:
 
         return True
 
-    def _generate_response(self, model, pdf_files, question):
+    def _reserve_extra_call(self, user_email, user_role, user_plan) -> bool:
+        """
+        Reserva mais uma requisição ao modelo na cota do plano (nova tentativa,
+        reserva do hedge ou repetição sem streaming), sem mensagens ao usuário.
+        """
+        if user_role == 'admin':
+            return True
+        rate_limiter = self._rate_limiters.get(user_plan)
+        if not rate_limiter:
+            return False
+        allowed, wait_seconds, _ = rate_limiter.try_acquire(user_email, user_role)
+        if not allowed:
+            logger.info(
+                f"Requisição extra negada pelo rate limit - User: {user_email}, Plan: {user_plan}, "
+                f"espera {wait_seconds:.0f}s"
+            )
+        return allowed
+
+    @staticmethod
+    def _apply_page_selection(pdf_files, question, page_profile):
+        """Substitui PDFs longos pelas páginas relevantes e anexa a nota/resumo à pergunta."""
+        selected_files = []
+        for pdf_file in pdf_files:
+            if hasattr(pdf_file, 'getvalue'):
+                pdf_bytes = pdf_file.getvalue()
+                name = getattr(pdf_file, 'name', 'documento.pdf')
+            else:
+                with open(pdf_file, 'rb') as f:
+                    pdf_bytes = f.read()
+                name = os.path.basename(pdf_file)
+
+            selection = select_pages(pdf_bytes, page_profile)
+            if selection is None:
+                selected_files.append(pdf_file)
+                continue
+            reduced = io.BytesIO(selection.pdf_bytes)
+            reduced.name = name
+            selected_files.append(reduced)
+            question += describe_selection(selection)
+        return selected_files, question
+
+    @staticmethod
+    def open_document_session(pdf_file) -> DocumentSession:
+        """
+        Abre (ou reutiliza) a sessão do PDF: o arquivo é enviado uma única vez
+        à File API e pode ser passado em pdf_files de várias perguntas.
+        """
+        if isinstance(pdf_file, DocumentSession):
+            return pdf_file
+        if hasattr(pdf_file, 'getvalue'):
+            pdf_bytes = pdf_file.getvalue()
+            name = getattr(pdf_file, 'name', 'documento.pdf')
+        else:
+            with open(pdf_file, 'rb') as f:
+                pdf_bytes = f.read()
+            name = os.path.basename(pdf_file)
+        return get_document_sessions().open(pdf_bytes, name)
+
+    def _build_pdf_part(self, model, pdf_file):
         """
-        Função interna que prepara e envia a requisição para um modelo Gemini específico, com timeout.
+        Parte do PDF para o prompt: o arquivo da sessão de documento quando
+        disponível; senão os bytes inline.
         """
-        
-        q = Queue()
+        session = pdf_file if isinstance(pdf_file, DocumentSession) else None
+        if session is None and SESSIONS_ENABLED:
+            session = self.open_document_session(pdf_file)
 
-        def worker():
+        api_key = get_model_api_key(model)
+        if session is not None and api_key:
+            try:
+                return session.file_for(api_key)
+            except Exception as e:
+                logger.warning(f"Falha ao enviar documento à File API, usando envio inline: {e}")
+
+        if session is not None:
+            pdf_bytes = session.getvalue()
+        elif hasattr(pdf_file, 'read'):  # Se for um objeto de arquivo (como st.UploadedFile)
+            pdf_bytes = pdf_file.getvalue() # Use getvalue() que é mais seguro
+        else:  # Se for um caminho de arquivo (string)
+            with open(pdf_file, 'rb') as f:
+                pdf_bytes = f.read()
+        return {"mime_type": "application/pdf", "data": pdf_bytes}
+
+    @staticmethod
+    def _collect_usage(response, usage_info):
+        """Copia o usage_metadata da resposta para usage_info."""
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is None:
+            return
+        usage_info['input_tokens'] = getattr(usage, 'prompt_token_count', 0) or 0
+        usage_info['output_tokens'] = getattr(usage, 'candidates_token_count', 0) or 0
+        usage_info['cached_tokens'] = getattr(usage, 'cached_content_token_count', 0) or 0
+
+    def _generate_response(self, model, pdf_files, question, timeout=DEFAULT_REQUEST_TIMEOUT,
+                           generation_config=None, stream=None, call_info=None, reserve=None):
+        """
+        Função interna que prepara e envia a requisição para um modelo Gemini específico.
+
+        Os PDFs são referenciados pela sessão de documento (enviados uma vez e
+        reutilizados entre extração, auditoria e outras perguntas).
+        A chamada roda no executor compartilhado (AI.model_executor), com limite
+        de concorrência por modelo e timeout repassado ao cliente da API, e passa
+        pela camada de resiliência (AI.resilience): novas tentativas com backoff
+        para falhas transitórias, hedge opcional e circuito por modelo.
+        generation_config é repassado ao modelo (ex.: modo JSON com response_schema).
+        Com stream (AI.streaming.ResponseStream) a resposta é recebida em streaming
+        e cada trecho é repassado a ele; MalformedStreamError interrompe o stream
+        e é propagada ao chamador.
+        call_info (dict), se informado, traz o contexto da telemetria (modelo,
+        tarefa, usuário...): cada requisição enviada ao modelo — novas
+        tentativas e reservas do hedge incluídas — vira uma linha com seus
+        tokens e bytes.
+        reserve, se informado, reserva na cota do plano cada requisição além
+        da primeira (ver ResilientCaller.run).
+        """
+
+        def call(request_timeout, hedge=False):
+            attempt = self._next_attempt(call_info) if call_info is not None else 0
+            usage = {}
+            start = time.time()
+            outcome = OUTCOME_ERROR
+            response = None
             try:
                 # Preparar os inputs para o modelo
-                inputs = []
-                
-                for pdf_file in pdf_files:
-                    if hasattr(pdf_file, 'read'):  # Se for um objeto de arquivo (como st.UploadedFile)
-                        pdf_bytes = pdf_file.getvalue() # Use getvalue() que é mais seguro
-                    else:  # Se for um caminho de arquivo (string)
-                        with open(pdf_file, 'rb') as f:
-                            pdf_bytes = f.read()
-                    
-                    part = {"mime_type": "application/pdf", "data": pdf_bytes}
-                    inputs.append(part)
-                
+                inputs = [self._build_pdf_part(model, pdf_file) for pdf_file in pdf_files]
+
                 # Adicionar a pergunta como texto
                 inputs.append({"text": question})
-                
-                # Gerar resposta usando o modelo multimodal fornecido
-                response = model.generate_content(inputs)
-                
-                q.put(response.text)
-                
-            except Exception as e:
-                q.put(e)
+                usage['bytes_sent'] = len(question.encode('utf-8')) + sum(
+                    len(part['data']) for part in inputs if isinstance(part, dict) and 'data' in part
+                )
 
-        thread = threading.Thread(target=worker)
-        thread.start()
-        
+                # Gerar resposta usando o modelo multimodal fornecido
+                response = model.generate_content(
+                    inputs, generation_config=generation_config, request_options={"timeout": request_timeout},
+                    stream=stream is not None
+                )
+                if stream is None:
+                    self._collect_usage(response, usage)
+                    text = response.text
+                    outcome = OUTCOME_OK
+                    return text
+
+                stream.reset()
+                parts = []
+                for chunk in response:
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        # Trecho sem texto (ex.: apenas o motivo de término)
+                        continue
+                    parts.append(text)
+                    stream.feed(text)
+                self._collect_usage(response, usage)
+                outcome = OUTCOME_OK
+                return "".join(parts)
+            finally:
+                if response is not None and 'input_tokens' not in usage:
+                    # Stream interrompido: registra o uso que a API já informou
+                    try:
+                        self._collect_usage(response, usage)
+                    except Exception:
+                        pass
+                self._record_attempt(call_info, attempt, usage, start, outcome, hedge=hedge,
+                                     streamed=stream is not None)
+
+        model_key = getattr(model, 'model_name', str(id(model)))
+        caller = get_resilient_caller()
         try:
-            # Espera por 120 segundos
-            result = q.get(timeout=120)
-            if isinstance(result, Exception):
-                raise result
-            return result
-        except Empty:
-            st.error("A análise da IA excedeu o tempo limite (120s). Tente novamente.")
+            return caller.run(model_key, call, timeout=timeout, hedge=stream is None, pass_hedge=True,
+                              reserve=reserve)
+        except MalformedStreamError:
+            raise
+        except CircuitOpenError:
+            self._report_error("⚠️ O serviço de IA está instável no momento. Aguarde alguns instantes e tente novamente.")
+            return None
+        except ModelCallTimeoutError:
+            self._report_error(f"A análise da IA excedeu o tempo limite ({timeout}s). Tente novamente.")
+            return None
+        except ExecutorSaturatedError:
+            self._report_error("⏳ Muitas análises em andamento no momento. Aguarde alguns instantes e tente novamente.")
             return None
         except Exception as e:
-            st.error(f"Erro na comunicação com a API Gemini: {str(e)}")
+            self._report_error(f"Erro na comunicação com a API Gemini: {str(e)}")
             return None
@@ -1,9 +1,120 @@
 import streamlit as st
 import google.generativeai as genai
+from google.generativeai import client as genai_client
+import os
+import threading
 import logging
+from contextlib import contextmanager
 
 logging.basicConfig(level=logging.INFO)
 
+# Endpoint alternativo da API Gemini (ex.: servidor falso local para testes)
+GEMINI_ENDPOINT = os.getenv("SEGSIS_GEMINI_ENDPOINT")
+
+# Handles dos modelos por (chave de API, nome do modelo), criados uma vez por processo
+_model_handles = {}
+_model_handles_lock = threading.RLock()
+
+# Chave configurada no cliente global do genai e quantos blocos use_api_key a usam
+_configured_key = None
+_key_users = 0
+# Threads esperando para trocar de chave (têm prioridade sobre novos blocos da chave atual)
+_key_waiting = 0
+_key_condition = threading.Condition()
+
+
+def _configure(api_key: str):
+    """Configura o cliente global do genai. Deve ser chamado com _key_condition."""
+    global _configured_key
+    if _configured_key == api_key:
+        return
+    if GEMINI_ENDPOINT:
+        genai.configure(api_key=api_key, transport="rest", client_options={"api_endpoint": GEMINI_ENDPOINT})
+    else:
+        genai.configure(api_key=api_key)
+    _configured_key = api_key
+
+
+@contextmanager
+def use_api_key(api_key: str):
+    """
+    Executa chamadas de módulo do genai (upload_file, delete_file...) com a
+    chave informada.
+
+    A configuração do genai é global: o lock só protege a troca de chave.
+    Blocos com a mesma chave rodam em paralelo (uploads e esperas pelo
+    processamento não se serializam); a troca para outra chave espera os
+    blocos em andamento terminarem, e novos blocos da chave atual aguardam
+    quem está esperando a troca.
+    """
+    global _key_users, _key_waiting
+    with _key_condition:
+        waiting = False
+        while True:
+            if _key_users == 0:
+                if waiting or _key_waiting == 0:
+                    break
+            elif _configured_key == api_key and (waiting or _key_waiting == 0):
+                break
+            elif _configured_key != api_key and not waiting:
+                waiting = True
+                _key_waiting += 1
+            _key_condition.wait()
+        if waiting:
+            _key_waiting -= 1
+        _configure(api_key)
+        _key_users += 1
+    try:
+        yield
+    finally:
+        with _key_condition:
+            _key_users -= 1
+            _key_condition.notify_all()
+
+
+def bind_model_client(model):
+    """
+    Liga o handle ao cliente da chave configurada. O GenerativeModel só cria
+    o cliente na primeira chamada, com a chave que estiver global naquele
+    momento; ligado aqui, ele sempre envia a chave com que foi criado.
+    Deve ser chamado dentro de use_api_key.
+    """
+    model._client = genai_client.get_default_generative_client()
+    return model
+
+
+def get_model_handle(api_key: str, model_name: str):
+    """
+    Retorna o GenerativeModel para a chave e o modelo, configurando o cliente
+    apenas na primeira vez em que o par é usado no processo.
+    """
+    key = (api_key, model_name)
+    with _model_handles_lock:
+        model = _model_handles.get(key)
+    if model is None:
+        with use_api_key(api_key):
+            model = bind_model_client(genai.GenerativeModel(model_name))
+        with _model_handles_lock:
+            model = _model_handles.setdefault(key, model)
+        logging.info(f"Modelo {model_name} inicializado.")
+    return model
+
+
+def register_model_handle(api_key: str, handle_name: str, model):
+    """Registra um handle criado fora de get_model_handle (ex.: ligado a contexto em cache)."""
+    with _model_handles_lock:
+        _model_handles[(api_key, handle_name)] = model
+
+
+def get_model_api_key(model) -> str | None:
+    """Chave de API com que o handle do modelo foi criado."""
+    with _model_handles_lock:
+        for (api_key, _), handle in _model_handles.items():
+            if handle is model:
+                return api_key
+    return None
+
+
 def load_models():
     """
     Carrega e configura dois modelos Gemini distintos, um para extração e outro para auditoria,
@@ -15,17 +126,13 @@ def load_models():
     try:
         extraction_key = st.secrets.get("general", {}).get("GEMINI_EXTRACTION_KEY")
         if extraction_key:
-            genai.configure(api_key=extraction_key)
-            extraction_model = genai.GenerativeModel('gemini-2.5-flash') 
-            logging.info("Modelo de EXTRAÇÃO carregado com sucesso.")
+            extraction_model = get_model_handle(extraction_key, 'gemini-2.5-flash')
         else:
             st.warning("Chave 'GEMINI_EXTRACTION_KEY' não encontrada nos secrets. Funções de extração de dados serão desativadas.")
 
         audit_key = st.secrets.get("general", {}).get("GEMINI_AUDIT_KEY")
         if audit_key:
-            genai.configure(api_key=audit_key)
-            audit_model = genai.GenerativeModel('gemini-2.5-pro')
-            logging.info("Modelo de AUDITORIA carregado com sucesso.")
+            audit_model = get_model_handle(audit_key, 'gemini-2.5-pro')
         else:
             st.warning("Chave 'GEMINI_AUDIT_KEY' não encontrada nos secrets. Funções de auditoria serão desativadas.")
 
@@ -33,4 +140,4 @@ def load_models():
 
     except Exception as e:
         st.error(f"Erro crítico ao carregar os modelos de IA: {e}")
-        return None, None
\ No newline at end of file
+        return None, None
@@ -0,0 +1,168 @@
+import os
+import time
+import tempfile
+import threading
+import logging
+import google.generativeai as genai
+from AI.api_load import use_api_key
+from AI.response_cache import hash_bytes
+
+logger = logging.getLogger('segsisone_app.document_session')
+
+# A File API mantém os arquivos por 48h; encerramos a sessão bem antes
+DEFAULT_SESSION_TTL = int(os.getenv("SEGSIS_DOC_SESSION_TTL", "3600"))
+SESSIONS_ENABLED = os.getenv("SEGSIS_DOC_SESSIONS", "1") == "1"
+# Espera máxima para o arquivo enviado ficar ACTIVE
+UPLOAD_READY_TIMEOUT = 30
+
+
+class DocumentSession:
+    """
+    Um PDF enviado uma única vez à File API do Gemini e reutilizado em
+    vários prompts (extração, auditoria, perguntas de acompanhamento).
+
+    Os arquivos pertencem ao projeto da chave de API que os enviou, então a
+    sessão guarda um upload por chave; o envio só acontece no primeiro
+    prompt feito com cada chave.
+
+    refs conta os processamentos que seguram a sessão (acquire/release do
+    gerenciador); enquanto for maior que zero a sessão não é encerrada.
+    """
+
+    def __init__(self, pdf_bytes: bytes, display_name: str = "documento.pdf",
+                 ttl_seconds: int = DEFAULT_SESSION_TTL, file_hash: str = None):
+        self.pdf_bytes = pdf_bytes
+        self.display_name = display_name
+        self.file_hash = file_hash or hash_bytes(pdf_bytes)
+        self.ttl_seconds = ttl_seconds
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.refs = 0
+        self._files = {}
+        self._lock = threading.Lock()
+
+    @property
+    def expired(self) -> bool:
+        return time.time() - self.last_used > self.ttl_seconds
+
+    def getvalue(self) -> bytes:
+        return self.pdf_bytes
+
+    def _upload(self, api_key: str):
+        temp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
+                temp_file.write(self.pdf_bytes)
+                temp_path = temp_file.name
+            with use_api_key(api_key):
+                uploaded = genai.upload_file(
+                    temp_path, mime_type='application/pdf', display_name=self.display_name
+                )
+                deadline = time.time() + UPLOAD_READY_TIMEOUT
+                while getattr(uploaded.state, 'name', 'ACTIVE') == 'PROCESSING' and time.time() < deadline:
+                    time.sleep(1)
+                    uploaded = genai.get_file(uploaded.name)
+            if getattr(uploaded.state, 'name', 'ACTIVE') != 'ACTIVE':
+                raise RuntimeError(f"Arquivo {uploaded.name} não ficou disponível ({uploaded.state})")
+            logger.info(f"Documento {self.file_hash[:12]} enviado à File API como {uploaded.name}")
+            return uploaded
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                os.unlink(temp_path)
+
+    def file_for(self, api_key: str):
+        """Retorna o arquivo enviado com a chave, enviando-o no primeiro uso."""
+        with self._lock:
+            self.last_used = time.time()
+            uploaded = self._files.get(api_key)
+            if uploaded is None:
+                uploaded = self._upload(api_key)
+                self._files[api_key] = uploaded
+            return uploaded
+
+    def close(self):
+        """Remove os arquivos enviados. Falhas são apenas registradas (expiram sozinhos)."""
+        with self._lock:
+            files, self._files = self._files, {}
+        for api_key, uploaded in files.items():
+            try:
+                with use_api_key(api_key):
+                    genai.delete_file(uploaded.name)
+            except Exception as e:
+                logger.warning(f"Falha ao remover {uploaded.name} da File API: {e}")
+
+
+class DocumentSessionManager:
+    """Sessões abertas do processo, indexadas pelo hash do PDF."""
+
+    def __init__(self, ttl_seconds: int = DEFAULT_SESSION_TTL):
+        self.ttl_seconds = ttl_seconds
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, pdf_bytes: bytes, display_name: str, acquire: bool) -> DocumentSession:
+        file_hash = hash_bytes(pdf_bytes)
+        self.cleanup()
+        with self._lock:
+            session = self._sessions.get(file_hash)
+            if session is None:
+                session = DocumentSession(pdf_bytes, display_name, self.ttl_seconds, file_hash=file_hash)
+                self._sessions[file_hash] = session
+            if acquire:
+                session.refs += 1
+            return session
+
+    def open(self, pdf_bytes: bytes, display_name: str = "documento.pdf") -> DocumentSession:
+        """
+        Retorna a sessão do PDF, criando-a se necessário; sessões expiradas são encerradas.
+        Não segura a sessão: ela fica aberta até o TTL ou o último release.
+        """
+        return self._get_or_create(pdf_bytes, display_name, acquire=False)
+
+    def acquire(self, pdf_bytes: bytes, display_name: str = "documento.pdf") -> DocumentSession:
+        """Como open, mas segura a sessão até o release correspondente."""
+        return self._get_or_create(pdf_bytes, display_name, acquire=True)
+
+    def release(self, file_hash: str):
+        """
+        Libera uma referência obtida com acquire. A sessão só é encerrada
+        (arquivos removidos da File API) quando ninguém mais a segura.
+        """
+        with self._lock:
+            session = self._sessions.get(file_hash)
+            if session is None:
+                return
+            session.refs = max(0, session.refs - 1)
+            if session.refs > 0:
+                return
+            del self._sessions[file_hash]
+        session.close()
+
+    def cleanup(self):
+        """Encerra as sessões expiradas que não estão seguras por nenhum processamento."""
+        with self._lock:
+            expired = [h for h, s in self._sessions.items() if s.expired and s.refs == 0]
+            sessions = [self._sessions.pop(h) for h in expired]
+        for session in sessions:
+            session.close()
+
+    def close_all(self):
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+
+_session_manager = None
+_session_manager_lock = threading.Lock()
+
+
+def get_document_sessions() -> DocumentSessionManager:
+    """Retorna o gerenciador de sessões de documentos do processo."""
+    global _session_manager
+    if _session_manager is None:
+        with _session_manager_lock:
+            if _session_manager is None:
+                _session_manager = DocumentSessionManager()
+    return _session_manager
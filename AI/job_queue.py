@@ -0,0 +1,593 @@
+import io
+import os
+import json
+import uuid
+import time
+import socket
+import sqlite3
+import threading
+import logging
+from datetime import date, datetime, timedelta
+from queue import Queue
+
+import pandas as pd
+
+from AI.api_Operation import PDFQA, AnalysisError
+from AI.document_session import get_document_sessions
+
+logger = logging.getLogger('segsisone_app.job_queue')
+
+# Status possíveis de um trabalho
+JOB_PENDING = 'pendente'
+JOB_RUNNING = 'processando'
+JOB_DONE = 'concluido'
+JOB_FAILED = 'erro'
+JOB_ARCHIVED = 'arquivado'
+
+ACTIVE_STATUSES = (JOB_PENDING, JOB_RUNNING, JOB_DONE, JOB_FAILED)
+
+DEFAULT_DB_PATH = os.getenv("SEGSIS_AI_JOBS_DB", "ai_jobs.db")
+DEFAULT_WORKERS = int(os.getenv("SEGSIS_AI_JOB_WORKERS", "3"))
+
+# Intervalo entre novas tentativas quando o plano do usuário está no limite
+RATE_LIMIT_RETRY_SECONDS = 5
+# Intervalo mínimo entre gravações do progresso em streaming
+PROGRESS_MIN_INTERVAL_SECONDS = 0.5
+# Cada processo renova o heartbeat dos seus trabalhos ativos neste intervalo;
+# sem renovação por HEARTBEAT_STALE_SECONDS o dono é considerado perdido
+HEARTBEAT_INTERVAL_SECONDS = int(os.getenv("SEGSIS_AI_JOB_HEARTBEAT_SECONDS", "15"))
+HEARTBEAT_STALE_SECONDS = int(os.getenv("SEGSIS_AI_JOB_STALE_SECONDS", str(HEARTBEAT_INTERVAL_SECONDS * 4)))
+
+
+class StoredUpload(io.BytesIO):
+    """
+    Arquivo reconstruído a partir dos bytes salvos na fila, com a mesma
+    interface usada dos objetos UploadedFile do Streamlit (name, type,
+    size, getvalue()).
+    """
+
+    def __init__(self, data: bytes, name: str, mime_type: str = 'application/pdf'):
+        super().__init__(data)
+        self.name = name
+        self.type = mime_type
+        self.size = len(data)
+
+
+def _encode_value(obj):
+    """Serializa datas preservando o tipo para a reconstrução do resultado."""
+    if isinstance(obj, pd.Timestamp):
+        return {'__datetime__': obj.isoformat()}
+    if isinstance(obj, datetime):
+        return {'__datetime__': obj.isoformat()}
+    if isinstance(obj, date):
+        return {'__date__': obj.isoformat()}
+    return str(obj)
+
+
+def _decode_value(obj: dict):
+    if '__date__' in obj:
+        return date.fromisoformat(obj['__date__'])
+    if '__datetime__' in obj:
+        return datetime.fromisoformat(obj['__datetime__'])
+    return obj
+
+
+def _dumps(value) -> str | None:
+    if value is None:
+        return None
+    return json.dumps(value, default=_encode_value, ensure_ascii=False)
+
+
+def _loads(value: str | None):
+    if not value:
+        return None
+    return json.loads(value, object_hook=_decode_value)
+
+
+class AIJobQueue:
+    """
+    Fila local de trabalhos de análise/auditoria com IA.
+
+    Os trabalhos (status, progresso, resultado e o PDF enviado) ficam em um
+    banco SQLite, de modo que a interface pode consultá-los mesmo após
+    recarregar a página. O processamento é feito por um pool de threads que
+    respeita os limites de requisições do plano de cada usuário.
+
+    As funções de análise são mantidas apenas em memória, no processo que
+    recebeu o trabalho (o dono, gravado com host, PID e um heartbeat). Vários
+    processos podem compartilhar o banco: só são marcados como erro os
+    trabalhos cujo dono terminou ou parou de renovar o heartbeat.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, num_workers: int = DEFAULT_WORKERS):
+        self.db_path = db_path
+        self.num_workers = max(1, num_workers)
+        self._db_lock = threading.Lock()
+        self._admission_lock = threading.Lock()
+        self._queue = Queue()
+        self._handlers = {}
+        # Chamadas de IA reservadas (ainda não feitas) pelos trabalhos em execução de cada usuário
+        self._reserved_calls = {}
+        self._workers = []
+        # Token por instância: um PID reutilizado após reinício não herda os trabalhos antigos
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._init_db()
+        self._recover_interrupted_jobs()
+        self._start_workers()
+        self._start_heartbeat()
+
+    # ------------------------------------------------------------------
+    # Persistência
+    # ------------------------------------------------------------------
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _init_db(self):
+        with self._db_lock, self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ai_jobs (
+                    id TEXT PRIMARY KEY,
+                    job_type TEXT NOT NULL,
+                    batch_id TEXT,
+                    user_email TEXT NOT NULL,
+                    unit_id TEXT,
+                    status TEXT NOT NULL,
+                    progress INTEGER NOT NULL DEFAULT 0,
+                    message TEXT,
+                    file_name TEXT,
+                    file_type TEXT,
+                    file_bytes BLOB,
+                    file_hash TEXT,
+                    context TEXT,
+                    result TEXT,
+                    error TEXT,
+                    owner TEXT,
+                    heartbeat_at TEXT,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL
+                )
+            """)
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(ai_jobs)")}
+            if 'batch_id' not in columns:
+                conn.execute("ALTER TABLE ai_jobs ADD COLUMN batch_id TEXT")
+            if 'owner' not in columns:
+                conn.execute("ALTER TABLE ai_jobs ADD COLUMN owner TEXT")
+            if 'heartbeat_at' not in columns:
+                conn.execute("ALTER TABLE ai_jobs ADD COLUMN heartbeat_at TEXT")
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_ai_jobs_user ON ai_jobs (user_email, job_type, status)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_jobs_batch ON ai_jobs (batch_id)")
+
+    def _update(self, job_id: str, **fields):
+        fields['updated_at'] = datetime.now().isoformat()
+        assignments = ", ".join(f"{column} = ?" for column in fields)
+        with self._db_lock, self._connect() as conn:
+            conn.execute(
+                f"UPDATE ai_jobs SET {assignments} WHERE id = ?",
+                [*fields.values(), job_id]
+            )
+
+    @staticmethod
+    def _owner_alive(owner: str | None) -> bool | None:
+        """
+        Se o processo dono ainda existe: True/False para donos deste host,
+        None quando não há como verificar (outro host ou dono desconhecido).
+        """
+        try:
+            host, pid, _ = owner.rsplit(':', 2)
+            pid = int(pid)
+        except (AttributeError, ValueError):
+            return None
+        if host != socket.gethostname():
+            return None
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        except OSError:
+            return None
+        return True
+
+    def _recover_interrupted_jobs(self):
+        """
+        Marca como erro os trabalhos ativos que nenhum processo vai concluir:
+        o dono terminou (mesmo host) ou não renova o heartbeat há mais de
+        HEARTBEAT_STALE_SECONDS. Trabalhos de outros processos vivos seguem intactos.
+        """
+        stale_before = (datetime.now() - timedelta(seconds=HEARTBEAT_STALE_SECONDS)).isoformat()
+        with self._db_lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, owner, heartbeat_at FROM ai_jobs WHERE status IN (?, ?) AND "
+                "(owner IS NULL OR owner <> ?)",
+                (JOB_PENDING, JOB_RUNNING, self.owner)
+            ).fetchall()
+            lost = [
+                row['id'] for row in rows
+                if self._owner_alive(row['owner']) is False
+                or not row['heartbeat_at'] or row['heartbeat_at'] < stale_before
+            ]
+            if not lost:
+                return
+            placeholders = ", ".join("?" for _ in lost)
+            cursor = conn.execute(
+                f"UPDATE ai_jobs SET status = ?, error = ?, message = ?, updated_at = ? "
+                f"WHERE id IN ({placeholders}) AND status IN (?, ?)",
+                (
+                    JOB_FAILED,
+                    "Processamento interrompido: o servidor que executava o trabalho foi encerrado.",
+                    "Interrompido - envie o arquivo novamente",
+                    datetime.now().isoformat(),
+                    *lost,
+                    JOB_PENDING,
+                    JOB_RUNNING
+                )
+            )
+            if cursor.rowcount:
+                logger.warning(f"{cursor.rowcount} trabalho(s) de IA interrompido(s) marcados como erro")
+
+    def _beat(self):
+        """Renova o heartbeat dos trabalhos ativos deste processo."""
+        with self._db_lock, self._connect() as conn:
+            conn.execute(
+                "UPDATE ai_jobs SET heartbeat_at = ? WHERE owner = ? AND status IN (?, ?)",
+                (datetime.now().isoformat(), self.owner, JOB_PENDING, JOB_RUNNING)
+            )
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(HEARTBEAT_INTERVAL_SECONDS)
+            try:
+                self._beat()
+                # Também libera os trabalhos de outros processos que terminaram
+                self._recover_interrupted_jobs()
+            except Exception as e:
+                logger.warning(f"Falha ao renovar o heartbeat dos trabalhos de IA: {e}")
+
+    def _start_heartbeat(self):
+        threading.Thread(target=self._heartbeat_loop, name="ai-job-heartbeat", daemon=True).start()
+
+    @staticmethod
+    def _row_to_job(row) -> dict:
+        job = dict(row)
+        job.pop('file_bytes', None)
+        job['context'] = _loads(job.get('context')) or {}
+        job['result'] = _loads(job.get('result'))
+        return job
+
+    # ------------------------------------------------------------------
+    # API pública
+    # ------------------------------------------------------------------
+
+    def submit(self, job_type: str, uploaded_file, analyze, audit=None, user=None,
+               unit_id: str = None, context: dict = None, file_hash: str = None,
+               batch_id: str = None) -> str:
+        """
+        Enfileira a análise de um PDF e retorna imediatamente o ID do trabalho.
+
+        Args:
+            job_type: Tipo do documento (ex: 'ASO', 'Treinamento')
+            uploaded_file: Arquivo enviado (UploadedFile ou StoredUpload)
+            analyze: Função que recebe o arquivo e retorna o dict extraído
+            audit: Função opcional (doc_info, bytes) -> resultado da auditoria
+            user: Tupla (email, role, plano); padrão é o usuário da sessão atual
+            unit_id: Unidade em que o trabalho foi enviado
+            context: Dados extras devolvidos com o resultado (ex: funcionario_id)
+            file_hash: Hash SHA-256 do arquivo, se já calculado
+            batch_id: Identificador do lote, quando o trabalho faz parte de uma importação
+        """
+        user_email, user_role, user_plan = user or PDFQA.get_current_user()
+        file_bytes = uploaded_file.getvalue()
+        now = datetime.now().isoformat()
+        job_id = uuid.uuid4().hex
+
+        with self._db_lock, self._connect() as conn:
+            conn.execute(
+                """
+                INSERT INTO ai_jobs (id, job_type, batch_id, user_email, unit_id, status, progress, message,
+                                     file_name, file_type, file_bytes, file_hash, context,
+                                     owner, heartbeat_at, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, 0, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    job_id, job_type, batch_id, user_email, unit_id, JOB_PENDING, "Na fila",
+                    getattr(uploaded_file, 'name', 'documento.pdf'),
+                    getattr(uploaded_file, 'type', 'application/pdf'),
+                    sqlite3.Binary(file_bytes), file_hash, _dumps(context or {}),
+                    self.owner, now, now, now
+                )
+            )
+
+        self._handlers[job_id] = {
+            'analyze': analyze,
+            'audit': audit,
+            'user': (user_email, user_role, user_plan)
+        }
+        self._queue.put(job_id)
+        logger.info(f"Trabalho {job_id} ({job_type}) enfileirado para {user_email}")
+        return job_id
+
+    def get_job(self, job_id: str) -> dict | None:
+        """Retorna os dados do trabalho (sem os bytes do arquivo)."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM ai_jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def get_job_file(self, job_id: str) -> StoredUpload | None:
+        """Reconstrói o arquivo enviado para o trabalho."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT file_bytes, file_name, file_type FROM ai_jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if not row or row['file_bytes'] is None:
+            return None
+        return StoredUpload(bytes(row['file_bytes']), row['file_name'], row['file_type'])
+
+    def get_active_job(self, user_email: str, job_type: str, unit_id: str = None) -> dict | None:
+        """Último trabalho ainda não arquivado do usuário para o tipo de documento."""
+        query = "SELECT * FROM ai_jobs WHERE user_email = ? AND job_type = ? AND status IN (?, ?, ?, ?)"
+        params = [user_email, job_type, *ACTIVE_STATUSES]
+        if unit_id is not None:
+            query += " AND unit_id = ?"
+            params.append(unit_id)
+        query += " ORDER BY created_at DESC LIMIT 1"
+        with self._connect() as conn:
+            row = conn.execute(query, params).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def list_jobs(self, user_email: str, limit: int = 20) -> list[dict]:
+        """Lista os trabalhos mais recentes do usuário."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM ai_jobs WHERE user_email = ? ORDER BY created_at DESC LIMIT ?",
+                (user_email, limit)
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def list_batch_jobs(self, batch_id: str, include_archived: bool = False) -> list[dict]:
+        """Lista os trabalhos de um lote na ordem de envio (sem os já arquivados, por padrão)."""
+        query = "SELECT * FROM ai_jobs WHERE batch_id = ?"
+        params = [batch_id]
+        if not include_archived:
+            query += " AND status <> ?"
+            params.append(JOB_ARCHIVED)
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY created_at, rowid", params).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+    def set_audit_result(self, job_id: str, audit_result: dict):
+        """Anexa ao resultado do trabalho concluído uma auditoria feita depois (ex.: auditoria do lote)."""
+        job = self.get_job(job_id)
+        if not job or job['status'] != JOB_DONE:
+            return
+        result = job['result'] or {}
+        result.setdefault('doc_info', {})['audit_result'] = audit_result
+        self._update(job_id, result=_dumps(result))
+
+    def archive_job(self, job_id: str):
+        """Marca o trabalho como tratado pelo usuário e descarta o arquivo salvo."""
+        self._update(job_id, status=JOB_ARCHIVED, file_bytes=None)
+        self._handlers.pop(job_id, None)
+
+    def cleanup(self, max_age_days: int = 7) -> int:
+        """Remove trabalhos antigos já finalizados."""
+        cutoff = (datetime.now() - timedelta(days=max_age_days)).isoformat()
+        with self._db_lock, self._connect() as conn:
+            cursor = conn.execute(
+                "DELETE FROM ai_jobs WHERE updated_at < ? AND status IN (?, ?, ?)",
+                (cutoff, JOB_DONE, JOB_FAILED, JOB_ARCHIVED)
+            )
+        return cursor.rowcount
+
+    # ------------------------------------------------------------------
+    # Processamento
+    # ------------------------------------------------------------------
+
+    def _start_workers(self):
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"ai-job-worker-{i}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    @staticmethod
+    def _calls_per_job(handler: dict) -> int:
+        """Chamadas de IA do trabalho: a análise e, se houver, a auditoria."""
+        return 2 if handler['audit'] else 1
+
+    def _has_capacity(self, user, calls: int = 1) -> bool:
+        """
+        Verifica se o plano do usuário comporta as chamadas do trabalho,
+        descontando as já reservadas pelos trabalhos dele em execução.
+        """
+        user_email, user_role, user_plan = user
+        if user_role == 'admin':
+            return True
+        rate_limiter = PDFQA._rate_limiters.get(user_plan)
+        if not rate_limiter:
+            return True  # answer_question recusa e o trabalho termina com erro
+        remaining = rate_limiter.get_remaining_calls(user_email, user_role)
+        if remaining == 'ilimitado':
+            return True
+        # Um trabalho maior que a janela por minuto do plano nunca caberia nela
+        calls = min(calls, rate_limiter.rpm_limit)
+        needed = self._reserved_calls.get(user_email, 0) + calls
+        return remaining['per_minute'] >= needed and remaining['per_day'] >= needed
+
+    def _release_calls(self, user_email: str, calls: int):
+        with self._admission_lock:
+            self._reserved_calls[user_email] = max(0, self._reserved_calls.get(user_email, 0) - calls)
+
+    def _requeue_later(self, job_id: str, delay: float):
+        timer = threading.Timer(delay, self._queue.put, args=(job_id,))
+        timer.daemon = True
+        timer.start()
+
+    def _worker_loop(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                handler = self._handlers.get(job_id)
+                if not handler:
+                    continue
+
+                user = handler['user']
+                calls = self._calls_per_job(handler)
+                with self._admission_lock:
+                    if not self._has_capacity(user, calls):
+                        self._update(job_id, message="Aguardando limite de análises do plano")
+                        self._requeue_later(job_id, RATE_LIMIT_RETRY_SECONDS)
+                        continue
+                    self._reserved_calls[user[0]] = self._reserved_calls.get(user[0], 0) + calls
+
+                handler['reserved_calls'] = calls
+                try:
+                    self._run_job(job_id, handler)
+                finally:
+                    # Libera o que o trabalho não chegou a usar (falha antes da auditoria)
+                    self._release_calls(user[0], handler.pop('reserved_calls', 0))
+            except Exception as e:
+                logger.error(f"Erro inesperado no worker de IA ({job_id}): {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def _wait_for_capacity(self, job_id: str, user, max_wait_seconds: int = 120) -> bool:
+        """Espera pela janela do plano antes de uma chamada adicional (auditoria)."""
+        user_email, user_role, user_plan = user
+        rate_limiter = PDFQA._rate_limiters.get(user_plan)
+        if user_role == 'admin' or not rate_limiter:
+            return True
+
+        waited = 0
+        while waited < max_wait_seconds:
+            remaining = rate_limiter.get_remaining_calls(user_email, user_role)
+            if remaining == 'ilimitado' or (remaining['per_minute'] > 0 and remaining['per_day'] > 0):
+                return True
+            if remaining['per_day'] <= 0:
+                return False
+            self._update(job_id, message="Aguardando limite de análises do plano")
+            wait = max(1, rate_limiter.get_wait_time_minutes(user_email))
+            threading.Event().wait(wait)
+            waited += wait
+        return False
+
+    def _progress_reporter(self, job_id: str, start: int, end: int, label: str):
+        """
+        Callback de progresso das respostas em streaming: mapeia a fração
+        recebida para a faixa [start, end] do trabalho e exibe o último campo.
+        """
+        last_update = [0.0]
+
+        def report(fraction, message):
+            if job_id not in self._handlers:
+                # Chamada abandonada que terminou depois do trabalho
+                return
+            now = time.monotonic()
+            if now - last_update[0] < PROGRESS_MIN_INTERVAL_SECONDS and fraction != 1.0:
+                return
+            last_update[0] = now
+            fields = {'message': f"{label} {message}"}
+            if fraction is not None:
+                fields['progress'] = int(start + (end - start) * fraction)
+            self._update(job_id, **fields)
+
+        return report
+
+    def _consume_reserved_call(self, handler: dict, user):
+        """A chamada reservada foi feita: o rate limiter já a contabiliza."""
+        if handler.get('reserved_calls', 0) > 0:
+            handler['reserved_calls'] -= 1
+            self._release_calls(user[0], 1)
+
+    def _run_job(self, job_id: str, handler: dict):
+        job = self.get_job(job_id)
+        if not job or job['status'] != JOB_PENDING:
+            return
+
+        user = handler['user']
+        uploaded_file = self.get_job_file(job_id)
+        # Segura a sessão do PDF: outros trabalhos com o mesmo arquivo a reutilizam
+        session = None
+        if uploaded_file is not None:
+            session = get_document_sessions().acquire(uploaded_file.getvalue(), uploaded_file.name)
+        self._update(job_id, status=JOB_RUNNING, progress=10, message=f"🤖 Analisando {job['job_type']} com IA...")
+
+        try:
+            analyze_progress = self._progress_reporter(job_id, 10, 60, f"🤖 Analisando {job['job_type']} com IA...")
+            with PDFQA.user_context(*user, unit_id=job.get('unit_id')), PDFQA.progress_context(analyze_progress):
+                PDFQA.pop_last_error()
+                try:
+                    doc_info = handler['analyze'](uploaded_file)
+                finally:
+                    self._consume_reserved_call(handler, user)
+                if not doc_info:
+                    # st.error não aparece em threads: o motivo vem do PDFQA
+                    self._update(
+                        job_id, status=JOB_FAILED, progress=100,
+                        message=f"Não foi possível extrair informações do {job['job_type']}.",
+                        error=PDFQA.pop_last_error() or "A análise não retornou dados."
+                    )
+                    return
+
+                audit_warning = None
+                if handler['audit']:
+                    self._update(job_id, progress=60, message="🔍 Executando auditoria de conformidade...")
+                    if self._wait_for_capacity(job_id, user):
+                        try:
+                            audit_progress = self._progress_reporter(job_id, 60, 95, "🔍 Auditoria:")
+                            with PDFQA.progress_context(audit_progress):
+                                try:
+                                    audit_result = handler['audit'](doc_info, uploaded_file.getvalue())
+                                finally:
+                                    self._consume_reserved_call(handler, user)
+                            if audit_result:
+                                doc_info['audit_result'] = audit_result
+                        except Exception as e:
+                            logger.warning(f"Auditoria do trabalho {job_id} falhou: {e}")
+                            audit_warning = f"Auditoria não disponível: {e}"
+                    else:
+                        audit_warning = "Auditoria não executada: limite de análises do plano atingido."
+
+            self._update(
+                job_id, status=JOB_DONE, progress=100,
+                message=f"✅ Análise de {job['job_type']} concluída!",
+                result=_dumps({'doc_info': doc_info, 'audit_warning': audit_warning})
+            )
+            logger.info(f"Trabalho {job_id} ({job['job_type']}) concluído")
+        except AnalysisError as e:
+            logger.warning(f"Análise do trabalho {job_id} falhou: {e}")
+            self._update(
+                job_id, status=JOB_FAILED, progress=100,
+                message=f"Não foi possível extrair informações do {job['job_type']}.", error=str(e)
+            )
+        except Exception as e:
+            logger.error(f"Erro ao processar trabalho {job_id}: {e}", exc_info=True)
+            self._update(
+                job_id, status=JOB_FAILED, progress=100,
+                message=f"Erro ao processar {job['job_type']}.", error=str(e)
+            )
+        finally:
+            self._handlers.pop(job_id, None)
+            # Extração e auditoria concluídas: o último trabalho com o PDF o remove da File API
+            if session is not None:
+                get_document_sessions().release(session.file_hash)
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> AIJobQueue:
+    """Retorna a fila de trabalhos de IA do processo, criando-a no primeiro uso."""
+    global _job_queue
+    if _job_queue is None:
+        with _job_queue_lock:
+            if _job_queue is None:
+                _job_queue = AIJobQueue()
+    return _job_queue
@@ -0,0 +1,136 @@
+import os
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+logger = logging.getLogger('segsisone_app.model_executor')
+
+DEFAULT_MODEL_CONCURRENCY = int(os.getenv("SEGSIS_AI_MODEL_CONCURRENCY", "4"))
+DEFAULT_REQUEST_TIMEOUT = 120
+# Tempo máximo aguardando uma vaga antes de recusar a chamada (backpressure)
+DEFAULT_ADMISSION_TIMEOUT = 30
+# Folga sobre o timeout da requisição antes de abandonar a chamada
+ABANDON_GRACE_SECONDS = 10
+
+
+class ExecutorSaturatedError(Exception):
+    """Todas as vagas do modelo estão ocupadas e a espera excedeu o limite."""
+
+
+class ModelCallTimeoutError(Exception):
+    """A chamada ao modelo não terminou dentro do tempo limite."""
+
+
+class ModelExecutor:
+    """
+    Executor compartilhado e limitado para chamadas aos modelos Gemini.
+
+    - Cada modelo tem um limite de chamadas simultâneas (semáforo); quem
+      chega com o limite esgotado espera até admission_timeout e então é
+      recusado, em vez de acumular threads.
+    - As chamadas rodam em um único pool de threads de tamanho fixo.
+    - O timeout é repassado ao cliente (request_options), que encerra a
+      requisição HTTP; a thread é então liberada em vez de ficar presa.
+    """
+
+    def __init__(self, model_concurrency: int = DEFAULT_MODEL_CONCURRENCY,
+                 max_models: int = 2, admission_timeout: float = DEFAULT_ADMISSION_TIMEOUT):
+        self.model_concurrency = model_concurrency
+        self.admission_timeout = admission_timeout
+        self._pool = ThreadPoolExecutor(
+            max_workers=model_concurrency * max_models, thread_name_prefix="gemini-call"
+        )
+        self._semaphores = {}
+        self._lock = threading.Lock()
+        self._metrics = {
+            'waiting': 0, 'in_flight': 0, 'completed': 0, 'failed': 0,
+            'timeouts': 0, 'abandoned': 0, 'rejected': 0
+        }
+        self._in_flight_by_model = {}
+
+    def _semaphore(self, model_key: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if model_key not in self._semaphores:
+                self._semaphores[model_key] = threading.BoundedSemaphore(self.model_concurrency)
+                self._in_flight_by_model[model_key] = 0
+            return self._semaphores[model_key]
+
+    def _count(self, metric: str, delta: int = 1, model_key: str = None):
+        with self._lock:
+            self._metrics[metric] += delta
+            if model_key is not None:
+                self._in_flight_by_model[model_key] += delta
+
+    def run(self, model_key: str, fn, timeout: float = DEFAULT_REQUEST_TIMEOUT):
+        """
+        Executa fn(timeout) com o limite de concorrência do modelo.
+
+        fn recebe o timeout para repassá-lo ao cliente da API.
+
+        Raises:
+            ExecutorSaturatedError: sem vaga dentro de admission_timeout
+            ModelCallTimeoutError: a chamada excedeu o tempo limite
+        """
+        semaphore = self._semaphore(model_key)
+
+        self._count('waiting')
+        acquired = semaphore.acquire(timeout=self.admission_timeout)
+        self._count('waiting', -1)
+        if not acquired:
+            self._count('rejected')
+            logger.warning(f"Executor saturado para {model_key}: chamada recusada")
+            raise ExecutorSaturatedError(model_key)
+
+        self._count('in_flight', model_key=model_key)
+
+        def release(_future):
+            self._count('in_flight', -1, model_key=model_key)
+            semaphore.release()
+
+        try:
+            future = self._pool.submit(fn, timeout)
+        except Exception:
+            release(None)
+            raise
+        future.add_done_callback(release)
+
+        try:
+            result = future.result(timeout=timeout + ABANDON_GRACE_SECONDS)
+            self._count('completed')
+            return result
+        except FutureTimeoutError:
+            # Não iniciada: cancelada; em andamento: abandonada até o timeout do cliente
+            if not future.cancel():
+                self._count('abandoned')
+            self._count('timeouts')
+            raise ModelCallTimeoutError(model_key)
+        except Exception:
+            self._count('failed')
+            raise
+
+    def has_capacity(self, model_key: str) -> bool:
+        """Indica se o modelo tem vaga livre para uma nova chamada sem espera."""
+        with self._lock:
+            return self._in_flight_by_model.get(model_key, 0) < self.model_concurrency
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['in_flight_by_model'] = dict(self._in_flight_by_model)
+        metrics['queue_depth'] = metrics['waiting']
+        metrics['model_concurrency'] = self.model_concurrency
+        return metrics
+
+
+_model_executor = None
+_model_executor_lock = threading.Lock()
+
+
+def get_model_executor() -> ModelExecutor:
+    """Retorna o executor de chamadas aos modelos do processo."""
+    global _model_executor
+    if _model_executor is None:
+        with _model_executor_lock:
+            if _model_executor is None:
+                _model_executor = ModelExecutor()
+    return _model_executor
@@ -0,0 +1,178 @@
+"""
+Seleção das páginas relevantes de PDFs longos antes do envio ao modelo.
+
+As páginas são pontuadas localmente pelas palavras-chave da tarefa (datas,
+assinaturas, inventário de riscos, plano de ação...) e só as melhores, dentro
+do orçamento de páginas e bytes, são enviadas; as demais entram como um
+resumo em texto. Sem camada de texto ou sem pypdf, o documento vai inteiro.
+"""
+import io
+import os
+import re
+import logging
+import unicodedata
+from dataclasses import dataclass, field
+
+logger = logging.getLogger('segsisone_app.page_selection')
+
+try:
+    from pypdf import PdfReader, PdfWriter
+except ImportError:
+    PdfReader = PdfWriter = None
+
+PAGE_SELECTION_ENABLED = os.getenv("SEGSIS_PAGE_SELECTION", "1") == "1"
+DEFAULT_MAX_BYTES = int(os.getenv("SEGSIS_PAGE_BYTE_BUDGET", str(4 * 1024 * 1024)))
+# Caracteres do resumo de cada página omitida
+DIGEST_CHARS_PER_PAGE = 300
+DIGEST_MAX_CHARS = 6000
+
+# Perfis por tarefa: palavras-chave (sem acento) com peso e orçamento de páginas.
+# A primeira página (capa) e a última (assinaturas) são sempre candidatas fortes.
+PAGE_PROFILES = {
+    'doc_empresa_extracao': {
+        'max_pages': int(os.getenv("SEGSIS_PAGE_BUDGET_EXTRACTION", "4")),
+        'keywords': {
+            r'vigencia': 3, r'validade': 3, r'data de (?:emissao|elaboracao|aprovacao)': 3,
+            r'elaborad[oa]': 2, r'revisao': 1, r'assinatura': 2, r'responsavel tecnico': 2,
+            r'\d{1,2}/\d{1,2}/\d{2,4}': 1, r'programa de': 1, r'\bpgr\b|\bpcmso\b|\bppr\b|\bpca\b': 2,
+        },
+    },
+    'auditoria_pgr': {
+        'max_pages': int(os.getenv("SEGSIS_PAGE_BUDGET_AUDIT", "12")),
+        'keywords': {
+            r'inventario de riscos': 4, r'plano de acao': 4, r'cronograma': 3, r'responsave(?:l|is)': 2,
+            r'severidade': 3, r'probabilidade': 3, r'nivel de risco': 3, r'emergencia': 3,
+            r'vigencia': 2, r'assinatura': 2, r'\d{1,2}/\d{1,2}/\d{2,4}': 1,
+        },
+    },
+    'auditoria_pcmso': {
+        'max_pages': int(os.getenv("SEGSIS_PAGE_BUDGET_AUDIT", "12")),
+        'keywords': {
+            r'medico responsavel': 4, r'exames? (?:complementares|clinicos?)': 3, r'periodicidade': 3,
+            r'relatorio analitico': 3, r'planejamento': 2, r'riscos? ocupacionais': 2,
+            r'vigencia': 2, r'assinatura': 2, r'crm': 2, r'\d{1,2}/\d{1,2}/\d{2,4}': 1,
+        },
+    },
+}
+PAGE_PROFILES['auditoria_doc_empresa'] = {
+    'max_pages': PAGE_PROFILES['auditoria_pgr']['max_pages'],
+    'keywords': {**PAGE_PROFILES['auditoria_pcmso']['keywords'], **PAGE_PROFILES['auditoria_pgr']['keywords']},
+}
+
+
+@dataclass
+class PageSelection:
+    """Resultado da seleção: o PDF reduzido e o resumo das páginas omitidas."""
+    pdf_bytes: bytes
+    pages: list = field(default_factory=list)
+    total_pages: int = 0
+    digest: str = ""
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def _score_page(text: str, keywords: dict) -> float:
+    normalized = _normalize(text)
+    # Limita a contribuição de cada termo para não premiar páginas repetitivas
+    return sum(weight * min(len(re.findall(pattern, normalized)), 3) for pattern, weight in keywords.items())
+
+
+def profile_for_norma(norma: str | None, doc_subtype: str | None = None) -> str:
+    """Perfil de auditoria para um documento da empresa."""
+    reference = f"{doc_subtype or ''} {norma or ''}".upper()
+    if 'PCMSO' in reference or 'NR-07' in reference:
+        return 'auditoria_pcmso'
+    if 'PGR' in reference or 'NR-01' in reference:
+        return 'auditoria_pgr'
+    return 'auditoria_doc_empresa'
+
+
+def select_pages(pdf_bytes: bytes, profile: str, max_pages: int = None,
+                 max_bytes: int = DEFAULT_MAX_BYTES) -> PageSelection | None:
+    """
+    Reduz o PDF às páginas mais relevantes para o perfil.
+
+    Returns:
+        PageSelection, ou None quando o documento deve ser enviado inteiro
+        (já cabe no orçamento, sem camada de texto, perfil desconhecido ou erro).
+    """
+    if not PAGE_SELECTION_ENABLED or PdfReader is None or profile not in PAGE_PROFILES:
+        return None
+
+    config = PAGE_PROFILES[profile]
+    max_pages = max_pages or config['max_pages']
+
+    try:
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        total_pages = len(reader.pages)
+        if total_pages <= max_pages and len(pdf_bytes) <= max_bytes:
+            return None
+
+        texts = [(page.extract_text() or "") for page in reader.pages]
+        if sum(len(t.strip()) for t in texts) < 50 * total_pages:
+            # Documento escaneado: sem texto para pontuar
+            return None
+
+        scores = {i: _score_page(text, config['keywords']) for i, text in enumerate(texts)}
+        scores[0] += 5
+        scores[total_pages - 1] += 3
+        # Páginas sem nenhum termo da tarefa ficam só no resumo
+        ranked = sorted((i for i in scores if scores[i] > 0), key=lambda i: (-scores[i], i))
+
+        selected, writer_bytes = [], b""
+        for page_index in ranked:
+            if len(selected) >= max_pages:
+                break
+            candidate = sorted(selected + [page_index])
+            candidate_bytes = _write_pages(reader, candidate)
+            if len(candidate_bytes) > max_bytes:
+                if selected:
+                    continue
+                return None
+            selected, writer_bytes = candidate, candidate_bytes
+
+        digest_parts, digest_size = [], 0
+        for i, text in enumerate(texts):
+            if i in selected or not text.strip():
+                continue
+            snippet = " ".join(text.split())[:DIGEST_CHARS_PER_PAGE]
+            if digest_size + len(snippet) > DIGEST_MAX_CHARS:
+                break
+            digest_parts.append(f"[página {i + 1}] {snippet}")
+            digest_size += len(snippet)
+
+        logger.info(
+            f"Seleção de páginas ({profile}): {len(selected)}/{total_pages} páginas, "
+            f"{len(writer_bytes) // 1024}KB de {len(pdf_bytes) // 1024}KB"
+        )
+        return PageSelection(writer_bytes, [i + 1 for i in selected], total_pages, "\n".join(digest_parts))
+    except Exception as e:
+        logger.warning(f"Falha na seleção de páginas ({profile}), enviando documento inteiro: {e}")
+        return None
+
+
+def _write_pages(reader, page_indexes: list) -> bytes:
+    writer = PdfWriter()
+    for i in page_indexes:
+        writer.add_page(reader.pages[i])
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def describe_selection(selection: PageSelection) -> str:
+    """Nota para o prompt sobre as páginas enviadas e o resumo das demais."""
+    pages = ", ".join(str(p) for p in selection.pages)
+    note = (
+        f"\n\nOBSERVAÇÃO: o PDF anexo contém apenas as páginas {pages} de um documento com "
+        f"{selection.total_pages} páginas, selecionadas por relevância. As demais páginas não foram "
+        f"enviadas: NÃO conclua que um item exigido está ausente só porque não aparece no PDF anexo "
+        f"nem nos trechos de contexto. Itens que não puder verificar devem ser registrados como ressalva "
+        f"(\"não verificado nas páginas enviadas\"), nunca como não conformidade."
+    )
+    if selection.digest:
+        note += f" Trechos das demais páginas, para contexto:\n{selection.digest}"
+    return note
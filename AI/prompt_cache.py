@@ -0,0 +1,122 @@
+import os
+import time
+import threading
+import logging
+from datetime import timedelta
+import google.generativeai as genai
+from google.generativeai import caching
+from AI.api_load import use_api_key, register_model_handle, bind_model_client
+from AI.response_cache import hash_text
+
+logger = logging.getLogger('segsisone_app.prompt_cache')
+
+DEFAULT_PREFIX_TTL = int(os.getenv("SEGSIS_PROMPT_CACHE_TTL", "3600"))
+PREFIX_CACHE_ENABLED = os.getenv("SEGSIS_PROMPT_CACHE", "1") == "1"
+# Renova o contexto antes de expirar no servidor
+REFRESH_MARGIN_SECONDS = 120
+# Após uma falha (ex.: prefixo abaixo do mínimo de tokens), não tenta de novo por este tempo
+FAILURE_BACKOFF_SECONDS = 3600
+
+
+class PromptPrefixCache:
+    """
+    Prefixos de prompt estáveis registrados como contexto em cache do Gemini
+    (CachedContent), para que cada chamada envie só o sufixo variável.
+
+    A chave é (chave de API, modelo, hash do texto do prefixo): qualquer
+    mudança no texto (versão do prompt, base RAG) registra um novo contexto,
+    e o anterior é removido.
+    """
+
+    def __init__(self, ttl_seconds: int = DEFAULT_PREFIX_TTL):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}
+        self._failures = {}
+        self._lock = threading.Lock()
+        self._metrics = {'hits': 0, 'created': 0, 'failures': 0}
+
+    def get_model(self, api_key: str, model_name: str, prefix: str, label: str = "prefixo"):
+        """
+        Retorna um GenerativeModel ligado ao contexto em cache do prefixo, ou
+        None se o cache de contexto não estiver disponível (o chamador deve
+        enviar o prefixo inline).
+        """
+        if not PREFIX_CACHE_ENABLED or not api_key:
+            return None
+
+        key = (api_key, model_name, hash_text(prefix))
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and now < entry['expires_at'] - REFRESH_MARGIN_SECONDS:
+                self._metrics['hits'] += 1
+                return entry['model']
+            if now - self._failures.get(key, 0) < FAILURE_BACKOFF_SECONDS:
+                return None
+            stale = self._drop_superseded(api_key, model_name, label)
+
+        for cached in stale:
+            self._delete(api_key, cached)
+
+        try:
+            with use_api_key(api_key):
+                cached = caching.CachedContent.create(
+                    model=model_name,
+                    display_name=f"segsis-{label}"[:120],
+                    system_instruction=prefix,
+                    ttl=timedelta(seconds=self.ttl_seconds)
+                )
+                # O contexto pertence ao projeto da chave: o handle usa a mesma
+                model = bind_model_client(genai.GenerativeModel.from_cached_content(cached_content=cached))
+        except Exception as e:
+            logger.warning(f"Contexto em cache indisponível para {label} ({model_name}): {e}")
+            with self._lock:
+                self._failures[key] = now
+                self._metrics['failures'] += 1
+            return None
+
+        register_model_handle(api_key, f"{model_name}@{cached.name}", model)
+        with self._lock:
+            self._entries[key] = {
+                'model': model, 'cached': cached, 'label': label,
+                'expires_at': now + self.ttl_seconds
+            }
+            self._metrics['created'] += 1
+        logger.info(f"Contexto em cache {cached.name} registrado para {label} ({model_name})")
+        return model
+
+    def _drop_superseded(self, api_key, model_name, label):
+        """Remove entradas do mesmo rótulo com outro prefixo. Deve ser chamado com o lock."""
+        stale = []
+        for key, entry in list(self._entries.items()):
+            if key[0] == api_key and key[1] == model_name and entry['label'] == label:
+                stale.append(self._entries.pop(key)['cached'])
+        return stale
+
+    @staticmethod
+    def _delete(api_key, cached):
+        try:
+            with use_api_key(api_key):
+                cached.delete()
+        except Exception as e:
+            logger.debug(f"Falha ao remover contexto em cache {getattr(cached, 'name', '?')}: {e}")
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['entries'] = len(self._entries)
+        return metrics
+
+
+_prefix_cache = None
+_prefix_cache_lock = threading.Lock()
+
+
+def get_prompt_prefix_cache() -> PromptPrefixCache:
+    """Retorna o cache de prefixos de prompt do processo."""
+    global _prefix_cache
+    if _prefix_cache is None:
+        with _prefix_cache_lock:
+            if _prefix_cache is None:
+                _prefix_cache = PromptPrefixCache()
+    return _prefix_cache
@@ -0,0 +1,356 @@
+"""
+Backends de estado para o RateLimiter.
+
+- MemoryRateLimitBackend: janelas deslizantes em memória (um processo)
+- SQLiteRateLimitBackend: contadores em um arquivo SQLite compartilhado
+  pelos processos do mesmo host
+- PostgresRateLimitBackend: contadores no banco da aplicação, compartilhados
+  por todas as réplicas
+
+Os backends persistentes guardam contadores por janela, o que permite
+verificar e reservar com um único upsert atômico. O limite por minuto usa a
+aproximação de janela deslizante: o minuto anterior entra com peso
+proporcional ao que ainda resta dele na janela dos últimos 60s, então não há
+rajada de 2×RPM na virada do minuto. O limite diário é por dia corrente (UTC).
+
+Todos implementam:
+    try_acquire(limiter, user_id, rpm, rpd) -> (permitido, espera_s, usadas_min, usadas_dia)
+    usage(limiter, user_id, rpm, rpd) -> (espera_s, usadas_min, usadas_dia)
+"""
+import os
+import math
+import time
+import sqlite3
+import threading
+import logging
+from collections import defaultdict, deque
+
+logger = logging.getLogger('segsisone_app.rate_limit_backends')
+
+MINUTE_WINDOW = 60
+DAY_WINDOW = 24 * 3600
+
+
+def _window_starts(now: float) -> tuple[int, int]:
+    return int(now // MINUTE_WINDOW) * MINUTE_WINDOW, int(now // DAY_WINDOW) * DAY_WINDOW
+
+
+def _previous_weight(now: float, minute_start: int) -> float:
+    """Fração do minuto anterior que ainda está dentro dos últimos 60s."""
+    return max(0.0, (minute_start + MINUTE_WINDOW - now) / MINUTE_WINDOW)
+
+
+def _sliding_minute_count(now, minute_start, previous_count, minute_count) -> int:
+    """Chamadas estimadas nos últimos 60s (arredondadas para cima)."""
+    return math.ceil(previous_count * _previous_weight(now, minute_start) + minute_count - 1e-9)
+
+
+def _sliding_minute_wait(now, minute_start, previous_count, minute_count, rpm) -> float:
+    """Segundos até a estimativa dos últimos 60s ficar abaixo de rpm."""
+    if previous_count * _previous_weight(now, minute_start) + minute_count < rpm:
+        return 0.0
+    if minute_count < rpm:
+        # Espera o minuto anterior pesar menos que as vagas que sobram no atual
+        elapsed = MINUTE_WINDOW * (1 - (rpm - minute_count) / previous_count)
+        return max(0.0, minute_start + elapsed - now)
+    # O minuto atual já está cheio: no próximo ele vira o anterior
+    next_start = minute_start + MINUTE_WINDOW
+    return next_start - now + MINUTE_WINDOW * max(0.0, 1 - rpm / minute_count)
+
+
+def _window_wait(now, minute_start, day_start, previous_count, minute_count, day_count, rpm, rpd) -> float:
+    wait = _sliding_minute_wait(now, minute_start, previous_count, minute_count, rpm)
+    if day_count >= rpd:
+        wait = max(wait, day_start + DAY_WINDOW - now)
+    return max(0.0, wait)
+
+
+class MemoryRateLimitBackend:
+    """
+    Janelas deslizantes em deques por usuário: chamadas antigas saem pela
+    esquerda, então cada verificação custa O(1) amortizado. Usuários sem
+    chamadas no último dia são removidos periodicamente.
+
+    Args:
+        clock: Função que retorna o horário atual em segundos (testes injetam um relógio falso).
+    """
+
+    # Intervalo entre varreduras de usuários inativos
+    EVICTION_INTERVAL = 600
+
+    def __init__(self, clock=time.time):
+        self.minute_calls = defaultdict(deque)
+        self.day_calls = defaultdict(deque)
+        self.lock = threading.Lock()
+        self._clock = clock
+        self._last_eviction = clock()
+
+    def _prune(self, key, now):
+        minute = self.minute_calls[key]
+        while minute and minute[0] <= now - MINUTE_WINDOW:
+            minute.popleft()
+        day = self.day_calls[key]
+        while day and day[0] <= now - DAY_WINDOW:
+            day.popleft()
+        return minute, day
+
+    def _evict_idle_users(self, now):
+        if now - self._last_eviction < self.EVICTION_INTERVAL:
+            return
+        self._last_eviction = now
+        for key in list(self.day_calls):
+            _, day = self._prune(key, now)
+            if not day:
+                self.day_calls.pop(key, None)
+                self.minute_calls.pop(key, None)
+
+    @staticmethod
+    def _wait_seconds(minute, day, now, rpm, rpd):
+        wait = 0.0
+        if len(minute) >= rpm:
+            wait = max(wait, minute[len(minute) - rpm] + MINUTE_WINDOW - now)
+        if len(day) >= rpd:
+            wait = max(wait, day[len(day) - rpd] + DAY_WINDOW - now)
+        return max(0.0, wait)
+
+    def try_acquire(self, limiter, user_id, rpm, rpd):
+        key = (limiter, user_id)
+        with self.lock:
+            now = self._clock()
+            self._evict_idle_users(now)
+            minute, day = self._prune(key, now)
+            allowed = len(minute) < rpm and len(day) < rpd
+            if allowed:
+                minute.append(now)
+                day.append(now)
+            return allowed, self._wait_seconds(minute, day, now, rpm, rpd), len(minute), len(day)
+
+    def usage(self, limiter, user_id, rpm, rpd):
+        key = (limiter, user_id)
+        with self.lock:
+            now = self._clock()
+            minute, day = self._prune(key, now)
+            return self._wait_seconds(minute, day, now, rpm, rpd), len(minute), len(day)
+
+
+class SQLiteRateLimitBackend:
+    """
+    Contadores em SQLite compartilhados entre processos do host: minuto atual
+    e anterior (janela deslizante aproximada) e dia corrente.
+    """
+
+    def __init__(self, db_path: str, clock=time.time):
+        self.db_path = db_path
+        self._clock = clock
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ai_rate_limits (
+                    limiter TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    minute_start INTEGER NOT NULL,
+                    minute_count INTEGER NOT NULL,
+                    prev_minute_count INTEGER NOT NULL DEFAULT 0,
+                    day_start INTEGER NOT NULL,
+                    day_count INTEGER NOT NULL,
+                    PRIMARY KEY (limiter, user_id)
+                )
+            """)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(ai_rate_limits)")}
+            if 'prev_minute_count' not in columns:
+                conn.execute("ALTER TABLE ai_rate_limits ADD COLUMN prev_minute_count INTEGER NOT NULL DEFAULT 0")
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+
+    def try_acquire(self, limiter, user_id, rpm, rpd):
+        now = self._clock()
+        minute_start, day_start = _window_starts(now)
+        params = {
+            'limiter': limiter, 'user_id': user_id, 'ms': minute_start, 'pms': minute_start - MINUTE_WINDOW,
+            'ds': day_start, 'w': _previous_weight(now, minute_start), 'rpm': rpm, 'rpd': rpd
+        }
+        with self._connect() as conn:
+            # As expressões do SET e do WHERE leem a linha antes da alteração
+            row = conn.execute("""
+                INSERT INTO ai_rate_limits (limiter, user_id, minute_start, minute_count, prev_minute_count,
+                                            day_start, day_count)
+                VALUES (:limiter, :user_id, :ms, 1, 0, :ds, 1)
+                ON CONFLICT (limiter, user_id) DO UPDATE SET
+                    prev_minute_count = CASE WHEN minute_start = :ms THEN prev_minute_count
+                                             WHEN minute_start = :pms THEN minute_count ELSE 0 END,
+                    minute_count = CASE WHEN minute_start = :ms THEN minute_count + 1 ELSE 1 END,
+                    day_count = CASE WHEN day_start = :ds THEN day_count + 1 ELSE 1 END,
+                    minute_start = :ms,
+                    day_start = :ds
+                WHERE (CASE WHEN minute_start = :ms THEN prev_minute_count
+                            WHEN minute_start = :pms THEN minute_count ELSE 0 END) * :w
+                      + (CASE WHEN minute_start = :ms THEN minute_count ELSE 0 END) < :rpm
+                  AND (day_start <> :ds OR day_count < :rpd)
+                RETURNING prev_minute_count, minute_count, day_count
+            """, params).fetchone()
+            if row:
+                previous_count, minute_count, day_count = row
+                allowed = True
+            else:
+                # Negado: nenhuma linha alterada, lê os contadores atuais
+                previous_count, minute_count, day_count = self._read(conn, limiter, user_id, minute_start, day_start)
+                allowed = False
+        wait = _window_wait(now, minute_start, day_start, previous_count, minute_count, day_count, rpm, rpd)
+        return allowed, wait, _sliding_minute_count(now, minute_start, previous_count, minute_count), day_count
+
+    @staticmethod
+    def _read(conn, limiter, user_id, minute_start, day_start):
+        """(minuto anterior, minuto atual, dia) vistos a partir da janela de minute_start."""
+        row = conn.execute(
+            "SELECT minute_start, minute_count, prev_minute_count, day_start, day_count FROM ai_rate_limits "
+            "WHERE limiter = ? AND user_id = ?",
+            (limiter, user_id)
+        ).fetchone()
+        if not row:
+            return 0, 0, 0
+        stored_start, stored_count, stored_previous, stored_day_start, stored_day_count = row
+        if stored_start == minute_start:
+            previous_count, minute_count = stored_previous, stored_count
+        elif stored_start == minute_start - MINUTE_WINDOW:
+            previous_count, minute_count = stored_count, 0
+        else:
+            previous_count, minute_count = 0, 0
+        day_count = stored_day_count if stored_day_start == day_start else 0
+        return previous_count, minute_count, day_count
+
+    def usage(self, limiter, user_id, rpm, rpd):
+        now = self._clock()
+        minute_start, day_start = _window_starts(now)
+        with self._connect() as conn:
+            previous_count, minute_count, day_count = self._read(conn, limiter, user_id, minute_start, day_start)
+        wait = _window_wait(now, minute_start, day_start, previous_count, minute_count, day_count, rpm, rpd)
+        return wait, _sliding_minute_count(now, minute_start, previous_count, minute_count), day_count
+
+
+class PostgresRateLimitBackend:
+    """
+    Contadores no PostgreSQL da aplicação (minuto atual e anterior, dia
+    corrente). Cada verificação é um único comando: o upsert condicional
+    reserva a chamada e, quando negado, o mesmo comando devolve os contadores atuais.
+    """
+
+    _ACQUIRE_SQL = """
+        WITH up AS (
+            INSERT INTO ai_rate_limits AS r (limiter, user_id, minute_start, minute_count, prev_minute_count,
+                                             day_start, day_count)
+            VALUES (:limiter, :user_id, :ms, 1, 0, :ds, 1)
+            ON CONFLICT (limiter, user_id) DO UPDATE SET
+                prev_minute_count = CASE WHEN r.minute_start = EXCLUDED.minute_start THEN r.prev_minute_count
+                                         WHEN r.minute_start = :pms THEN r.minute_count ELSE 0 END,
+                minute_count = CASE WHEN r.minute_start = EXCLUDED.minute_start THEN r.minute_count + 1 ELSE 1 END,
+                day_count = CASE WHEN r.day_start = EXCLUDED.day_start THEN r.day_count + 1 ELSE 1 END,
+                minute_start = EXCLUDED.minute_start,
+                day_start = EXCLUDED.day_start
+            WHERE (CASE WHEN r.minute_start = EXCLUDED.minute_start THEN r.prev_minute_count
+                        WHEN r.minute_start = :pms THEN r.minute_count ELSE 0 END) * :w
+                  + (CASE WHEN r.minute_start = EXCLUDED.minute_start THEN r.minute_count ELSE 0 END) < :rpm
+              AND (r.day_start <> EXCLUDED.day_start OR r.day_count < :rpd)
+            RETURNING prev_minute_count, minute_count, day_count
+        )
+        SELECT TRUE AS allowed, prev_minute_count, minute_count, day_count FROM up
+        UNION ALL
+        SELECT FALSE,
+               CASE WHEN minute_start = :ms THEN prev_minute_count
+                    WHEN minute_start = :pms THEN minute_count ELSE 0 END,
+               CASE WHEN minute_start = :ms THEN minute_count ELSE 0 END,
+               CASE WHEN day_start = :ds THEN day_count ELSE 0 END
+        FROM ai_rate_limits
+        WHERE limiter = :limiter AND user_id = :user_id AND NOT EXISTS (SELECT 1 FROM up)
+    """
+
+    def __init__(self, engine=None):
+        from sqlalchemy import text
+        self._text = text
+        if engine is None:
+            from managers.supabase_config import get_database_engine
+            engine = get_database_engine()
+        self.engine = engine
+        with self.engine.begin() as conn:
+            conn.execute(text("""
+                CREATE TABLE IF NOT EXISTS ai_rate_limits (
+                    limiter TEXT NOT NULL,
+                    user_id TEXT NOT NULL,
+                    minute_start BIGINT NOT NULL,
+                    minute_count INTEGER NOT NULL,
+                    prev_minute_count INTEGER NOT NULL DEFAULT 0,
+                    day_start BIGINT NOT NULL,
+                    day_count INTEGER NOT NULL,
+                    PRIMARY KEY (limiter, user_id)
+                )
+            """))
+            conn.execute(text(
+                "ALTER TABLE ai_rate_limits ADD COLUMN IF NOT EXISTS prev_minute_count INTEGER NOT NULL DEFAULT 0"
+            ))
+
+    def try_acquire(self, limiter, user_id, rpm, rpd):
+        now = time.time()
+        minute_start, day_start = _window_starts(now)
+        params = {
+            'limiter': limiter, 'user_id': user_id, 'ms': minute_start, 'pms': minute_start - MINUTE_WINDOW,
+            'ds': day_start, 'w': _previous_weight(now, minute_start), 'rpm': rpm, 'rpd': rpd
+        }
+        with self.engine.begin() as conn:
+            row = conn.execute(self._text(self._ACQUIRE_SQL), params).fetchone()
+        if row is None:
+            allowed, previous_count, minute_count, day_count = False, 0, 0, 0
+        else:
+            allowed, previous_count, minute_count, day_count = bool(row[0]), row[1], row[2], row[3]
+        wait = _window_wait(now, minute_start, day_start, previous_count, minute_count, day_count, rpm, rpd)
+        return allowed, wait, _sliding_minute_count(now, minute_start, previous_count, minute_count), day_count
+
+    def usage(self, limiter, user_id, rpm, rpd):
+        now = time.time()
+        minute_start, day_start = _window_starts(now)
+        with self.engine.connect() as conn:
+            row = conn.execute(self._text("""
+                SELECT CASE WHEN minute_start = :ms THEN prev_minute_count
+                            WHEN minute_start = :pms THEN minute_count ELSE 0 END,
+                       CASE WHEN minute_start = :ms THEN minute_count ELSE 0 END,
+                       CASE WHEN day_start = :ds THEN day_count ELSE 0 END
+                FROM ai_rate_limits WHERE limiter = :limiter AND user_id = :user_id
+            """), {'limiter': limiter, 'user_id': user_id, 'ms': minute_start,
+                   'pms': minute_start - MINUTE_WINDOW, 'ds': day_start}).fetchone()
+        previous_count, minute_count, day_count = (row[0], row[1], row[2]) if row else (0, 0, 0)
+        wait = _window_wait(now, minute_start, day_start, previous_count, minute_count, day_count, rpm, rpd)
+        return wait, _sliding_minute_count(now, minute_start, previous_count, minute_count), day_count
+
+
+_default_backend = None
+_default_backend_lock = threading.Lock()
+
+
+def create_backend(kind: str = None):
+    """
+    Cria o backend configurado em SEGSIS_RATE_LIMIT_BACKEND
+    ('memory' - padrão, 'sqlite' ou 'postgres'). Em caso de falha ao
+    inicializar um backend persistente, volta para memória.
+
+    O limite por minuto é deslizante nos três: exato em memória e aproximado
+    (peso do minuto anterior) nos persistentes. O limite diário é deslizante
+    em memória e por dia corrente (UTC) no SQLite e no Postgres.
+    """
+    kind = (kind or os.getenv("SEGSIS_RATE_LIMIT_BACKEND", "memory")).lower()
+    try:
+        if kind == 'sqlite':
+            return SQLiteRateLimitBackend(os.getenv("SEGSIS_RATE_LIMIT_DB", "ai_rate_limits.db"))
+        if kind == 'postgres':
+            return PostgresRateLimitBackend()
+    except Exception as e:
+        logger.error(f"Falha ao inicializar backend de rate limit '{kind}', usando memória: {e}")
+    return MemoryRateLimitBackend()
+
+
+def get_default_backend():
+    """Backend compartilhado pelos RateLimiters do processo."""
+    global _default_backend
+    if _default_backend is None:
+        with _default_backend_lock:
+            if _default_backend is None:
+                _default_backend = create_backend()
+    return _default_backend
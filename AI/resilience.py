@@ -0,0 +1,334 @@
+import os
+import time
+import random
+import threading
+import logging
+from collections import deque
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from AI.model_executor import get_model_executor, ModelCallTimeoutError, ExecutorSaturatedError
+
+logger = logging.getLogger('segsisone_app.resilience')
+
+MAX_ATTEMPTS = int(os.getenv("SEGSIS_AI_MAX_ATTEMPTS", "3"))
+BACKOFF_BASE_SECONDS = float(os.getenv("SEGSIS_AI_BACKOFF_BASE", "1.0"))
+BACKOFF_CAP_SECONDS = float(os.getenv("SEGSIS_AI_BACKOFF_CAP", "20.0"))
+# Erros de cota (429) esperam mais antes de nova tentativa
+QUOTA_BACKOFF_SECONDS = 15.0
+# Fração de novas tentativas em relação às chamadas bem-sucedidas (orçamento de retry)
+RETRY_BUDGET_RATIO = float(os.getenv("SEGSIS_AI_RETRY_BUDGET_RATIO", "0.2"))
+RETRY_BUDGET_MIN_TOKENS = 10
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("SEGSIS_AI_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("SEGSIS_AI_BREAKER_RESET", "30"))
+# Requisição de reserva (hedge) quando a chamada passa do percentil de latência
+HEDGING_ENABLED = os.getenv("SEGSIS_AI_HEDGING", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("SEGSIS_AI_HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+# Nomes das exceções do google.api_core e do transporte HTTP que indicam falha transitória
+_RETRYABLE_NAMES = {
+    'ServiceUnavailable', 'InternalServerError', 'DeadlineExceeded', 'GatewayTimeout',
+    'TooManyRequests', 'ResourceExhausted', 'Aborted', 'Unknown',
+    'ConnectionError', 'ConnectTimeout', 'ReadTimeout', 'ChunkedEncodingError', 'RemoteDisconnected',
+}
+_QUOTA_NAMES = {'TooManyRequests', 'ResourceExhausted'}
+_RETRYABLE_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """O circuito do modelo está aberto: chamadas recusadas até o fim da pausa."""
+
+
+def classify_error(exc: Exception) -> str:
+    """
+    Classifica a falha de uma chamada ao modelo.
+
+    Returns:
+        'quota' (429), 'transient' (vale nova tentativa) ou 'fatal'.
+    """
+    if isinstance(exc, ExecutorSaturatedError):
+        # Backpressure local: nova tentativa só pioraria a fila
+        return 'fatal'
+    if isinstance(exc, (ModelCallTimeoutError, TimeoutError, ConnectionError)):
+        return 'transient'
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    if names & _QUOTA_NAMES or getattr(exc, 'code', None) == 429:
+        return 'quota'
+    if names & _RETRYABLE_NAMES or getattr(exc, 'code', None) in _RETRYABLE_CODES:
+        return 'transient'
+    return 'fatal'
+
+
+def backoff_delay(attempt: int, kind: str = 'transient') -> float:
+    """Backoff exponencial com jitter (attempt começa em 0)."""
+    base = QUOTA_BACKOFF_SECONDS if kind == 'quota' else BACKOFF_BASE_SECONDS
+    ceiling = min(BACKOFF_CAP_SECONDS, base * (2 ** attempt))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+class CircuitBreaker:
+    """
+    Circuito por modelo: após failure_threshold falhas transitórias seguidas
+    abre e recusa chamadas por reset_seconds; depois deixa passar uma chamada
+    de teste (meio-aberto) e fecha no primeiro sucesso.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'fechado', 'aberto', 'meio-aberto'
+
+    def __init__(self, name: str, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def release(self):
+        """Libera a vaga de teste sem alterar o estado (a chamada não chegou ao modelo)."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuito de {self.name} aberto após {self._failures} falhas")
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+class RetryBudget:
+    """
+    Limita as novas tentativas a uma fração das chamadas bem-sucedidas, para
+    que retries não consumam a cota dos modelos durante uma instabilidade.
+    """
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, min_tokens: int = RETRY_BUDGET_MIN_TOKENS):
+        self.ratio = ratio
+        self.max_tokens = max(min_tokens, 1)
+        self._tokens = float(self.max_tokens)
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class LatencyTracker:
+    """Latências recentes das chamadas bem-sucedidas de um modelo."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float, min_samples: int = HEDGE_MIN_SAMPLES) -> float | None:
+        with self._lock:
+            if len(self._samples) < min_samples:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)]
+
+
+class ResilientCaller:
+    """
+    Camada de resiliência sobre o ModelExecutor.
+
+    - Falhas transitórias (5xx, timeout, conexão) e de cota (429) têm novas
+      tentativas com backoff exponencial e jitter, dentro do orçamento de
+      retry, da cota do plano do usuário (reserve) e do timeout total da
+      chamada.
+    - Com SEGSIS_AI_HEDGING=1, uma chamada que passa do percentil de
+      latência do modelo ganha uma requisição de reserva; vale a primeira
+      resposta. Só é usado quando o executor tem vaga livre e a cota do
+      plano permite mais uma requisição.
+    - O circuito por modelo recusa chamadas (CircuitOpenError) durante
+      quedas, em vez de cada usuário esperar o timeout. Erros de cota (429)
+      não contam como falha do circuito: são do usuário/projeto, não do
+      serviço.
+    """
+
+    def __init__(self, max_attempts: int = MAX_ATTEMPTS, hedging: bool = HEDGING_ENABLED):
+        self.max_attempts = max(1, max_attempts)
+        self.hedging = hedging
+        self._breakers = {}
+        self._latency = {}
+        self._budget = RetryBudget()
+        self._hedge_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="gemini-hedge")
+        self._lock = threading.Lock()
+        self._metrics = {'retries': 0, 'retry_budget_exhausted': 0, 'retry_rate_limited': 0,
+                         'hedges': 0, 'hedge_wins': 0, 'hedge_rate_limited': 0, 'circuit_rejections': 0}
+
+    def breaker(self, model_key: str) -> CircuitBreaker:
+        with self._lock:
+            if model_key not in self._breakers:
+                self._breakers[model_key] = CircuitBreaker(model_key)
+                self._latency[model_key] = LatencyTracker()
+            return self._breakers[model_key]
+
+    def _count(self, metric: str):
+        with self._lock:
+            self._metrics[metric] += 1
+
+    def run(self, model_key: str, fn, timeout: float, hedge: bool = True, pass_hedge: bool = False,
+            reserve=None):
+        """
+        Executa fn(timeout) pelo executor de modelos com novas tentativas,
+        hedge e circuito.
+
+        Args:
+            hedge: Permite a requisição de reserva (desligar quando fn tem
+                efeitos colaterais, como o streaming de progresso).
+            pass_hedge: Chama fn(timeout, hedge=bool), indicando se a
+                requisição é a reserva do hedge (para a telemetria).
+            reserve: Função sem argumentos que reserva mais uma requisição
+                na cota do plano (RateLimiter.try_acquire) e retorna se foi
+                permitida. É chamada antes de cada nova tentativa e de cada
+                reserva do hedge; a primeira requisição já foi contabilizada
+                pelo chamador.
+
+        Raises:
+            CircuitOpenError: o circuito do modelo está aberto
+            A exceção da última tentativa, se todas falharem.
+        """
+        breaker = self.breaker(model_key)
+        latency = self._latency[model_key]
+        deadline = time.monotonic() + timeout
+
+        for attempt in range(self.max_attempts):
+            if not breaker.allow():
+                self._count('circuit_rejections')
+                raise CircuitOpenError(model_key)
+
+            remaining = max(deadline - time.monotonic(), 1.0)
+            start = time.monotonic()
+            try:
+                if hedge and self.hedging:
+                    result = self._run_hedged(model_key, fn, remaining, latency, pass_hedge, reserve)
+                else:
+                    primary = partial(fn, hedge=False) if pass_hedge else fn
+                    result = get_model_executor().run(model_key, primary, timeout=remaining)
+            except Exception as e:
+                kind = classify_error(e)
+                if kind == 'fatal':
+                    # Erro do pedido (não do serviço): o modelo respondeu
+                    if isinstance(e, ExecutorSaturatedError):
+                        breaker.release()
+                    else:
+                        breaker.record_success()
+                    raise
+                if kind == 'quota':
+                    # Cota esgotada não é queda do serviço: não abre o circuito de todos
+                    breaker.release()
+                else:
+                    breaker.record_failure()
+
+                delay = backoff_delay(attempt, kind)
+                if attempt + 1 >= self.max_attempts or time.monotonic() + delay >= deadline:
+                    raise
+                if not self._budget.withdraw():
+                    self._count('retry_budget_exhausted')
+                    raise
+                if reserve is not None and not reserve():
+                    self._count('retry_rate_limited')
+                    raise
+                self._count('retries')
+                logger.warning(
+                    f"Falha {kind} em {model_key} (tentativa {attempt + 1}/{self.max_attempts}): "
+                    f"{type(e).__name__}: {e}. Nova tentativa em {delay:.1f}s"
+                )
+                time.sleep(delay)
+                continue
+
+            breaker.record_success()
+            latency.add(time.monotonic() - start)
+            self._budget.deposit()
+            return result
+
+    def _run_hedged(self, model_key, fn, timeout, latency: LatencyTracker, pass_hedge: bool = False,
+                    reserve=None):
+        executor = get_model_executor()
+        threshold = latency.percentile(HEDGE_PERCENTILE)
+        primary_fn, backup_fn = (partial(fn, hedge=False), partial(fn, hedge=True)) if pass_hedge else (fn, fn)
+        primary = self._hedge_pool.submit(executor.run, model_key, primary_fn, timeout)
+        if threshold is None or threshold >= timeout:
+            return primary.result()
+
+        done, _ = wait([primary], timeout=threshold)
+        if done or not executor.has_capacity(model_key):
+            return primary.result()
+        if reserve is not None and not reserve():
+            self._count('hedge_rate_limited')
+            return primary.result()
+
+        self._count('hedges')
+        logger.info(f"Chamada a {model_key} passou de {threshold:.1f}s (p{HEDGE_PERCENTILE:.0f}); enviando reserva")
+        backup = self._hedge_pool.submit(executor.run, model_key, backup_fn, max(timeout - threshold, 1.0))
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is backup:
+                        self._count('hedge_wins')
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+            breakers = dict(self._breakers)
+            latency = dict(self._latency)
+        metrics['circuits'] = {key: breaker.state for key, breaker in breakers.items()}
+        metrics['p95_seconds'] = {key: tracker.percentile(95, min_samples=1) for key, tracker in latency.items()}
+        return metrics
+
+
+_resilient_caller = None
+_resilient_caller_lock = threading.Lock()
+
+
+def get_resilient_caller() -> ResilientCaller:
+    """Retorna a camada de resiliência das chamadas aos modelos do processo."""
+    global _resilient_caller
+    if _resilient_caller is None:
+        with _resilient_caller_lock:
+            if _resilient_caller is None:
+                _resilient_caller = ResilientCaller()
+    return _resilient_caller
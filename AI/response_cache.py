@@ -0,0 +1,210 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger('segsisone_app.response_cache')
+
+DEFAULT_DB_PATH = os.getenv("SEGSIS_AI_CACHE_DB", "ai_response_cache.db")
+DEFAULT_TTL_SECONDS = int(os.getenv("SEGSIS_AI_CACHE_TTL", str(30 * 24 * 3600)))
+DEFAULT_MEMORY_ENTRIES = 256
+DEFAULT_MAX_DISK_ENTRIES = 20000
+
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def hash_text(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def hash_pdf_files(pdf_files) -> str:
+    """
+    Hash combinado dos PDFs de uma chamada. Aceita caminhos ou objetos de
+    arquivo (UploadedFile/StoredUpload), como PDFQA.answer_question.
+    """
+    hashes = []
+    for pdf_file in pdf_files:
+        if hasattr(pdf_file, 'getvalue'):
+            hashes.append(hash_bytes(pdf_file.getvalue()))
+        else:
+            with open(pdf_file, 'rb') as f:
+                hashes.append(hash_bytes(f.read()))
+    return hashlib.sha256("|".join(hashes).encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Cache endereçado por conteúdo para respostas do Gemini.
+
+    A chave combina o hash dos PDFs, o hash do prompt (qualquer alteração no
+    texto do prompt gera uma nova versão), o modelo e o tipo de tarefa.
+    Camadas:
+      - LRU em memória (por processo)
+      - SQLite local, com TTL e limite de entradas (as menos usadas saem primeiro)
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                 memory_entries: int = DEFAULT_MEMORY_ENTRIES, max_disk_entries: int = DEFAULT_MAX_DISK_ENTRIES):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.memory_entries = memory_entries
+        self.max_disk_entries = max_disk_entries
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+        try:
+            self._init_db()
+            self._disk_available = True
+        except sqlite3.Error as e:
+            logger.error(f"Cache persistente de respostas indisponível: {e}")
+            self._disk_available = False
+
+    @staticmethod
+    def make_key(file_hash: str, prompt: str, model_name: str, task_type: str) -> str:
+        return hashlib.sha256(
+            f"{file_hash}|{hash_text(prompt)}|{model_name}|{task_type}".encode('utf-8')
+        ).hexdigest()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ai_response_cache (
+                    cache_key TEXT PRIMARY KEY,
+                    model TEXT,
+                    task_type TEXT,
+                    response TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_ai_response_cache_access ON ai_response_cache (last_access)"
+            )
+
+    def _remember(self, key: str, response: str, created_at: float):
+        self._memory[key] = (response, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached and now - cached[1] < self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self._metrics['memory_hits'] += 1
+                return cached[0]
+            if cached:
+                del self._memory[key]
+
+        if self._disk_available:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        "SELECT response, created_at FROM ai_response_cache WHERE cache_key = ?", (key,)
+                    ).fetchone()
+                    if row and now - row[1] < self.ttl_seconds:
+                        conn.execute(
+                            "UPDATE ai_response_cache SET last_access = ? WHERE cache_key = ?", (now, key)
+                        )
+                        with self._lock:
+                            self._remember(key, row[0], row[1])
+                            self._metrics['disk_hits'] += 1
+                        return row[0]
+            except sqlite3.Error as e:
+                logger.warning(f"Falha ao ler o cache de respostas: {e}")
+
+        with self._lock:
+            self._metrics['misses'] += 1
+        return None
+
+    def set(self, key: str, response: str, model_name: str = None, task_type: str = None):
+        now = time.time()
+        with self._lock:
+            self._remember(key, response, now)
+            self._metrics['stores'] += 1
+
+        if not self._disk_available:
+            return
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    """
+                    INSERT OR REPLACE INTO ai_response_cache
+                        (cache_key, model, task_type, response, created_at, last_access)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    """,
+                    (key, model_name, task_type, response, now, now)
+                )
+                self._evict(conn, now)
+        except sqlite3.Error as e:
+            logger.warning(f"Falha ao gravar no cache de respostas: {e}")
+
+    def _evict(self, conn, now: float):
+        """Remove entradas expiradas e, acima do limite, as menos acessadas."""
+        expired = conn.execute(
+            "DELETE FROM ai_response_cache WHERE created_at < ?", (now - self.ttl_seconds,)
+        ).rowcount
+        overflow = conn.execute("SELECT COUNT(*) FROM ai_response_cache").fetchone()[0] - self.max_disk_entries
+        if overflow > 0:
+            conn.execute(
+                """
+                DELETE FROM ai_response_cache WHERE cache_key IN (
+                    SELECT cache_key FROM ai_response_cache ORDER BY last_access LIMIT ?
+                )
+                """,
+                (overflow,)
+            )
+        evicted = expired + max(overflow, 0)
+        if evicted:
+            with self._lock:
+                self._metrics['evictions'] += evicted
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self._disk_available:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM ai_response_cache")
+
+    def get_metrics(self) -> dict:
+        """Contadores de acertos/erros desde o início do processo e tamanho atual."""
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['memory_entries'] = len(self._memory)
+        metrics['disk_entries'] = 0
+        if self._disk_available:
+            try:
+                with self._connect() as conn:
+                    metrics['disk_entries'] = conn.execute("SELECT COUNT(*) FROM ai_response_cache").fetchone()[0]
+            except sqlite3.Error:
+                pass
+        lookups = metrics['memory_hits'] + metrics['disk_hits'] + metrics['misses']
+        metrics['hit_rate'] = (metrics['memory_hits'] + metrics['disk_hits']) / lookups if lookups else 0.0
+        return metrics
+
+
+_response_cache = None
+_response_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Retorna o cache de respostas do processo, criando-o no primeiro uso."""
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache()
+    return _response_cache
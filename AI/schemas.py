@@ -0,0 +1,328 @@
+"""
+Esquemas de resposta por tarefa de IA.
+
+Cada tarefa registra:
+  - o esquema enviado ao Gemini como restrição de saída (response_schema),
+    no subconjunto OpenAPI aceito pela API;
+  - a classe do resultado tipado.
+
+parse_structured valida a resposta de forma estrita e informa quais campos
+de primeiro nível falharam, para que só eles sejam pedidos de novo.
+"""
+import re
+import json
+from dataclasses import dataclass, field, fields, is_dataclass
+
+_DATE_PATTERN = re.compile(r'^\d{1,2}/\d{1,2}/\d{4}$')
+
+
+def _string(description: str = None, enum: list = None, nullable: bool = True) -> dict:
+    schema = {"type": "STRING", "nullable": nullable}
+    if description:
+        schema["description"] = description
+    if enum:
+        schema["enum"] = enum
+    return schema
+
+
+def _date(description: str) -> dict:
+    return {**_string(f"{description} Formato: DD/MM/AAAA."), "x-date": True}
+
+
+ASO_TYPES = ['Admissional', 'Periódico', 'Demissional', 'Mudança de Risco',
+             'Retorno ao Trabalho', 'Monitoramento Pontual']
+
+_POINT = {
+    "type": "OBJECT",
+    "properties": {
+        "item": _string(nullable=False),
+        "referencia_normativa": _string(),
+        "observacao": _string()
+    },
+    "required": ["item"]
+}
+
+SCHEMAS = {
+    'aso': {
+        "type": "OBJECT",
+        "properties": {
+            "data_aso": _date("Data de emissão ou realização do exame clínico."),
+            "vencimento_aso": _date("Data de vencimento explícita no ASO, se houver."),
+            "riscos": _string("Riscos ocupacionais listados, separados por vírgula."),
+            "cargo": _string("Cargo ou função do trabalhador."),
+            "tipo_aso": _string("Tipo de exame.", enum=ASO_TYPES),
+            "nome_funcionario": _string("Nome completo do trabalhador examinado.")
+        },
+        "required": ["data_aso", "tipo_aso"]
+    },
+    'treinamento': {
+        "type": "OBJECT",
+        "properties": {
+            "norma": _string("Norma do treinamento (ex: 'NR-10 SEP', 'NR-35').", nullable=False),
+            "modulo": _string("Módulo específico (ex: 'SEP', 'Básico') ou 'N/A'."),
+            "data_realizacao": _date("Data de realização do treinamento."),
+            "tipo_treinamento": _string(enum=['formação', 'reciclagem'], nullable=False),
+            "carga_horaria": {"type": "INTEGER", "nullable": True, "description": "Horas de treinamento."},
+            "nome_funcionario": _string("Nome completo do participante.")
+        },
+        "required": ["norma", "data_realizacao", "tipo_treinamento"]
+    },
+    'epi': {
+        "type": "OBJECT",
+        "properties": {
+            "nome_funcionario": _string("Nome do funcionário da ficha."),
+            "itens_epi": {
+                "type": "ARRAY",
+                "items": {
+                    "type": "OBJECT",
+                    "properties": {
+                        "item_numero": _string(),
+                        "descricao": _string(nullable=False),
+                        "data_entrega": _date("Data de entrega."),
+                        "ca": _string("Número do Certificado de Aprovação.")
+                    },
+                    "required": ["descricao"]
+                }
+            }
+        },
+        "required": ["nome_funcionario", "itens_epi"]
+    },
+    'auditoria': {
+        "type": "OBJECT",
+        "properties": {
+            "parecer_final": _string(enum=['Conforme', 'Não Conforme', 'Conforme com Ressalvas'], nullable=False),
+            "resumo_executivo": _string(nullable=False),
+            "pontos_de_nao_conformidade": {"type": "ARRAY", "items": _POINT},
+            "pontos_de_ressalva": {"type": "ARRAY", "items": _POINT}
+        },
+        "required": ["parecer_final", "resumo_executivo", "pontos_de_nao_conformidade"]
+    },
+    'matriz': {
+        "type": "ARRAY",
+        "items": {
+            "type": "OBJECT",
+            "properties": {
+                "funcao": _string(nullable=False),
+                "normas_obrigatorias": {"type": "ARRAY", "items": _string(nullable=False)}
+            },
+            "required": ["funcao", "normas_obrigatorias"]
+        }
+    },
+}
+
+
+@dataclass
+class AsoResult:
+    data_aso: str | None = None
+    vencimento_aso: str | None = None
+    riscos: str | None = None
+    cargo: str | None = None
+    tipo_aso: str | None = None
+    nome_funcionario: str | None = None
+
+
+@dataclass
+class TrainingResult:
+    norma: str | None = None
+    modulo: str | None = None
+    data_realizacao: str | None = None
+    tipo_treinamento: str | None = None
+    carga_horaria: int | None = None
+    nome_funcionario: str | None = None
+
+
+@dataclass
+class EpiItem:
+    item_numero: str | None = None
+    descricao: str | None = None
+    data_entrega: str | None = None
+    ca: str | None = None
+
+
+@dataclass
+class EpiResult:
+    nome_funcionario: str | None = None
+    itens_epi: list[EpiItem] = field(default_factory=list)
+
+
+@dataclass
+class AuditPoint:
+    item: str | None = None
+    referencia_normativa: str | None = None
+    observacao: str | None = None
+
+
+@dataclass
+class AuditResult:
+    parecer_final: str | None = None
+    resumo_executivo: str | None = None
+    pontos_de_nao_conformidade: list[AuditPoint] = field(default_factory=list)
+    pontos_de_ressalva: list[AuditPoint] = field(default_factory=list)
+
+
+@dataclass
+class MatrixRow:
+    funcao: str | None = None
+    normas_obrigatorias: list[str] = field(default_factory=list)
+
+
+RESULT_TYPES = {
+    'aso': AsoResult,
+    'treinamento': TrainingResult,
+    'epi': EpiResult,
+    'auditoria': AuditResult,
+    'matriz': MatrixRow,
+}
+
+# Tipo dos itens das listas de cada resultado
+_LIST_ITEM_TYPES = {
+    (EpiResult, 'itens_epi'): EpiItem,
+    (AuditResult, 'pontos_de_nao_conformidade'): AuditPoint,
+    (AuditResult, 'pontos_de_ressalva'): AuditPoint,
+}
+
+
+def get_schema(task: str, only_fields: list = None) -> dict:
+    """
+    Esquema da tarefa, opcionalmente restrito a alguns campos de primeiro
+    nível (usado para pedir de novo só os campos que falharam).
+    """
+    schema = SCHEMAS[task]
+    if only_fields and schema["type"] == "OBJECT":
+        schema = {
+            "type": "OBJECT",
+            "properties": {k: v for k, v in schema["properties"].items() if k in only_fields},
+            "required": [k for k in schema.get("required", []) if k in only_fields]
+        }
+    return _strip_private(schema)
+
+
+def _strip_private(schema):
+    """Remove as marcações internas (x-*) antes de enviar o esquema à API."""
+    if isinstance(schema, dict):
+        return {k: _strip_private(v) for k, v in schema.items() if not k.startswith('x-')}
+    if isinstance(schema, list):
+        return [_strip_private(v) for v in schema]
+    return schema
+
+
+def load_json_payload(text: str):
+    """JSON da resposta: direto (modo estruturado) ou o primeiro bloco {...}/[...]."""
+    if text is None:
+        return None
+    cleaned = text.strip()
+    if cleaned.startswith("```"):
+        cleaned = re.sub(r'^```(?:json)?\s*|\s*```$', '', cleaned)
+    try:
+        return json.loads(cleaned)
+    except json.JSONDecodeError:
+        pass
+    for pattern in (r'\{.*\}', r'\[.*\]'):
+        match = re.search(pattern, cleaned, re.DOTALL)
+        if match:
+            try:
+                return json.loads(match.group(0))
+            except json.JSONDecodeError:
+                continue
+    return None
+
+
+def _coerce(schema: dict, value):
+    """Valida e normaliza um valor. Retorna (ok, valor)."""
+    if value is None or (isinstance(value, str) and value.strip().lower() in ('', 'null', 'n/a')):
+        return schema.get("nullable", False) or schema["type"] == "ARRAY", None if schema["type"] != "ARRAY" else []
+
+    kind = schema["type"]
+    if kind == "STRING":
+        value = str(value).strip()
+        if "enum" in schema:
+            matches = [option for option in schema["enum"] if option.lower() == value.lower()]
+            return (True, matches[0]) if matches else (False, None)
+        if schema.get("x-date") and not _DATE_PATTERN.match(value):
+            return False, None
+        return True, value
+    if kind == "INTEGER":
+        match = re.match(r'^\s*(\d+)', str(value))
+        return (True, int(match.group(1))) if match else (False, None)
+    if kind == "ARRAY":
+        if not isinstance(value, list):
+            return False, []
+        items = []
+        for item in value:
+            ok, coerced = _coerce(schema["items"], item)
+            if ok and coerced is not None:
+                items.append(coerced)
+        return bool(items) or not value, items
+    if kind == "OBJECT":
+        if not isinstance(value, dict):
+            return False, None
+        obj, failed = _validate_object(schema, value)
+        return not failed, obj
+    return True, value
+
+
+def _validate_object(schema: dict, data: dict):
+    obj, failed = {}, []
+    required = set(schema.get("required", []))
+    for name, prop in schema["properties"].items():
+        ok, value = _coerce(prop, data.get(name))
+        obj[name] = value
+        if name in required and (not ok or value is None):
+            failed.append(name)
+        elif not ok:
+            # Campo opcional inválido: descartado, sem novo pedido
+            obj[name] = [] if prop["type"] == "ARRAY" else None
+    return obj, failed
+
+
+def parse_structured(task: str, text: str, only_fields: list = None):
+    """
+    Valida a resposta contra o esquema da tarefa.
+
+    Returns:
+        tuple: (dados normalizados ou None, campos de primeiro nível que falharam)
+    """
+    schema = SCHEMAS[task]
+    payload = load_json_payload(text)
+
+    if schema["type"] == "ARRAY":
+        if not isinstance(payload, list):
+            return None, ['*']
+        ok, items = _coerce(schema, payload)
+        return (items, []) if ok and items else (None, ['*'])
+
+    if not isinstance(payload, dict):
+        return None, list(only_fields or schema.get("required", []))
+    if only_fields:
+        schema = {**schema, "properties": {k: v for k, v in schema["properties"].items() if k in only_fields},
+                  "required": [k for k in schema.get("required", []) if k in only_fields]}
+    return _validate_object(schema, payload)
+
+
+def _build(cls, data: dict):
+    kwargs = {}
+    for f in fields(cls):
+        value = data.get(f.name)
+        item_type = _LIST_ITEM_TYPES.get((cls, f.name))
+        if item_type and isinstance(value, list):
+            value = [_build(item_type, item) for item in value if isinstance(item, dict)]
+        if value is not None:
+            kwargs[f.name] = value
+    return cls(**kwargs)
+
+
+def build_result(task: str, data):
+    """Resultado tipado (lista de resultados para tarefas cujo esquema é um array)."""
+    cls = RESULT_TYPES[task]
+    if isinstance(data, list):
+        return [_build(cls, item) for item in data if isinstance(item, dict)]
+    return _build(cls, data)
+
+
+def result_to_dict(result):
+    """Converte o resultado tipado de volta para dict/list (formato dos analisadores)."""
+    if isinstance(result, list):
+        return [result_to_dict(item) for item in result]
+    if is_dataclass(result):
+        return {f.name: result_to_dict(getattr(result, f.name)) for f in fields(result)}
+    return result
@@ -0,0 +1,171 @@
+"""
+Respostas do modelo em streaming com parsing incremental do JSON.
+
+IncrementalJSONParser recebe os trechos conforme chegam e devolve cada campo
+de primeiro nível (ou item, quando a raiz é um array) assim que ele se
+completa. Saída claramente malformada interrompe o stream com
+MalformedStreamError, sem esperar a resposta inteira.
+
+ResponseStream liga o parser a um callback de progresso (fração, mensagem).
+"""
+import os
+import re
+import json
+import logging
+
+logger = logging.getLogger('segsisone_app.streaming')
+
+STREAMING_ENABLED = os.getenv("SEGSIS_AI_STREAMING", "1") == "1"
+# Texto tolerado antes do JSON quando a resposta não é restrita a um esquema
+MAX_PREAMBLE_CHARS = 500
+MAX_NESTING = 32
+PREVIEW_CHARS = 60
+
+_CLOSING = {'}': '{', ']': '['}
+
+
+class MalformedStreamError(Exception):
+    """A resposta em streaming não é um JSON válido; o stream deve ser abortado."""
+
+
+class IncrementalJSONParser:
+    """
+    Parser incremental de um documento JSON.
+
+    Args:
+        strict: Exige que o JSON comece logo no início da resposta (apenas
+            espaços e cerca de código antes), como no modo response_schema.
+    """
+
+    def __init__(self, strict: bool = True):
+        self.strict = strict
+        self.root = None
+        self.done = False
+        self.fields = {}
+        self.items = []
+        self._text = ""
+        self._pos = 0
+        self._stack = []
+        self._in_string = False
+        self._escape = False
+        self._member_start = None
+
+    def feed(self, chunk: str) -> list[tuple]:
+        """
+        Processa um trecho da resposta.
+
+        Returns:
+            Lista de (chave, valor) completados neste trecho; para raiz
+            array, (índice, item).
+
+        Raises:
+            MalformedStreamError: a resposta não pode ser um JSON válido.
+        """
+        self._text += chunk
+        completed = []
+        text = self._text
+        while self._pos < len(text) and not self.done:
+            ch = text[self._pos]
+            if self.root is None:
+                self._scan_preamble(ch)
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in '{[':
+                self._stack.append(ch)
+                if len(self._stack) > MAX_NESTING:
+                    raise MalformedStreamError("aninhamento excessivo")
+            elif ch in '}]':
+                if not self._stack or self._stack.pop() != _CLOSING[ch]:
+                    raise MalformedStreamError(f"'{ch}' inesperado na posição {self._pos}")
+                if not self._stack:
+                    self._complete_member(completed)
+                    self.done = True
+            elif ch == ',' and len(self._stack) == 1:
+                self._complete_member(completed)
+                self._member_start = self._pos + 1
+            self._pos += 1
+        return completed
+
+    def _scan_preamble(self, ch: str):
+        if ch in '{[':
+            self.root = ch
+            self._stack.append(ch)
+            self._member_start = self._pos + 1
+            return
+        preamble = self._text[:self._pos + 1]
+        if self.strict and not "```json".startswith(re.sub(r'\s', '', preamble)):
+            raise MalformedStreamError(f"resposta não começa com JSON: {preamble[:40]!r}")
+        if len(preamble) > MAX_PREAMBLE_CHARS:
+            raise MalformedStreamError("nenhum JSON no início da resposta")
+
+    def _complete_member(self, completed: list):
+        segment = self._text[self._member_start:self._pos].strip()
+        if not segment:
+            return
+        try:
+            if self.root == '{':
+                key, value = next(iter(json.loads("{" + segment + "}").items()))
+                self.fields[key] = value
+            else:
+                key, value = len(self.items), json.loads(segment)
+                self.items.append(value)
+        except (ValueError, StopIteration) as e:
+            raise MalformedStreamError(f"trecho inválido {segment[:40]!r}: {e}")
+        completed.append((key, value))
+
+
+class ResponseStream:
+    """
+    Recebe os trechos do stream do modelo, repassa ao parser e informa o
+    progresso: fração dos campos do esquema já recebidos (None quando o
+    total não é conhecido) e uma mensagem com o último campo.
+    """
+
+    def __init__(self, progress_callback, response_schema: dict = None):
+        self.progress_callback = progress_callback
+        properties = (response_schema or {}).get('properties')
+        self.total_fields = len(properties) if properties else None
+        self.strict = response_schema is not None
+        self.reset()
+
+    def reset(self):
+        """Descarta o que foi recebido (nova tentativa da chamada)."""
+        self.parser = IncrementalJSONParser(strict=self.strict)
+        self.chars = 0
+
+    def feed(self, chunk: str):
+        first = self.chars == 0
+        self.chars += len(chunk)
+        completed = self.parser.feed(chunk)
+        if completed:
+            key, value = completed[-1]
+            self._notify(self._fraction(), self._describe(key, value))
+        elif first:
+            self._notify(0.0 if self.total_fields else None, "Recebendo resposta da IA...")
+
+    def _fraction(self):
+        if not self.total_fields:
+            return None
+        return min(len(self.parser.fields) / self.total_fields, 1.0)
+
+    def _describe(self, key, value) -> str:
+        if self.parser.root == '[':
+            return f"{len(self.parser.items)} itens recebidos"
+        if isinstance(value, (str, int, float)) and value != "":
+            return f"{key}: {str(value)[:PREVIEW_CHARS]}"
+        if isinstance(value, list):
+            return f"{key}: {len(value)} itens"
+        return f"{key} recebido"
+
+    def _notify(self, fraction, message):
+        try:
+            self.progress_callback(fraction, message)
+        except Exception as e:
+            logger.debug(f"Callback de progresso falhou: {e}")
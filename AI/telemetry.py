@@ -0,0 +1,295 @@
+import os
+import time
+import queue
+import atexit
+import sqlite3
+import threading
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+logger = logging.getLogger('segsisone_app.telemetry')
+
+DEFAULT_DB_PATH = os.getenv("SEGSIS_AI_TELEMETRY_DB", "ai_telemetry.db")
+TELEMETRY_ENABLED = os.getenv("SEGSIS_AI_TELEMETRY", "1") == "1"
+DEFAULT_RETENTION_DAYS = int(os.getenv("SEGSIS_AI_TELEMETRY_RETENTION_DAYS", "90"))
+MAX_QUEUE_SIZE = 10000
+BATCH_SIZE = 200
+FLUSH_INTERVAL_SECONDS = 2.0
+
+# Preço em US$ por 1M de tokens (entrada, saída, entrada lida do cache de contexto),
+# para estimar o custo
+MODEL_PRICES = {
+    'gemini-2.5-flash': (0.30, 2.50, 0.075),
+    'gemini-2.5-pro': (1.25, 10.00, 0.31),
+}
+
+# Resultados possíveis de uma chamada
+OUTCOME_OK = 'ok'
+OUTCOME_CACHE_HIT = 'cache'
+OUTCOME_RATE_LIMITED = 'limite'
+OUTCOME_ERROR = 'erro'
+
+# attempt = 0: o pedido (resultado final, latência ponta a ponta, sem tokens);
+# attempt >= 1: cada requisição enviada ao modelo (novas tentativas, reservas
+# do hedge, a repetição sem streaming), com os tokens e bytes que consumiu.
+REQUEST_ROW = 0
+
+_COLUMNS = (
+    'ts', 'model', 'task_type', 'prompt_version', 'request_key', 'input_tokens', 'output_tokens',
+    'cached_tokens', 'bytes_sent', 'latency_ms', 'outcome', 'unit_id', 'user_email', 'streamed',
+    'attempt', 'hedge'
+)
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> float:
+    """
+    Custo estimado em US$ pela tabela MODEL_PRICES (0 para modelos desconhecidos).
+
+    cached_tokens faz parte de input_tokens (prompt_token_count da API) e é
+    cobrado pelo preço do cache de contexto.
+    """
+    for prefix, (input_price, output_price, cached_price) in MODEL_PRICES.items():
+        if (model or '').startswith(prefix) or (model or '').startswith(f"models/{prefix}"):
+            cached_tokens = min(cached_tokens or 0, input_tokens or 0)
+            return ((input_tokens - cached_tokens) * input_price + cached_tokens * cached_price
+                    + output_tokens * output_price) / 1_000_000
+    return 0.0
+
+
+def _percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * p / 100), len(ordered) - 1)] if ordered else 0.0
+
+
+class TelemetrySink:
+    """
+    Telemetria das chamadas aos modelos.
+
+    record() apenas enfileira o evento (não bloqueia a chamada); uma thread
+    grava em lote no SQLite local. Com a fila cheia os eventos são
+    descartados e contados em 'dropped'. As consultas agregadas alimentam a
+    página de administração.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, retention_days: int = DEFAULT_RETENTION_DAYS):
+        self.db_path = db_path
+        self.retention_days = retention_days
+        self._queue = queue.Queue(maxsize=MAX_QUEUE_SIZE)
+        self._lock = threading.Lock()
+        self._metrics = {'recorded': 0, 'written': 0, 'dropped': 0, 'write_errors': 0}
+        self._init_db()
+        self._stop = threading.Event()
+        self._writer = threading.Thread(target=self._writer_loop, name="ai-telemetry", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS ai_calls (
+                    ts TEXT NOT NULL,
+                    model TEXT,
+                    task_type TEXT,
+                    prompt_version TEXT,
+                    request_key TEXT,
+                    input_tokens INTEGER NOT NULL DEFAULT 0,
+                    output_tokens INTEGER NOT NULL DEFAULT 0,
+                    cached_tokens INTEGER NOT NULL DEFAULT 0,
+                    bytes_sent INTEGER NOT NULL DEFAULT 0,
+                    latency_ms INTEGER NOT NULL DEFAULT 0,
+                    outcome TEXT NOT NULL,
+                    unit_id TEXT,
+                    user_email TEXT,
+                    streamed INTEGER NOT NULL DEFAULT 0,
+                    attempt INTEGER NOT NULL DEFAULT 0,
+                    hedge INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(ai_calls)")}
+            for column in ('attempt', 'hedge'):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE ai_calls ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_ai_calls_ts ON ai_calls (ts)")
+
+    def record(self, model: str, task_type: str, outcome: str, latency_seconds: float = 0.0,
+               input_tokens: int = 0, output_tokens: int = 0, cached_tokens: int = 0, bytes_sent: int = 0,
+               prompt_version: str = None, request_key: str = None, unit_id: str = None,
+               user_email: str = None, streamed: bool = False, attempt: int = REQUEST_ROW,
+               hedge: bool = False):
+        """
+        Enfileira o evento de um pedido (attempt=0) ou de uma requisição ao
+        modelo (attempt >= 1, hedge=True para a reserva do hedge). Não bloqueia.
+        """
+        row = (
+            datetime.now().isoformat(timespec='seconds'), model, task_type, prompt_version, request_key,
+            int(input_tokens or 0), int(output_tokens or 0), int(cached_tokens or 0), int(bytes_sent or 0),
+            int((latency_seconds or 0) * 1000), outcome, unit_id, user_email, int(bool(streamed)),
+            int(attempt or 0), int(bool(hedge))
+        )
+        try:
+            self._queue.put_nowait(row)
+            self._count('recorded')
+        except queue.Full:
+            self._count('dropped')
+
+    def _count(self, metric: str, delta: int = 1):
+        with self._lock:
+            self._metrics[metric] += delta
+
+    def _writer_loop(self):
+        last_cleanup = 0.0
+        while not self._stop.is_set() or not self._queue.empty():
+            batch = []
+            try:
+                batch.append(self._queue.get(timeout=FLUSH_INTERVAL_SECONDS))
+                while len(batch) < BATCH_SIZE:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+            if batch:
+                self._write(batch)
+            if time.time() - last_cleanup > 3600:
+                last_cleanup = time.time()
+                self._cleanup()
+
+    def _write(self, batch: list):
+        try:
+            with self._connect() as conn:
+                conn.executemany(
+                    f"INSERT INTO ai_calls ({', '.join(_COLUMNS)}) VALUES ({', '.join('?' for _ in _COLUMNS)})",
+                    batch
+                )
+            self._count('written', len(batch))
+        except Exception as e:
+            self._count('write_errors')
+            logger.warning(f"Falha ao gravar {len(batch)} eventos de telemetria: {e}")
+
+    def _cleanup(self):
+        cutoff = (datetime.now() - timedelta(days=self.retention_days)).isoformat(timespec='seconds')
+        try:
+            with self._connect() as conn:
+                conn.execute("DELETE FROM ai_calls WHERE ts < ?", (cutoff,))
+        except Exception as e:
+            logger.debug(f"Falha na limpeza da telemetria: {e}")
+
+    def close(self, timeout: float = 5.0):
+        """Grava os eventos pendentes e encerra a thread de escrita."""
+        self._stop.set()
+        self._writer.join(timeout=timeout)
+
+    def _rows(self, days: int) -> list[dict]:
+        cutoff = (datetime.now() - timedelta(days=days)).isoformat(timespec='seconds')
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute("SELECT * FROM ai_calls WHERE ts >= ?", (cutoff,)).fetchall()
+        return [dict(row) for row in rows]
+
+    def summarize(self, group_by: str, days: int = 7) -> list[dict]:
+        """
+        Agregado por 'model', 'task_type', 'unit_id', 'user_email' ou 'prompt_version'.
+
+        Returns:
+            Uma linha por grupo: pedidos ao modelo, acertos de cache, erros,
+            requisições enviadas (com novas tentativas e reservas do hedge),
+            tokens e custo estimado de todas as requisições e latência p50/p95
+            dos pedidos concluídos.
+        """
+        if group_by not in ('model', 'task_type', 'unit_id', 'user_email', 'prompt_version'):
+            raise ValueError(f"Agrupamento inválido: {group_by}")
+
+        groups = defaultdict(list)
+        for row in self._rows(days):
+            groups[row[group_by] or 'N/A'].append(row)
+
+        summary = []
+        for key, rows in groups.items():
+            requests = [r for r in rows if r['attempt'] == REQUEST_ROW]
+            attempts = [r for r in rows if r['attempt'] != REQUEST_ROW]
+            called = [r for r in requests if r['outcome'] in (OUTCOME_OK, OUTCOME_ERROR)]
+            latencies = [r['latency_ms'] / 1000 for r in requests if r['outcome'] == OUTCOME_OK]
+            # Tokens ficam nas linhas das requisições (linhas antigas, sem tentativas, nos pedidos)
+            input_tokens = sum(r['input_tokens'] for r in rows)
+            output_tokens = sum(r['output_tokens'] for r in rows)
+            summary.append({
+                group_by: key,
+                'chamadas': len(called),
+                'cache': sum(1 for r in requests if r['outcome'] == OUTCOME_CACHE_HIT),
+                'limite': sum(1 for r in requests if r['outcome'] == OUTCOME_RATE_LIMITED),
+                'erros': sum(1 for r in requests if r['outcome'] == OUTCOME_ERROR),
+                'requisicoes': len(attempts),
+                'novas_tentativas': sum(1 for r in attempts if r['attempt'] > 1 and not r['hedge']),
+                'reservas_hedge': sum(1 for r in attempts if r['hedge']),
+                'tokens_entrada': input_tokens,
+                'tokens_cache': sum(r['cached_tokens'] for r in rows),
+                'tokens_saida': output_tokens,
+                'custo_usd': round(sum(
+                    estimate_cost(r['model'], r['input_tokens'], r['output_tokens'], r['cached_tokens'])
+                    for r in rows
+                ), 4),
+                'mb_enviados': round(sum(r['bytes_sent'] for r in rows) / (1024 * 1024), 2),
+                'p50_s': round(_percentile(latencies, 50), 2),
+                'p95_s': round(_percentile(latencies, 95), 2),
+            })
+        return sorted(summary, key=lambda item: -item['chamadas'])
+
+    def cache_potential(self, days: int = 7) -> dict:
+        """
+        Chamadas ao modelo que repetiram um pedido já feito no período (mesmo
+        PDF, prompt, modelo e tarefa): o que um cache ideal teria evitado.
+        """
+        seen, repeated, called = set(), 0, 0
+        for row in sorted(self._rows(days), key=lambda r: r['ts']):
+            if row['attempt'] != REQUEST_ROW:
+                continue
+            if row['outcome'] not in (OUTCOME_OK, OUTCOME_CACHE_HIT) or not row['request_key']:
+                continue
+            if row['outcome'] == OUTCOME_OK:
+                called += 1
+                if row['request_key'] in seen:
+                    repeated += 1
+            seen.add(row['request_key'])
+        return {'calls': called, 'repeated': repeated, 'rate': repeated / called if called else 0.0}
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics['queued'] = self._queue.qsize()
+        return metrics
+
+
+class _NullTelemetry:
+    """Telemetria desativada (SEGSIS_AI_TELEMETRY=0)."""
+
+    def record(self, *args, **kwargs):
+        pass
+
+    def summarize(self, group_by: str, days: int = 7) -> list[dict]:
+        return []
+
+    def cache_potential(self, days: int = 7) -> dict:
+        return {'calls': 0, 'repeated': 0, 'rate': 0.0}
+
+    def get_metrics(self) -> dict:
+        return {'recorded': 0, 'written': 0, 'dropped': 0, 'write_errors': 0, 'queued': 0}
+
+
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+
+def get_telemetry():
+    """Retorna o coletor de telemetria das chamadas de IA do processo."""
+    global _telemetry
+    if _telemetry is None:
+        with _telemetry_lock:
+            if _telemetry is None:
+                try:
+                    _telemetry = TelemetrySink() if TELEMETRY_ENABLED else _NullTelemetry()
+                except Exception as e:
+                    logger.error(f"Telemetria de IA indisponível: {e}")
+                    _telemetry = _NullTelemetry()
+    return _telemetry
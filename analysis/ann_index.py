@@ -0,0 +1,240 @@
+"""
+Índice aproximado (IVF) para bases RAG grandes.
+
+Os vetores normalizados são agrupados por k-means esférico em nlist listas
+invertidas; a busca compara a consulta só com os centróides e percorre as
+nprobe listas mais próximas. nprobe é o ajuste recall/latência: nprobe =
+nlist equivale à busca exata.
+
+O índice é construído offline, ao lado do arquivo de embeddings:
+
+    python -m analysis.ann_index rag_embeddings.npy [nlist]
+
+e o benchmark de recall contra a busca exata:
+
+    python -m analysis.ann_index --benchmark 100000
+"""
+import os
+import sys
+import time
+import threading
+import logging
+
+import numpy as np
+
+from analysis.vector_index import VectorIndex, get_vector_index, DEFAULT_DTYPE
+
+logger = logging.getLogger('segsisone_app.ann_index')
+
+DEFAULT_NPROBE = int(os.getenv("SEGSIS_ANN_NPROBE", "8"))
+# Abaixo deste número de chunks a busca exata é rápida o bastante
+ANN_MIN_CHUNKS = int(os.getenv("SEGSIS_ANN_MIN_CHUNKS", "200000"))
+KMEANS_ITERATIONS = 20
+# Pontos de treino do k-means por lista
+TRAIN_POINTS_PER_LIST = 64
+_ASSIGN_BLOCK_ROWS = 65536
+
+
+def ivf_path(source_path: str) -> str:
+    return f"{os.path.splitext(source_path)[0]}.ivf.npz"
+
+
+def default_nlist(n_rows: int) -> int:
+    return max(1, min(int(4 * np.sqrt(n_rows)), n_rows))
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _assign(index: VectorIndex, centroids: np.ndarray) -> np.ndarray:
+    """Lista (centróide mais próximo) de cada linha do índice, em blocos."""
+    assignments = np.empty(len(index), dtype=np.int32)
+    for start in range(0, len(index), _ASSIGN_BLOCK_ROWS):
+        block = index.rows(slice(start, start + _ASSIGN_BLOCK_ROWS))
+        assignments[start:start + block.shape[0]] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+
+def train_centroids(index: VectorIndex, nlist: int, iterations: int = KMEANS_ITERATIONS,
+                    seed: int = 0) -> np.ndarray:
+    """K-means esférico sobre uma amostra das linhas do índice."""
+    rng = np.random.default_rng(seed)
+    n_rows = len(index)
+    sample_size = min(n_rows, nlist * TRAIN_POINTS_PER_LIST)
+    sample = index.rows(np.sort(rng.choice(n_rows, sample_size, replace=False)))
+    centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, sample)
+        counts = np.bincount(assignments, minlength=nlist)
+        # Listas vazias recebem um ponto aleatório da amostra
+        empty = np.flatnonzero(counts == 0)
+        sums[empty] = sample[rng.choice(sample_size, len(empty), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+def build_ivf(source_path: str, nlist: int = None, dtype: str = DEFAULT_DTYPE) -> str:
+    """Treina o IVF sobre o índice vetorial do arquivo e grava <base>.ivf.npz."""
+    index = VectorIndex.load(source_path, dtype)
+    nlist = nlist or default_nlist(len(index))
+    start_time = time.perf_counter()
+    centroids = train_centroids(index, nlist)
+    assignments = _assign(index, centroids)
+    ids = np.argsort(assignments, kind='stable').astype(np.int64)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(assignments, minlength=nlist))]).astype(np.int64)
+
+    path = ivf_path(source_path)
+    tmp_path = f"{path}.tmp-{os.getpid()}.npz"
+    np.savez(tmp_path, centroids=centroids, ids=ids, offsets=offsets, n_rows=np.int64(len(index)))
+    os.replace(tmp_path, path)
+    logger.info(f"IVF com {nlist} listas para {len(index)} chunks em {time.perf_counter() - start_time:.1f}s")
+    return path
+
+
+class IVFIndex:
+    """
+    Busca aproximada por listas invertidas sobre um VectorIndex.
+
+    Args:
+        index: Índice com os vetores normalizados (os vetores não são copiados).
+        centroids: Centróides normalizados (nlist, d).
+        ids: Linhas do índice ordenadas por lista.
+        offsets: Início de cada lista em ids (nlist + 1).
+        nprobe: Listas percorridas por consulta.
+    """
+
+    def __init__(self, index: VectorIndex, centroids: np.ndarray, ids: np.ndarray, offsets: np.ndarray,
+                 nprobe: int = DEFAULT_NPROBE):
+        self.index = index
+        self.centroids = centroids
+        self.ids = ids
+        self.offsets = offsets
+        self.nprobe = nprobe
+
+    @classmethod
+    def load(cls, source_path: str, dtype: str = DEFAULT_DTYPE, nprobe: int = DEFAULT_NPROBE,
+             index: VectorIndex = None) -> 'IVFIndex':
+        index = index or VectorIndex.load(source_path, dtype)
+        with np.load(ivf_path(source_path)) as data:
+            if int(data['n_rows']) != len(index):
+                raise ValueError("IVF desatualizado: número de chunks diferente dos embeddings")
+            return cls(index, data['centroids'], data['ids'], data['offsets'], nprobe)
+
+    @property
+    def nlist(self) -> int:
+        return self.centroids.shape[0]
+
+    def __len__(self):
+        return len(self.index)
+
+    def search(self, query, top_k: int = 5, nprobe: int = None) -> tuple[np.ndarray, np.ndarray]:
+        """Top-k aproximado: (índices, similaridades) em ordem decrescente."""
+        query = _normalize(np.atleast_2d(query))[0]
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        centroid_scores = self.centroids @ query
+        if nprobe < self.nlist:
+            probes = np.argpartition(centroid_scores, -nprobe)[-nprobe:]
+        else:
+            probes = np.arange(self.nlist)
+
+        # Linhas em ordem crescente: leitura sequencial do memory-map
+        candidates = np.sort(np.concatenate([self.ids[self.offsets[p]:self.offsets[p + 1]] for p in probes]))
+        if candidates.size == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = self.index.rows(candidates) @ query
+        top_k = min(top_k, candidates.size)
+        best = np.argpartition(scores, -top_k)[-top_k:] if top_k < candidates.size else np.arange(candidates.size)
+        best = best[np.argsort(-scores[best])]
+        return candidates[best], scores[best]
+
+    def search_batch(self, queries, top_k: int = 5, nprobe: int = None) -> tuple[np.ndarray, np.ndarray]:
+        results = [self.search(query, top_k, nprobe) for query in np.atleast_2d(queries)]
+        return np.stack([r[0] for r in results]), np.stack([r[1] for r in results])
+
+
+_search_indexes = {}
+_search_indexes_lock = threading.Lock()
+
+
+def get_search_index(source_path: str = "rag_embeddings.npy", min_chunks: int = ANN_MIN_CHUNKS):
+    """
+    Índice de busca do processo: IVF quando a base tem pelo menos min_chunks
+    e o arquivo .ivf.npz está em dia; senão a busca exata do VectorIndex.
+    """
+    index = get_vector_index(source_path)
+    path = ivf_path(source_path)
+    if len(index) < min_chunks:
+        return index
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(source_path):
+        logger.warning(f"Base com {len(index)} chunks sem IVF atualizado; usando busca exata. "
+                       f"Gere com: python -m analysis.ann_index {source_path}")
+        return index
+
+    key = (os.path.abspath(path), id(index))
+    with _search_indexes_lock:
+        entry = _search_indexes.get(key)
+        mtime = os.path.getmtime(path)
+        if entry is None or entry[0] != mtime:
+            try:
+                entry = (mtime, IVFIndex.load(source_path, index=index))
+            except Exception as e:
+                logger.error(f"Falha ao carregar IVF, usando busca exata: {e}")
+                return index
+            _search_indexes[key] = entry
+        return entry[1]
+
+
+def _benchmark(size: int, dim: int = 768, queries: int = 50, top_k: int = 7, clusters: int = 500):
+    """Recall@k e latência do IVF contra a busca exata, variando nprobe."""
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    # Dados com estrutura de tópicos (misturas), como uma base de normas real
+    topics = rng.standard_normal((clusters, dim)).astype(np.float32)
+    with tempfile.TemporaryDirectory() as tmp:
+        source_path = os.path.join(tmp, "emb.npy")
+        source = np.lib.format.open_memmap(source_path, mode='w+', dtype=np.float32, shape=(size, dim))
+        for start in range(0, size, 100000):
+            end = min(start + 100000, size)
+            labels = rng.integers(0, clusters, end - start)
+            source[start:end] = topics[labels] + 0.9 * rng.standard_normal((end - start, dim), dtype=np.float32)
+        source.flush()
+        del source
+        query_vectors = topics[rng.integers(0, clusters, queries)] + 0.9 * rng.standard_normal((queries, dim))
+
+        exact = VectorIndex.load(source_path, 'float32')
+        start_time = time.perf_counter()
+        truth = [exact.search(query, top_k)[0] for query in query_vectors]
+        exact_ms = (time.perf_counter() - start_time) / queries * 1000
+
+        start_time = time.perf_counter()
+        build_ivf(source_path, dtype='float32')
+        ivf = IVFIndex.load(source_path, 'float32', index=exact)
+        print(f"{size} chunks, nlist={ivf.nlist}, construção {time.perf_counter() - start_time:.1f}s")
+        print(f"{'modo':<14} {'ms/consulta':>12} {'recall@k':>9}")
+        print(f"{'exata':<14} {exact_ms:>12.2f} {1.0:>9.3f}")
+        for nprobe in (1, 2, 4, 8, 16, 32, 64):
+            if nprobe > ivf.nlist:
+                break
+            start_time = time.perf_counter()
+            found = [ivf.search(query, top_k, nprobe)[0] for query in query_vectors]
+            elapsed = (time.perf_counter() - start_time) / queries * 1000
+            recall = np.mean([len(set(a) & set(b)) / top_k for a, b in zip(found, truth)])
+            print(f"{'nprobe=' + str(nprobe):<14} {elapsed:>12.2f} {recall:>9.3f}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--benchmark':
+        for n in (sys.argv[2:] or ['100000']):
+            _benchmark(int(n))
+    elif len(sys.argv) > 1:
+        print(build_ivf(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None))
+    else:
+        print(__doc__)
@@ -0,0 +1,231 @@
+"""
+Cache de embeddings das consultas de recuperação (RAG).
+
+As consultas de auditoria saem de um modelo fixo por (tipo de documento,
+norma), então o mesmo punhado de textos era embedado a cada chamada. Os
+vetores ficam em um LRU em memória e em um SQLite local, com chave pelo
+modelo, tipo de tarefa e texto normalizado; warm_up() pré-calcula as
+consultas conhecidas em uma única chamada em lote.
+"""
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+import logging
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+logger = logging.getLogger('segsisone_app.embedding_cache')
+
+EMBEDDING_MODEL = "models/text-embedding-004"
+DEFAULT_DB_PATH = os.getenv("SEGSIS_EMBEDDING_CACHE_DB", "embedding_cache.db")
+DEFAULT_MEMORY_ENTRIES = 512
+# Limite de textos por chamada de embed_content em lote
+EMBED_BATCH_SIZE = 100
+
+AUDIT_QUERY_TEMPLATE = "Quais são os principais requisitos de conformidade para um {doc_type} da norma {norma}?"
+
+# Normas usadas no pré-aquecimento quando as regras da unidade não estão disponíveis
+DEFAULT_TRAINING_NORMAS = ['NR-05', 'NR-06', 'NR-10', 'NR-10 SEP', 'NR-11', 'NR-12', 'NR-18',
+                           'NR-20', 'NR-23', 'NR-33', 'NR-34', 'NR-35', 'NBR-16710']
+COMPANY_DOC_NORMAS = {'PGR': 'NR-01', 'PCMSO': 'NR-07', 'PPR': 'NR-09'}
+COMPANY_DOC_FALLBACK_NORMA = "normas aplicáveis"
+
+
+def normalize_text(text: str) -> str:
+    """Texto canônico da consulta: Unicode NFC e espaços colapsados."""
+    return re.sub(r'\s+', ' ', unicodedata.normalize('NFC', text or '')).strip()
+
+
+def resolve_audit_norma(doc_type: str, norma: str = "", doc_subtype: str = "") -> str:
+    """Norma usada na consulta de auditoria quando o documento não informa uma."""
+    if norma or doc_type not in ("ASO", "Doc. Empresa"):
+        return norma
+    if doc_type == "ASO":
+        return "NR-07"
+    doc_subtype = (doc_subtype or "").upper()
+    for keyword, company_norma in COMPANY_DOC_NORMAS.items():
+        if keyword in doc_subtype:
+            return company_norma
+    return COMPANY_DOC_FALLBACK_NORMA
+
+
+def build_audit_query(doc_type: str, norma: str) -> str:
+    return AUDIT_QUERY_TEMPLATE.format(doc_type=doc_type, norma=norma)
+
+
+def known_audit_queries(training_normas: list = None) -> list[str]:
+    """Consultas de auditoria de todos os tipos de documento e normas conhecidos."""
+    queries = [build_audit_query("ASO", "NR-07")]
+    queries += [build_audit_query("Treinamento", norma) for norma in (training_normas or DEFAULT_TRAINING_NORMAS)]
+    queries += [build_audit_query("Doc. Empresa", norma)
+                for norma in [*COMPANY_DOC_NORMAS.values(), COMPANY_DOC_FALLBACK_NORMA]]
+    return list(dict.fromkeys(queries))
+
+
+class EmbeddingCache:
+    """
+    LRU em memória + SQLite para vetores de embedding.
+
+    A chave é o hash de (modelo, tipo de tarefa, texto normalizado); os
+    vetores são gravados como float32.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_DB_PATH, memory_entries: int = DEFAULT_MEMORY_ENTRIES):
+        self.db_path = db_path
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._metrics = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'embedded': 0}
+        self._disk_available = True
+        try:
+            self._init_db()
+        except Exception as e:
+            logger.warning(f"Cache persistente de embeddings indisponível, usando só memória: {e}")
+            self._disk_available = False
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+
+    def _init_db(self):
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS query_embeddings (
+                    key TEXT PRIMARY KEY,
+                    model TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    vector BLOB NOT NULL
+                )
+            """)
+
+    @staticmethod
+    def make_key(model: str, task_type: str, text: str) -> str:
+        return hashlib.sha256(f"{model}|{task_type}|{normalize_text(text)}".encode('utf-8')).hexdigest()
+
+    def _remember(self, key: str, vector: np.ndarray):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, model: str, task_type: str, text: str) -> np.ndarray | None:
+        key = self.make_key(model, task_type, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self._metrics['memory_hits'] += 1
+                return vector
+
+        if self._disk_available:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute("SELECT vector FROM query_embeddings WHERE key = ?", (key,)).fetchone()
+                if row:
+                    vector = np.frombuffer(row[0], dtype=np.float32)
+                    self._remember(key, vector)
+                    with self._lock:
+                        self._metrics['disk_hits'] += 1
+                    return vector
+            except Exception as e:
+                logger.warning(f"Falha ao ler cache de embeddings: {e}")
+
+        with self._lock:
+            self._metrics['misses'] += 1
+        return None
+
+    def set(self, model: str, task_type: str, text: str, vector) -> np.ndarray:
+        key = self.make_key(model, task_type, text)
+        vector = np.asarray(vector, dtype=np.float32)
+        self._remember(key, vector)
+        if self._disk_available:
+            try:
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO query_embeddings (key, model, text, vector) VALUES (?, ?, ?, ?)",
+                        (key, model, normalize_text(text), vector.tobytes())
+                    )
+            except Exception as e:
+                logger.warning(f"Falha ao gravar cache de embeddings: {e}")
+        return vector
+
+    def embed(self, texts: list[str], model: str = EMBEDDING_MODEL, task_type: str = "retrieval_query",
+              embed_fn=None) -> list[np.ndarray]:
+        """
+        Vetores dos textos, consultando o cache e embedando só os ausentes
+        (em lote). embed_fn(model, contents, task_type) -> lista de vetores;
+        padrão: google.generativeai.embed_content.
+        """
+        vectors = [self.get(model, task_type, text) for text in texts]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if not missing:
+            return vectors
+
+        embed_fn = embed_fn or embed_with_gemini
+        for start in range(0, len(missing), EMBED_BATCH_SIZE):
+            batch = missing[start:start + EMBED_BATCH_SIZE]
+            results = embed_fn(model, [normalize_text(texts[i]) for i in batch], task_type)
+            for i, vector in zip(batch, results):
+                vectors[i] = self.set(model, task_type, texts[i], vector)
+            with self._lock:
+                self._metrics['embedded'] += len(batch)
+        return vectors
+
+    def embed_one(self, text: str, **kwargs) -> np.ndarray:
+        return self.embed([text], **kwargs)[0]
+
+    def warm_up(self, queries: list[str], **kwargs) -> int:
+        """Pré-calcula os embeddings das consultas; retorna quantas foram embedadas agora."""
+        before = self._metrics['embedded']
+        self.embed(queries, **kwargs)
+        embedded = self._metrics['embedded'] - before
+        logger.info(f"Cache de embeddings aquecido: {len(queries)} consultas, {embedded} novas")
+        return embedded
+
+    def get_metrics(self) -> dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics['memory_entries'] = len(self._memory)
+        return metrics
+
+
+def embed_with_gemini(model: str, contents: list[str], task_type: str) -> list:
+    from google.generativeai import embed_content
+    from AI.telemetry import get_telemetry, OUTCOME_OK, OUTCOME_ERROR
+
+    start = time.time()
+    outcome = OUTCOME_ERROR
+    try:
+        result = embed_content(model=model, content=contents, task_type=task_type)
+        outcome = OUTCOME_OK
+    finally:
+        # Cada embed_content é uma requisição ao modelo (a API não informa tokens)
+        get_telemetry().record(
+            model=model, task_type=f"embedding:{task_type}", outcome=outcome,
+            latency_seconds=time.time() - start,
+            bytes_sent=sum(len(text.encode('utf-8')) for text in contents), attempt=1
+        )
+    embeddings = result['embedding']
+    # Com um único texto a API pode devolver o vetor direto
+    if embeddings and not isinstance(embeddings[0], (list, tuple, np.ndarray)):
+        embeddings = [embeddings]
+    return embeddings
+
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """Retorna o cache de embeddings do processo."""
+    global _embedding_cache
+    if _embedding_cache is None:
+        with _embedding_cache_lock:
+            if _embedding_cache is None:
+                _embedding_cache = EmbeddingCache()
+    return _embedding_cache
@@ -0,0 +1,310 @@
+"""
+Recuperação híbrida (BM25 + vetorial) com filtro por norma.
+
+Quando a consulta tem uma norma conhecida (NR-07, NR-35...), os candidatos
+são primeiro restritos aos chunks daquela norma pelos metadados da base
+(coluna Norma/NR/Source); sobre eles, a pontuação BM25 local e a
+similaridade vetorial são combinadas:
+
+- 'rrf' (padrão): fusão por posição, 1 / (RRF_K + posição) em cada lista;
+- 'linear': alpha * vetorial + (1 - alpha) * BM25, ambos normalizados 0-1;
+- 'vector': só similaridade vetorial (comportamento anterior).
+
+Configuração: SEGSIS_RAG_FUSION e SEGSIS_RAG_HYBRID_ALPHA.
+
+Benchmark de relevância offline:
+
+    python -m analysis.hybrid_retrieval casos.json [rag_store]  # versão publicada; casos: [{"query", "norma", "relevant": [linhas]}]
+    python -m analysis.hybrid_retrieval --synthetic  # corpus sintético
+"""
+import os
+import re
+import sys
+import json
+import time
+import threading
+import logging
+import unicodedata
+from collections import Counter
+
+import numpy as np
+
+logger = logging.getLogger('segsisone_app.hybrid_retrieval')
+
+FUSION_MODES = ('rrf', 'linear', 'vector')
+DEFAULT_FUSION = os.getenv("SEGSIS_RAG_FUSION", "rrf")
+DEFAULT_ALPHA = float(os.getenv("SEGSIS_RAG_HYBRID_ALPHA", "0.5"))
+RRF_K = 60
+# Candidatos de cada lista (BM25 e vetorial) antes da fusão, por resultado pedido
+CANDIDATES_PER_RESULT = 10
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Colunas de metadados com a norma de cada chunk, em ordem de preferência
+METADATA_COLUMNS = ('Norma', 'NR', 'Source')
+TEXT_COLUMN = 'Answer_Chunk'
+
+_STOPWORDS = {
+    'de', 'da', 'do', 'das', 'dos', 'em', 'no', 'na', 'nos', 'nas', 'um', 'uma', 'para', 'por', 'com',
+    'que', 'se', 'ao', 'aos', 'as', 'os', 'ou', 'ser', 'sao', 'pelo', 'pela', 'quais', 'qual',
+}
+_NORMA_PATTERN = re.compile(r'\b(NR|NBR)\s*[-–.]?\s*(\d{1,5})\b', re.IGNORECASE)
+
+
+def norma_key(text: str) -> str | None:
+    """Norma canônica citada no texto ('NR 7', 'nr-07' -> 'NR-07'; 'NBR 16710' -> 'NBR-16710')."""
+    match = _NORMA_PATTERN.search(text or '')
+    if not match:
+        return None
+    prefix, number = match.group(1).upper(), match.group(2)
+    return f"NR-{int(number):02d}" if prefix == 'NR' else f"NBR-{number}"
+
+
+def tokenize(text: str) -> list[str]:
+    """Palavras sem acentos e sem stopwords; 'NR-35' vira o termo 'nr35'."""
+    text = unicodedata.normalize('NFKD', (text or '').lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r'\b(nr|nbr)\s*[-.]?\s*0*(\d+)', r'\1\2', text)
+    return [word for word in re.findall(r'[a-z0-9]{2,}', text) if word not in _STOPWORDS]
+
+
+class BM25Index:
+    """BM25 em memória com listas invertidas em arrays NumPy (formato CSR)."""
+
+    def __init__(self, texts, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        vocabulary = {}
+        term_ids, doc_ids, freqs = [], [], []
+        lengths = []
+        for doc_id, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for term, freq in counts.items():
+                term_ids.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_ids.append(doc_id)
+                freqs.append(freq)
+
+        self.vocabulary = vocabulary
+        self.n_docs = len(lengths)
+        term_ids = np.asarray(term_ids, dtype=np.int64)
+        order = np.argsort(term_ids, kind='stable')
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int64)[order]
+        self.freqs = np.asarray(freqs, dtype=np.float32)[order]
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)))])
+        lengths = np.asarray(lengths, dtype=np.float32)
+        document_freq = np.diff(self.offsets)
+        self.idf = np.log(1 + (self.n_docs - document_freq + 0.5) / (document_freq + 0.5)).astype(np.float32)
+        # Denominador de normalização por tamanho, pré-calculado por documento
+        self._length_norm = self.k1 * (1 - self.b + self.b * lengths / max(lengths.mean() if self.n_docs else 1, 1))
+
+    def scores(self, query: str) -> np.ndarray:
+        """Pontuação BM25 de todos os documentos."""
+        scores = np.zeros(self.n_docs, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs, freqs = self.doc_ids[start:end], self.freqs[start:end]
+            scores[docs] += self.idf[term_id] * freqs * (self.k1 + 1) / (freqs + self._length_norm[docs])
+        return scores
+
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    """Posições dos k maiores valores, em ordem decrescente."""
+    k = min(k, scores.size)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    best = np.argpartition(scores, -k)[-k:] if k < scores.size else np.arange(scores.size)
+    return best[np.argsort(-scores[best], kind='stable')]
+
+
+def _min_max(values: np.ndarray) -> np.ndarray:
+    spread = values.max() - values.min() if values.size else 0
+    return (values - values.min()) / spread if spread > 0 else np.zeros_like(values)
+
+
+class HybridRetriever:
+    """
+    Recuperação sobre a base RAG (DataFrame + índice vetorial).
+
+    Args:
+        df: Chunks da base, com TEXT_COLUMN e, se houver, uma coluna de norma.
+        vector_index: VectorIndex ou IVFIndex alinhado às linhas do df.
+        fusion: 'rrf', 'linear' ou 'vector'.
+        alpha: Peso da similaridade vetorial na fusão linear.
+    """
+
+    def __init__(self, df, vector_index, fusion: str = DEFAULT_FUSION, alpha: float = DEFAULT_ALPHA):
+        if fusion not in FUSION_MODES:
+            raise ValueError(f"Fusão inválida: {fusion}")
+        self.df = df
+        self.vector_index = vector_index
+        self.fusion = fusion
+        self.alpha = alpha
+        self._bm25 = None
+        self._bm25_lock = threading.Lock()
+        self._normas = self._chunk_normas(df)
+
+    @staticmethod
+    def _chunk_normas(df) -> np.ndarray | None:
+        """Norma de cada chunk pelos metadados (None se a base não tem a coluna)."""
+        for column in METADATA_COLUMNS:
+            if column in df.columns:
+                return np.array([norma_key(str(value)) or '' for value in df[column]], dtype=object)
+        logger.info("Base RAG sem coluna de norma; filtro por metadados desativado")
+        return None
+
+    @property
+    def bm25(self) -> BM25Index:
+        # Construído no primeiro uso: a busca só vetorial não paga o custo
+        if self._bm25 is None:
+            with self._bm25_lock:
+                if self._bm25 is None:
+                    start_time = time.perf_counter()
+                    self._bm25 = BM25Index(self.df[TEXT_COLUMN].astype(str).tolist())
+                    logger.info(f"Índice BM25 com {self._bm25.n_docs} chunks e {len(self._bm25.vocabulary)} "
+                                f"termos em {time.perf_counter() - start_time:.1f}s")
+        return self._bm25
+
+    def candidates_for(self, norma: str | None) -> np.ndarray | None:
+        """Linhas da norma, ou None (base inteira) sem norma ou sem chunks dela."""
+        key = norma_key(norma) if norma else None
+        if key is None or self._normas is None:
+            return None
+        rows = np.flatnonzero(self._normas == key)
+        if rows.size == 0:
+            logger.info(f"Nenhum chunk com a norma {key}; buscando na base inteira")
+            return None
+        return rows
+
+    def _vector_scores(self, query_vector, rows: np.ndarray | None, pool: int) -> tuple[np.ndarray, np.ndarray]:
+        if rows is None:
+            return self.vector_index.search(query_vector, pool)
+        query = np.asarray(query_vector, dtype=np.float32).ravel()
+        query = query / (np.linalg.norm(query) or 1.0)
+        index = getattr(self.vector_index, 'index', self.vector_index)
+        scores = index.rows(rows) @ query
+        best = _top(scores, pool)
+        return rows[best], scores[best]
+
+    def _bm25_scores(self, query_text: str, rows: np.ndarray | None, pool: int) -> tuple[np.ndarray, np.ndarray]:
+        scores = self.bm25.scores(query_text)
+        if rows is not None:
+            scores = scores[rows]
+        best = _top(scores, pool)
+        best = best[scores[best] > 0]
+        return (rows[best] if rows is not None else best), scores[best]
+
+    def search(self, query_text: str, query_vector, top_k: int = 5, norma: str = None,
+               fusion: str = None) -> np.ndarray:
+        """
+        Linhas do df mais relevantes para a consulta, em ordem decrescente.
+
+        Args:
+            norma: Restringe os candidatos aos chunks desta norma.
+            fusion: Substitui o modo de fusão configurado.
+        """
+        fusion = fusion or self.fusion
+        rows = self.candidates_for(norma)
+        pool = max(top_k * CANDIDATES_PER_RESULT, top_k)
+
+        vector_rows, vector_scores = self._vector_scores(query_vector, rows, top_k if fusion == 'vector' else pool)
+        if fusion == 'vector':
+            return vector_rows[:top_k]
+        bm25_rows, bm25_scores = self._bm25_scores(query_text, rows, pool)
+
+        fused = {}
+        if fusion == 'rrf':
+            for ranked in (vector_rows, bm25_rows):
+                for rank, row in enumerate(ranked):
+                    fused[int(row)] = fused.get(int(row), 0.0) + 1.0 / (RRF_K + rank + 1)
+        else:
+            for ranked, scores, weight in ((vector_rows, _min_max(vector_scores), self.alpha),
+                                           (bm25_rows, _min_max(bm25_scores), 1 - self.alpha)):
+                for row, score in zip(ranked, scores):
+                    fused[int(row)] = fused.get(int(row), 0.0) + weight * float(score)
+        ranked = sorted(fused, key=lambda row: -fused[row])
+        return np.asarray(ranked[:top_k], dtype=np.int64)
+
+
+def evaluate(retriever: HybridRetriever, cases: list[dict], query_vectors, top_k: int = 7) -> list[dict]:
+    """
+    Recall@k, MRR e latência por configuração.
+
+    Args:
+        cases: [{'query', 'norma', 'relevant': [linhas]}]
+        query_vectors: Embedding de cada consulta, na mesma ordem.
+    """
+    configs = [('vetorial', 'vector', False), ('vetorial + filtro', 'vector', True),
+               ('rrf', 'rrf', False), ('rrf + filtro', 'rrf', True),
+               ('linear', 'linear', False), ('linear + filtro', 'linear', True)]
+    retriever.bm25  # constrói fora da medição
+    results = []
+    for label, fusion, use_filter in configs:
+        recalls, reciprocal_ranks = [], []
+        start_time = time.perf_counter()
+        for case, vector in zip(cases, query_vectors):
+            found = retriever.search(case['query'], vector, top_k, case.get('norma') if use_filter else None, fusion)
+            relevant = set(case['relevant'])
+            # Acertos sobre o máximo possível (min(relevantes, k))
+            recalls.append(len(relevant & set(found.tolist())) / min(len(relevant), top_k) if relevant else 0.0)
+            ranks = [rank for rank, row in enumerate(found.tolist(), 1) if row in relevant]
+            reciprocal_ranks.append(1 / ranks[0] if ranks else 0.0)
+        elapsed = (time.perf_counter() - start_time) / max(len(cases), 1) * 1000
+        results.append({'config': label, 'recall': float(np.mean(recalls)), 'mrr': float(np.mean(reciprocal_ranks)),
+                        'ms': elapsed})
+    return results
+
+
+def _synthetic_benchmark(n_chunks: int = 20000, dim: int = 256, n_queries: int = 200, noise: float = 4.0):
+    """Corpus com vocabulário e tópicos vetoriais por norma; relevantes = chunks do mesmo tema."""
+    import pandas as pd
+    from analysis.vector_index import VectorIndex
+
+    rng = np.random.default_rng(0)
+    normas = [f"NR-{n:02d}" for n in (1, 5, 6, 7, 10, 11, 12, 18, 20, 23, 33, 35)]
+    common = [f"termo{i}" for i in range(400)]
+    themes = {(norma, t): [f"{norma.lower().replace('-', '')}tema{t}palavra{i}" for i in range(8)]
+              for norma in normas for t in range(20)}
+    norma_vectors = {norma: rng.standard_normal(dim) for norma in normas}
+    theme_vectors = {key: norma_vectors[key[0]] + rng.standard_normal(dim) for key in themes}
+
+    keys = [list(themes)[i] for i in rng.integers(0, len(themes), n_chunks)]
+    texts = [" ".join(list(rng.choice(common, 40)) + list(rng.choice(themes[key], 3))) for key in keys]
+    vectors = np.stack([theme_vectors[key] + noise * rng.standard_normal(dim) for key in keys])
+    df = pd.DataFrame({TEXT_COLUMN: texts, 'Source': [key[0] for key in keys]})
+    retriever = HybridRetriever(df, VectorIndex.from_vectors(vectors))
+
+    rows_by_key = {}
+    for row, key in enumerate(keys):
+        rows_by_key.setdefault(key, []).append(row)
+    cases, query_vectors = [], []
+    for key in [list(themes)[i] for i in rng.integers(0, len(themes), n_queries)]:
+        cases.append({'query': " ".join(rng.choice(themes[key], 2)) + " " + " ".join(rng.choice(common, 6)),
+                      'norma': key[0], 'relevant': rows_by_key.get(key, [])})
+        query_vectors.append(theme_vectors[key] + noise * rng.standard_normal(dim))
+    return evaluate(retriever, cases, query_vectors)
+
+
+def _real_benchmark(cases_path: str, store_dir: str = None):
+    from analysis.embedding_cache import get_embedding_cache
+    from analysis.rag_builder import RagStore
+
+    with open(cases_path, encoding='utf-8') as f:
+        cases = json.load(f)
+    store = RagStore(store_dir) if store_dir else RagStore()
+    df, index = store.load()
+    retriever = HybridRetriever(df, index)
+    query_vectors = get_embedding_cache().embed([case['query'] for case in cases], model=store.embedding_model())
+    return evaluate(retriever, cases, query_vectors)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] != '--synthetic':
+        rows = _real_benchmark(*sys.argv[1:3])
+    else:
+        rows = _synthetic_benchmark()
+    print(f"{'configuração':<20} {'recall@k':>9} {'MRR':>7} {'ms/consulta':>12}")
+    for row in rows:
+        print(f"{row['config']:<20} {row['recall']:>9.3f} {row['mrr']:>7.3f} {row['ms']:>12.2f}")
@@ -1,18 +1,25 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 import google.generativeai as genai
-from google.generativeai.client import configure
 from google.generativeai.generative_models import GenerativeModel
-import re
-import json
+import io
 import tempfile
 import os
 import random
+import threading
 from datetime import datetime
 from typing import Optional
-from sklearn.metrics.pairwise import cosine_similarity
 from AI.api_Operation import PDFQA
+from AI.api_load import use_api_key
+from AI.page_selection import profile_for_norma
+from AI.schemas import get_schema, parse_structured, build_result
+from analysis.embedding_cache import (
+    get_embedding_cache, embed_with_gemini, known_audit_queries, build_audit_query, resolve_audit_norma,
+    EMBEDDING_MODEL
+)
+from analysis.ann_index import get_search_index
+from analysis.hybrid_retrieval import HybridRetriever
+from analysis.rag_builder import RagStore
 from operations.supabase_operations import SupabaseOperations
 import logging
 
@@ -28,7 +35,7 @@ def validate_managers(manager_dict: dict) -> Optional[str]:
     Returns:
         None se tudo estiver ok, ou mensagem de erro se houver problema.
     """
-    required_managers = ['supabase_ops', 'pdf_analyzer']
+    required_managers = ['supabase_ops']
     
     # Verifica se todos os managers necessários estão presentes
     for manager in required_managers:
@@ -40,7 +47,7 @@ def validate_managers(manager_dict: dict) -> Optional[str]:
     # Verifica tipos específicos
     if not isinstance(manager_dict['supabase_ops'], SupabaseOperations):
         return "SupabaseOperations não inicializado corretamente"
-    if not isinstance(manager_dict['pdf_analyzer'], PDFQA):
+    if 'pdf_analyzer' in manager_dict and not isinstance(manager_dict['pdf_analyzer'], PDFQA):
         return "PDFQA não inicializado corretamente"
             
     return None
@@ -51,13 +58,96 @@ class NRAnalyzer:
     _rag_cache = None
     _rag_cache_time = None
     RAG_CACHE_TTL = 3600  # 1 hora
+    RAG_VERSION_CHECK_SECONDS = 30
+    _rag_version = None
+    _rag_checked_at = None
+    # Modelo de embedding da base carregada; as consultas usam o mesmo
+    _rag_embedding_model = None
+    # Trechos recuperados por consulta; a consulta depende só de (tipo, norma)
+    _knowledge_cache = {}
+    _retriever = None
+    _warm_up_started = False
+
+    @classmethod
+    def _embed_texts(cls, model, contents, task_type):
+        """
+        Embeddings via API (só para consultas ausentes do cache), com a chave de
+        embeddings aplicada pelo AI.api_load (o cliente do genai é global).
+        """
+        with use_api_key(os.getenv("GEMINI_API_KEY")):
+            return embed_with_gemini(model, contents, task_type)
+
+    @classmethod
+    def _query_embedding_model(cls) -> str:
+        """Modelo de embedding das consultas: o da base em uso (ou da versão publicada)."""
+        if cls._rag_embedding_model:
+            return cls._rag_embedding_model
+        try:
+            return RagStore().embedding_model()
+        except Exception as e:
+            logger.warning(f"Manifesto da base RAG ilegível, usando {EMBEDDING_MODEL}: {e}")
+            return EMBEDDING_MODEL
+
+    @classmethod
+    def warm_up_query_embeddings(cls, training_normas: list = None) -> int:
+        """
+        Pré-calcula os embeddings das consultas de auditoria de todos os tipos
+        de documento e normas conhecidos; auditorias comuns passam a recuperar
+        o contexto sem chamada de rede.
+        """
+        try:
+            return get_embedding_cache().warm_up(known_audit_queries(training_normas),
+                                                 model=cls._query_embedding_model(), embed_fn=cls._embed_texts)
+        except Exception as e:
+            logger.warning(f"Falha no pré-aquecimento dos embeddings de consulta: {e}")
+            return 0
+
+    @classmethod
+    def _start_warm_up(cls):
+        """Pré-aquecimento em segundo plano, uma vez por processo."""
+        if cls._warm_up_started:
+            return
+        cls._warm_up_started = True
+        threading.Thread(target=cls.warm_up_query_embeddings, name="embedding-warm-up", daemon=True).start()
     
     @classmethod
     def _get_rag_base(cls):
-        """Carrega RAG com cache de classe (não de sessão)"""
+        """
+        Carrega a base RAG com cache de classe (não de sessão).
+
+        Com o artefato versionado (rag_store/), a versão publicada é conferida
+        a cada RAG_VERSION_CHECK_SECONDS e trocada sem reiniciar o servidor;
+        sem ele, usa rag_dataframe.pkl + rag_embeddings.npy com TTL.
+        """
         import time
         
         now = time.time()
+        store = RagStore()
+        
+        if cls._rag_cache is not None and cls._rag_checked_at is not None and \
+                (now - cls._rag_checked_at) < cls.RAG_VERSION_CHECK_SECONDS:
+            return cls._rag_cache
+        
+        version = store.current_version()
+        if version is not None:
+            cls._rag_checked_at = now
+            if cls._rag_cache is not None and version == cls._rag_version:
+                return cls._rag_cache
+            try:
+                df, vector_index = store.load(version)
+                if cls._rag_version is not None:
+                    logger.info(f"Base RAG atualizada: {cls._rag_version} -> {version}")
+                cls._rag_cache = (df, vector_index)
+                cls._rag_version = version
+                cls._rag_embedding_model = store.embedding_model(version)
+                cls._rag_cache_time = now
+                cls._knowledge_cache = {}
+                return cls._rag_cache
+            except Exception as e:
+                logger.error(f"Erro ao carregar a base RAG {version}: {e}")
+                # Mantém a versão em uso até a nova ser corrigida
+                if cls._rag_cache is not None:
+                    return cls._rag_cache
         
         # Verifica se o cache ainda é válido
         if (cls._rag_cache is not None and 
@@ -65,16 +155,30 @@ class NRAnalyzer:
             (now - cls._rag_cache_time) < cls.RAG_CACHE_TTL):
             return cls._rag_cache
         
-        # Carrega dados
+        # Carrega dados (formato antigo)
         try:
             df = pd.read_pickle("rag_dataframe.pkl")
-            embeddings = np.load("rag_embeddings.npy")
-            cls._rag_cache = (df, embeddings)
+            # ✅ Índice pré-normalizado e em memory-map, compartilhado entre processos;
+            # bases grandes usam o IVF aproximado (SEGSIS_ANN_MIN_CHUNKS)
+            vector_index = get_search_index("rag_embeddings.npy")
+            cls._rag_cache = (df, vector_index)
+            cls._rag_embedding_model = EMBEDDING_MODEL
             cls._rag_cache_time = now
+            cls._rag_checked_at = now
+            cls._knowledge_cache = {}
             return cls._rag_cache
         except Exception as e:
             logger.error(f"Erro ao carregar RAG: {e}")
-            return None, None
+            return cls._rag_cache or (None, None)
+
+    @classmethod
+    def _get_retriever(cls, df, vector_index) -> HybridRetriever:
+        """Recuperação híbrida da base carregada (recriada quando a base muda)."""
+        retriever = cls._retriever
+        if retriever is None or retriever.df is not df or retriever.vector_index is not vector_index:
+            retriever = HybridRetriever(df, vector_index)
+            cls._retriever = retriever
+        return retriever
 
     def __init__(self, unit_id: Optional[str]):
         """
@@ -92,13 +196,17 @@ class NRAnalyzer:
         # Cache de dados
         self._page_id_map = None
         self.df = None  # Será carregado após validação
-        self.embeddings = None
+        self.vector_index = None
         
         # Validação inicial
         self._initialize_managers()
-        
-        # Setup de bibliotecas
-        configure(api_key=os.getenv("GEMINI_API_KEY"))
+
+    @property
+    def pdf_analyzer(self):
+        """PDFQA criado no primeiro uso de IA."""
+        if self._pdf_analyzer is None:
+            self._pdf_analyzer = PDFQA()
+        return self._pdf_analyzer
         
     def _initialize_managers(self):
         """
@@ -119,16 +227,14 @@ class NRAnalyzer:
                 self.supabase_ops = None  # Garante que está definido
                 raise
             
-            # Inicializa o PDF Analyzer
-            self._pdf_analyzer = PDFQA()
-            
             # Carrega os dados RAG
-            self.df, self.embeddings = self._get_rag_base()
+            self.df, self.vector_index = self._get_rag_base()
+            if self.vector_index is not None:
+                self._start_warm_up()
             
-            # Valida todos os managers
+            # Valida os managers (o PDFQA é criado sob demanda)
             managers = {
-                'supabase_ops': self.supabase_ops,
-                'pdf_analyzer': self._pdf_analyzer
+                'supabase_ops': self.supabase_ops
             }
             
             validation_error = validate_managers(managers)
@@ -141,47 +247,53 @@ class NRAnalyzer:
             st.error("❌ Falha ao inicializar componentes necessários")
             raise RuntimeError("Falha na inicialização dos managers")
 
-    def _find_semantically_relevant_chunks(self, query_text: str, top_k: int = 5) -> str:
+    def _find_semantically_relevant_chunks(self, query_text: str, top_k: int = 5, norma: str = None) -> str:
         """
-        Busca chunks de texto semanticamente relevantes na base de conhecimento.
+        Busca chunks de texto relevantes na base de conhecimento (BM25 + vetorial).
         
         Args:
             query_text: Texto da consulta
             top_k: Número de chunks a retornar
+            norma: Restringe a busca aos chunks desta norma, quando a base tem o metadado
             
         Returns:
             String com os chunks mais relevantes ou mensagem de erro
         """
+        # Sessões longas passam a usar a versão publicada mais recente
+        self.df, self.vector_index = self._get_rag_base()
+
         # Valida a base de dados
-        if self.df is None or self.df.empty or self.embeddings is None or self.embeddings.size == 0:
+        if self.df is None or self.df.empty or self.vector_index is None or len(self.vector_index) == 0:
             logger.error("Base de conhecimento não encontrada ou vazia")
             return "Base de conhecimento indisponível ou não indexada."
 
+        if 'Answer_Chunk' not in self.df.columns:
+            logger.error("Coluna 'Answer_Chunk' não encontrada")
+            return "Erro na estrutura da base de conhecimento"
+
+        cache_key = (id(self.vector_index), query_text, top_k, norma)
+        cached_chunks = self._knowledge_cache.get(cache_key)
+        if cached_chunks is not None:
+            return cached_chunks
+
         try:
             try:
-                from google.generativeai import embed_content
-                
-                result = embed_content(
-                    model="models/text-embedding-004",
-                    content=query_text,
-                    task_type="retrieval_query"
+                # ✅ Consultas repetidas (modelos fixos por tipo/norma) vêm do cache, sem rede
+                query_vector = get_embedding_cache().embed_one(
+                    query_text, model=self._query_embedding_model(), embed_fn=self._embed_texts
                 )
             except ImportError:
                 logger.error("Falha ao importar embed_content do google.generativeai")
                 return "Erro: módulo de embeddings não disponível" 
             
-            query_embedding = np.array(result['embedding']).reshape(1, -1)
-            
-            # Calcula similaridade
-            similarities = cosine_similarity(query_embedding, self.embeddings)[0]
-            top_k_indices = similarities.argsort()[-top_k:][::-1]
+            # ✅ Candidatos da norma primeiro; BM25 e similaridade vetorial combinados
+            retriever = self._get_retriever(self.df, self.vector_index)
+            top_k_indices = retriever.search(query_text, query_vector, top_k, norma=norma)
             relevant_chunks = self.df.iloc[top_k_indices]
             
-            if 'Answer_Chunk' not in relevant_chunks.columns:
-                logger.error("Coluna 'Answer_Chunk' não encontrada")
-                return "Erro na estrutura da base de conhecimento"
-            
-            return "\n\n---\n\n".join(relevant_chunks['Answer_Chunk'].tolist())
+            chunks = "\n\n---\n\n".join(relevant_chunks['Answer_Chunk'].tolist())
+            self._knowledge_cache[cache_key] = chunks
+            return chunks
             
         except Exception as e:
             logger.error(f"Erro durante busca semântica: {str(e)}")
@@ -195,47 +307,109 @@ class NRAnalyzer:
         norma = doc_info.get("norma", "")
         
         # Para ASOs e Documentos de Empresa que não têm norma específica
-        if not norma and doc_type in ["ASO", "Doc. Empresa"]:
-            if doc_type == "ASO":
-                norma = "NR-07"
-            elif doc_type == "Doc. Empresa":
-                # Tenta identificar a norma pelo tipo de documento
-                doc_subtype = doc_info.get("tipo_documento", "").upper()
-                if "PGR" in doc_subtype:
-                    norma = "NR-01"
-                elif "PCMSO" in doc_subtype:
-                    norma = "NR-07"
-                elif "PPR" in doc_subtype:
-                    norma = "NR-09"
-                else:
-                    norma = "normas aplicáveis"
+        norma = resolve_audit_norma(doc_type, norma, doc_info.get("tipo_documento", ""))
         
-        query = f"Quais são os principais requisitos de conformidade para um {doc_type} da norma {norma}?"
+        query = build_audit_query(doc_type, norma)
         
-        relevant_knowledge = self._find_semantically_relevant_chunks(query, top_k=7)
+        relevant_knowledge = self._find_semantically_relevant_chunks(query, top_k=7, norma=norma)
         
         if "Base de conhecimento indisponível" in relevant_knowledge:
              return {"summary": "Falha na Auditoria", "details": [{"item_verificacao": "Base de conhecimento indisponível.", "status": "Não Conforme"}]}
 
-        prompt = self._get_advanced_audit_prompt(doc_info, relevant_knowledge)
-        
+        prompt_prefix, prompt_suffix = self._get_audit_prompt_parts(doc_info, relevant_knowledge)
+
         temp_path = None
         try:
             with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
                 temp_file.write(file_content)
                 temp_path = temp_file.name
-            if not self._pdf_analyzer:
-                raise ValueError("PDF Analyzer não foi inicializado")
-            analysis_result, _ = self._pdf_analyzer.answer_question([temp_path], prompt, task_type='audit')
-            return self._parse_advanced_audit_result(analysis_result) if analysis_result else None
+            # Documentos da empresa (PGR/PCMSO...) são longos: envia as páginas relevantes
+            page_profile = None
+            if doc_type not in ["ASO", "Treinamento"]:
+                page_profile = profile_for_norma(norma, doc_info.get("tipo_documento"))
+            result, failed = self.pdf_analyzer.answer_structured(
+                [temp_path], 'auditoria', prompt_suffix, task_type='audit',
+                prompt_prefix=prompt_prefix, prefix_label=f"auditoria-{doc_type}-{norma}",
+                page_profile=page_profile
+            )
+            if result is None:
+                return self._invalid_audit_result(failed) if failed else None
+            if failed:
+                logger.warning(f"Resposta da auditoria com campos inválidos: {failed}")
+            return self._audit_result_to_dict(result)
         finally:
             if temp_path and os.path.exists(temp_path):
                 os.unlink(temp_path)
 
+    def perform_batch_audit(self, docs: list[tuple[dict, bytes]],
+                            progress_callback=None) -> list[tuple[dict | None, str | None]]:
+        """
+        Audita vários documentos com PDFQA.answer_questions_batch: as chamadas
+        aguardam a janela do plano em vez de serem recusadas.
+
+        Args:
+            docs: Lista de (doc_info, bytes do PDF), como em perform_initial_audit.
+            progress_callback: Chamado com (concluídos, total).
+
+        Returns:
+            Um (resultado da auditoria ou None, erro ou None) por documento, na mesma ordem.
+        """
+        results = [(None, None)] * len(docs)
+        items, positions = [], []
+        for index, (doc_info, file_content) in enumerate(docs):
+            doc_type = doc_info.get("type", "documento")
+            norma = resolve_audit_norma(doc_type, doc_info.get("norma", ""), doc_info.get("tipo_documento", ""))
+            relevant_knowledge = self._find_semantically_relevant_chunks(
+                build_audit_query(doc_type, norma), top_k=7, norma=norma
+            )
+            if "Base de conhecimento indisponível" in relevant_knowledge:
+                results[index] = (None, "Base de conhecimento indisponível.")
+                continue
+
+            prompt_prefix, prompt_suffix = self._get_audit_prompt_parts(doc_info, relevant_knowledge)
+            pdf_file = io.BytesIO(file_content)
+            pdf_file.name = f"auditoria-{index + 1}.pdf"
+            pdf_files, question = [pdf_file], f"{prompt_prefix}\n\n{prompt_suffix}"
+            if doc_type not in ["ASO", "Treinamento"]:
+                page_profile = profile_for_norma(norma, doc_info.get("tipo_documento"))
+                if page_profile:
+                    pdf_files, question = PDFQA._apply_page_selection(pdf_files, question, page_profile)
+            items.append((pdf_files, question))
+            positions.append(index)
+
+        answers = self.pdf_analyzer.answer_questions_batch(
+            items, task_type='audit', response_schema=get_schema('auditoria'), progress_callback=progress_callback
+        )
+        for index, answer in zip(positions, answers):
+            if answer['error']:
+                results[index] = (None, answer['error'])
+            else:
+                results[index] = (self._parse_advanced_audit_result(answer['answer']), None)
+        return results
+
     def _get_advanced_audit_prompt(self, doc_info: dict, relevant_knowledge: str) -> str:
+        prefix, suffix = self._get_audit_prompt_parts(doc_info, relevant_knowledge)
+        return f"{prefix}\n\n{suffix}"
+
+    def _get_audit_prompt_suffix(self) -> str:
+        """Parte variável do prompt de auditoria (data da auditoria)."""
+        data_atual = datetime.now().strftime('%d/%m/%Y')
+        return f"""
+        **Contexto Crítico:** A data de hoje, que é a data da auditoria, é **{data_atual}**.
+
+        Audite o documento PDF anexo seguindo as regras e o checklist acima e responda somente com o JSON.
+        """
+
+    def _get_audit_prompt_parts(self, doc_info: dict, relevant_knowledge: str) -> tuple[str, str]:
+        """
+        Monta o prompt de auditoria em duas partes: um prefixo estável por
+        (tipo de documento, norma, base de conhecimento, versão do prompt),
+        registrado como contexto em cache, e o sufixo com a data da auditoria.
+        O contexto é identificado pelo hash do prefixo: mudanças no texto do
+        prompt ou nos trechos da base RAG registram um novo contexto.
+        """
         doc_type = doc_info.get("type", "documento")
         norma = doc_info.get("norma", "normas aplicáveis")
-        data_atual = datetime.now().strftime('%d/%m/%Y')
 
         checklist_instrucoes = ""
         json_example = ""
@@ -297,7 +471,7 @@ class NRAnalyzer:
                 *   Verifique se o certificado possui um campo para a assinatura do trabalhador e se ele está assinado. A assinatura do trabalhador é a evidência de que ele recebeu o treinamento.
                 *   **REGRA:** Se a assinatura do trabalhador estiver ausente, este item é **'Não Conforme'**. Não aceite o documento como totalmente conforme sem ela.
 
-            5.  **Consistência das Datas:** A data de realização do treinamento não pode ser futura em relação à data da auditoria ({data_atual}).
+            5.  **Consistência das Datas:** A data de realização do treinamento não pode ser futura em relação à data da auditoria.
             """
             json_example = """
               "resumo_executivo": "O certificado de treinamento apresenta uma não conformidade crítica devido à ausência da assinatura do trabalhador, o que compromete a comprovação de que o treinamento foi efetivamente recebido.",
@@ -311,7 +485,7 @@ class NRAnalyzer:
             """
 
         elif doc_type == "ASO":
-            checklist_instrucoes = f"""
+            checklist_instrucoes = """
             **Checklist de Auditoria Obrigatório para Atestado de Saúde Ocupacional (ASO - NR-07):**
             
             1.  **Identificação Completa:** Verifique se o ASO contém o nome completo do trabalhador, número de CPF, e a função desempenhada.
@@ -319,7 +493,7 @@ class NRAnalyzer:
             2.  **Dados do Exame:**
                 *   Verifique se o tipo de exame (admissional, periódico, demissional, etc.) está claro.
                 *   Confira se os riscos ocupacionais específicos (se houver) estão listados.
-                *   Verifique se a data de emissão do ASO é explícita e não é uma data futura em relação à data da auditoria ({data_atual}).
+                *   Verifique se a data de emissão do ASO é explícita e não é uma data futura em relação à data da auditoria.
             
             3.  **Assinatura do Médico (Item Crítico):**
                 *   Verifique se o ASO contém o nome, número do conselho de classe (CRM) e a **assinatura** do médico responsável pelo exame.
@@ -360,10 +534,10 @@ class NRAnalyzer:
               ]
             """
 
-        return f"""
+        prefix = f"""
         **Persona:** Você é um Auditor Líder de SST. Sua análise é baseada em duas fontes: (1) As regras da sua tarefa e (2) a Base de Conhecimento fornecida.
 
-        **Contexto Crítico:** A data de hoje é **{data_atual}**.
+        **Contexto Crítico:** A data da auditoria é informada ao final, junto com o documento.
 
         **Base de Conhecimento Normativa (Fonte da Verdade):**
         A seguir estão trechos de Normas Regulamentadoras. USE ESTA FONTE para preencher a chave "referencia_normativa" no JSON.
@@ -397,34 +571,43 @@ class NRAnalyzer:
         }}
         ```
         """
+        return prefix, self._get_audit_prompt_suffix()
 
     def _parse_advanced_audit_result(self, json_string: str) -> dict:
-        try:
-            match = re.search(r'\{.*\}', json_string, re.DOTALL)
-            if not match:
-                return {"summary": "Falha na Análise", "details": [{"item_verificacao": "Resposta Bruta da IA", "observacao": json_string, "status": "Não Conforme"}]}
-            data = json.loads(match.group(0))
-            summary = data.get("parecer_final", "Indefinido")
-            details = []
-            
-            if data.get("resumo_executivo"):
-                status_resumo = "Conforme" if "conforme" in summary.lower() else "Não Conforme"
-                details.append({"item_verificacao": "Resumo Executivo da Auditoria", "referencia_normativa": "N/A", "observacao": data["resumo_executivo"], "status": status_resumo})
-            
-            for item in data.get("pontos_de_nao_conformidade", []):
-                details.append({"item_verificacao": item.get("item", ""), "referencia_normativa": item.get("referencia_normativa", ""), "observacao": item.get("observacao", ""), "status": "Não Conforme"})
-
-            for item in data.get("pontos_de_ressalva", []):
-                details.append({
-                    "item_verificacao": f"Ressalva: {item.get('item', '')}",
-                    "referencia_normativa": item.get("referencia_normativa", ""),
-                    "observacao": item.get("observacao", ""),
-                    "status": "Ressalva"
-                })
-
-            return {"summary": summary, "details": details}
-        except (json.JSONDecodeError, AttributeError):
+        data, failed = parse_structured('auditoria', json_string)
+        if data is None:
             return {"summary": "Falha na Análise (Erro de JSON)", "details": [{"item_verificacao": "Resposta Bruta da IA", "observacao": json_string, "status": "Não Conforme"}]}
+        if failed:
+            logger.warning(f"Resposta da auditoria com campos inválidos: {failed}")
+        return self._audit_result_to_dict(build_result('auditoria', data))
+
+    @staticmethod
+    def _invalid_audit_result(failed: list) -> dict:
+        """Resultado exibido quando a resposta da auditoria não seguiu o esquema."""
+        return {"summary": "Falha na Análise (Erro de JSON)", "details": [{"item_verificacao": "Resposta da IA fora do formato esperado", "observacao": f"Campos inválidos: {', '.join(failed)}", "status": "Não Conforme"}]}
+
+    @staticmethod
+    def _audit_result_to_dict(result) -> dict:
+        """Converte o AuditResult tipado no formato {'summary', 'details'} usado pela interface."""
+        summary = result.parecer_final or "Indefinido"
+        details = []
+
+        if result.resumo_executivo:
+            status_resumo = "Conforme" if "conforme" in summary.lower() else "Não Conforme"
+            details.append({"item_verificacao": "Resumo Executivo da Auditoria", "referencia_normativa": "N/A", "observacao": result.resumo_executivo, "status": status_resumo})
+
+        for point in result.pontos_de_nao_conformidade:
+            details.append({"item_verificacao": point.item or "", "referencia_normativa": point.referencia_normativa or "", "observacao": point.observacao or "", "status": "Não Conforme"})
+
+        for point in result.pontos_de_ressalva:
+            details.append({
+                "item_verificacao": f"Ressalva: {point.item or ''}",
+                "referencia_normativa": point.referencia_normativa or "",
+                "observacao": point.observacao or "",
+                "status": "Ressalva"
+            })
+
+        return {"summary": summary, "details": details}
 
     def create_action_plan_from_audit(
         self, 
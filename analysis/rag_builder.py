@@ -0,0 +1,381 @@
+"""
+Artefato versionado da base RAG e pipeline de construção offline.
+
+Cada versão fica em um diretório próprio dentro de rag_store/:
+
+    rag_store/
+        CURRENT                 nome da versão publicada (ex.: v0003)
+        v0003/
+            manifest.json       versão, modelo, dimensão, fontes e hashes dos arquivos
+            chunks.parquet      texto e metadados (chunk_id, Answer_Chunk, Source, Norma, position)
+            embeddings.npy      matriz float32 alinhada às linhas (aberta com memory-map)
+
+A construção divide as fontes (PDF, .txt, .md) em chunks, identifica cada
+um pelo hash do conteúdo e reaproveita os embeddings da versão publicada;
+só chunks novos ou alterados vão para a API. A versão é publicada trocando
+o CURRENT de forma atômica, e o NRAnalyzer passa a usá-la sem reiniciar.
+
+    python -m analysis.rag_builder build <pasta de fontes>
+    python -m analysis.rag_builder import-legacy rag_dataframe.pkl rag_embeddings.npy
+    python -m analysis.rag_builder status
+"""
+import os
+import re
+import sys
+import json
+import shutil
+import hashlib
+import logging
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from analysis.embedding_cache import EMBEDDING_MODEL, EMBED_BATCH_SIZE, normalize_text, embed_with_gemini
+from analysis.hybrid_retrieval import norma_key, TEXT_COLUMN
+from analysis.vector_index import build_index_files, DEFAULT_DTYPE
+from analysis.ann_index import build_ivf, ANN_MIN_CHUNKS
+
+logger = logging.getLogger('segsisone_app.rag_builder')
+
+DEFAULT_STORE_DIR = os.getenv("SEGSIS_RAG_STORE_DIR", "rag_store")
+FORMAT_VERSION = 1
+DOCUMENT_TASK_TYPE = "retrieval_document"
+DEFAULT_CHUNK_CHARS = 1500
+DEFAULT_OVERLAP_CHARS = 200
+# Versões mantidas em disco (a publicada e as anteriores, para rollback)
+KEEP_VERSIONS = 3
+SOURCE_EXTENSIONS = ('.pdf', '.txt', '.md')
+
+CHUNKS_FILE = "chunks.parquet"
+EMBEDDINGS_FILE = "embeddings.npy"
+MANIFEST_FILE = "manifest.json"
+CURRENT_FILE = "CURRENT"
+
+
+def chunk_id(text: str) -> str:
+    """Identificador do chunk pelo conteúdo normalizado."""
+    return hashlib.sha256(normalize_text(text).encode('utf-8')).hexdigest()[:32]
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def split_text(text: str, chunk_chars: int = DEFAULT_CHUNK_CHARS,
+               overlap_chars: int = DEFAULT_OVERLAP_CHARS) -> list[str]:
+    """
+    Agrupa parágrafos em chunks de até chunk_chars caracteres; parágrafos
+    maiores são cortados em janelas com sobreposição, no limite de palavra.
+    """
+    paragraphs = [normalize_text(p) for p in re.split(r'\n\s*\n', text or '')]
+    chunks, current = [], ""
+    for paragraph in filter(None, paragraphs):
+        if len(paragraph) > chunk_chars:
+            if current:
+                chunks.append(current)
+                current = ""
+            start = 0
+            while start < len(paragraph):
+                end = min(start + chunk_chars, len(paragraph))
+                cut = paragraph.rfind(' ', start + chunk_chars // 2, end)
+                if end < len(paragraph) and cut > start:
+                    end = cut
+                chunks.append(paragraph[start:end].strip())
+                if end >= len(paragraph):
+                    break
+                start = max(end - overlap_chars, start + 1)
+        elif len(current) + len(paragraph) + 1 > chunk_chars:
+            chunks.append(current)
+            current = paragraph
+        else:
+            current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        chunks.append(current)
+    return [chunk for chunk in chunks if chunk]
+
+
+def _read_source(path: str) -> str:
+    if path.lower().endswith('.pdf'):
+        from operations.local_extraction import extract_pdf_text
+        with open(path, 'rb') as f:
+            return extract_pdf_text(f.read(), max_pages=None)
+    with open(path, encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+
+def collect_chunks(source_dir: str, chunk_chars: int = DEFAULT_CHUNK_CHARS,
+                   overlap_chars: int = DEFAULT_OVERLAP_CHARS) -> tuple[pd.DataFrame, list[dict]]:
+    """
+    Chunks de todas as fontes da pasta (recursivo), sem duplicatas.
+
+    Returns:
+        (DataFrame dos chunks, lista de fontes para o manifesto)
+    """
+    rows, sources, seen = [], [], set()
+    for root, _, files in os.walk(source_dir):
+        for name in sorted(files):
+            if not name.lower().endswith(SOURCE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            relative = os.path.relpath(path, source_dir)
+            text = _read_source(path)
+            if not text.strip():
+                logger.warning(f"Fonte sem texto extraível (PDF escaneado?): {relative}")
+            norma = norma_key(relative) or norma_key(text[:2000]) or ''
+            count = 0
+            for position, chunk in enumerate(split_text(text, chunk_chars, overlap_chars)):
+                identifier = chunk_id(chunk)
+                if identifier in seen:
+                    continue
+                seen.add(identifier)
+                rows.append({'chunk_id': identifier, TEXT_COLUMN: chunk, 'Source': relative,
+                             'Norma': norma, 'position': position})
+                count += 1
+            sources.append({'path': relative, 'sha256': _file_sha256(path), 'chunks': count})
+    df = pd.DataFrame(rows, columns=['chunk_id', TEXT_COLUMN, 'Source', 'Norma', 'position'])
+    return df, sources
+
+
+class RagStore:
+    """Diretório de versões da base RAG."""
+
+    def __init__(self, root: str = DEFAULT_STORE_DIR):
+        self.root = root
+
+    def version_dir(self, version: str) -> str:
+        return os.path.join(self.root, version)
+
+    def current_version(self) -> str | None:
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), encoding='utf-8') as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+        return version or None
+
+    def versions(self) -> list[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name for name in os.listdir(self.root)
+                      if re.fullmatch(r'v\d{4,}', name) and os.path.isdir(self.version_dir(name)))
+
+    def manifest(self, version: str) -> dict:
+        with open(os.path.join(self.version_dir(version), MANIFEST_FILE), encoding='utf-8') as f:
+            return json.load(f)
+
+    def embedding_model(self, version: str = None) -> str:
+        """Modelo com que a versão foi embedada (as consultas precisam do mesmo)."""
+        version = version or self.current_version()
+        if version is None:
+            return EMBEDDING_MODEL
+        return self.manifest(version).get('embedding_model') or EMBEDDING_MODEL
+
+    def verify(self, version: str, manifest: dict = None):
+        """
+        Confere tamanho e sha256 de cada arquivo listado no manifesto.
+
+        Raises:
+            ValueError: arquivo ausente, truncado ou alterado
+        """
+        manifest = manifest or self.manifest(version)
+        directory = self.version_dir(version)
+        files = manifest.get('files') or {}
+        if not files:
+            raise ValueError(f"Manifesto da versão {version} sem hashes dos arquivos")
+        for name, expected in files.items():
+            path = os.path.join(directory, name)
+            if not os.path.exists(path):
+                raise ValueError(f"Versão {version}: arquivo {name} ausente")
+            if os.path.getsize(path) != expected['bytes'] or _file_sha256(path) != expected['sha256']:
+                raise ValueError(f"Versão {version}: {name} não confere com o manifesto")
+
+    def load(self, version: str = None, verify: bool = True) -> tuple[pd.DataFrame, object]:
+        """
+        Chunks e índice de busca da versão (padrão: a publicada). Com verify,
+        os arquivos são conferidos com os hashes do manifesto antes do uso.
+
+        Raises:
+            FileNotFoundError: nenhuma versão publicada
+            ValueError: artefato inconsistente com o manifesto
+        """
+        from analysis.ann_index import get_search_index
+
+        version = version or self.current_version()
+        if version is None:
+            raise FileNotFoundError(f"Nenhuma versão publicada em {self.root}")
+        manifest = self.manifest(version)
+        if manifest.get('format') != FORMAT_VERSION:
+            raise ValueError(f"Formato de artefato não suportado: {manifest.get('format')}")
+        if verify:
+            self.verify(version, manifest)
+        directory = self.version_dir(version)
+        df = pd.read_parquet(os.path.join(directory, CHUNKS_FILE))
+        index = get_search_index(os.path.join(directory, EMBEDDINGS_FILE))
+        if len(df) != manifest['n_chunks'] or len(index) != len(df):
+            raise ValueError(f"Versão {version} inconsistente: {len(df)} chunks, {len(index)} embeddings, "
+                             f"manifesto {manifest['n_chunks']}")
+        return df, index
+
+    def _previous_embeddings(self, model: str) -> dict:
+        """chunk_id -> linha da matriz da versão publicada (mesmo modelo de embedding)."""
+        version = self.current_version()
+        if version is None:
+            return {}
+        try:
+            if self.manifest(version).get('embedding_model') != model:
+                return {}
+            directory = self.version_dir(version)
+            ids = pd.read_parquet(os.path.join(directory, CHUNKS_FILE), columns=['chunk_id'])['chunk_id']
+            matrix = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode='r')
+        except Exception as e:
+            logger.warning(f"Versão publicada ilegível, embedando tudo: {e}")
+            return {}
+        return {identifier: matrix[row] for row, identifier in enumerate(ids)}
+
+    def _next_version(self) -> str:
+        versions = self.versions()
+        return f"v{(int(versions[-1][1:]) + 1 if versions else 1):04d}"
+
+    def publish(self, df: pd.DataFrame, embeddings: np.ndarray, model: str, extra: dict = None) -> str:
+        """Grava uma nova versão e a publica (troca atômica do CURRENT)."""
+        if len(df) != len(embeddings):
+            raise ValueError(f"{len(df)} chunks para {len(embeddings)} embeddings")
+        os.makedirs(self.root, exist_ok=True)
+        version = self._next_version()
+        tmp_dir = os.path.join(self.root, f".{version}.tmp-{os.getpid()}")
+        os.makedirs(tmp_dir)
+        try:
+            df.reset_index(drop=True).to_parquet(os.path.join(tmp_dir, CHUNKS_FILE), index=False)
+            np.save(os.path.join(tmp_dir, EMBEDDINGS_FILE), np.asarray(embeddings, dtype=np.float32))
+            # Índices derivados prontos antes da publicação (o servidor não os reconstrói)
+            build_index_files(os.path.join(tmp_dir, EMBEDDINGS_FILE), DEFAULT_DTYPE)
+            if len(df) >= ANN_MIN_CHUNKS:
+                build_ivf(os.path.join(tmp_dir, EMBEDDINGS_FILE))
+
+            manifest = {
+                'format': FORMAT_VERSION,
+                'version': version,
+                'parent': self.current_version(),
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'embedding_model': model,
+                'dim': int(embeddings.shape[1]) if len(embeddings) else 0,
+                'n_chunks': len(df),
+                'files': {name: {'sha256': _file_sha256(os.path.join(tmp_dir, name)),
+                                 'bytes': os.path.getsize(os.path.join(tmp_dir, name))}
+                          for name in (CHUNKS_FILE, EMBEDDINGS_FILE)},
+                **(extra or {}),
+            }
+            with open(os.path.join(tmp_dir, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+                json.dump(manifest, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_dir, self.version_dir(version))
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        tmp_current = os.path.join(self.root, f".{CURRENT_FILE}.tmp-{os.getpid()}")
+        with open(tmp_current, 'w', encoding='utf-8') as f:
+            f.write(version)
+        os.replace(tmp_current, os.path.join(self.root, CURRENT_FILE))
+        logger.info(f"Base RAG {version} publicada com {len(df)} chunks")
+        self.prune()
+        return version
+
+    def prune(self, keep: int = KEEP_VERSIONS):
+        """Remove versões antigas (processos com memory-map aberto continuam lendo até fechar)."""
+        current = self.current_version()
+        for version in self.versions()[:-keep]:
+            if version != current:
+                shutil.rmtree(self.version_dir(version), ignore_errors=True)
+
+    def build(self, source_dir: str, model: str = EMBEDDING_MODEL, embed_fn=None,
+              chunk_chars: int = DEFAULT_CHUNK_CHARS, overlap_chars: int = DEFAULT_OVERLAP_CHARS) -> str:
+        """
+        Constrói e publica uma versão a partir das fontes; embeda só os chunks
+        que não existem na versão publicada.
+
+        Args:
+            embed_fn: embed_fn(model, contents, task_type) -> lista de vetores;
+                padrão: API do Gemini (GEMINI_API_KEY).
+        """
+        df, sources = collect_chunks(source_dir, chunk_chars, overlap_chars)
+        if df.empty:
+            raise ValueError(f"Nenhum texto encontrado em {source_dir}")
+
+        previous = self._previous_embeddings(model)
+        missing = [row for row, identifier in enumerate(df['chunk_id']) if identifier not in previous]
+        logger.info(f"{len(df)} chunks: {len(df) - len(missing)} reaproveitados, {len(missing)} a embedar")
+
+        new_vectors = {}
+        embed_fn = embed_fn or _gemini_embed_fn()
+        for start in range(0, len(missing), EMBED_BATCH_SIZE):
+            batch = missing[start:start + EMBED_BATCH_SIZE]
+            vectors = embed_fn(model, [df.at[row, TEXT_COLUMN] for row in batch], DOCUMENT_TASK_TYPE)
+            new_vectors.update(zip(batch, vectors))
+            logger.info(f"Embedados {min(start + EMBED_BATCH_SIZE, len(missing))}/{len(missing)}")
+
+        embeddings = np.stack([
+            np.asarray(new_vectors[row] if row in new_vectors else previous[identifier], dtype=np.float32)
+            for row, identifier in enumerate(df['chunk_id'])
+        ])
+        return self.publish(df, embeddings, model, extra={
+            'task_type': DOCUMENT_TASK_TYPE,
+            'chunking': {'chunk_chars': chunk_chars, 'overlap_chars': overlap_chars},
+            'sources': sources,
+            'reused_embeddings': len(df) - len(missing),
+            'new_embeddings': len(missing),
+        })
+
+    def import_legacy(self, dataframe_path: str, embeddings_path: str, model: str = EMBEDDING_MODEL) -> str:
+        """Publica a base antiga (pickle + .npy) como versão, sem reembedar."""
+        # Leitura de pickle só aqui, em migração explícita de um arquivo local conhecido
+        df = pd.read_pickle(dataframe_path).reset_index(drop=True)
+        embeddings = np.load(embeddings_path)
+        if TEXT_COLUMN not in df.columns:
+            raise ValueError(f"Coluna '{TEXT_COLUMN}' ausente em {dataframe_path}")
+        df[TEXT_COLUMN] = df[TEXT_COLUMN].astype(str)
+        df.insert(0, 'chunk_id', [chunk_id(text) for text in df[TEXT_COLUMN]])
+        if 'Norma' not in df.columns:
+            source = df['Source'] if 'Source' in df.columns else df[TEXT_COLUMN]
+            df['Norma'] = [norma_key(str(value)) or '' for value in source]
+        # Colunas de objetos variados não são serializáveis em Parquet
+        for column in df.columns:
+            if df[column].dtype == object:
+                df[column] = df[column].map(lambda value: value if value is None else str(value))
+        return self.publish(df, embeddings, model, extra={
+            'task_type': DOCUMENT_TASK_TYPE,
+            'sources': [{'path': os.path.basename(dataframe_path), 'sha256': _file_sha256(dataframe_path),
+                         'chunks': len(df)}],
+            'reused_embeddings': len(df),
+            'new_embeddings': 0,
+        })
+
+
+def _gemini_embed_fn():
+    from google.generativeai.client import configure
+
+    configure(api_key=os.getenv("GEMINI_API_KEY"))
+    return embed_with_gemini
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    command = sys.argv[1] if len(sys.argv) > 1 else 'status'
+    store = RagStore()
+    if command == 'build' and len(sys.argv) > 2:
+        print(store.build(sys.argv[2]))
+    elif command == 'import-legacy' and len(sys.argv) > 3:
+        print(store.import_legacy(sys.argv[2], sys.argv[3]))
+    elif command == 'status':
+        current = store.current_version()
+        for version in store.versions():
+            manifest = store.manifest(version)
+            marker = '*' if version == current else ' '
+            print(f"{marker} {version}  {manifest['created_at']}  {manifest['n_chunks']} chunks  "
+                  f"{manifest.get('new_embeddings', 0)} novos")
+    else:
+        print(__doc__)
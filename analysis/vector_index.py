@@ -0,0 +1,258 @@
+"""
+Índice vetorial em memória para a base RAG.
+
+Os embeddings são normalizados uma única vez e gravados ao lado do arquivo
+original (float32, float16 ou int8 com escala por linha); o índice abre esse
+arquivo com memory-map, então vários processos do servidor compartilham a
+mesma cópia pelo cache de páginas do sistema. A busca é um produto
+matriz-vetor (similaridade de cosseno com vetores já normalizados) e
+argpartition para o top-k, com suporte a consultas em lote.
+
+Benchmark (dados sintéticos de 768 dimensões):
+
+    python -m analysis.vector_index --benchmark 10000 100000 1000000
+"""
+import os
+import sys
+import time
+import threading
+import logging
+
+import numpy as np
+
+logger = logging.getLogger('segsisone_app.vector_index')
+
+DEFAULT_DTYPE = os.getenv("SEGSIS_VECTOR_INDEX_DTYPE", "float32")
+SUPPORTED_DTYPES = ('float32', 'float16', 'int8')
+# Linhas por bloco no produto com matrizes float16/int8 (limita a memória temporária)
+BLOCK_ROWS = 65536
+_NORMALIZE_BLOCK_ROWS = 100000
+
+
+def _index_paths(source_path: str, dtype: str) -> tuple[str, str]:
+    base = os.path.splitext(source_path)[0]
+    return f"{base}.index-{dtype}.npy", f"{base}.index-{dtype}.scales.npy"
+
+
+def _normalized_blocks(source: np.ndarray):
+    """Linhas normalizadas (float32) em blocos, sem carregar a matriz inteira."""
+    for start in range(0, source.shape[0], _NORMALIZE_BLOCK_ROWS):
+        block = np.asarray(source[start:start + _NORMALIZE_BLOCK_ROWS], dtype=np.float32)
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        yield start, block / norms
+
+
+def build_index_files(source_path: str, dtype: str = DEFAULT_DTYPE) -> tuple[str, str | None]:
+    """
+    Grava a matriz normalizada (e as escalas, para int8) ao lado do .npy original.
+
+    Returns:
+        (caminho da matriz, caminho das escalas ou None)
+    """
+    if dtype not in SUPPORTED_DTYPES:
+        raise ValueError(f"dtype não suportado: {dtype}")
+    matrix_path, scales_path = _index_paths(source_path, dtype)
+    source = np.load(source_path, mmap_mode='r')
+    if source.ndim != 2:
+        raise ValueError(f"Embeddings devem ser uma matriz 2D, recebido {source.shape}")
+
+    tmp_matrix = f"{matrix_path}.tmp-{os.getpid()}"
+    out = np.lib.format.open_memmap(tmp_matrix, mode='w+', dtype=np.dtype(dtype), shape=source.shape)
+    scales = np.ones(source.shape[0], dtype=np.float32) if dtype == 'int8' else None
+    for start, block in _normalized_blocks(source):
+        end = start + block.shape[0]
+        if dtype == 'int8':
+            block_scales = np.abs(block).max(axis=1) / 127.0
+            block_scales[block_scales == 0] = 1.0
+            out[start:end] = np.round(block / block_scales[:, None]).astype(np.int8)
+            scales[start:end] = block_scales
+        else:
+            out[start:end] = block.astype(dtype)
+    out.flush()
+    del out
+    # Troca atômica: outros processos nunca leem um arquivo pela metade
+    os.replace(tmp_matrix, matrix_path)
+    if scales is not None:
+        tmp_scales = f"{scales_path}.tmp-{os.getpid()}.npy"
+        np.save(tmp_scales, scales)
+        os.replace(tmp_scales, scales_path)
+        return matrix_path, scales_path
+    return matrix_path, None
+
+
+class VectorIndex:
+    """
+    Busca por similaridade de cosseno sobre vetores pré-normalizados.
+
+    Args:
+        matrix: Matriz (n, d) já normalizada, em float32/float16/int8
+            (pode ser um memmap).
+        scales: Escala por linha das matrizes int8.
+    """
+
+    def __init__(self, matrix: np.ndarray, scales: np.ndarray | None = None):
+        self.matrix = matrix
+        self.scales = scales
+        self.dtype = str(matrix.dtype)
+
+    @classmethod
+    def from_vectors(cls, vectors, dtype: str = 'float32') -> 'VectorIndex':
+        """Índice em memória a partir de vetores não normalizados."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        normalized = vectors / norms
+        if dtype == 'int8':
+            scales = np.abs(normalized).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            return cls(np.round(normalized / scales[:, None]).astype(np.int8), scales.astype(np.float32))
+        return cls(normalized.astype(dtype))
+
+    @classmethod
+    def load(cls, source_path: str, dtype: str = DEFAULT_DTYPE, mmap: bool = True) -> 'VectorIndex':
+        """
+        Abre o índice do arquivo de embeddings, criando os arquivos normalizados
+        quando ausentes ou mais antigos que o original.
+        """
+        matrix_path, scales_path = _index_paths(source_path, dtype)
+        stale = (not os.path.exists(matrix_path)
+                 or os.path.getmtime(matrix_path) < os.path.getmtime(source_path)
+                 or (dtype == 'int8' and not os.path.exists(scales_path)))
+        if stale:
+            logger.info(f"Construindo índice vetorial {dtype} para {source_path}")
+            build_index_files(source_path, dtype)
+        matrix = np.load(matrix_path, mmap_mode='r' if mmap else None)
+        scales = np.load(scales_path) if dtype == 'int8' else None
+        return cls(matrix, scales)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def rows(self, selector) -> np.ndarray:
+        """Linhas normalizadas em float32 (slice ou array de índices)."""
+        block = np.asarray(self.matrix[selector], dtype=np.float32)
+        if self.scales is not None:
+            block *= self.scales[selector][:, None]
+        return block
+
+    def _scores(self, queries: np.ndarray) -> np.ndarray:
+        """Similaridades (n, q) para consultas normalizadas (q, d)."""
+        if self.matrix.dtype == np.float32:
+            return self.matrix @ queries.T
+        scores = np.empty((self.matrix.shape[0], queries.shape[0]), dtype=np.float32)
+        for start in range(0, self.matrix.shape[0], BLOCK_ROWS):
+            block = np.asarray(self.matrix[start:start + BLOCK_ROWS], dtype=np.float32)
+            scores[start:start + block.shape[0]] = block @ queries.T
+        if self.scales is not None:
+            scores *= self.scales[:, None]
+        return scores
+
+    def search_batch(self, queries, top_k: int = 5) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Top-k de várias consultas.
+
+        Returns:
+            (índices (q, k), similaridades (q, k)), em ordem decrescente.
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        scores = self._scores(queries / norms).T
+
+        top_k = min(top_k, scores.shape[1])
+        if top_k <= 0:
+            return np.empty((queries.shape[0], 0), dtype=np.int64), np.empty((queries.shape[0], 0), dtype=np.float32)
+        if top_k < scores.shape[1]:
+            candidates = np.argpartition(scores, -top_k, axis=1)[:, -top_k:]
+        else:
+            candidates = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+        candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-candidate_scores, axis=1)
+        return np.take_along_axis(candidates, order, axis=1), np.take_along_axis(candidate_scores, order, axis=1)
+
+    def search(self, query, top_k: int = 5) -> tuple[np.ndarray, np.ndarray]:
+        """Top-k de uma consulta: (índices, similaridades) em ordem decrescente."""
+        indices, scores = self.search_batch(query, top_k)
+        return indices[0], scores[0]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_vector_index(source_path: str = "rag_embeddings.npy", dtype: str = DEFAULT_DTYPE) -> VectorIndex:
+    """Índice do processo para o arquivo de embeddings (recarregado se o arquivo mudar)."""
+    key = (os.path.abspath(source_path), dtype)
+    mtime = os.path.getmtime(source_path)
+    with _indexes_lock:
+        entry = _indexes.get(key)
+        if entry is None or entry[0] != mtime:
+            entry = (mtime, VectorIndex.load(source_path, dtype))
+            _indexes[key] = entry
+        return entry[1]
+
+
+def _benchmark(sizes: list[int], dim: int = 768, queries: int = 32, top_k: int = 7):
+    """Compara a busca atual (normaliza + argsort a cada consulta) com o índice."""
+    import tempfile
+
+    rng = np.random.default_rng(0)
+    query_vectors = rng.standard_normal((queries, dim)).astype(np.float32)
+    print(f"{'chunks':>9} {'modo':<24} {'ms/consulta':>12} {'recall@k':>9} {'MB':>8}")
+
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            source_path = os.path.join(tmp, "emb.npy")
+            source = np.lib.format.open_memmap(source_path, mode='w+', dtype=np.float32, shape=(size, dim))
+            for start in range(0, size, _NORMALIZE_BLOCK_ROWS):
+                end = min(start + _NORMALIZE_BLOCK_ROWS, size)
+                source[start:end] = rng.standard_normal((end - start, dim), dtype=np.float32)
+            source.flush()
+            del source
+
+            exact = None
+            if size * dim * 8 < 2 * 1024 ** 3:
+                # Referência: como a busca era feita (cosine_similarity do sklearn + argsort completo)
+                embeddings = np.load(source_path)
+                start_time = time.perf_counter()
+                for query in query_vectors[:4]:
+                    matrix = embeddings.astype(np.float64)
+                    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+                    sims = matrix @ (query / np.linalg.norm(query))
+                    sims.argsort()[-top_k:][::-1]
+                    del matrix
+                elapsed = (time.perf_counter() - start_time) / 4 * 1000
+                print(f"{size:>9} {'original (float64+argsort)':<24} {elapsed:>12.1f} {'1.000':>9} "
+                      f"{size * dim * 8 / 1024 ** 2:>8.0f}")
+                del embeddings
+
+            for dtype in SUPPORTED_DTYPES:
+                if dtype == 'float32' and size * dim * 4 > 2 * 1024 ** 3:
+                    continue
+                index = VectorIndex.load(source_path, dtype)
+                index.search_batch(query_vectors[:1], top_k)
+                start_time = time.perf_counter()
+                for query in query_vectors:
+                    index.search(query, top_k)
+                single = (time.perf_counter() - start_time) / queries * 1000
+                start_time = time.perf_counter()
+                indices, _ = index.search_batch(query_vectors, top_k)
+                batched = (time.perf_counter() - start_time) / queries * 1000
+                if exact is None:
+                    exact = indices
+                recall = np.mean([len(set(a) & set(b)) / top_k for a, b in zip(indices, exact)])
+                size_mb = index.matrix.nbytes / 1024 ** 2
+                print(f"{size:>9} {dtype + ' (1 consulta)':<24} {single:>12.1f} {recall:>9.3f} {size_mb:>8.0f}")
+                print(f"{size:>9} {dtype + ' (lote)':<24} {batched:>12.1f} {recall:>9.3f} {size_mb:>8.0f}")
+                del index
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--benchmark':
+        _benchmark([int(n) for n in sys.argv[2:]] or [10000, 100000, 1000000])
+    elif len(sys.argv) > 1:
+        for dtype in (sys.argv[2:] or [DEFAULT_DTYPE]):
+            print(build_index_files(sys.argv[1], dtype))
+    else:
+        print(__doc__)
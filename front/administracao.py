@@ -8,6 +8,11 @@ from ui.metrics import display_minimalist_metrics
 from operations.audit_logger import log_action
 from operations.cached_loaders import load_nr_rules_data
 from operations.supabase_operations import SupabaseOperations
+from AI.response_cache import get_response_cache
+from AI.model_executor import get_model_executor
+from AI.prompt_cache import get_prompt_prefix_cache
+from AI.resilience import get_resilient_caller
+from AI.telemetry import get_telemetry
 
 logger = logging.getLogger('segsisone_app.administracao')
 
@@ -696,6 +701,99 @@ def show_super_admin_view():
             else:
                 st.info("Nenhum usuário Premium IA ativo")
 
+        # ✅ Cache de respostas da IA
+        st.markdown("---")
+        st.subheader("🗄️ Cache de Respostas da IA")
+        cache_metrics = get_response_cache().get_metrics()
+
+        col_c1, col_c2, col_c3, col_c4 = st.columns(4)
+        col_c1.metric("Taxa de Acerto", f"{cache_metrics['hit_rate']:.0%}")
+        col_c2.metric("Acertos (memória/disco)", f"{cache_metrics['memory_hits']}/{cache_metrics['disk_hits']}")
+        col_c3.metric("Chamadas Evitadas", cache_metrics['memory_hits'] + cache_metrics['disk_hits'])
+        col_c4.metric("Entradas Salvas", cache_metrics['disk_entries'])
+        st.caption(
+            f"Falhas: {cache_metrics['misses']} · Gravações: {cache_metrics['stores']} · "
+            f"Remoções por TTL/tamanho: {cache_metrics['evictions']} (desde o início do servidor)"
+        )
+
+        # ✅ Executor de chamadas aos modelos
+        executor_metrics = get_model_executor().get_metrics()
+        st.markdown("##### ⚙️ Chamadas aos Modelos")
+        col_e1, col_e2, col_e3, col_e4 = st.columns(4)
+        col_e1.metric("Em Andamento", executor_metrics['in_flight'])
+        col_e2.metric("Na Fila", executor_metrics['queue_depth'])
+        col_e3.metric("Timeouts", executor_metrics['timeouts'])
+        col_e4.metric("Recusadas (saturação)", executor_metrics['rejected'])
+        st.caption(
+            f"Concluídas: {executor_metrics['completed']} · Falhas: {executor_metrics['failed']} · "
+            f"Limite por modelo: {executor_metrics['model_concurrency']} chamadas simultâneas"
+        )
+
+        resilience_metrics = get_resilient_caller().get_metrics()
+        circuits = ", ".join(
+            f"{model}: {state}" for model, state in resilience_metrics['circuits'].items()
+        ) or "nenhum"
+        st.caption(
+            f"Novas tentativas: {resilience_metrics['retries']} · "
+            f"Sem orçamento de retry: {resilience_metrics['retry_budget_exhausted']} · "
+            f"Reservas (hedge): {resilience_metrics['hedges']} ({resilience_metrics['hedge_wins']} mais rápidas) · "
+            f"Recusadas (circuito aberto): {resilience_metrics['circuit_rejections']} · Circuitos: {circuits}"
+        )
+
+        prefix_metrics = get_prompt_prefix_cache().get_metrics()
+        st.caption(
+            f"Contexto em cache dos prompts de auditoria: {prefix_metrics['entries']} ativo(s) · "
+            f"Reutilizações: {prefix_metrics['hits']} · Registros: {prefix_metrics['created']} · "
+            f"Falhas (envio inline): {prefix_metrics['failures']}"
+        )
+
+        # ✅ Telemetria das chamadas de IA
+        st.markdown("---")
+        st.subheader("📈 Telemetria das Chamadas de IA")
+        telemetry = get_telemetry()
+        period_days = st.selectbox(
+            "Período", [1, 7, 30], index=1, format_func=lambda d: f"Últimos {d} dia(s)",
+            key="telemetry_period"
+        )
+        by_model = pd.DataFrame(telemetry.summarize('model', days=period_days))
+        if by_model.empty:
+            st.info("Nenhuma chamada registrada no período.")
+        else:
+            potential = telemetry.cache_potential(days=period_days)
+            col_t1, col_t2, col_t3, col_t4 = st.columns(4)
+            col_t1.metric("Chamadas ao Modelo", int(by_model['chamadas'].sum()),
+                          help=f"{int(by_model['requisicoes'].sum())} requisições enviadas, incluindo "
+                               f"{int(by_model['novas_tentativas'].sum())} novas tentativas e "
+                               f"{int(by_model['reservas_hedge'].sum())} reservas do hedge.")
+            col_t2.metric("Tokens (entrada/saída)",
+                          f"{by_model['tokens_entrada'].sum():,}/{by_model['tokens_saida'].sum():,}".replace(",", "."))
+            col_t3.metric("Custo Estimado", f"US$ {by_model['custo_usd'].sum():.2f}")
+            col_t4.metric("Potencial de Cache", f"{potential['rate']:.0%}",
+                          help="Chamadas ao modelo que repetiram um pedido idêntico já feito no período.")
+
+            st.markdown("##### Por modelo")
+            st.dataframe(by_model, use_container_width=True, hide_index=True)
+
+            tab_unit, tab_user, tab_task, tab_prompt = st.tabs(["Por unidade", "Por usuário", "Por tarefa", "Por versão do prompt"])
+            with tab_unit:
+                st.dataframe(pd.DataFrame(telemetry.summarize('unit_id', days=period_days)),
+                             use_container_width=True, hide_index=True)
+            with tab_user:
+                st.dataframe(pd.DataFrame(telemetry.summarize('user_email', days=period_days)),
+                             use_container_width=True, hide_index=True)
+            with tab_task:
+                st.dataframe(pd.DataFrame(telemetry.summarize('task_type', days=period_days)),
+                             use_container_width=True, hide_index=True)
+            with tab_prompt:
+                st.dataframe(pd.DataFrame(telemetry.summarize('prompt_version', days=period_days)),
+                             use_container_width=True, hide_index=True)
+
+        sink_metrics = telemetry.get_metrics()
+        st.caption(
+            f"Eventos registrados: {sink_metrics['recorded']} · Gravados: {sink_metrics['written']} · "
+            f"Na fila: {sink_metrics['queued']} · Descartados: {sink_metrics['dropped']} (desde o início do servidor)"
+        )
+
         # Botão de refresh
         if st.button("🔄 Atualizar Dados", key="refresh_admin_stats"):
             st.rerun()
@@ -2,16 +2,22 @@ import streamlit as st
 from datetime import date
 import pandas as pd
 import logging
+import zipfile
 from fuzzywuzzy import process
 
 from auth.auth_utils import check_permission, check_feature_permission
+from AI.api_Operation import PDFQA
+from AI.job_queue import get_job_queue
+from operations.bulk_import import BulkImportManager, collect_pdfs, BULK_JOB_TYPE
 from ui.ui_helpers import (
     mostrar_info_normas,
-    highlight_expired,
+    style_expired,
     process_aso_pdf,
     process_training_pdf,
     process_company_doc_pdf,
-    process_epi_pdf
+    process_epi_pdf,
+    render_analysis_job,
+    clear_analysis_state
 )
 
 logger = logging.getLogger('segsisone_app.dashboard')
@@ -83,6 +89,516 @@ def handle_delete_confirmation(docs_manager, employee_manager):
         
         confirm_delete_dialog()
 
+def _render_employee_details(employee, employee_manager, epi_manager, matrix_manager_unidade):
+    """
+    Renderiza o detalhamento (ASOs, treinamentos, EPIs e matriz) de um único funcionário.
+    Os indicadores do topo vêm do resumo pré-calculado; apenas as tabelas de detalhe
+    são montadas aqui, e somente para o funcionário selecionado.
+    """
+    employee_id = employee.get('id')
+    employee_name = employee.get('nome', 'N/A')
+    employee_cargo = employee.get('cargo', 'N/A')
+    aso_vencimento = employee.get('aso_vencimento')
+    overall_status = employee.get('status_geral', 'Em Dia')
+    num_pendencias = int(employee.get('pendencias', 0))
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric(
+        "Status Geral",
+        overall_status,
+        f"{num_pendencias} pendência(s)" if num_pendencias > 0 else "Nenhuma",
+        delta_color="inverse" if overall_status != 'Em Dia' else "off"
+    )
+    col2.metric(
+        "Status do ASO",
+        employee.get('aso_status', 'Não encontrado'),
+        help=f"Vencimento: {aso_vencimento.strftime('%d/%m/%Y') if pd.notna(aso_vencimento) else 'N/A'}"
+    )
+    col3.metric(
+        "Treinamentos Vencidos",
+        f"{int(employee.get('treinamentos_vencidos', 0))} de {int(employee.get('treinamentos_total', 0))}"
+    )
+    
+    st.markdown("---")
+
+    latest_asos = employee_manager.get_latest_aso_by_employee(employee_id)
+    all_trainings = employee_manager.get_all_trainings_by_employee(employee_id)
+    
+    # === ASOs ===
+    st.markdown("##### 🩺 ASO (Mais Recente por Tipo)")
+    if isinstance(latest_asos, pd.DataFrame) and not latest_asos.empty:
+        st.dataframe(
+            style_expired(latest_asos),
+            column_config={
+                "tipo_aso": "Tipo",
+                "data_aso": st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
+                "vencimento": st.column_config.DateColumn("Vencimento", format="DD/MM/YYYY"),
+                "arquivo_id": st.column_config.LinkColumn("Anexo", display_text="📄 PDF"),
+                "situacao": "Situação"
+            },
+            column_order=["tipo_aso", "data_aso", "vencimento", "situacao", "arquivo_id"],
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.info(f"ℹ️ Nenhum ASO encontrado para {employee_name}.")
+
+    # === TREINAMENTOS ===
+    st.markdown("##### 🎓 Treinamentos (Mais Recente por Norma/Módulo)")
+    if isinstance(all_trainings, pd.DataFrame) and not all_trainings.empty:
+        # Formata display do treinamento
+        def format_training_display(row):
+            try:
+                norma = str(row.get('norma', 'N/A')).strip() if 'norma' in row.index else 'N/A'
+                modulo = str(row.get('modulo', 'N/A')).strip() if 'modulo' in row.index else 'N/A'
+                tipo = str(row.get('tipo_treinamento', 'N/A')).strip().title() if 'tipo_treinamento' in row.index else 'N/A'
+
+                # NR-10 SEP
+                if 'NR-10' in norma.upper() or 'NR-10' in modulo.upper():
+                    if 'SEP' in norma.upper() or 'SEP' in modulo.upper():
+                        return f"⚡ NR-10 SEP ({tipo})"
+                    else:
+                        return f"⚡ NR-10 ({tipo})"
+
+                # Normas com módulos
+                if modulo and modulo not in ['N/A', 'nan', '', 'Nan']:
+                    modulo_exibicao = modulo.title()
+                    return f"{norma} - {modulo_exibicao} ({tipo})"
+
+                # Normas simples
+                return f"{norma} ({tipo})"
+
+            except Exception as e:
+                logger.error(f"Erro ao formatar display de treinamento: {e}")
+                return "Erro ao exibir"
+
+        all_trainings['treinamento_completo'] = all_trainings.apply(format_training_display, axis=1)
+
+        st.dataframe(
+            style_expired(all_trainings),
+            column_config={
+                "treinamento_completo": st.column_config.TextColumn(
+                    "Treinamento",
+                    help="Norma, módulo e tipo do treinamento",
+                    width="large"
+                ),
+                "data": st.column_config.DateColumn("Realização", format="DD/MM/YYYY"),
+                "vencimento": st.column_config.DateColumn("Vencimento", format="DD/MM/YYYY"),
+                "anexo": st.column_config.LinkColumn("Anexo", display_text="📄 PDF"),
+                "situacao": "Situação",
+                "norma": None,
+                "modulo": None,
+                "tipo_treinamento": None
+            },
+            column_order=["treinamento_completo", "data", "vencimento", "situacao", "anexo"],
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.info(f"ℹ️ Nenhum treinamento encontrado para {employee_name}.")
+
+    # === EPIs ===
+    st.markdown("##### 🦺 Equipamentos de Proteção Individual (EPIs)")
+    all_epis = epi_manager.get_epi_by_employee(employee_id)
+
+    if isinstance(all_epis, pd.DataFrame) and not all_epis.empty:
+        st.dataframe(
+            all_epis,
+            column_config={
+                "descricao_epi": "Equipamento",
+                "ca_epi": "C.A.",
+                "data_entrega": st.column_config.DateColumn("Data de Entrega", format="DD/MM/YYYY"),
+                "arquivo_id": st.column_config.LinkColumn("Ficha", display_text="📄 PDF")
+            },
+            column_order=["descricao_epi", "ca_epi", "data_entrega", "arquivo_id"],
+            hide_index=True,
+            use_container_width=True
+        )
+    else:
+        st.info(f"ℹ️ Nenhuma Ficha de EPI encontrada para {employee_name}.")
+
+    st.markdown("---")
+
+    # === MATRIZ DE CONFORMIDADE ===
+    st.markdown("##### 📋 Matriz de Conformidade de Treinamentos")
+
+    if not employee_cargo or employee_cargo == 'N/A':
+        st.info("ℹ️ Cargo não definido, impossibilitando análise de matriz.")
+    else:
+        matched_function = matrix_manager_unidade.find_closest_function(employee_cargo)
+
+        if not matched_function:
+            st.success(f"✅ O cargo '{employee_cargo}' não possui treinamentos obrigatórios na matriz da unidade.")
+        else:
+            if matched_function.lower() != employee_cargo.lower():
+                st.caption(f"💡 Analisando com base na função da matriz mais próxima: **'{matched_function}'**")
+
+            required_trainings = matrix_manager_unidade.get_required_trainings_for_function(matched_function)
+
+            if not required_trainings:
+                st.success(f"✅ Nenhum treinamento obrigatório mapeado para a função '{matched_function}'.")
+            else:
+                # Cria lista de treinamentos realizados
+                completed_trainings = []
+
+                if isinstance(all_trainings, pd.DataFrame) and not all_trainings.empty:
+                    for _, row in all_trainings.iterrows():
+                        norma = str(row.get('norma', '')).strip().upper()
+                        modulo = str(row.get('modulo', 'N/A')).strip().title()
+
+                        # Normalização especial para NR-10
+                        if 'NR-10' in norma:
+                            if 'SEP' in norma or 'SEP' in modulo.upper():
+                                completed_trainings.append('nr-10 sep')
+                                completed_trainings.append('nr-10-sep')
+                            else:
+                                completed_trainings.append('nr-10')
+                                completed_trainings.append('nr-10 básico')
+
+                        # Normalização para NR-33
+                        elif 'NR-33' in norma:
+                            if 'SUPERVISOR' in modulo.upper():
+                                completed_trainings.append('nr-33 supervisor')
+                            elif 'TRABALHADOR' in modulo.upper() or 'AUTORIZADO' in modulo.upper():
+                                completed_trainings.append('nr-33 trabalhador autorizado')
+                            completed_trainings.append('nr-33')
+
+                        # Outras normas
+                        else:
+                            completed_trainings.append(norma.lower())
+                            if modulo and modulo not in ['N/A', 'nan', '']:
+                                completed_trainings.append(f"{norma} - {modulo}".lower())
+                                completed_trainings.append(f"{norma} {modulo}".lower())
+                                completed_trainings.append(f"{norma}-{modulo}".lower())
+
+                # Verifica treinamentos faltantes
+                missing = []
+                try:
+                    for req in required_trainings:
+                        if not req or not isinstance(req, str):
+                            logger.warning(f"Treinamento requerido inválido: {req}")
+                            continue
+
+                        req_lower = req.lower().strip()
+
+                        # CRÍTICO: NR-10 Básico NÃO cobre NR-10 SEP
+                        if 'nr-10 sep' in req_lower or 'nr-10-sep' in req_lower:
+                            has_sep = any('sep' in comp for comp in completed_trainings if 'nr-10' in comp)
+                            if not has_sep:
+                                missing.append(req)
+                            continue
+
+                        # Verifica match direto
+                        has_match = any(
+                            req_lower == comp or
+                            req_lower in comp or
+                            comp in req_lower
+                            for comp in completed_trainings
+                        )
+
+                        # Fuzzy matching se não houver match direto
+                        if not has_match and completed_trainings:
+                            try:
+                                from fuzzywuzzy import process as fuzz_process  # ✅ Import local seguro
+                                best_match = fuzz_process.extractOne(req_lower, completed_trainings)
+                                if best_match and best_match[1] > 85:
+                                    has_match = True
+                            except ImportError:
+                                logger.warning("fuzzywuzzy não disponível para fuzzy matching")
+                                pass
+
+                        if not has_match:
+                            missing.append(req)
+
+                except Exception as e:
+                    logger.error(f"Erro ao verificar treinamentos faltantes: {e}")
+                    st.warning("⚠️ Erro ao verificar conformidade de treinamentos")
+
+                # Exibe resultado
+                if not missing:
+                    st.success("✅ Todos os treinamentos obrigatórios foram realizados.")
+                else:
+                    st.error(f"⚠️ **{len(missing)} Treinamento(s) Faltante(s):**")
+
+                    for treinamento in sorted(missing):
+                        if 'SEP' in treinamento.upper():
+                            st.markdown(f"- ⚡ **{treinamento}** *(Sistema Elétrico de Potência)*")
+                        elif any(x in treinamento.upper() for x in ['BÁSICO', 'INTERMEDIÁRIO', 'AVANÇADO']):
+                            st.markdown(f"- 🎯 **{treinamento}**")
+                        else:
+                            st.markdown(f"- 📋 {treinamento}")
+
+
+EMPLOYEE_PAGE_SIZES = [25, 50, 100]
+
+
+def _render_employee_list(selected_company, employee_manager, epi_manager, matrix_manager_unidade):
+    """
+    Grade resumida e paginada dos funcionários da empresa, montada a partir dos
+    status pré-calculados pelo EmployeeManager. O detalhamento completo só é
+    calculado para o funcionário selecionado na grade.
+    """
+    all_employees = employee_manager.get_employees_status_summary(selected_company)
+
+    if all_employees.empty:
+        st.error(f"❌ Nenhum funcionário encontrado para esta empresa (ID: {selected_company}).")
+        st.info(f"💡 **Ação necessária:** Verifique se existem funcionários cadastrados com `empresa_id` igual a `{selected_company}`.")
+        return
+
+    # === FILTROS ===
+    col_status, col_cargo, col_expired = st.columns([1, 2, 1])
+    with col_status:
+        status_filter = st.selectbox(
+            "Status",
+            options=["Todos", "Em Dia", "Pendente"],
+            key=f"employee_status_filter_{selected_company}"
+        )
+    with col_cargo:
+        cargo_filter = st.multiselect(
+            "Função",
+            options=sorted(all_employees['cargo'].astype(str).unique()),
+            key=f"employee_cargo_filter_{selected_company}",
+            placeholder="Todas as funções"
+        )
+    with col_expired:
+        st.write("")
+        only_expired = st.checkbox(
+            "Apenas com vencidos",
+            key=f"employee_expired_filter_{selected_company}"
+        )
+
+    employees = employee_manager.get_employees_status_summary(
+        selected_company,
+        status=None if status_filter == "Todos" else status_filter,
+        only_expired=only_expired,
+        cargos=cargo_filter
+    )
+
+    total = len(employees)
+    pendentes = int((all_employees['status_geral'] == 'Pendente').sum())
+    st.caption(f"{total} de {len(all_employees)} funcionário(s) exibido(s) · {pendentes} com pendências")
+
+    if employees.empty:
+        st.info("ℹ️ Nenhum funcionário corresponde aos filtros selecionados.")
+        return
+
+    # === PAGINAÇÃO ===
+    col_size, col_page = st.columns([1, 3])
+    with col_size:
+        page_size = st.selectbox(
+            "Por página",
+            options=EMPLOYEE_PAGE_SIZES,
+            key=f"employee_page_size_{selected_company}"
+        )
+    num_pages = max(1, -(-total // page_size))
+    with col_page:
+        page = st.number_input(
+            f"Página (de {num_pages})",
+            min_value=1,
+            max_value=num_pages,
+            value=1,
+            step=1,
+            key=f"employee_page_{selected_company}"
+        )
+
+    start = (int(page) - 1) * page_size
+    # A seleção da tabela não sobrevive a mudanças de filtro, página ou tamanho
+    filters_key = f"{status_filter}|{'|'.join(sorted(map(str, cargo_filter)))}|{only_expired}"
+    page_df = employees.iloc[start:start + page_size].copy()
+    page_df['status_icon'] = page_df['status_geral'].map({'Em Dia': "✅", 'Pendente': "⚠️"})
+
+    selection = st.dataframe(
+        page_df,
+        column_config={
+            "status_icon": st.column_config.TextColumn("", width="small"),
+            "nome": "Funcionário",
+            "cargo": "Cargo",
+            "aso_status": "ASO",
+            "aso_vencimento": st.column_config.DateColumn("Venc. ASO", format="DD/MM/YYYY"),
+            "treinamentos_vencidos": st.column_config.NumberColumn("Trein. Vencidos"),
+            "treinamentos_total": st.column_config.NumberColumn("Trein. Total"),
+            "status_geral": "Status"
+        },
+        column_order=[
+            "status_icon", "nome", "cargo", "aso_status", "aso_vencimento",
+            "treinamentos_vencidos", "treinamentos_total", "status_geral"
+        ],
+        hide_index=True,
+        use_container_width=True,
+        on_select="rerun",
+        selection_mode="single-row",
+        key=f"employee_grid_{selected_company}_{page}_{page_size}_{filters_key}"
+    )
+
+    selected_rows = selection.selection.rows if selection else []
+    if not selected_rows or selected_rows[0] >= len(page_df):
+        st.caption("💡 Selecione um funcionário na tabela para ver os detalhes.")
+        return
+
+    employee = page_df.iloc[selected_rows[0]]
+    status_icon = "✅" if employee['status_geral'] == 'Em Dia' else "⚠️"
+    with st.container(border=True):
+        st.markdown(f"#### {status_icon} **{employee['nome']}** - *{employee['cargo']}*")
+        _render_employee_details(employee, employee_manager, epi_manager, matrix_manager_unidade)
+
+
+def _employee_labels(employees: pd.DataFrame) -> dict:
+    """Rótulo único de cada funcionário (nome e ID), por ID: homônimos não se confundem."""
+    labels = {}
+    if employees.empty:
+        return labels
+    for emp_id, name in zip(employees['id'].astype(str), employees['nome'].astype(str)):
+        label = f"{name} (ID {emp_id[:8]})"
+        if label in labels.values():
+            label = f"{name} (ID {emp_id})"
+        labels[emp_id] = label
+    return labels
+
+
+@st.fragment(run_every=3)
+def _poll_bulk_import(batch_id):
+    """Atualiza o progresso do lote e recarrega a página quando todos os arquivos terminam."""
+    progress = BulkImportManager.get_progress(batch_id)
+    if progress['total'] and progress['finished'] >= progress['total']:
+        st.rerun()
+    st.progress(
+        progress['finished'] / max(progress['total'], 1),
+        text=f"🤖 Analisando documentos: {progress['finished']}/{progress['total']} concluídos"
+    )
+
+
+def _render_bulk_import(selected_company, employee_manager, docs_manager, epi_manager):
+    """Importação de um ZIP de PDFs: envio para a fila de IA, revisão e gravação em lote."""
+    st.header("📦 Importação em Lote")
+    bulk_manager = BulkImportManager(employee_manager, docs_manager, epi_manager)
+
+    summary = st.session_state.pop('bulk_commit_summary', None)
+    if summary:
+        saved_total = sum(summary['saved'].values())
+        if saved_total:
+            st.success(f"✅ {saved_total} registro(s) gravado(s).")
+        if summary.get('action_items'):
+            st.info(f"📋 {summary['action_items']} não conformidade(s) adicionada(s) ao Plano de Ação")
+        for arquivo, motivo in summary['failed']:
+            st.warning(f"⚠️ {arquivo}: {motivo}")
+
+    batch_id = st.session_state.get('bulk_batch_id')
+    if not batch_id:
+        # Recupera um lote em andamento após recarregar a página
+        active_job = get_job_queue().get_active_job(
+            PDFQA.get_current_user()[0], BULK_JOB_TYPE, employee_manager.unit_id
+        )
+        if active_job and active_job.get('batch_id'):
+            batch_id = active_job['batch_id']
+            st.session_state.bulk_batch_id = batch_id
+
+    if not batch_id:
+        st.markdown(
+            "Envie um arquivo **ZIP** com os PDFs (ASOs, certificados, fichas de EPI e documentos da empresa). "
+            "O tipo é identificado pelo nome do arquivo ou da pasta, e cada documento é associado ao funcionário "
+            "pelo nome encontrado no PDF ou no nome do arquivo."
+        )
+        zip_file = st.file_uploader("📎 Arquivo ZIP", type=['zip'], key="bulk_zip_uploader")
+        if zip_file and st.button("🚀 Iniciar Importação", type="primary"):
+            try:
+                files = collect_pdfs(zip_file)
+            except zipfile.BadZipFile:
+                st.error("❌ O arquivo enviado não é um ZIP válido.")
+                return
+            if not files:
+                st.warning("⚠️ Nenhum PDF encontrado no arquivo.")
+                return
+            st.session_state.bulk_batch_id = bulk_manager.submit(files, selected_company)
+            st.rerun()
+        return
+
+    progress = BulkImportManager.get_progress(batch_id)
+    if progress['total'] == 0:
+        del st.session_state.bulk_batch_id
+        st.rerun()
+
+    if progress['finished'] < progress['total']:
+        _poll_bulk_import(batch_id)
+        st.caption("Você pode continuar usando o sistema; a análise segue em segundo plano.")
+        return
+
+    staging_key = f'bulk_staging_{batch_id}'
+    if staging_key not in st.session_state:
+        st.session_state[staging_key] = bulk_manager.build_staging(batch_id, selected_company)
+    staging_df = st.session_state[staging_key]
+
+    employees = employee_manager.get_employees_by_company(selected_company)
+    employee_labels = _employee_labels(employees)
+    label_to_id = {label: emp_id for emp_id, label in employee_labels.items()}
+
+    editor_df = staging_df.assign(funcionario=staging_df['funcionario'].map(employee_labels))
+    st.markdown(
+        f"**{len(staging_df)}** arquivo(s) analisado(s). Revise os dados, ajuste o funcionário quando "
+        "necessário e desmarque os documentos que não devem ser importados."
+    )
+    edited_df = st.data_editor(
+        editor_df,
+        column_config={
+            "incluir": st.column_config.CheckboxColumn("Incluir"),
+            "arquivo": st.column_config.TextColumn("Arquivo", width="large"),
+            "tipo": "Tipo",
+            "funcionario": st.column_config.SelectboxColumn("Funcionário", options=sorted(label_to_id)),
+            "match_score": st.column_config.ProgressColumn("Confiança", min_value=0, max_value=100, format="%d"),
+            "data": st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
+            "vencimento": st.column_config.DateColumn("Vencimento", format="DD/MM/YYYY"),
+            "detalhe": "Detalhe",
+            "erro": "Observação",
+            "auditoria": "Auditoria",
+            "status": None,
+            "job_id": None,
+            "doc_type": None
+        },
+        disabled=["arquivo", "tipo", "match_score", "detalhe", "erro", "auditoria"],
+        hide_index=True,
+        use_container_width=True,
+        key=f"bulk_editor_{batch_id}"
+    )
+    edited_df = edited_df.assign(funcionario=edited_df['funcionario'].map(label_to_id))
+
+    nr_analyzer = st.session_state.get('nr_analyzer')
+    col_commit, col_audit, col_discard = st.columns([2, 1, 1])
+    with col_commit:
+        total_selected = int(edited_df['incluir'].sum())
+        if st.button(f"💾 Gravar {total_selected} documento(s)", type="primary",
+                     use_container_width=True, disabled=total_selected == 0):
+            progress_bar = st.progress(0.0, text="Enviando arquivos...")
+            summary = bulk_manager.commit(
+                edited_df, selected_company,
+                progress_callback=lambda i, n: progress_bar.progress(i / n, text=f"Gravando {i}/{n}..."),
+                nr_analyzer=nr_analyzer
+            )
+            # Os arquivos não gravados continuam no lote: a revisão é remontada sem os gravados
+            st.session_state.bulk_commit_summary = summary
+            del st.session_state[staging_key]
+            st.session_state.pop(f"bulk_editor_{batch_id}", None)
+            if BulkImportManager.get_progress(batch_id)['total'] == 0:
+                del st.session_state.bulk_batch_id
+            st.rerun()
+    with col_audit:
+        if st.button("🔍 Auditar Selecionados", use_container_width=True,
+                     disabled=total_selected == 0 or not nr_analyzer,
+                     help="Auditoria de conformidade dos ASOs, treinamentos e documentos da empresa marcados"):
+            progress_bar = st.progress(0.0, text="Auditando documentos...")
+            with st.spinner("Auditando documentos (aguardando o limite do plano quando necessário)..."):
+                st.session_state[staging_key] = bulk_manager.audit(
+                    edited_df, nr_analyzer,
+                    progress_callback=lambda i, n: progress_bar.progress(i / n, text=f"Auditando {i}/{n}...")
+                )
+            st.session_state.pop(f"bulk_editor_{batch_id}", None)
+            st.rerun()
+    with col_discard:
+        if st.button("🗑️ Descartar Lote", use_container_width=True):
+            BulkImportManager.discard(batch_id)
+            del st.session_state[staging_key]
+            del st.session_state.bulk_batch_id
+            st.rerun()
+
+
 def show_dashboard_page():
     logger.info("Iniciando a renderização da página do dashboard.")
     
@@ -123,7 +639,8 @@ def show_dashboard_page():
         "🩺 Adicionar ASO", 
         "🎓 Adicionar Treinamento", 
         "🦺 Adicionar Ficha de EPI", 
-        "⚙️ Gerenciar Registros"
+        "⚙️ Gerenciar Registros",
+        "📦 Importação em Lote"
     ]
     
     tabs = st.tabs(tab_list)
@@ -133,6 +650,7 @@ def show_dashboard_page():
     tab_add_treinamento = tabs[3]
     tab_add_epi = tabs[4]
     tab_manage = tabs[5]
+    tab_bulk_import = tabs[6]
 
     # =============================================
     # ABA: SITUAÇÃO GERAL
@@ -151,17 +669,16 @@ def show_dashboard_page():
                 expected_doc_cols = ["tipo_documento", "data_emissao", "vencimento", "arquivo_id"]
                 
                 if isinstance(company_docs, pd.DataFrame) and not company_docs.empty:
-                    company_docs['vencimento_dt'] = pd.to_datetime(company_docs['vencimento']).dt.date
                     st.dataframe(
-                        company_docs.style.apply(highlight_expired, axis=1),
+                        style_expired(company_docs),
                         column_config={
                             "tipo_documento": "Documento",
                             "data_emissao": st.column_config.DateColumn("Emissão", format="DD/MM/YYYY"),
                             "vencimento": st.column_config.DateColumn("Vencimento", format="DD/MM/YYYY"),
                             "arquivo_id": st.column_config.LinkColumn("Anexo", display_text="📄 PDF"),
-                            "vencimento_dt": None
+                            "situacao": "Situação"
                         },
-                        column_order=expected_doc_cols,
+                        column_order=expected_doc_cols + ["situacao"],
                         hide_index=True,
                         use_container_width=True
                     )
@@ -172,277 +689,7 @@ def show_dashboard_page():
                 
                 # === FUNCIONÁRIOS ===
                 st.subheader("👥 Funcionários")
-                employees = employee_manager.get_employees_by_company(selected_company)
-                
-                if not employees.empty:
-                    for index, employee in employees.iterrows():
-                        employee_id = employee.get('id')
-                        employee_name = employee.get('nome', 'N/A')
-                        employee_cargo = employee.get('cargo', 'N/A')
-                        today = date.today()
-                        
-                        # === VERIFICA ASO ===
-                        aso_status, aso_vencimento = 'Não encontrado', None
-                        latest_asos = employee_manager.get_latest_aso_by_employee(employee_id)
-                        
-                        if isinstance(latest_asos, pd.DataFrame) and not latest_asos.empty:
-                            aptitude_asos = latest_asos[~latest_asos['tipo_aso'].str.lower().isin(['demissional'])].copy()
-                            if not aptitude_asos.empty:
-                                current_aso = aptitude_asos.sort_values('data_aso', ascending=False).iloc[0]
-                                vencimento_obj = current_aso.get('vencimento')
-                                if pd.notna(vencimento_obj):
-                                    aso_vencimento = pd.to_datetime(vencimento_obj)
-                                    aso_status = 'Válido' if aso_vencimento.date() >= today else 'Vencido'
-                                else:
-                                    aso_status = 'Venc. Inválido'
-                            else:
-                                aso_status = 'Apenas Demissional'
-                        
-                        # === VERIFICA TREINAMENTOS ===
-                        all_trainings = employee_manager.get_all_trainings_by_employee(employee_id)
-                        trainings_total, trainings_expired_count = 0, 0
-                        
-                        if isinstance(all_trainings, pd.DataFrame) and not all_trainings.empty:
-                            trainings_total = len(all_trainings)
-                            all_trainings['vencimento_date'] = pd.to_datetime(all_trainings['vencimento']).dt.date
-                            trainings_expired_count = (all_trainings['vencimento_date'] < today).sum()
-                        
-                        # === STATUS GERAL ===
-                        overall_status = 'Em Dia' if aso_status != 'Vencido' and trainings_expired_count == 0 else 'Pendente'
-                        status_icon = "✅" if overall_status == 'Em Dia' else "⚠️"
-                        
-                        # === EXPANDER DO FUNCIONÁRIO ===
-                        with st.expander(f"{status_icon} **{employee_name}** - *{employee_cargo}*"):
-                            num_pendencias = trainings_expired_count + (1 if aso_status == 'Vencido' else 0)
-                            
-                            col1, col2, col3 = st.columns(3)
-                            col1.metric(
-                                "Status Geral",
-                                overall_status,
-                                f"{num_pendencias} pendência(s)" if num_pendencias > 0 else "Nenhuma",
-                                delta_color="inverse" if overall_status != 'Em Dia' else "off"
-                            )
-                            col2.metric(
-                                "Status do ASO",
-                                aso_status,
-                                help=f"Vencimento: {aso_vencimento.strftime('%d/%m/%Y') if aso_vencimento else 'N/A'}"
-                            )
-                            col3.metric(
-                                "Treinamentos Vencidos",
-                                f"{trainings_expired_count} de {trainings_total}"
-                            )
-                            
-                            st.markdown("---")
-                            
-                            # === ASOs ===
-                            st.markdown("##### 🩺 ASO (Mais Recente por Tipo)")
-                            if isinstance(latest_asos, pd.DataFrame) and not latest_asos.empty:
-                                latest_asos['vencimento_dt'] = pd.to_datetime(latest_asos['vencimento'], errors='coerce').dt.date
-                                st.dataframe(
-                                    latest_asos.style.apply(highlight_expired, axis=1),
-                                    column_config={
-                                        "tipo_aso": "Tipo",
-                                        "data_aso": st.column_config.DateColumn("Data", format="DD/MM/YYYY"),
-                                        "vencimento": st.column_config.DateColumn("Vencimento", format="DD/MM/YYYY"),
-                                        "arquivo_id": st.column_config.LinkColumn("Anexo", display_text="📄 PDF"),
-                                        "vencimento_dt": None
-                                    },
-                                    column_order=["tipo_aso", "data_aso", "vencimento", "arquivo_id"],
-                                    hide_index=True,
-                                    use_container_width=True
-                                )
-                            else:
-                                st.info(f"ℹ️ Nenhum ASO encontrado para {employee_name}.")
-                            
-                            # === TREINAMENTOS ===
-                            st.markdown("##### 🎓 Treinamentos (Mais Recente por Norma/Módulo)")
-                            if isinstance(all_trainings, pd.DataFrame) and not all_trainings.empty:
-                                all_trainings['vencimento_dt'] = pd.to_datetime(all_trainings['vencimento'], errors='coerce').dt.date
-                                
-                                # Formata display do treinamento
-                                def format_training_display(row):
-                                    try:
-                                        norma = str(row.get('norma', 'N/A')).strip() if 'norma' in row.index else 'N/A'
-                                        modulo = str(row.get('modulo', 'N/A')).strip() if 'modulo' in row.index else 'N/A'
-                                        tipo = str(row.get('tipo_treinamento', 'N/A')).strip().title() if 'tipo_treinamento' in row.index else 'N/A'
-                                        
-                                        # NR-10 SEP
-                                        if 'NR-10' in norma.upper() or 'NR-10' in modulo.upper():
-                                            if 'SEP' in norma.upper() or 'SEP' in modulo.upper():
-                                                return f"⚡ NR-10 SEP ({tipo})"
-                                            else:
-                                                return f"⚡ NR-10 ({tipo})"
-                                        
-                                        # Normas com módulos
-                                        if modulo and modulo not in ['N/A', 'nan', '', 'Nan']:
-                                            modulo_exibicao = modulo.title()
-                                            return f"{norma} - {modulo_exibicao} ({tipo})"
-                                        
-                                        # Normas simples
-                                        return f"{norma} ({tipo})"
-                                        
-                                    except Exception as e:
-                                        logger.error(f"Erro ao formatar display de treinamento: {e}")
-                                        return "Erro ao exibir"
-                                
-                                all_trainings['treinamento_completo'] = all_trainings.apply(format_training_display, axis=1)
-                                
-                                st.dataframe(
-                                    all_trainings.style.apply(highlight_expired, axis=1),
-                                    column_config={
-                                        "treinamento_completo": st.column_config.TextColumn(
-                                            "Treinamento",
-                                            help="Norma, módulo e tipo do treinamento",
-                                            width="large"
-                                        ),
-                                        "data": st.column_config.DateColumn("Realização", format="DD/MM/YYYY"),
-                                        "vencimento": st.column_config.DateColumn("Vencimento", format="DD/MM/YYYY"),
-                                        "anexo": st.column_config.LinkColumn("Anexo", display_text="📄 PDF"),
-                                        "vencimento_dt": None,
-                                        "norma": None,
-                                        "modulo": None,
-                                        "tipo_treinamento": None
-                                    },
-                                    column_order=["treinamento_completo", "data", "vencimento", "anexo"],
-                                    hide_index=True,
-                                    use_container_width=True
-                                )
-                            else:
-                                st.info(f"ℹ️ Nenhum treinamento encontrado para {employee_name}.")
-                            
-                            # === EPIs ===
-                            st.markdown("##### 🦺 Equipamentos de Proteção Individual (EPIs)")
-                            all_epis = epi_manager.get_epi_by_employee(employee_id)
-                            
-                            if isinstance(all_epis, pd.DataFrame) and not all_epis.empty:
-                                st.dataframe(
-                                    all_epis,
-                                    column_config={
-                                        "descricao_epi": "Equipamento",
-                                        "ca_epi": "C.A.",
-                                        "data_entrega": st.column_config.DateColumn("Data de Entrega", format="DD/MM/YYYY"),
-                                        "arquivo_id": st.column_config.LinkColumn("Ficha", display_text="📄 PDF")
-                                    },
-                                    column_order=["descricao_epi", "ca_epi", "data_entrega", "arquivo_id"],
-                                    hide_index=True,
-                                    use_container_width=True
-                                )
-                            else:
-                                st.info(f"ℹ️ Nenhuma Ficha de EPI encontrada para {employee_name}.")
-                            
-                            st.markdown("---")
-                            
-                            # === MATRIZ DE CONFORMIDADE ===
-                            st.markdown("##### 📋 Matriz de Conformidade de Treinamentos")
-                            
-                            if not employee_cargo or employee_cargo == 'N/A':
-                                st.info("ℹ️ Cargo não definido, impossibilitando análise de matriz.")
-                            else:
-                                matched_function = matrix_manager_unidade.find_closest_function(employee_cargo)
-                                
-                                if not matched_function:
-                                    st.success(f"✅ O cargo '{employee_cargo}' não possui treinamentos obrigatórios na matriz da unidade.")
-                                else:
-                                    if matched_function.lower() != employee_cargo.lower():
-                                        st.caption(f"💡 Analisando com base na função da matriz mais próxima: **'{matched_function}'**")
-                                    
-                                    required_trainings = matrix_manager_unidade.get_required_trainings_for_function(matched_function)
-                                    
-                                    if not required_trainings:
-                                        st.success(f"✅ Nenhum treinamento obrigatório mapeado para a função '{matched_function}'.")
-                                    else:
-                                        # Cria lista de treinamentos realizados
-                                        completed_trainings = []
-                                        
-                                        if isinstance(all_trainings, pd.DataFrame) and not all_trainings.empty:
-                                            for _, row in all_trainings.iterrows():
-                                                norma = str(row.get('norma', '')).strip().upper()
-                                                modulo = str(row.get('modulo', 'N/A')).strip().title()
-                                                
-                                                # Normalização especial para NR-10
-                                                if 'NR-10' in norma:
-                                                    if 'SEP' in norma or 'SEP' in modulo.upper():
-                                                        completed_trainings.append('nr-10 sep')
-                                                        completed_trainings.append('nr-10-sep')
-                                                    else:
-                                                        completed_trainings.append('nr-10')
-                                                        completed_trainings.append('nr-10 básico')
-                                                
-                                                # Normalização para NR-33
-                                                elif 'NR-33' in norma:
-                                                    if 'SUPERVISOR' in modulo.upper():
-                                                        completed_trainings.append('nr-33 supervisor')
-                                                    elif 'TRABALHADOR' in modulo.upper() or 'AUTORIZADO' in modulo.upper():
-                                                        completed_trainings.append('nr-33 trabalhador autorizado')
-                                                    completed_trainings.append('nr-33')
-                                                
-                                                # Outras normas
-                                                else:
-                                                    completed_trainings.append(norma.lower())
-                                                    if modulo and modulo not in ['N/A', 'nan', '']:
-                                                        completed_trainings.append(f"{norma} - {modulo}".lower())
-                                                        completed_trainings.append(f"{norma} {modulo}".lower())
-                                                        completed_trainings.append(f"{norma}-{modulo}".lower())
-                                        
-                                        # Verifica treinamentos faltantes
-                                        missing = []
-                                        try:
-                                            for req in required_trainings:
-                                                if not req or not isinstance(req, str):
-                                                    logger.warning(f"Treinamento requerido inválido: {req}")
-                                                    continue
-                                                
-                                                req_lower = req.lower().strip()
-                                                
-                                                # CRÍTICO: NR-10 Básico NÃO cobre NR-10 SEP
-                                                if 'nr-10 sep' in req_lower or 'nr-10-sep' in req_lower:
-                                                    has_sep = any('sep' in comp for comp in completed_trainings if 'nr-10' in comp)
-                                                    if not has_sep:
-                                                        missing.append(req)
-                                                    continue
-                                                
-                                                # Verifica match direto
-                                                has_match = any(
-                                                    req_lower == comp or
-                                                    req_lower in comp or
-                                                    comp in req_lower
-                                                    for comp in completed_trainings
-                                                )
-                                                
-                                                # Fuzzy matching se não houver match direto
-                                                if not has_match and completed_trainings:
-                                                    try:
-                                                        from fuzzywuzzy import process as fuzz_process  # ✅ Import local seguro
-                                                        best_match = fuzz_process.extractOne(req_lower, completed_trainings)
-                                                        if best_match and best_match[1] > 85:
-                                                            has_match = True
-                                                    except ImportError:
-                                                        logger.warning("fuzzywuzzy não disponível para fuzzy matching")
-                                                        pass
-                                                
-                                                if not has_match:
-                                                    missing.append(req)
-                                            
-                                        except Exception as e:
-                                            logger.error(f"Erro ao verificar treinamentos faltantes: {e}")
-                                            st.warning("⚠️ Erro ao verificar conformidade de treinamentos")
-                                        
-                                        # Exibe resultado
-                                        if not missing:
-                                            st.success("✅ Todos os treinamentos obrigatórios foram realizados.")
-                                        else:
-                                            st.error(f"⚠️ **{len(missing)} Treinamento(s) Faltante(s):**")
-                                            
-                                            for treinamento in sorted(missing):
-                                                if 'SEP' in treinamento.upper():
-                                                    st.markdown(f"- ⚡ **{treinamento}** *(Sistema Elétrico de Potência)*")
-                                                elif any(x in treinamento.upper() for x in ['BÁSICO', 'INTERMEDIÁRIO', 'AVANÇADO']):
-                                                    st.markdown(f"- 🎯 **{treinamento}**")
-                                                else:
-                                                    st.markdown(f"- 📋 {treinamento}")
-                else:
-                    st.error(f"❌ Nenhum funcionário encontrado para esta empresa (ID: {selected_company}).")
-                    st.info(f"💡 **Ação necessária:** Verifique se existem funcionários cadastrados com `empresa_id` igual a `{selected_company}`.")
+                _render_employee_list(selected_company, employee_manager, epi_manager, matrix_manager_unidade)
             
             except Exception as e:
                 logger.error(f"ERRO CRÍTICO ao renderizar dashboard para empresa {selected_company}: {e}", exc_info=True)
@@ -484,6 +731,7 @@ def show_dashboard_page():
                     on_change=process_company_doc_pdf,
                     help="Faça upload e aguarde a extração automática"
                 )
+                render_analysis_job('Doc. Empresa')
                 
                 if st.session_state.get('Doc. Empresa_info_para_salvar'):
                     doc_info = st.session_state['Doc. Empresa_info_para_salvar']
@@ -556,9 +804,7 @@ def show_dashboard_page():
                             )
                         
                         if cancel_button:
-                            for key in list(st.session_state.keys()):
-                                if key.startswith('Doc. Empresa_'):
-                                    del st.session_state[key]
+                            clear_analysis_state('Doc. Empresa')
                             st.rerun()
                         
                         if confirm_button:
@@ -597,9 +843,7 @@ def show_dashboard_page():
                                                 if items_added > 0:
                                                     st.info(f"📋 {items_added} não conformidade(s) adicionada(s) ao Plano de Ação")
                                         
-                                        for key in list(st.session_state.keys()):
-                                            if key.startswith('Doc. Empresa_'):
-                                                del st.session_state[key]
+                                        clear_analysis_state('Doc. Empresa')
                                         st.balloons()
                                         st.rerun()
                                     else:
@@ -755,6 +999,7 @@ def show_dashboard_page():
                         on_change=process_aso_pdf,
                         help="Faça upload e aguarde a extração automática"
                     )
+                    render_analysis_job('ASO')
                     
                     if st.session_state.get('ASO_info_para_salvar'):
                         aso_info = st.session_state.ASO_info_para_salvar
@@ -852,9 +1097,7 @@ def show_dashboard_page():
                                 )
                             
                             if cancel_button:
-                                for key in list(st.session_state.keys()):
-                                    if key.startswith('ASO_'):
-                                        del st.session_state[key]
+                                clear_analysis_state('ASO')
                                 st.rerun()
                             
                             if confirm_button:
@@ -899,9 +1142,7 @@ def show_dashboard_page():
                                                     if items_added > 0:
                                                         st.info(f"📋 {items_added} não conformidade(s) adicionada(s) ao Plano de Ação")
                                             
-                                            for key in list(st.session_state.keys()):
-                                                if key.startswith('ASO_'):
-                                                    del st.session_state[key]
+                                            clear_analysis_state('ASO')
                                             st.balloons()
                                             st.rerun()
                                         else:
@@ -1094,6 +1335,7 @@ def show_dashboard_page():
                         on_change=process_training_pdf,
                         help="Faça upload do certificado de treinamento em PDF"
                     )
+                    render_analysis_job('Treinamento')
                     
                     if st.session_state.get('Treinamento_info_para_salvar'):
                         training_info = st.session_state['Treinamento_info_para_salvar']
@@ -1227,9 +1469,7 @@ def show_dashboard_page():
                                 )
                             
                             if cancel_button:
-                                for key in list(st.session_state.keys()):
-                                    if key.startswith('Treinamento_'):
-                                        del st.session_state[key]
+                                clear_analysis_state('Treinamento')
                                 st.rerun()
                             
                             if confirm_button:
@@ -1278,9 +1518,7 @@ def show_dashboard_page():
                                                     if items_added > 0:
                                                         st.info(f"📋 {items_added} não conformidade(s) adicionada(s) ao Plano de Ação")
                                             
-                                            for key in list(st.session_state.keys()):
-                                                if key.startswith('Treinamento_'):
-                                                    del st.session_state[key]
+                                            clear_analysis_state('Treinamento')
                                             st.rerun()
                                         else:
                                             st.error("❌ Falha ao salvar o treinamento no banco de dados.")
@@ -1410,6 +1648,7 @@ def show_dashboard_page():
                         on_change=process_epi_pdf,
                         help="Faça upload da ficha de controle de entrega de EPI em PDF"
                     )
+                    render_analysis_job('epi')
                     
                     if st.session_state.get('epi_info_para_salvar'):
                         epi_info = st.session_state['epi_info_para_salvar']
@@ -1446,9 +1685,7 @@ def show_dashboard_page():
                                                 if saved_ids:
                                                     st.success(f"✅ Ficha de EPI salva com sucesso! {len(saved_ids)} item(ns) cadastrado(s).")
                                                     
-                                                    for key in list(st.session_state.keys()):
-                                                        if key.startswith('epi_'):
-                                                            del st.session_state[key]
+                                                    clear_analysis_state('epi')
                                                     st.rerun()
                                                 else:
                                                     st.error("❌ Falha ao salvar os itens de EPI.")
@@ -1481,31 +1718,27 @@ def show_dashboard_page():
                 if employees.empty:
                     st.info("Nenhum funcionário cadastrado.")
                 else:
+                    employee_names = dict(zip(employees['id'], employees['nome']))
                     employee_filter = st.selectbox(
                         "Filtrar por Funcionário:",
-                        options=['Todos'] + employees['id'].tolist(),
-                        format_func=lambda x: 'Todos os Funcionários' if x == 'Todos' else employee_manager.get_employee_name(x),
+                        options=['Todos'] + list(employee_names),
+                        format_func=lambda x: 'Todos os Funcionários' if x == 'Todos' else employee_names.get(x, f"ID {x}"),
                         key="aso_employee_filter"
                     )
                     
-                    all_asos = []
-                    employees_to_check = employees if employee_filter == 'Todos' else employees[employees['id'] == employee_filter]
+                    employee_ids = list(employee_names) if employee_filter == 'Todos' else [employee_filter]
+                    asos_df = employee_manager.get_latest_asos_for_employees(employee_ids)
                     
-                    for _, emp in employees_to_check.iterrows():
-                        emp_asos = employee_manager.get_latest_aso_by_employee(emp['id'])
-                        if not emp_asos.empty:
-                            emp_asos['nome_funcionario'] = emp['nome']
-                            all_asos.append(emp_asos)
-                    
-                    if all_asos:
-                        asos_df = pd.concat(all_asos, ignore_index=True)
-                        asos_df['vencimento_dt'] = pd.to_datetime(asos_df['vencimento']).dt.date
+                    if not asos_df.empty:
+                        asos_df = asos_df.assign(nome_funcionario=asos_df['funcionario_id'].map(employee_names))
+                        asos_df = asos_df.sort_values(['nome_funcionario', 'data_aso'], ascending=[True, False]).reset_index(drop=True)
                         
-                        display_df = asos_df[['nome_funcionario', 'tipo_aso', 'data_aso', 'vencimento', 'cargo']].copy()
-                        display_df['vencimento_dt'] = asos_df['vencimento_dt']
+                        display_df = asos_df[['nome_funcionario', 'tipo_aso', 'data_aso', 'vencimento', 'situacao', 'cargo']]
                         
+                        # Tabela potencialmente grande: situação como coluna nativa, sem Styler
                         st.dataframe(
-                            display_df.style.apply(highlight_expired, axis=1),
+                            display_df,
+                            column_config={"situacao": "Situação"},
                             use_container_width=True,
                             hide_index=True
                         )
@@ -1513,20 +1746,25 @@ def show_dashboard_page():
                         st.markdown("---")
                         st.subheader("🗑️ Excluir ASO")
                         
+                        aso_labels = dict(zip(
+                            asos_df['id'],
+                            asos_df['nome_funcionario'].astype(str) + " - " + asos_df['tipo_aso'].astype(str)
+                            + " - " + asos_df['data_aso'].dt.strftime('%d/%m/%Y')
+                        ))
+                        aso_files = dict(zip(asos_df['id'], asos_df['arquivo_id']))
                         aso_to_delete = st.selectbox(
                             "Selecione o ASO para excluir:",
-                            options=asos_df['id'].tolist(),
-                            format_func=lambda x: f"{asos_df[asos_df['id']==x]['nome_funcionario'].values[0]} - {asos_df[asos_df['id']==x]['tipo_aso'].values[0]} - {asos_df[asos_df['id']==x]['data_aso'].values[0]}",
+                            options=list(aso_labels),
+                            format_func=aso_labels.get,
                             key="aso_delete_select"
                         )
                         
                         if st.button("🗑️ Excluir ASO Selecionado", type="secondary"):
-                            aso_row = asos_df[asos_df['id'] == aso_to_delete].iloc[0]
                             st.session_state.show_delete_dialog = True
                             st.session_state.item_to_delete = {
                                 'type': 'ASO',
                                 'id': aso_to_delete,
-                                'file_url': aso_row.get('arquivo_id')
+                                'file_url': aso_files.get(aso_to_delete)
                             }
                             st.rerun()
                     else:
@@ -1540,31 +1778,27 @@ def show_dashboard_page():
                 if employees.empty:
                     st.info("Nenhum funcionário cadastrado.")
                 else:
+                    employee_names = dict(zip(employees['id'], employees['nome']))
                     employee_filter = st.selectbox(
                         "Filtrar por Funcionário:",
-                        options=['Todos'] + employees['id'].tolist(),
-                        format_func=lambda x: 'Todos os Funcionários' if x == 'Todos' else employee_manager.get_employee_name(x),
+                        options=['Todos'] + list(employee_names),
+                        format_func=lambda x: 'Todos os Funcionários' if x == 'Todos' else employee_names.get(x, f"ID {x}"),
                         key="training_employee_filter"
                     )
                     
-                    all_trainings = []
-                    employees_to_check = employees if employee_filter == 'Todos' else employees[employees['id'] == employee_filter]
+                    employee_ids = list(employee_names) if employee_filter == 'Todos' else [employee_filter]
+                    trainings_df = employee_manager.get_latest_trainings_for_employees(employee_ids)
                     
-                    for _, emp in employees_to_check.iterrows():
-                        emp_trainings = employee_manager.get_all_trainings_by_employee(emp['id'])
-                        if not emp_trainings.empty:
-                            emp_trainings['nome_funcionario'] = emp['nome']
-                            all_trainings.append(emp_trainings)
-                    
-                    if all_trainings:
-                        trainings_df = pd.concat(all_trainings, ignore_index=True)
-                        trainings_df['vencimento_dt'] = pd.to_datetime(trainings_df['vencimento']).dt.date
+                    if not trainings_df.empty:
+                        trainings_df = trainings_df.assign(nome_funcionario=trainings_df['funcionario_id'].map(employee_names))
+                        trainings_df = trainings_df.sort_values('nome_funcionario', kind='stable').reset_index(drop=True)
                         
-                        display_df = trainings_df[['nome_funcionario', 'norma', 'modulo', 'data', 'vencimento', 'tipo_treinamento']].copy()
-                        display_df['vencimento_dt'] = trainings_df['vencimento_dt']
+                        display_df = trainings_df[['nome_funcionario', 'norma', 'modulo', 'data', 'vencimento', 'situacao', 'tipo_treinamento']]
                         
+                        # Tabela potencialmente grande: situação como coluna nativa, sem Styler
                         st.dataframe(
-                            display_df.style.apply(highlight_expired, axis=1),
+                            display_df,
+                            column_config={"situacao": "Situação"},
                             use_container_width=True,
                             hide_index=True
                         )
@@ -1572,20 +1806,25 @@ def show_dashboard_page():
                         st.markdown("---")
                         st.subheader("🗑️ Excluir Treinamento")
                         
+                        training_labels = dict(zip(
+                            trainings_df['id'],
+                            trainings_df['nome_funcionario'].astype(str) + " - " + trainings_df['norma'].astype(str)
+                            + " - " + trainings_df['data'].astype(str)
+                        ))
+                        training_files = dict(zip(trainings_df['id'], trainings_df['anexo']))
                         training_to_delete = st.selectbox(
                             "Selecione o Treinamento para excluir:",
-                            options=trainings_df['id'].tolist(),
-                            format_func=lambda x: f"{trainings_df[trainings_df['id']==x]['nome_funcionario'].values[0]} - {trainings_df[trainings_df['id']==x]['norma'].values[0]} - {trainings_df[trainings_df['id']==x]['data'].values[0]}",
+                            options=list(training_labels),
+                            format_func=training_labels.get,
                             key="training_delete_select"
                         )
                         
                         if st.button("🗑️ Excluir Treinamento Selecionado", type="secondary"):
-                            training_row = trainings_df[trainings_df['id'] == training_to_delete].iloc[0]
                             st.session_state.show_delete_dialog = True
                             st.session_state.item_to_delete = {
                                 'type': 'Treinamento',
                                 'id': training_to_delete,
-                                'file_url': training_row.get('anexo')
+                                'file_url': training_files.get(training_to_delete)
                             }
                             st.rerun()
                     else:
@@ -1600,13 +1839,11 @@ def show_dashboard_page():
                 if company_docs.empty:
                     st.info("Nenhum documento da empresa cadastrado.")
                 else:
-                    company_docs['vencimento_dt'] = pd.to_datetime(company_docs['vencimento']).dt.date
-                    
-                    display_df = company_docs[['tipo_documento', 'data_emissao', 'vencimento']].copy()
-                    display_df['vencimento_dt'] = company_docs['vencimento_dt']
+                    display_df = company_docs[['tipo_documento', 'data_emissao', 'vencimento', 'situacao']]
                     
                     st.dataframe(
-                        display_df.style.apply(highlight_expired, axis=1),
+                        style_expired(display_df),
+                        column_config={"situacao": "Situação"},
                         use_container_width=True,
                         hide_index=True
                     )
@@ -1614,20 +1851,24 @@ def show_dashboard_page():
                     st.markdown("---")
                     st.subheader("🗑️ Excluir Documento")
                     
+                    doc_labels = dict(zip(
+                        company_docs['id'],
+                        company_docs['tipo_documento'].astype(str) + " - Emissão: " + company_docs['data_emissao'].astype(str)
+                    ))
+                    doc_files = dict(zip(company_docs['id'], company_docs['arquivo_id']))
                     doc_to_delete = st.selectbox(
                         "Selecione o Documento para excluir:",
-                        options=company_docs['id'].tolist(),
-                        format_func=lambda x: f"{company_docs[company_docs['id']==x]['tipo_documento'].values[0]} - Emissão: {company_docs[company_docs['id']==x]['data_emissao'].values[0]}",
+                        options=list(doc_labels),
+                        format_func=doc_labels.get,
                         key="doc_delete_select"
                     )
                     
                     if st.button("🗑️ Excluir Documento Selecionado", type="secondary"):
-                        doc_row = company_docs[company_docs['id'] == doc_to_delete].iloc[0]
                         st.session_state.show_delete_dialog = True
                         st.session_state.item_to_delete = {
                             'type': 'Doc. Empresa',
                             'id': doc_to_delete,
-                            'file_url': doc_row.get('arquivo_id')
+                            'file_url': doc_files.get(doc_to_delete)
                         }
                         st.rerun()
             
@@ -1639,26 +1880,22 @@ def show_dashboard_page():
                 if employees.empty:
                     st.info("Nenhum funcionário cadastrado.")
                 else:
+                    employee_names = dict(zip(employees['id'], employees['nome']))
                     employee_filter = st.selectbox(
                         "Filtrar por Funcionário:",
-                        options=['Todos'] + employees['id'].tolist(),
-                        format_func=lambda x: 'Todos os Funcionários' if x == 'Todos' else employee_manager.get_employee_name(x),
+                        options=['Todos'] + list(employee_names),
+                        format_func=lambda x: 'Todos os Funcionários' if x == 'Todos' else employee_names.get(x, f"ID {x}"),
                         key="epi_employee_filter"
                     )
                     
-                    all_epis = []
-                    employees_to_check = employees if employee_filter == 'Todos' else employees[employees['id'] == employee_filter]
+                    employee_ids = list(employee_names) if employee_filter == 'Todos' else [employee_filter]
+                    epis_df = epi_manager.get_latest_epis_for_employees(employee_ids)
                     
-                    for _, emp in employees_to_check.iterrows():
-                        emp_epis = epi_manager.get_epi_by_employee(emp['id'])
-                        if not emp_epis.empty:
-                            emp_epis['nome_funcionario'] = emp['nome']
-                            all_epis.append(emp_epis)
-                    
-                    if all_epis:
-                        epis_df = pd.concat(all_epis, ignore_index=True)
+                    if not epis_df.empty:
+                        epis_df = epis_df.assign(nome_funcionario=epis_df['funcionario_id'].map(employee_names))
+                        epis_df = epis_df.sort_values(['nome_funcionario', 'data_entrega'], ascending=[True, False]).reset_index(drop=True)
                         
-                        display_df = epis_df[['nome_funcionario', 'descricao_epi', 'ca_epi', 'data_entrega']].copy()
+                        display_df = epis_df[['nome_funcionario', 'descricao_epi', 'ca_epi', 'data_entrega']]
                         
                         st.dataframe(
                             display_df,
@@ -1669,24 +1906,42 @@ def show_dashboard_page():
                         st.markdown("---")
                         st.subheader("🗑️ Excluir Item de EPI")
                         
+                        epi_labels = dict(zip(
+                            epis_df['id'],
+                            epis_df['nome_funcionario'].astype(str) + " - " + epis_df['descricao_epi'].astype(str)
+                            + " - CA: " + epis_df['ca_epi'].astype(str)
+                        ))
+                        epi_files = dict(zip(epis_df['id'], epis_df['arquivo_id']))
                         epi_to_delete = st.selectbox(
                             "Selecione o Item de EPI para excluir:",
-                            options=epis_df['id'].tolist(),
-                            format_func=lambda x: f"{epis_df[epis_df['id']==x]['nome_funcionario'].values[0]} - {epis_df[epis_df['id']==x]['descricao_epi'].values[0]} - CA: {epis_df[epis_df['id']==x]['ca_epi'].values[0]}",
+                            options=list(epi_labels),
+                            format_func=epi_labels.get,
                             key="epi_delete_select"
                         )
                         
                         if st.button("🗑️ Excluir Item de EPI Selecionado", type="secondary"):
-                            epi_row = epis_df[epis_df['id'] == epi_to_delete].iloc[0]
                             st.session_state.show_delete_dialog = True
                             st.session_state.item_to_delete = {
                                 'type': 'EPI',
                                 'id': epi_to_delete,
-                                'file_url': epi_row.get('arquivo_id')
+                                'file_url': epi_files.get(epi_to_delete)
                             }
                             st.rerun()
                     else:
                         st.info("Nenhum item de EPI cadastrado para os funcionários selecionados.")
     
+    # =============================================
+    # ABA: IMPORTAÇÃO EM LOTE
+    # ============================================
+    with tab_bulk_import:
+        if not selected_company:
+            st.info("👈 Selecione uma empresa na aba 'Situação Geral' primeiro.")
+        elif not check_permission(level='editor'):
+            st.error("Você não tem permissão para importar documentos.")
+        elif not check_feature_permission('premium_ia'):
+            st.info("💡 A importação em lote com análise automática é um recurso do plano **Premium IA**.")
+        else:
+            _render_bulk_import(selected_company, employee_manager, docs_manager, epi_manager)
+    
     # Gerencia o diálogo de confirmação de exclusão
     handle_delete_confirmation(docs_manager, employee_manager)
@@ -4,6 +4,7 @@ import tempfile
 import yaml
 import logging 
 from managers.supabase_storage import SupabaseStorageManager
+from operations.file_utils import infer_doc_type
 
 logger = logging.getLogger('segsisone_app.api_manager')
 
@@ -15,33 +16,18 @@ class GoogleApiManager:
     """
     
     @staticmethod
-    def _infer_doc_type(filename: str) -> str:
+    def _infer_doc_type(filename: str, file_content: bytes = None) -> str:
         """
-        Infere o tipo de documento pelo nome do arquivo.
+        Infere o tipo de documento pelo conteúdo do PDF ou pelo nome do arquivo.
         
         Args:
             filename: Nome do arquivo
+            file_content: Conteúdo do arquivo (opcional)
             
         Returns:
             Tipo do documento ('aso', 'treinamento', 'epi', 'doc_empresa')
         """
-        if not filename or not isinstance(filename, str):
-            return 'aso'  # Default
-        
-        filename_lower = filename.lower()
-        
-        # Prioridade de verificação
-        if 'aso' in filename_lower:
-            return 'aso'
-        elif 'training' in filename_lower or 'treinamento' in filename_lower:
-            return 'treinamento'
-        elif 'epi' in filename_lower:
-            return 'epi'
-        elif any(doc in filename_lower for doc in ['pgr', 'pcmso', 'ppr', 'pca', 'doc_empresa']):
-            return 'doc_empresa'
-        
-        # Default: ASO
-        return 'aso'
+        return infer_doc_type(filename, file_content)
 
     def __init__(self):
         """Inicializa o gerenciador usando Supabase Storage."""
@@ -72,7 +58,7 @@ class GoogleApiManager:
             filename = novo_nome if novo_nome else arquivo.name
             
             # Infere o tipo de documento
-            doc_type = GoogleApiManager._infer_doc_type(filename)
+            doc_type = GoogleApiManager._infer_doc_type(filename, arquivo.getvalue())
             
             # Faz o upload
             result = self.storage_manager.upload_file(
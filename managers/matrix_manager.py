@@ -166,6 +166,7 @@ class MatrixManager:
         try:
             from operations.training_matrix_manager import MatrixManager as TrainingMatrixManager
             global_matrix_manager = TrainingMatrixManager("global")
+            unit_matrix_manager = TrainingMatrixManager(unit_id)
 
             # Buscar todas as funções globais
             global_functions = global_matrix_manager.get_all_functions_global()
@@ -187,7 +188,7 @@ class MatrixManager:
                     if success:
                         # Importar treinamentos da função
                         # Primeiro encontrar o ID da função recém-importada na unidade
-                        unit_matrix_manager = TrainingMatrixManager(unit_id)
+                        unit_matrix_manager._functions_df = None
                         unit_functions = unit_matrix_manager.functions_df
 
                         if not unit_functions.empty:
@@ -166,8 +166,8 @@ class SupabaseStorageManager:
             # Determina o nome do arquivo
             filename = novo_nome if novo_nome else arquivo.name
             
-            # Infere o tipo de documento
-            doc_type = infer_doc_type(filename)
+            # Infere o tipo de documento pelo conteúdo
+            doc_type = infer_doc_type(filename, arquivo.getvalue())
             
             # Faz o upload
             result = self.upload_file(
@@ -403,8 +403,8 @@ class SupabaseUploader:
             
             progress_bar.progress(30, text="Determinando tipo de documento...")
             
-            # Determina o tipo de documento pelo nome
-            doc_type = infer_doc_type(filename)
+            # Determina o tipo de documento pelo conteúdo
+            doc_type = infer_doc_type(filename, file_content)
             
             progress_bar.progress(50, text="Enviando para o servidor...")
             
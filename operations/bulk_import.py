@@ -0,0 +1,544 @@
+"""
+Importação em lote de PDFs (ZIP ou pasta) com extração por IA em paralelo.
+
+Fluxo:
+    1. collect_pdfs: lê os PDFs de um ZIP ou diretório
+    2. BulkImportManager.submit: classifica cada arquivo e envia a extração
+       para a fila de IA (AI.job_queue), que respeita os limites do plano
+    3. BulkImportManager.build_staging: monta a tabela de revisão com os
+       dados extraídos e o funcionário correspondente
+    4. BulkImportManager.audit (opcional): audita os documentos marcados em
+       lote (PDFQA.answer_questions_batch), aguardando a janela do plano
+    5. BulkImportManager.commit: valida as linhas, envia os arquivos ao
+       storage e grava todos os registros aprovados em uma única transação;
+       não conformidades auditadas vão para o plano de ação
+"""
+import io
+import os
+import re
+import uuid
+import zipfile
+import logging
+from datetime import date, datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import streamlit as st
+from fuzzywuzzy import fuzz, process
+
+from AI.job_queue import get_job_queue, StoredUpload, JOB_DONE, JOB_FAILED
+from operations.file_hash import calcular_hash_arquivo
+from operations.file_utils import classify_upload, is_valid_pdf
+from operations.utils import format_date_safe
+
+logger = logging.getLogger('segsisone_app.bulk_import')
+
+MAX_BULK_FILES = 500
+UPLOAD_WORKERS = 4
+EMPLOYEE_MATCH_CUTOFF = 80
+
+BULK_JOB_TYPE = 'lote'
+
+DOC_TYPE_LABELS = {
+    'aso': 'ASO',
+    'treinamento': 'Treinamento',
+    'epi': 'Ficha de EPI',
+    'doc_empresa': 'Doc. Empresa'
+}
+
+# Tipos auditados (os mesmos da análise individual; fichas de EPI não são auditadas)
+AUDITED_DOC_TYPES = ('aso', 'treinamento', 'doc_empresa')
+
+# Palavras removidas do nome do arquivo antes de procurar o nome do funcionário
+_FILENAME_NOISE = re.compile(
+    r'\b(aso|epi|nr[\s-]?\d+\w*|treinamento|training|certificado|ficha|admissional|'
+    r'peri[oó]dico|demissional|reciclagem|forma[cç][aã]o|pdf)\b|\d+',
+    re.IGNORECASE
+)
+
+
+def collect_pdfs(source) -> list[tuple[str, bytes]]:
+    """
+    Lê os PDFs de um ZIP (caminho, bytes ou arquivo enviado) ou de um diretório.
+
+    Returns:
+        Lista de (caminho relativo, bytes) limitada a MAX_BULK_FILES.
+    """
+    files = []
+
+    if isinstance(source, str) and os.path.isdir(source):
+        for root, _, names in os.walk(source):
+            for name in sorted(names):
+                if not is_valid_pdf(name):
+                    continue
+                path = os.path.join(root, name)
+                with open(path, 'rb') as f:
+                    files.append((os.path.relpath(path, source), f.read()))
+    else:
+        if isinstance(source, str):
+            zip_source = source
+        elif isinstance(source, bytes):
+            zip_source = io.BytesIO(source)
+        else:
+            zip_source = io.BytesIO(source.getvalue())
+
+        with zipfile.ZipFile(zip_source) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or info.filename.startswith('__MACOSX/'):
+                    continue
+                if not is_valid_pdf(info.filename):
+                    continue
+                files.append((info.filename, archive.read(info)))
+
+    if len(files) > MAX_BULK_FILES:
+        logger.warning(f"Lote com {len(files)} PDFs truncado para {MAX_BULK_FILES}")
+        files = files[:MAX_BULK_FILES]
+
+    return files
+
+
+def _name_from_filename(path: str) -> str:
+    """Extrai um provável nome de funcionário do nome do arquivo."""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    stem = re.sub(r'[_\-.]+', ' ', stem)
+    return re.sub(r'\s+', ' ', _FILENAME_NOISE.sub(' ', stem)).strip()
+
+
+def match_employee(candidate_names: list[str], employees: pd.DataFrame,
+                   score_cutoff: int = EMPLOYEE_MATCH_CUTOFF) -> tuple[str | None, int]:
+    """
+    Associa um documento a um funcionário por similaridade de nome.
+
+    Args:
+        candidate_names: Nomes em ordem de prioridade (extraído do PDF, nome do arquivo)
+        employees: DataFrame de funcionários da empresa (colunas 'id' e 'nome')
+
+    Returns:
+        (funcionario_id, score) ou (None, 0) se nenhum nome atingir o corte.
+    """
+    if employees.empty:
+        return None, 0
+
+    choices = dict(zip(employees['id'].astype(str), employees['nome'].astype(str)))
+    for name in candidate_names:
+        if not name or len(name) < 3:
+            continue
+        match = process.extractOne(name, choices, scorer=fuzz.token_set_ratio, score_cutoff=score_cutoff)
+        if match:
+            _, score, employee_id = match
+            return employee_id, score
+    return None, 0
+
+
+class BulkImportManager:
+    """Coordena a importação em lote usando os managers da unidade."""
+
+    def __init__(self, employee_manager, docs_manager, epi_manager):
+        self.employee_manager = employee_manager
+        self.docs_manager = docs_manager
+        self.epi_manager = epi_manager
+
+    def _analysis_method(self, doc_type: str):
+        if doc_type == 'aso':
+            return self.employee_manager.analyze_aso_pdf
+        if doc_type == 'treinamento':
+            return self.employee_manager.analyze_training_pdf
+        if doc_type == 'epi':
+            return self.epi_manager.analyze_epi_pdf
+        if doc_type == 'doc_empresa':
+            return self.docs_manager.analyze_company_doc_pdf
+        return None
+
+    def submit(self, files: list[tuple[str, bytes]], company_id: str) -> str:
+        """
+        Classifica os arquivos e envia a extração de cada um para a fila de IA.
+
+        Returns:
+            ID do lote, usado para acompanhar o progresso e montar a revisão.
+        """
+        batch_id = uuid.uuid4().hex
+        queue = get_job_queue()
+        unit_id = self.employee_manager.unit_id
+
+        for path, data in files:
+            upload = StoredUpload(data, os.path.basename(path))
+            # ✅ Tipo pelo conteúdo: cada arquivo vai direto ao extrator certo
+            classification = classify_upload(path, data)
+            doc_type = classification['doc_type']
+            analyze = self._analysis_method(doc_type)
+            context = {
+                'path': path, 'doc_type': doc_type, 'company_id': str(company_id),
+                'norma_provavel': classification['norma'],
+                'confianca_tipo': classification['confidence']
+            }
+
+            if analyze is None:
+                # Tipos não importáveis (ex: evidências) entram no lote já com erro
+                analyze = lambda _upload: None
+
+            queue.submit(
+                job_type=BULK_JOB_TYPE,
+                uploaded_file=upload,
+                analyze=analyze,
+                unit_id=unit_id,
+                context=context,
+                file_hash=calcular_hash_arquivo(upload),
+                batch_id=batch_id
+            )
+
+        logger.info(f"Lote {batch_id} enviado com {len(files)} arquivo(s)")
+        return batch_id
+
+    @staticmethod
+    def get_progress(batch_id: str) -> dict:
+        """Contagem de trabalhos do lote por status."""
+        jobs = get_job_queue().list_batch_jobs(batch_id)
+        counts = pd.Series([job['status'] for job in jobs], dtype=object).value_counts().to_dict()
+        finished = counts.get(JOB_DONE, 0) + counts.get(JOB_FAILED, 0)
+        return {'total': len(jobs), 'finished': finished, 'counts': counts}
+
+    def _staging_row(self, job: dict, employees: pd.DataFrame) -> dict:
+        doc_type = job['context'].get('doc_type')
+        path = job['context'].get('path', job['file_name'])
+        doc_info = (job['result'] or {}).get('doc_info') or {}
+
+        row = {
+            'incluir': False,
+            'arquivo': path,
+            'tipo': DOC_TYPE_LABELS.get(doc_type, doc_type),
+            'funcionario': None,
+            'match_score': 0,
+            'data': None,
+            'vencimento': None,
+            'detalhe': '',
+            'status': job['status'],
+            'erro': job.get('error') or '',
+            'auditoria': '',
+            'job_id': job['id'],
+            'doc_type': doc_type
+        }
+
+        if job['status'] != JOB_DONE:
+            if doc_type not in DOC_TYPE_LABELS:
+                row['erro'] = f"Tipo '{doc_type}' não suportado na importação em lote"
+            return row
+
+        if doc_type == 'aso':
+            row.update(data=doc_info.get('data_aso'), vencimento=doc_info.get('vencimento'),
+                       detalhe=doc_info.get('tipo_aso', ''))
+        elif doc_type == 'treinamento':
+            vencimento = self.employee_manager.calcular_vencimento_treinamento(
+                doc_info.get('data'), doc_info.get('norma'), doc_info.get('modulo'),
+                doc_info.get('tipo_treinamento', 'formação')
+            )
+            row.update(data=doc_info.get('data'), vencimento=vencimento,
+                       detalhe=f"{doc_info.get('norma', '')} - {doc_info.get('modulo', 'N/A')}")
+        elif doc_type == 'epi':
+            itens = doc_info.get('itens_epi') or []
+            row.update(detalhe=f"{len(itens)} item(ns) de EPI")
+        elif doc_type == 'doc_empresa':
+            row.update(data=doc_info.get('data_emissao'), vencimento=doc_info.get('vencimento'),
+                       detalhe=doc_info.get('tipo_documento', ''))
+
+        if doc_info.get('audit_result'):
+            row['auditoria'] = doc_info['audit_result'].get('summary', '')
+
+        if doc_type != 'doc_empresa':
+            employee_id, score = match_employee(
+                [doc_info.get('nome_funcionario'), _name_from_filename(path)], employees
+            )
+            if employee_id:
+                row['funcionario'] = employee_id
+                row['match_score'] = score
+            else:
+                row['erro'] = "Funcionário não identificado"
+
+        row['incluir'] = not row['erro']
+        return row
+
+    def build_staging(self, batch_id: str, company_id: str) -> pd.DataFrame:
+        """Monta a tabela de revisão do lote (uma linha por arquivo)."""
+        employees = self.employee_manager.get_employees_by_company(company_id)
+        jobs = get_job_queue().list_batch_jobs(batch_id)
+        rows = [self._staging_row(job, employees) for job in jobs]
+        return pd.DataFrame(rows)
+
+    def audit(self, staging_df: pd.DataFrame, nr_analyzer, progress_callback=None) -> pd.DataFrame:
+        """
+        Audita em lote os documentos marcados como 'incluir' (ASOs, treinamentos
+        e documentos da empresa) com NRAnalyzer.perform_batch_audit.
+
+        O resultado fica no trabalho de cada arquivo (usado pelo commit para o
+        plano de ação) e o parecer na coluna 'auditoria' da tabela devolvida.
+        """
+        staging_df = staging_df.copy()
+        selected = staging_df[
+            staging_df['incluir'] & (staging_df['status'] == JOB_DONE)
+            & staging_df['doc_type'].isin(AUDITED_DOC_TYPES)
+        ]
+        queue = get_job_queue()
+
+        docs, indexes = [], []
+        for index, row in selected.iterrows():
+            job = queue.get_job(row['job_id']) or {}
+            upload = queue.get_job_file(row['job_id'])
+            if upload is None:
+                staging_df.at[index, 'auditoria'] = "Não auditado: arquivo indisponível"
+                continue
+            doc_info = (job.get('result') or {}).get('doc_info') or {}
+            audit_doc_info = {
+                "type": DOC_TYPE_LABELS[row['doc_type']],
+                "norma": doc_info.get('norma', doc_info.get('tipo_documento', ''))
+            }
+            docs.append((audit_doc_info, upload.getvalue()))
+            indexes.append(index)
+
+        if not docs:
+            return staging_df
+
+        results = nr_analyzer.perform_batch_audit(docs, progress_callback=progress_callback)
+        for index, (audit_result, error) in zip(indexes, results):
+            if audit_result:
+                queue.set_audit_result(staging_df.at[index, 'job_id'], audit_result)
+                staging_df.at[index, 'auditoria'] = audit_result.get('summary', '')
+            else:
+                staging_df.at[index, 'auditoria'] = f"Não auditado: {error or 'sem resposta'}"
+
+        audited = sum(1 for audit_result, _ in results if audit_result)
+        logger.info(f"Auditoria do lote: {audited}/{len(docs)} documento(s) auditado(s)")
+        return staging_df
+
+    def _create_action_plans(self, audited: list[tuple[dict, str, str | None]], company_id: str,
+                             nr_analyzer) -> int:
+        """Leva ao plano de ação as não conformidades dos documentos gravados."""
+        items_added = 0
+        for audit_result, doc_id, employee_id in audited:
+            try:
+                items_added += nr_analyzer.create_action_plan_from_audit(
+                    audit_result, company_id, doc_id, employee_id=employee_id
+                )
+            except Exception as e:
+                logger.warning(f"Falha ao criar o plano de ação do documento {doc_id}: {e}")
+        return items_added
+
+    def _upload_file(self, job_id: str, file_name: str) -> str | None:
+        upload = get_job_queue().get_job_file(job_id)
+        if upload is None:
+            return None
+        return self.employee_manager.upload_documento_e_obter_link(upload, file_name)
+
+    def _delete_uploaded(self, file_urls: list[str]):
+        """Remove do storage os arquivos enviados cujas linhas não foram gravadas."""
+        try:
+            from managers.supabase_storage import SupabaseStorageManager
+            storage_manager = SupabaseStorageManager(self.employee_manager.unit_id)
+        except Exception as e:
+            logger.warning(f"{len(file_urls)} arquivo(s) órfão(s) no storage: {e}")
+            return
+        for file_url in file_urls:
+            try:
+                storage_manager.delete_file_by_url(file_url)
+            except Exception as e:
+                logger.warning(f"Arquivo órfão no storage: {file_url}. Erro: {e}")
+
+    @staticmethod
+    def _storage_name(row: pd.Series, employee_name: str) -> str:
+        prefix = {'aso': 'ASO', 'treinamento': 'TREINAMENTO', 'epi': 'EPI', 'doc_empresa': 'DOC'}[row['doc_type']]
+        ref_date = row['data'] if isinstance(row['data'], (date, datetime)) else date.today()
+        name = (employee_name or row['detalhe'] or 'documento').replace(' ', '_')
+        return f"{prefix}_{name}_{ref_date.strftime('%Y%m%d')}.pdf"
+
+    @staticmethod
+    def _employee_id(row: pd.Series) -> str | None:
+        funcionario = row['funcionario']
+        return str(funcionario) if funcionario and not pd.isna(funcionario) else None
+
+    def _find_duplicate(self, doc_type: str, owner_id: str, arquivo_hash: str) -> pd.DataFrame:
+        """Registros já cadastrados com o mesmo arquivo, pela checagem do manager do tipo."""
+        if doc_type == 'aso':
+            return self.employee_manager.find_duplicate_aso(owner_id, arquivo_hash)
+        if doc_type == 'treinamento':
+            return self.employee_manager.find_duplicate_training(owner_id, arquivo_hash)
+        if doc_type == 'epi':
+            return self.epi_manager.find_duplicate_epi(owner_id, arquivo_hash)
+        return self.docs_manager.find_duplicate_document(owner_id, arquivo_hash)
+
+    def _validation_error(self, row: pd.Series, doc_info: dict, arquivo_hash: str, company_id: str) -> str | None:
+        """Motivo para não gravar a linha, ou None se ela pode ser gravada."""
+        doc_type = row['doc_type']
+        funcionario_id = self._employee_id(row)
+        if doc_type != 'doc_empresa' and not funcionario_id:
+            return "Funcionário não informado"
+        if doc_type in ('aso', 'treinamento', 'doc_empresa') and not isinstance(row['data'], (date, datetime)):
+            return "Data inválida"
+        if doc_type == 'epi' and not doc_info.get('itens_epi'):
+            return "Nenhum item de EPI extraído"
+
+        owner_id = str(company_id) if doc_type == 'doc_empresa' else funcionario_id
+        if not self._find_duplicate(doc_type, owner_id, arquivo_hash).empty:
+            return "Este PDF já foi cadastrado anteriormente"
+
+        if doc_type == 'treinamento':
+            training_data = {**doc_info, 'funcionario_id': funcionario_id, 'data': row['data'],
+                             'vencimento': row['vencimento'], 'arquivo_hash': arquivo_hash}
+            is_valid, validation_msg = self.employee_manager.validate_training_data(training_data)
+            if not is_valid:
+                return validation_msg
+        return None
+
+    @staticmethod
+    def _records(row: pd.Series, doc_info: dict, arquivo_hash: str, arquivo_id: str,
+                 company_id: str) -> tuple[str, list[dict]]:
+        """Tabela e linhas a inserir para um documento já enviado ao storage."""
+        funcionario_id = BulkImportManager._employee_id(row)
+
+        if row['doc_type'] == 'aso':
+            return 'asos', [{
+                'funcionario_id': funcionario_id,
+                'data_aso': format_date_safe(row['data']),
+                'vencimento': format_date_safe(row['vencimento']),
+                'arquivo_id': arquivo_id,
+                'arquivo_hash': arquivo_hash,
+                'riscos': doc_info.get('riscos', 'N/A'),
+                'cargo': doc_info.get('cargo', 'N/A'),
+                'tipo_aso': doc_info.get('tipo_aso', 'N/A')
+            }]
+        if row['doc_type'] == 'treinamento':
+            return 'treinamentos', [{
+                'funcionario_id': funcionario_id,
+                'data': format_date_safe(row['data']),
+                'vencimento': format_date_safe(row['vencimento']),
+                'norma': doc_info.get('norma'),
+                'modulo': doc_info.get('modulo', 'N/A'),
+                'status': "Válido",
+                'anexo': arquivo_id,
+                'arquivo_hash': arquivo_hash,
+                'tipo_treinamento': str(doc_info.get('tipo_treinamento', 'formação')),
+                'carga_horaria': str(doc_info.get('carga_horaria', '0'))
+            }]
+        if row['doc_type'] == 'epi':
+            return 'fichas_epi', [{
+                'funcionario_id': funcionario_id,
+                'item_id': str(item.get('item_numero', '')),
+                'descricao_epi': str(item.get('descricao', '')),
+                'ca_epi': str(item.get('ca', '')),
+                'data_entrega': str(item.get('data_entrega', '')),
+                'arquivo_id': arquivo_id,
+                'arquivo_hash': arquivo_hash
+            } for item in doc_info.get('itens_epi') or []]
+        return 'documentos_empresa', [{
+            'empresa_id': str(company_id),
+            'tipo_documento': str(row['detalhe']),
+            'data_emissao': format_date_safe(row['data']),
+            'vencimento': format_date_safe(row['vencimento']),
+            'arquivo_id': arquivo_id,
+            'arquivo_hash': arquivo_hash
+        }]
+
+    def commit(self, staging_df: pd.DataFrame, company_id: str, progress_callback=None,
+               nr_analyzer=None) -> dict:
+        """
+        Grava os registros marcados como 'incluir': valida todas as linhas,
+        envia os PDFs aprovados ao storage em paralelo e insere as linhas de
+        todas as tabelas em uma única transação.
+
+        Só os trabalhos gravados são arquivados; os que falharam ou não foram
+        marcados continuam no lote para revisão. Arquivos enviados de linhas
+        que não foram gravadas são removidos do storage. Com nr_analyzer, as
+        não conformidades dos documentos auditados (ver audit) vão para o
+        plano de ação.
+
+        Returns:
+            dict com 'saved' (por tabela), 'failed' (lista de (arquivo, motivo))
+            e 'action_items' (itens adicionados ao plano de ação).
+        """
+        selected = staging_df[staging_df['incluir'] & (staging_df['status'] == JOB_DONE)]
+        failed = []
+        queue = get_job_queue()
+
+        # 1. Validação completa (inclusive duplicatas) antes de qualquer upload
+        pending = []
+        batch_hashes = {}
+        for _, row in selected.iterrows():
+            job = queue.get_job(row['job_id']) or {}
+            doc_info = (job.get('result') or {}).get('doc_info') or {}
+            arquivo_hash = job.get('file_hash') or ''
+            reason = self._validation_error(row, doc_info, arquivo_hash, company_id)
+            if not reason and arquivo_hash in batch_hashes:
+                reason = f"Arquivo idêntico a '{batch_hashes[arquivo_hash]}' neste lote"
+            if reason:
+                failed.append((row['arquivo'], reason))
+                continue
+            if arquivo_hash:
+                batch_hashes[arquivo_hash] = row['arquivo']
+            pending.append((row, doc_info, arquivo_hash))
+
+        # 2. Uploads em paralelo
+        employee_names = {}
+        if pending:
+            employees = self.employee_manager.get_employees_by_company(company_id)
+            if not employees.empty:
+                employee_names = dict(zip(employees['id'].astype(str), employees['nome']))
+
+        def upload(item):
+            row = item[0]
+            name = self._storage_name(row, employee_names.get(self._employee_id(row)))
+            return self._upload_file(row['job_id'], name)
+
+        with ThreadPoolExecutor(max_workers=UPLOAD_WORKERS) as executor:
+            arquivo_ids = list(executor.map(upload, pending))
+
+        # 3. Linhas por tabela
+        tables = {'asos': [], 'treinamentos': [], 'fichas_epi': [], 'documentos_empresa': []}
+        uploaded = []
+        positions = []
+        for i, ((row, doc_info, arquivo_hash), arquivo_id) in enumerate(zip(pending, arquivo_ids), start=1):
+            if progress_callback:
+                progress_callback(i, len(pending))
+            if not arquivo_id:
+                failed.append((row['arquivo'], "Falha no upload do arquivo"))
+                continue
+            table_name, records = self._records(row, doc_info, arquivo_hash, str(arquivo_id), company_id)
+            # Posição da linha na tabela: os IDs inseridos voltam na mesma ordem
+            positions.append((table_name, len(tables[table_name]), doc_info.get('audit_result')))
+            tables[table_name].extend(records)
+            uploaded.append((row, arquivo_id))
+
+        # 4. Inserção de todas as tabelas em uma única transação
+        saved = {}
+        action_items = 0
+        if uploaded:
+            inserted = self.employee_manager.supabase_ops.insert_batches(tables)
+            if inserted is None:
+                # Nada foi gravado: remove os arquivos enviados para não deixar órfãos
+                self._delete_uploaded([arquivo_id for _, arquivo_id in uploaded])
+                failed.extend((row['arquivo'], "Falha ao gravar registros no banco de dados") for row, _ in uploaded)
+                uploaded = []
+            else:
+                saved = {table_name: len(ids) for table_name, ids in inserted.items()}
+                if nr_analyzer:
+                    audited = [
+                        (audit_result, inserted[table_name][position], self._employee_id(row))
+                        for (row, _), (table_name, position, audit_result) in zip(uploaded, positions)
+                        if audit_result and position < len(inserted.get(table_name, []))
+                    ]
+                    action_items = self._create_action_plans(audited, company_id, nr_analyzer)
+
+        if uploaded:
+            from operations.cached_loaders import load_all_unit_data
+            load_all_unit_data.clear()
+            st.cache_data.clear()
+            st.session_state.force_reload_managers = True
+            logger.info(f"✅ Importação em lote gravada: {saved}")
+
+        for row, _ in uploaded:
+            queue.archive_job(row['job_id'])
+
+        return {'saved': saved, 'failed': failed, 'action_items': action_items}
+
+    @staticmethod
+    def discard(batch_id: str):
+        """Arquiva todos os trabalhos restantes de um lote."""
+        queue = get_job_queue()
+        for job in queue.list_batch_jobs(batch_id):
+            queue.archive_job(job['id'])
@@ -4,13 +4,14 @@ from datetime import datetime, timedelta, date
 import re
 import logging
 from operations.supabase_operations import SupabaseOperations
-from AI.api_Operation import PDFQA
+from AI.api_Operation import PDFQA, AnalysisError
 import tempfile
 import os
 from operations.audit_logger import log_action
 from operations.cached_loaders import load_all_unit_data
 from managers.supabase_storage import SupabaseStorageManager
 from operations.file_hash import calcular_hash_arquivo, verificar_hash_seguro
+from operations.utils import add_expiry_status
 
 logger = logging.getLogger('segsisone_app.company_docs_manager')
 
@@ -56,6 +57,8 @@ class CompanyDocsManager:
         try:
             data = load_all_unit_data(self.unit_id)
             self.docs_df = data['company_docs']
+            if not self.docs_df.empty:
+                self.docs_df = add_expiry_status(self.docs_df)
             self.data_loaded_successfully = True
         except Exception as e:
             logger.error(f"Erro: {e}", exc_info=True)
@@ -93,7 +96,9 @@ class CompanyDocsManager:
             1. Qual o tipo deste documento? Responda 'PGR', 'PCMSO', 'PPR', 'PCA' ou 'Outro'.
             2. Qual a data de emissão, vigência ou elaboração do documento? Responda a data no formato DD/MM/AAAA.
             """
-            answer, _ = self.pdf_analyzer.answer_question([temp_path], combined_question)
+            answer, _ = self.pdf_analyzer.answer_question(
+                [temp_path], combined_question, page_profile='doc_empresa_extracao'
+            )
             os.unlink(temp_path)
             
             if not answer: 
@@ -112,8 +117,7 @@ class CompanyDocsManager:
             data_emissao = self._parse_flexible_date(results.get(2, ''))
 
             if not data_emissao:
-                st.error("Não foi possível extrair a data de emissão do documento.")
-                return None
+                raise AnalysisError("Não foi possível extrair a data de emissão do documento.")
 
             if "PGR" in doc_type_str: 
                 doc_type = "PGR"
@@ -138,23 +142,27 @@ class CompanyDocsManager:
                 'data_emissao': data_emissao, 
                 'vencimento': vencimento
             }
+        except AnalysisError:
+            raise
         except Exception as e:
-            st.error(f"Erro ao analisar o PDF do documento: {e}")
-            return None
+            raise AnalysisError(f"Erro ao analisar o PDF do documento: {e}") from e
+
+    def find_duplicate_document(self, empresa_id, arquivo_hash) -> pd.DataFrame:
+        """Documentos da empresa já cadastrados com o mesmo arquivo (vazio se não houver)."""
+        if not arquivo_hash or not verificar_hash_seguro(self.docs_df, 'arquivo_hash'):
+            return pd.DataFrame()
+        return self.docs_df[
+            (self.docs_df['empresa_id'] == str(empresa_id)) &
+            (self.docs_df['arquivo_hash'] == arquivo_hash)
+        ]
 
     def add_company_document(self, empresa_id, tipo_documento, data_emissao, vencimento, arquivo_id, arquivo_hash=None):
         """Adiciona documento da empresa usando Supabase."""
         empresa_id_str = str(empresa_id)
 
-        if arquivo_hash and verificar_hash_seguro(self.docs_df, 'arquivo_hash'):
-            duplicata = self.docs_df[
-                (self.docs_df['empresa_id'] == empresa_id_str) &
-                (self.docs_df['arquivo_hash'] == arquivo_hash)
-            ]
-
-            if not duplicata.empty:
-                st.warning(f"⚠️ Este arquivo PDF já foi cadastrado anteriormente para esta empresa.")
-                return None
+        if not self.find_duplicate_document(empresa_id_str, arquivo_hash).empty:
+            st.warning(f"⚠️ Este arquivo PDF já foi cadastrado anteriormente para esta empresa.")
+            return None
 
         # ✅ Valida datas antes de formatar
         if not isinstance(data_emissao, date):
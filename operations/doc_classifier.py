@@ -0,0 +1,367 @@
+"""
+Classificador local do tipo de documento pelo conteúdo do PDF.
+
+Usa a camada de texto do PDF e um modelo Naive Bayes multinomial pequeno
+(vocabulário de palavras e bigramas com pesos por classe) salvo em
+operations/doc_classifier_model.json. Retorna o tipo, a norma provável e
+a confiança; sem texto (PDF escaneado) ou com confiança baixa, o nome do
+arquivo é usado como antes.
+
+A probabilidade a posteriori do Naive Bayes satura em 1.0 com qualquer
+texto de tamanho real, então a confiança vem da margem entre as duas
+melhores classes normalizada pelo tamanho do texto (margem / sqrt(termos)),
+calibrada por regressão logística (Platt) sobre predições de validação
+cruzada feitas no treino: trechos curtos e ambíguos dos documentos dão os
+exemplos de erro.
+
+Para retreinar com documentos reais, organize PDFs em subpastas com o nome
+do tipo (aso/, treinamento/, epi/, doc_empresa/) e execute:
+
+    python -m operations.doc_classifier <pasta>
+
+e para medir acurácia e cobertura em PDFs rotulados que não entraram no treino:
+
+    python -m operations.doc_classifier --validate <pasta>
+"""
+import os
+import re
+import sys
+import json
+import math
+import logging
+import unicodedata
+from collections import Counter
+
+from operations.local_extraction import extract_pdf_text
+
+logger = logging.getLogger('segsisone_app.doc_classifier')
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), 'doc_classifier_model.json')
+# Abaixo desta confiança o nome do arquivo prevalece, se indicar um tipo
+MIN_CONFIDENCE = float(os.getenv("SEGSIS_DOC_CLASSIFIER_MIN_CONFIDENCE", "0.6"))
+MIN_TEXT_CHARS = 80
+
+DOC_TYPES = ['aso', 'treinamento', 'epi', 'doc_empresa']
+
+# Norma implícita por tipo, quando o texto não cita outra
+DEFAULT_NORMA = {'aso': 'NR-07', 'epi': 'NR-06'}
+_COMPANY_DOC_NORMA = {
+    'pgr': 'NR-01', 'programa de gerenciamento de riscos': 'NR-01',
+    'pcmso': 'NR-07', 'programa de controle medico de saude ocupacional': 'NR-07',
+    'ppr': 'NR-09', 'programa de protecao respiratoria': 'NR-09',
+    'pca': 'NR-09', 'programa de conservacao auditiva': 'NR-09',
+}
+# Caracteres iniciais tratados como título/capa do documento
+TITLE_CHARS = 400
+CALIBRATION_FOLDS = 4
+# Tamanhos (em palavras) dos trechos usados como exemplos na calibração
+CALIBRATION_WINDOWS = (3, 6, 12)
+
+# Corpus semente do modelo distribuído (trechos típicos de cada tipo)
+SEED_CORPUS = {
+    'aso': [
+        "atestado de saúde ocupacional aso exame clínico admissional periódico demissional",
+        "médico examinador crm apto inapto para a função riscos ocupacionais pcmso nr-07",
+        "mudança de risco retorno ao trabalho monitoramento pontual exames complementares audiometria",
+        "declaro que o trabalhador foi considerado apto para exercer a função médico coordenador",
+        "tipo de exame admissional data do exame assinatura do médico assinatura do trabalhador",
+    ],
+    'treinamento': [
+        "certificado certificamos que participou do treinamento carga horária horas conteúdo programático",
+        "curso de capacitação nr-35 trabalho em altura instrutor responsável técnico reciclagem",
+        "nr-10 segurança em instalações e serviços em eletricidade sep sistema elétrico de potência",
+        "nr-33 espaço confinado trabalhador autorizado vigia supervisor de entrada formação",
+        "nr-20 inflamáveis e combustíveis básico intermediário avançado certificado de conclusão",
+        "aproveitamento avaliação final instrutor assinatura do participante realizado em",
+    ],
+    'epi': [
+        "ficha de controle de entrega de equipamento de proteção individual epi nr-06",
+        "certificado de aprovação ca quantidade data de entrega devolução assinatura do empregado",
+        "declaro ter recebido os equipamentos de proteção individual e treinamento sobre uso guarda",
+        "luva capacete óculos de proteção protetor auricular botina respirador ca número",
+        "recebi gratuitamente os epis listados abaixo comprometo-me a usá-los conservação",
+    ],
+    'doc_empresa': [
+        "programa de gerenciamento de riscos pgr inventário de riscos plano de ação nr-01",
+        "programa de controle médico de saúde ocupacional pcmso médico responsável cronograma",
+        "programa de proteção respiratória ppr programa de conservação auditiva pca",
+        "gerenciamento de riscos ocupacionais avaliação de riscos severidade probabilidade nível de risco",
+        "documento base vigência responsável técnico elaboração empresa cnpj grau de risco cnae",
+        "ltcat laudo técnico das condições ambientais do trabalho agentes nocivos",
+    ],
+}
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(c for c in text if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> list[str]:
+    """Palavras (sem acentos, 2+ caracteres) e bigramas."""
+    words = re.findall(r'[a-z0-9]{2,}', _normalize(text))
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+def _fit_naive_bayes(samples: list[tuple[str, str]], alpha: float, max_features: int) -> dict:
+    counts = {doc_type: Counter() for doc_type in DOC_TYPES}
+    docs = Counter()
+    for text, doc_type in samples:
+        counts[doc_type].update(tokenize(text))
+        docs[doc_type] += 1
+
+    totals = Counter()
+    for counter in counts.values():
+        totals.update(counter)
+    vocabulary = [term for term, _ in totals.most_common(max_features)]
+
+    total_docs = sum(docs.values())
+    model = {'version': 1, 'vocabulary': vocabulary, 'classes': {}}
+    for doc_type in DOC_TYPES:
+        class_total = sum(counts[doc_type][term] for term in vocabulary) + alpha * len(vocabulary)
+        model['classes'][doc_type] = {
+            'prior': math.log((docs[doc_type] + 1) / (total_docs + len(DOC_TYPES))),
+            'weights': [round(math.log((counts[doc_type][term] + alpha) / class_total), 5) for term in vocabulary]
+        }
+    return model
+
+
+def _fit_platt(points: list[tuple[float, bool]], iterations: int = 50) -> tuple[float, float]:
+    """
+    Regressão logística de uma variável (Platt): P(acerto) = sigmoid(a * x + b).
+
+    Usa os alvos suavizados de Platt, que mantêm a e b finitos mesmo sem erros
+    na validação.
+    """
+    positives = sum(1 for _, correct in points if correct)
+    negatives = len(points) - positives
+    high, low = (positives + 1) / (positives + 2), 1 / (negatives + 2)
+    targets = [high if correct else low for _, correct in points]
+    a, b = 1.0, 0.0
+    for _ in range(iterations):
+        # Newton-Raphson com pequena regularização na diagonal
+        g_a = g_b = 0.0
+        h_aa, h_ab, h_bb = 1e-6, 0.0, 1e-6
+        for (x, _), t in zip(points, targets):
+            p = 1.0 / (1.0 + math.exp(-max(min(a * x + b, 35.0), -35.0)))
+            w = p * (1.0 - p)
+            g_a += (p - t) * x
+            g_b += p - t
+            h_aa += w * x * x
+            h_ab += w * x
+            h_bb += w
+        det = h_aa * h_bb - h_ab * h_ab
+        if det <= 0:
+            break
+        step_a = (h_bb * g_a - h_ab * g_b) / det
+        step_b = (h_aa * g_b - h_ab * g_a) / det
+        a, b = a - step_a, b - step_b
+        if abs(step_a) < 1e-7 and abs(step_b) < 1e-7:
+            break
+    return round(a, 6), round(b, 6)
+
+
+def _windows(text: str) -> list[str]:
+    """O texto inteiro e trechos curtos dele (exemplos ambíguos para a calibração)."""
+    words = text.split()
+    fragments = [text]
+    for size in CALIBRATION_WINDOWS:
+        if len(words) > size:
+            fragments.extend(" ".join(words[start:start + size]) for start in range(0, len(words), size))
+    return fragments
+
+
+def train(samples: list[tuple[str, str]], alpha: float = 0.5, max_features: int = 3000) -> dict:
+    """
+    Treina o Naive Bayes multinomial e calibra a confiança.
+
+    Args:
+        samples: Lista de (texto, tipo)
+        alpha: Suavização de Laplace
+        max_features: Tamanho máximo do vocabulário (termos mais frequentes)
+
+    Returns:
+        Modelo serializável em JSON.
+    """
+    points = []
+    for fold in range(CALIBRATION_FOLDS):
+        held_out = samples[fold::CALIBRATION_FOLDS]
+        if not held_out:
+            continue
+        classifier = DocumentClassifier(_fit_naive_bayes(
+            [sample for i, sample in enumerate(samples) if i % CALIBRATION_FOLDS != fold], alpha, max_features
+        ))
+        for text, doc_type in held_out:
+            for fragment in _windows(text):
+                predicted, score = classifier.margin(fragment)
+                if predicted is not None:
+                    points.append((score, predicted == doc_type))
+
+    model = _fit_naive_bayes(samples, alpha, max_features)
+    a, b = _fit_platt(points) if points else (1.0, 0.0)
+    model['calibration'] = {'a': a, 'b': b, 'points': len(points),
+                            'accuracy': round(sum(c for _, c in points) / len(points), 3) if points else None}
+    return model
+
+
+class DocumentClassifier:
+    """Classificador carregado do JSON do modelo."""
+
+    def __init__(self, model: dict):
+        self.vocabulary = {term: i for i, term in enumerate(model['vocabulary'])}
+        self.classes = model['classes']
+        self.calibration = model.get('calibration')
+
+    @classmethod
+    def load(cls, path: str = MODEL_PATH):
+        with open(path, encoding='utf-8') as f:
+            return cls(json.load(f))
+
+    def margin(self, text: str) -> tuple[str | None, float]:
+        """
+        Retorna (tipo, margem normalizada): diferença de log-verossimilhança
+        entre a melhor e a segunda classe dividida por sqrt(termos conhecidos).
+        """
+        features = Counter(i for i in map(self.vocabulary.get, tokenize(text)) if i is not None)
+        if not features:
+            return None, 0.0
+
+        scores = {}
+        for doc_type, params in self.classes.items():
+            weights = params['weights']
+            scores[doc_type] = params['prior'] + sum(weights[i] * n for i, n in features.items())
+
+        ranked = sorted(scores, key=scores.get, reverse=True)
+        gap = scores[ranked[0]] - scores[ranked[1]] if len(ranked) > 1 else 0.0
+        return ranked[0], gap / math.sqrt(sum(features.values()))
+
+    def predict(self, text: str) -> tuple[str | None, float]:
+        """Retorna (tipo, confiança calibrada) ou (None, 0.0) se nenhum termo é conhecido."""
+        best, score = self.margin(text)
+        if best is None:
+            return None, 0.0
+        if not self.calibration:
+            # Modelo antigo, sem calibração: a margem sozinha não é uma probabilidade
+            return best, 0.0
+        z = self.calibration['a'] * score + self.calibration['b']
+        return best, 1.0 / (1.0 + math.exp(-max(min(z, 35.0), -35.0)))
+
+
+_classifier = None
+
+
+def get_classifier() -> DocumentClassifier | None:
+    """Classificador do processo (None se o modelo não puder ser carregado)."""
+    global _classifier
+    if _classifier is None:
+        try:
+            _classifier = DocumentClassifier.load()
+        except Exception as e:
+            logger.error(f"Modelo do classificador de documentos indisponível: {e}")
+            return None
+    return _classifier
+
+
+def _company_doc_norma(normalized: str) -> str | None:
+    """
+    Norma do programa (PGR, PCMSO...) pelo título; fora dele, pelo programa
+    mais citado. Um PGR cita o PCMSO, mas o título e a maioria das menções são
+    do próprio programa.
+    """
+    title = " ".join(normalized[:TITLE_CHARS].split())
+    in_title = []
+    for keyword, norma in _COMPANY_DOC_NORMA.items():
+        match = re.search(rf'\b{keyword}\b', title)
+        if match:
+            in_title.append((match.start(), norma))
+    if in_title:
+        return min(in_title)[1]
+
+    mentions = Counter()
+    for keyword, norma in _COMPANY_DOC_NORMA.items():
+        mentions[norma] += len(re.findall(rf'\b{keyword}\b', normalized))
+    mentions = +mentions
+    return mentions.most_common(1)[0][0] if mentions else None
+
+
+def infer_norma(text: str, doc_type: str | None) -> str | None:
+    """Norma mais citada no texto ou a implícita pelo tipo."""
+    normalized = _normalize(text)
+    if doc_type == 'doc_empresa':
+        norma = _company_doc_norma(normalized)
+        if norma:
+            return norma
+    mentions = Counter(f"NR-{int(n):02d}" for n in re.findall(r'\bnr\s*-?\s*(\d{1,2})\b', normalized))
+    if mentions:
+        norma = mentions.most_common(1)[0][0]
+        if norma == 'NR-10' and re.search(r'\bsep\b|sistema eletrico de potencia', normalized):
+            return 'NR-10 SEP'
+        return norma
+    return DEFAULT_NORMA.get(doc_type)
+
+
+def classify_document(pdf_bytes: bytes = None, text: str = None) -> dict:
+    """
+    Classifica um documento pelo conteúdo.
+
+    Returns:
+        {'doc_type': str | None, 'norma': str | None, 'confidence': float}
+        doc_type None quando não há texto ou modelo.
+    """
+    if text is None:
+        text = extract_pdf_text(pdf_bytes) if pdf_bytes else ""
+    if len(text.strip()) < MIN_TEXT_CHARS:
+        return {'doc_type': None, 'norma': None, 'confidence': 0.0}
+
+    classifier = get_classifier()
+    if classifier is None:
+        return {'doc_type': None, 'norma': None, 'confidence': 0.0}
+
+    doc_type, confidence = classifier.predict(text)
+    return {'doc_type': doc_type, 'norma': infer_norma(text, doc_type), 'confidence': round(confidence, 3)}
+
+
+def _training_samples(folder: str) -> list[tuple[str, str]]:
+    samples = []
+    for doc_type in DOC_TYPES:
+        class_dir = os.path.join(folder, doc_type)
+        if not os.path.isdir(class_dir):
+            continue
+        for name in sorted(os.listdir(class_dir)):
+            if name.lower().endswith('.pdf'):
+                with open(os.path.join(class_dir, name), 'rb') as f:
+                    text = extract_pdf_text(f.read())
+                if text.strip():
+                    samples.append((text, doc_type))
+    return samples
+
+
+def validate(samples: list[tuple[str, str]], classifier: DocumentClassifier = None,
+             min_confidence: float = MIN_CONFIDENCE) -> dict:
+    """
+    Acurácia do classificador em amostras rotuladas e o efeito do limiar:
+    quantas passam de min_confidence (cobertura) e a acurácia entre elas.
+    """
+    classifier = classifier or get_classifier()
+    results = [(classifier.predict(text), doc_type) for text, doc_type in samples]
+    accepted = [(predicted, doc_type) for (predicted, confidence), doc_type in results
+                if confidence >= min_confidence]
+    return {
+        'samples': len(results),
+        'accuracy': sum(p == t for (p, _), t in results) / len(results) if results else 0.0,
+        'coverage': len(accepted) / len(results) if results else 0.0,
+        'accuracy_above_threshold': sum(p == t for p, t in accepted) / len(accepted) if accepted else 0.0,
+    }
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--validate':
+        print(validate(_training_samples(sys.argv[2])))
+        sys.exit(0)
+    seed = [(text, doc_type) for doc_type, texts in SEED_CORPUS.items() for text in texts]
+    extra = _training_samples(sys.argv[1]) if len(sys.argv) > 1 else []
+    model = train(seed + extra)
+    with open(MODEL_PATH, 'w', encoding='utf-8') as f:
+        json.dump(model, f, ensure_ascii=False, separators=(',', ':'))
+    print(f"Modelo salvo em {MODEL_PATH} ({len(seed)} amostras semente, {len(extra)} PDFs); "
+          f"calibração: {model['calibration']}")
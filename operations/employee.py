@@ -3,12 +3,12 @@ from operations.file_hash import calcular_hash_arquivo, verificar_hash_seguro
 import streamlit as st
 from datetime import datetime, date, timedelta
 from operations.file_utils import infer_doc_type
-from AI.api_Operation import PDFQA
+from AI.api_Operation import PDFQA, AnalysisError
+from AI.schemas import result_to_dict
 import tempfile
 import os
 import re
 import locale
-import json
 from dateutil.relativedelta import relativedelta
 from operations.audit_logger import log_action
 from auth.auth_utils import get_user_email
@@ -16,8 +16,9 @@ from difflib import SequenceMatcher
 import logging
 from typing import Optional, Union
 from operations.cached_loaders import load_all_unit_data
-from operations.utils import format_date_safe
+from operations.utils import format_date_safe, add_expiry_status
 from operations.nr_rules_manager import NRRulesManager  # <-- NOVA IMPORTAÇÃO
+from operations.local_extraction import LocalExtractor
 
 def similar(a: str, b: str) -> float:
     return SequenceMatcher(None, a, b).ratio()
@@ -31,6 +32,85 @@ logger = logging.getLogger('segsisone_app.employee_manager')
 
 from operations.supabase_operations import SupabaseOperations
 
+def _normalizar_modulo_especial(row):
+    """Normaliza o módulo de um treinamento conforme as regras específicas de cada norma."""
+    try:
+        # ✅ CORREÇÃO: Validação antes de usar
+        norma = str(row.get('norma_normalizada', '')).strip().upper()
+        modulo = str(row.get('modulo_normalizado', '')).strip().title()
+
+        # Se algum valor for vazio/inválido, retorna o módulo como está
+        if not norma or norma in ['NAN', 'NONE', '']:
+            return modulo if modulo not in ['Nan', 'N/A', ''] else 'N/A'
+
+        # Dicionário de mapeamentos
+        normalizacao_map = {
+            'NR-10': {
+                'sep_keywords': ['SEP'],
+                'sep_value': 'SEP',
+                'default': 'Básico'
+            },
+            'NR-33': {
+                'supervisor': ['SUPERVISOR'],
+                'trabalhador': ['TRABALHADOR', 'AUTORIZADO'],
+                'values': {
+                    'supervisor': 'Supervisor',
+                    'trabalhador': 'Trabalhador Autorizado'
+                }
+            },
+            'NR-20': {
+                'validos': ['Básico', 'Intermediário', 'Avançado I', 'Avançado II']
+            },
+            'PERMISSÃO': {
+                'emitente': ['EMITENTE'],
+                'requisitante': ['REQUISITANTE'],
+                'values': {
+                    'emitente': 'Emitente',
+                    'requisitante': 'Requisitante'
+                }
+            }
+        }
+
+        # NR-10
+        if 'NR-10' in norma:
+            if any(kw in norma or kw in modulo.upper() for kw in normalizacao_map['NR-10']['sep_keywords']):
+                return normalizacao_map['NR-10']['sep_value']
+            elif modulo in ['N/A', 'Nan', '']:
+                return normalizacao_map['NR-10']['default']
+            return modulo
+
+        # NR-33
+        if 'NR-33' in norma:
+            modulo_upper = modulo.upper()
+            if any(kw in modulo_upper for kw in normalizacao_map['NR-33']['supervisor']):
+                return normalizacao_map['NR-33']['values']['supervisor']
+            elif any(kw in modulo_upper for kw in normalizacao_map['NR-33']['trabalhador']):
+                return normalizacao_map['NR-33']['values']['trabalhador']
+            return modulo
+
+        # NR-20
+        if 'NR-20' in norma:
+            for valido in normalizacao_map['NR-20']['validos']:
+                if valido.upper() in modulo.upper():
+                    return valido
+            return modulo
+
+        # Permissão de Trabalho
+        if 'PERMISSÃO' in norma or 'PT' in norma:
+            modulo_upper = modulo.upper()
+            if any(kw in modulo_upper for kw in normalizacao_map['PERMISSÃO']['emitente']):
+                return normalizacao_map['PERMISSÃO']['values']['emitente']
+            elif any(kw in modulo_upper for kw in normalizacao_map['PERMISSÃO']['requisitante']):
+                return normalizacao_map['PERMISSÃO']['values']['requisitante']
+            return modulo
+
+        return modulo
+
+    except Exception as e:
+        logger.error(f"Erro ao normalizar módulo: {e}")
+        return 'N/A'
+
+
 class EmployeeManager:
     def __init__(self, unit_id: str, folder_id: str = ""):
         logger.info(f"Inicializando EmployeeManager para unit_id: ...{unit_id[-6:]}")
@@ -38,7 +118,9 @@ class EmployeeManager:
         self.supabase_ops = SupabaseOperations(unit_id)
         self.folder_id = folder_id
         self._pdf_analyzer = None
+        self._local_extractor = None
         self.data_loaded_successfully = False
+        self._status_summary_cache = {}
 
         # ✅ PASSO 1: INICIALIZAR O NOVO MANAGER
         self.nr_rules_manager = NRRulesManager(self.unit_id)
@@ -51,6 +133,13 @@ class EmployeeManager:
             self._pdf_analyzer = PDFQA()
         return self._pdf_analyzer
 
+    @property
+    def local_extractor(self):
+        """Extração pela camada de texto do PDF, antes de recorrer ao Gemini."""
+        if self._local_extractor is None:
+            self._local_extractor = LocalExtractor(self._parse_flexible_date, self._padronizar_norma)
+        return self._local_extractor
+
     def upload_documento_e_obter_link(self, arquivo, novo_nome: str):
         if not self.unit_id:
             st.error("O ID da unidade não está definido.")
@@ -72,6 +161,7 @@ class EmployeeManager:
             return None
 
     def load_data(self):
+        self._status_summary_cache = {}
         try:
             data = load_all_unit_data(self.unit_id)
             if not data or not isinstance(data, dict):
@@ -112,6 +202,12 @@ class EmployeeManager:
                 self.employees_df.set_index('id', inplace=True, drop=False)
                 self._employees_by_company = self.employees_df.groupby('empresa_id')
 
+            # Situação de vencimento calculada uma vez por carga, antes dos agrupamentos
+            if not self.aso_df.empty:
+                self.aso_df = add_expiry_status(self.aso_df)
+            if not self.training_df.empty:
+                self.training_df = add_expiry_status(self.training_df)
+
             if not self.aso_df.empty:
                 self._asos_by_employee = self.aso_df.groupby('funcionario_id')
 
@@ -152,11 +248,36 @@ class EmployeeManager:
 
     def analyze_aso_pdf(self, pdf_file):
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-                temp_file.write(pdf_file.getvalue())
-                temp_path = temp_file.name
+            # ✅ Modelos conhecidos com camada de texto: extração local, sem cota de IA
+            data = self.local_extractor.extract('aso', pdf_file.getvalue())
+            if data is None:
+                data = self._extract_aso_with_ai(pdf_file)
+            if not data: return None
+
+            data_aso = self._parse_flexible_date(data.get('data_aso'))
+            vencimento = self._parse_flexible_date(data.get('vencimento_aso'))
+            if not data_aso:
+                raise AnalysisError("Data do exame não encontrada no ASO.")
+                
+            tipo_aso = str(data.get('tipo_aso') or 'Não identificado')
+            if not vencimento and tipo_aso != 'Demissional':
+                if tipo_aso in ['Admissional', 'Periódico', 'Mudança de Risco', 'Retorno ao Trabalho']:
+                    vencimento = data_aso + relativedelta(years=1)
+                elif tipo_aso == 'Monitoramento Pontual':
+                    vencimento = data_aso + relativedelta(months=6)
             
-            structured_prompt = """        
+            return {'data_aso': data_aso, 'vencimento': vencimento, 'riscos': data.get('riscos') or "", 'cargo': data.get('cargo') or "", 'tipo_aso': tipo_aso, 'nome_funcionario': data.get('nome_funcionario')}
+        except AnalysisError:
+            raise
+        except Exception as e:
+            raise AnalysisError(f"Erro ao analisar PDF do ASO: {e}") from e
+
+    def _extract_aso_with_ai(self, pdf_file) -> dict | None:
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
+            temp_file.write(pdf_file.getvalue())
+            temp_path = temp_file.name
+
+        structured_prompt = """        
             Você é um assistente de extração de dados para documentos de Saúde e Segurança do Trabalho. Sua tarefa é analisar o ASO em PDF e extrair as informações abaixo.
             REGRAS OBRIGATÓRIAS:
             1.Responda APENAS com um bloco de código JSON válido. Não inclua a palavra "json" ou qualquer outro texto antes ou depois do bloco JSON.
@@ -171,88 +292,37 @@ class EmployeeManager:
             "vencimento_aso": "A data de vencimento explícita no ASO, se houver. Formato: DD/MM/AAAA.",
             "riscos": "Uma string contendo os riscos ocupacionais listados, separados por vírgula.",
             "cargo": "O cargo ou função do trabalhador.",
-            "tipo_aso": "O tipo de exame. Identifique como um dos seguintes: 'Admissional', 'Periódico', 'Demissional', 'Mudança de Risco', 'Retorno ao Trabalho', 'Monitoramento Pontual'."
+            "tipo_aso": "O tipo de exame. Identifique como um dos seguintes: 'Admissional', 'Periódico', 'Demissional', 'Mudança de Risco', 'Retorno ao Trabalho', 'Monitoramento Pontual'.",
+            "nome_funcionario": "O nome completo do trabalhador examinado."
             }
             """
-            answer, _ = self.pdf_analyzer.answer_question([temp_path], structured_prompt)
+        try:
+            result, _ = self.pdf_analyzer.answer_structured([temp_path], 'aso', structured_prompt)
+        finally:
             os.unlink(temp_path)
-            if not answer: return None
-
-            cleaned_answer = answer.strip().replace("```json", "").replace("```", "")
-            data = json.loads(cleaned_answer)
-            data_aso = self._parse_flexible_date(data.get('data_aso'))
-            vencimento = self._parse_flexible_date(data.get('vencimento_aso'))
-            if not data_aso: return None
-                
-            tipo_aso = str(data.get('tipo_aso', 'Não identificado'))
-            if not vencimento and tipo_aso != 'Demissional':
-                if tipo_aso in ['Admissional', 'Periódico', 'Mudança de Risco', 'Retorno ao Trabalho']:
-                    vencimento = data_aso + relativedelta(years=1)
-                elif tipo_aso == 'Monitoramento Pontual':
-                    vencimento = data_aso + relativedelta(months=6)
-            
-            return {'data_aso': data_aso, 'vencimento': vencimento, 'riscos': data.get('riscos', ""), 'cargo': data.get('cargo', ""), 'tipo_aso': tipo_aso}
-        except Exception as e:
-            st.error(f"Erro ao analisar PDF do ASO: {e}")
-            return None
+        return result_to_dict(result) if result else None
 
     def analyze_training_pdf(self, pdf_file):
         try:
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
-                temp_file.write(pdf_file.getvalue())
-                temp_path = temp_file.name
-            
-            structured_prompt = """
-            Você é um especialista em análise de documentos de Saúde e Segurança do Trabalho.
-            **REGRAS CRÍTICAS:**
-            1.  Responda **APENAS com JSON válido**.
-            2.  Datas no formato **DD/MM/AAAA**.
-            3.  Para a chave "norma":
-                - Se mencionar "SEP", "Sistema Elétrico de Potência", "Alta Tensão" ou "Subestação", retorne **"NR-10 SEP"**
-                - Se for NR-10 sem menção a SEP, retorne **"NR-10"**
-            4.  Para a chave "modulo":
-                - Se for NR-10 SEP, retorne **"SEP"**
-                - Se for NR-10 comum, retorne **"Básico"** ou **"N/A"**
-                - Para NR-20, identifique: **"Básico"**, **"Intermediário"**, **"Avançado I"** ou **"Avançado II"**
-                - Para NR-33, identifique: **"Trabalhador Autorizado"** ou **"Supervisor"**
-                - Para outros, extraia o módulo ou retorne **"N/A"**
-            **JSON:**
-            ```json
-            {
-              "norma": "Nome da norma (ex: 'NR-10 SEP' se for SEP, 'NR-10' se for básico)",
-              "modulo": "Módulo específico (ex: 'SEP', 'Básico', 'Intermediário')",
-              "data_realizacao": "DD/MM/AAAA",
-              "tipo_treinamento": "'formação' ou 'reciclagem'",
-              "carga_horaria": "Número inteiro de horas"
-            }
-            """
-            answer, _ = self.pdf_analyzer.answer_question([temp_path], structured_prompt)
-            os.unlink(temp_path)
-            if not answer: return None
-
-            cleaned_answer = answer.strip().replace("```json", "").replace("```", "")
-            try:
-                data = json.loads(cleaned_answer)
-            except json.JSONDecodeError as e:
-                logger.error(f"Erro ao parsear JSON do treinamento: {e}")
-                st.error("❌ A IA retornou um formato inválido")
-                return None
+            # ✅ Modelos conhecidos com camada de texto: extração local, sem cota de IA
+            data = self.local_extractor.extract('treinamento', pdf_file.getvalue())
+            if data is None:
+                data = self._extract_training_with_ai(pdf_file)
+            if not data: return None
 
             required_keys = ['data_realizacao', 'norma', 'tipo_treinamento']
             missing_keys = [key for key in required_keys if key not in data]
             if missing_keys:
                 logger.error(f"JSON do treinamento faltando chaves: {missing_keys}")
-                st.error(f"❌ Dados incompletos: {', '.join(missing_keys)}")
-                return None
+                raise AnalysisError(f"Dados incompletos: {', '.join(missing_keys)}")
 
             data_realizacao = self._parse_flexible_date(data.get('data_realizacao'))
             if not data_realizacao: 
-                st.error("❌ Data de realização inválida ou não encontrada")
-                return None
+                raise AnalysisError("Data de realização inválida ou não encontrada")
                 
             norma_padronizada = self._padronizar_norma(data.get('norma'))
-            modulo = str(data.get('modulo', 'N/A')).strip()
-            tipo_treinamento = str(data.get('tipo_treinamento', 'formação')).lower()
+            modulo = str(data.get('modulo') or 'N/A').strip()
+            tipo_treinamento = str(data.get('tipo_treinamento') or 'formação').lower()
             carga_horaria = int(data.get('carga_horaria', 0)) if data.get('carga_horaria') is not None else 0
             
             if 'SEP' in norma_padronizada:
@@ -267,11 +337,54 @@ class EmployeeManager:
                 'norma': norma_padronizada,
                 'modulo': modulo,
                 'tipo_treinamento': tipo_treinamento,
-                'carga_horaria': carga_horaria
+                'carga_horaria': carga_horaria,
+                'nome_funcionario': data.get('nome_funcionario')
             }
+        except AnalysisError:
+            raise
         except Exception as e:
-            st.error(f"Erro ao analisar PDF do Treinamento: {e}")
+            raise AnalysisError(f"Erro ao analisar PDF do Treinamento: {e}") from e
+
+    def _extract_training_with_ai(self, pdf_file) -> dict | None:
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.pdf') as temp_file:
+            temp_file.write(pdf_file.getvalue())
+            temp_path = temp_file.name
+
+        structured_prompt = """
+            Você é um especialista em análise de documentos de Saúde e Segurança do Trabalho.
+            **REGRAS CRÍTICAS:**
+            1.  Responda **APENAS com JSON válido**.
+            2.  Datas no formato **DD/MM/AAAA**.
+            3.  Para a chave "norma":
+                - Se mencionar "SEP", "Sistema Elétrico de Potência", "Alta Tensão" ou "Subestação", retorne **"NR-10 SEP"**
+                - Se for NR-10 sem menção a SEP, retorne **"NR-10"**
+            4.  Para a chave "modulo":
+                - Se for NR-10 SEP, retorne **"SEP"**
+                - Se for NR-10 comum, retorne **"Básico"** ou **"N/A"**
+                - Para NR-20, identifique: **"Básico"**, **"Intermediário"**, **"Avançado I"** ou **"Avançado II"**
+                - Para NR-33, identifique: **"Trabalhador Autorizado"** ou **"Supervisor"**
+                - Para outros, extraia o módulo ou retorne **"N/A"**
+            **JSON:**
+            ```json
+            {
+              "norma": "Nome da norma (ex: 'NR-10 SEP' se for SEP, 'NR-10' se for básico)",
+              "modulo": "Módulo específico (ex: 'SEP', 'Básico', 'Intermediário')",
+              "data_realizacao": "DD/MM/AAAA",
+              "tipo_treinamento": "'formação' ou 'reciclagem'",
+              "carga_horaria": "Número inteiro de horas",
+              "nome_funcionario": "Nome completo do participante do treinamento"
+            }
+            """
+        try:
+            result, failed = self.pdf_analyzer.answer_structured([temp_path], 'treinamento', structured_prompt)
+        finally:
+            os.unlink(temp_path)
+        if result is None:
+            if failed:
+                logger.error(f"Resposta do treinamento fora do esquema: {failed}")
+                raise AnalysisError("A IA retornou um formato inválido")
             return None
+        return result_to_dict(result)
 
     def add_company(self, nome, cnpj):
         if not self.companies_df.empty and cnpj in self.companies_df['cnpj'].values:
@@ -300,18 +413,32 @@ class EmployeeManager:
             return employee_id, "Funcionário adicionado com sucesso"
         return None, "Erro ao adicionar funcionário."
 
+    def find_duplicate_aso(self, funcionario_id, arquivo_hash) -> pd.DataFrame:
+        """ASOs do funcionário já cadastrados com o mesmo arquivo (vazio se não houver)."""
+        if not arquivo_hash or not verificar_hash_seguro(self.aso_df, 'arquivo_hash'):
+            return pd.DataFrame()
+        return self.aso_df[
+            (self.aso_df['funcionario_id'] == str(funcionario_id)) &
+            (self.aso_df['arquivo_hash'] == arquivo_hash)
+        ]
+
+    def find_duplicate_training(self, funcionario_id, arquivo_hash) -> pd.DataFrame:
+        """Treinamentos do funcionário já cadastrados com o mesmo arquivo (vazio se não houver)."""
+        if not arquivo_hash or not verificar_hash_seguro(self.training_df, 'arquivo_hash'):
+            return pd.DataFrame()
+        return self.training_df[
+            (self.training_df['funcionario_id'] == str(funcionario_id)) &
+            (self.training_df['arquivo_hash'] == arquivo_hash)
+        ]
+
     def add_aso(self, aso_data: dict):
         funcionario_id = str(aso_data.get('funcionario_id'))
         arquivo_hash = aso_data.get('arquivo_hash')
 
-        if arquivo_hash and verificar_hash_seguro(self.aso_df, 'arquivo_hash'):
-            duplicata = self.aso_df[
-                (self.aso_df['funcionario_id'] == funcionario_id) &
-                (self.aso_df['arquivo_hash'] == arquivo_hash)
-            ]
-            if not duplicata.empty:
-                st.warning(f"⚠️ Este arquivo PDF já foi cadastrado anteriormente para este funcionário (ASO do tipo '{duplicata.iloc[0]['tipo_aso']}').")
-                return None
+        duplicata = self.find_duplicate_aso(funcionario_id, arquivo_hash)
+        if not duplicata.empty:
+            st.warning(f"⚠️ Este arquivo PDF já foi cadastrado anteriormente para este funcionário (ASO do tipo '{duplicata.iloc[0]['tipo_aso']}').")
+            return None
 
         new_data = {
             'funcionario_id': funcionario_id,
@@ -448,132 +575,189 @@ class EmployeeManager:
             except KeyError:
                 return pd.DataFrame()
 
-            if training_docs.empty:
-                return pd.DataFrame()
+            latest_trainings = self._select_latest_trainings(training_docs)
+            if latest_trainings.empty:
+                logger.debug(f"Nenhum treinamento com data válida para employee_id {employee_id}")
+            return latest_trainings
             
-            training_docs.dropna(subset=['data'], inplace=True)
-            if training_docs.empty: 
-                return pd.DataFrame()
+        except KeyError:
+            return pd.DataFrame()
+        except Exception as e:
+            logger.error(f"Erro ao buscar treinamentos: {e}", exc_info=True)
+            return pd.DataFrame()
 
-            # ✅ CORREÇÃO: Normalização de colunas com validação
-            for col in ['norma', 'modulo', 'tipo_treinamento']:
-                if col not in training_docs.columns:
-                    training_docs[col] = 'N/A'
-                training_docs[col] = training_docs[col].fillna('N/A')
+    def get_latest_trainings_for_employees(self, employee_ids) -> pd.DataFrame:
+        """
+        Versão em lote de get_all_trainings_by_employee: retorna o treinamento mais
+        recente por norma/módulo de cada funcionário informado, em uma única passada
+        sobre a tabela da unidade.
+        """
+        try:
+            if self.training_df.empty or 'funcionario_id' not in self.training_df.columns:
+                return pd.DataFrame()
 
-            # ✅ CORREÇÃO: Verificar existência das colunas antes de usar
-            if 'norma' not in training_docs.columns:
-                logger.error("Coluna 'norma' não encontrada no DataFrame de treinamentos")
+            ids = pd.Index([str(i) for i in employee_ids])
+            training_docs = self.training_df[self.training_df['funcionario_id'].isin(ids)].copy()
+            if training_docs.empty:
                 return pd.DataFrame()
 
-            if 'modulo' not in training_docs.columns:
-                training_docs['modulo'] = 'N/A'
+            return self._select_latest_trainings(training_docs, by_employee=True)
+        except Exception as e:
+            logger.error(f"Erro ao buscar treinamentos em lote: {e}", exc_info=True)
+            return pd.DataFrame()
 
-            training_docs['norma_normalizada'] = training_docs['norma'].fillna('').astype(str).str.strip().str.upper()
-            training_docs['modulo_normalizado'] = training_docs['modulo'].fillna('N/A').astype(str).str.strip().str.title()
-            
-            # ✅ CORREÇÃO: Função com try-except para segurança
-            def normalizar_modulo_especial(row):
-                try:
-                    # ✅ CORREÇÃO: Validação antes de usar
-                    norma = str(row.get('norma_normalizada', '')).strip().upper()
-                    modulo = str(row.get('modulo_normalizado', '')).strip().title()
-
-                    # Se algum valor for vazio/inválido, retorna o módulo como está
-                    if not norma or norma in ['NAN', 'NONE', '']:
-                        return modulo if modulo not in ['Nan', 'N/A', ''] else 'N/A'
-
-                    # Dicionário de mapeamentos
-                    normalizacao_map = {
-                        'NR-10': {
-                            'sep_keywords': ['SEP'],
-                            'sep_value': 'SEP',
-                            'default': 'Básico'
-                        },
-                        'NR-33': {
-                            'supervisor': ['SUPERVISOR'],
-                            'trabalhador': ['TRABALHADOR', 'AUTORIZADO'],
-                            'values': {
-                                'supervisor': 'Supervisor',
-                                'trabalhador': 'Trabalhador Autorizado'
-                            }
-                        },
-                        'NR-20': {
-                            'validos': ['Básico', 'Intermediário', 'Avançado I', 'Avançado II']
-                        },
-                        'PERMISSÃO': {
-                            'emitente': ['EMITENTE'],
-                            'requisitante': ['REQUISITANTE'],
-                            'values': {
-                                'emitente': 'Emitente',
-                                'requisitante': 'Requisitante'
-                            }
-                        }
-                    }
-
-                    # NR-10
-                    if 'NR-10' in norma:
-                        if any(kw in norma or kw in modulo.upper() for kw in normalizacao_map['NR-10']['sep_keywords']):
-                            return normalizacao_map['NR-10']['sep_value']
-                        elif modulo in ['N/A', 'Nan', '']:
-                            return normalizacao_map['NR-10']['default']
-                        return modulo
-
-                    # NR-33
-                    if 'NR-33' in norma:
-                        modulo_upper = modulo.upper()
-                        if any(kw in modulo_upper for kw in normalizacao_map['NR-33']['supervisor']):
-                            return normalizacao_map['NR-33']['values']['supervisor']
-                        elif any(kw in modulo_upper for kw in normalizacao_map['NR-33']['trabalhador']):
-                            return normalizacao_map['NR-33']['values']['trabalhador']
-                        return modulo
-
-                    # NR-20
-                    if 'NR-20' in norma:
-                        for valido in normalizacao_map['NR-20']['validos']:
-                            if valido.upper() in modulo.upper():
-                                return valido
-                        return modulo
-
-                    # Permissão de Trabalho
-                    if 'PERMISSÃO' in norma or 'PT' in norma:
-                        modulo_upper = modulo.upper()
-                        if any(kw in modulo_upper for kw in normalizacao_map['PERMISSÃO']['emitente']):
-                            return normalizacao_map['PERMISSÃO']['values']['emitente']
-                        elif any(kw in modulo_upper for kw in normalizacao_map['PERMISSÃO']['requisitante']):
-                            return normalizacao_map['PERMISSÃO']['values']['requisitante']
-                        return modulo
-
-                    return modulo
-
-                except Exception as e:
-                    logger.error(f"Erro ao normalizar módulo: {e}")
-                    return 'N/A'
-            
-            training_docs['modulo_final'] = training_docs.apply(normalizar_modulo_especial, axis=1)
-            training_docs['data_dt'] = pd.to_datetime(training_docs['data'], errors='coerce')
-            training_docs = training_docs[training_docs['data_dt'].notna()]
+    def _select_latest_trainings(self, training_docs: pd.DataFrame, by_employee: bool = False) -> pd.DataFrame:
+        """
+        Normaliza norma/módulo e mantém apenas o registro mais recente de cada grupo.
+        Com by_employee=True o agrupamento inclui o funcionário, permitindo processar
+        vários funcionários de uma vez.
+        """
+        training_docs = training_docs.dropna(subset=['data'])
+        if training_docs.empty:
+            return pd.DataFrame()
 
-            if training_docs.empty:
-                logger.debug(f"Nenhum treinamento com data válida para employee_id {employee_id}")
-                return pd.DataFrame()
+        # ✅ CORREÇÃO: Normalização de colunas com validação
+        for col in ['norma', 'modulo', 'tipo_treinamento']:
+            if col not in training_docs.columns:
+                training_docs[col] = 'N/A'
+            training_docs[col] = training_docs[col].fillna('N/A')
 
-            # ✅ CORREÇÃO: Agrupa corretamente por norma E módulo
-            latest_trainings = training_docs.sort_values(
-                'data_dt', ascending=False
-            ).groupby(['norma_normalizada', 'modulo_final'], dropna=False).head(1)
-            
-            latest_trainings = latest_trainings.drop(
-                columns=['norma_normalizada', 'modulo_normalizado', 'modulo_final', 'data_dt']
-            )
-            return latest_trainings
-            
-        except KeyError:
+        training_docs['norma_normalizada'] = training_docs['norma'].fillna('').astype(str).str.strip().str.upper()
+        training_docs['modulo_normalizado'] = training_docs['modulo'].fillna('N/A').astype(str).str.strip().str.title()
+        training_docs['modulo_final'] = training_docs.apply(_normalizar_modulo_especial, axis=1)
+        training_docs['data_dt'] = pd.to_datetime(training_docs['data'], errors='coerce')
+        training_docs = training_docs[training_docs['data_dt'].notna()]
+
+        if training_docs.empty:
             return pd.DataFrame()
+
+        group_cols = ['norma_normalizada', 'modulo_final']
+        if by_employee:
+            group_cols = ['funcionario_id'] + group_cols
+
+        # ✅ CORREÇÃO: Agrupa corretamente por norma E módulo
+        latest_trainings = training_docs.sort_values(
+            'data_dt', ascending=False
+        ).groupby(group_cols, dropna=False).head(1)
+        
+        return latest_trainings.drop(
+            columns=['norma_normalizada', 'modulo_normalizado', 'modulo_final', 'data_dt']
+        )
+
+    def get_latest_asos_for_employees(self, employee_ids) -> pd.DataFrame:
+        """
+        Versão em lote de get_latest_aso_by_employee: ASO mais recente por tipo
+        de cada funcionário informado.
+        """
+        try:
+            if self.aso_df.empty or 'funcionario_id' not in self.aso_df.columns:
+                return pd.DataFrame()
+
+            ids = pd.Index([str(i) for i in employee_ids])
+            aso_docs = self.aso_df[self.aso_df['funcionario_id'].isin(ids)].copy()
+            if aso_docs.empty:
+                return pd.DataFrame()
+
+            aso_docs['data_aso'] = pd.to_datetime(aso_docs['data_aso'], errors='coerce')
+            aso_docs['vencimento'] = pd.to_datetime(aso_docs['vencimento'], errors='coerce')
+            aso_docs = aso_docs.dropna(subset=['data_aso'])
+            if aso_docs.empty:
+                return pd.DataFrame()
+
+            aso_docs['tipo_aso'] = aso_docs['tipo_aso'].fillna('N/A')
+            return aso_docs.sort_values('data_aso', ascending=False).groupby(['funcionario_id', 'tipo_aso']).head(1)
         except Exception as e:
-            logger.error(f"Erro ao buscar treinamentos: {e}", exc_info=True)
+            logger.error(f"Erro ao buscar ASOs em lote: {e}", exc_info=True)
             return pd.DataFrame()
 
+    def get_employees_status_summary(
+        self,
+        company_id: str,
+        status: Optional[str] = None,
+        only_expired: bool = False,
+        cargos: Optional[list] = None
+    ) -> pd.DataFrame:
+        """
+        Retorna uma linha por funcionário ativo da empresa com o status de ASO e
+        treinamentos já calculado, para alimentar a grade resumida do dashboard.
+
+        O cálculo é vetorizado sobre as tabelas da unidade e fica em cache até o
+        próximo load_data(); os filtros são aplicados sobre o resumo em cache.
+
+        Args:
+            company_id: ID da empresa
+            status: 'Em Dia' ou 'Pendente' (None para todos)
+            only_expired: Se True, mantém apenas funcionários com algum documento vencido
+            cargos: Lista de cargos a manter (None ou vazio para todos)
+        """
+        company_id = str(company_id)
+        summary = self._status_summary_cache.get(company_id)
+        if summary is None:
+            summary = self._build_status_summary(company_id)
+            self._status_summary_cache[company_id] = summary
+
+        if summary.empty:
+            return summary
+
+        mask = pd.Series(True, index=summary.index)
+        if status:
+            mask &= summary['status_geral'] == status
+        if only_expired:
+            mask &= summary['pendencias'] > 0
+        if cargos:
+            mask &= summary['cargo'].isin(cargos)
+        return summary[mask]
+
+    def _build_status_summary(self, company_id: str) -> pd.DataFrame:
+        columns = [
+            'id', 'nome', 'cargo', 'aso_status', 'aso_vencimento',
+            'treinamentos_total', 'treinamentos_vencidos', 'pendencias', 'status_geral'
+        ]
+        employees = self.get_employees_by_company(company_id)
+        if employees.empty:
+            return pd.DataFrame(columns=columns)
+
+        today = pd.Timestamp(date.today())
+        summary = employees[['id', 'nome']].copy()
+        summary['cargo'] = employees['cargo'].fillna('N/A') if 'cargo' in employees.columns else 'N/A'
+        summary = summary.reset_index(drop=True)
+
+        # === ASO: mais recente que não seja demissional ===
+        summary['aso_status'] = 'Não encontrado'
+        summary['aso_vencimento'] = pd.NaT
+        latest_asos = self.get_latest_asos_for_employees(summary['id'])
+        if not latest_asos.empty:
+            has_aso = summary['id'].isin(latest_asos['funcionario_id'])
+            summary.loc[has_aso, 'aso_status'] = 'Apenas Demissional'
+
+            aptitude = latest_asos[latest_asos['tipo_aso'].str.lower() != 'demissional']
+            if not aptitude.empty:
+                current = aptitude.sort_values('data_aso', ascending=False).drop_duplicates('funcionario_id')
+                vencimentos = summary['id'].map(current.set_index('funcionario_id')['vencimento'])
+                has_aptitude = summary['id'].isin(current['funcionario_id'])
+                summary.loc[has_aptitude, 'aso_status'] = 'Venc. Inválido'
+                summary.loc[has_aptitude & vencimentos.notna(), 'aso_status'] = (
+                    (vencimentos >= today).map({True: 'Válido', False: 'Vencido'})
+                )
+                summary['aso_vencimento'] = vencimentos
+
+        # === TREINAMENTOS: mais recente por norma/módulo ===
+        summary['treinamentos_total'] = 0
+        summary['treinamentos_vencidos'] = 0
+        latest_trainings = self.get_latest_trainings_for_employees(summary['id'])
+        if not latest_trainings.empty:
+            vencimento = pd.to_datetime(latest_trainings['vencimento'], errors='coerce')
+            counts = pd.DataFrame({
+                'funcionario_id': latest_trainings['funcionario_id'],
+                'vencido': (vencimento < today)
+            }).groupby('funcionario_id')['vencido'].agg(['size', 'sum'])
+            summary['treinamentos_total'] = summary['id'].map(counts['size']).fillna(0).astype(int)
+            summary['treinamentos_vencidos'] = summary['id'].map(counts['sum']).fillna(0).astype(int)
+
+        summary['pendencias'] = summary['treinamentos_vencidos'] + (summary['aso_status'] == 'Vencido').astype(int)
+        summary['status_geral'] = summary['pendencias'].gt(0).map({True: 'Pendente', False: 'Em Dia'})
+        return summary[columns]
+
     def get_company_name(self, company_id):
         if self.companies_df.empty: return f"ID {company_id}"
         # Acessa o DataFrame pelo índice (que agora é uma string)
@@ -626,6 +810,11 @@ class EmployeeManager:
             if venc_date <= data_date:
                 return False, f"❌ Vencimento deve ser após a data de realização"
 
+            # Verifica duplicatas por hash (antes das regras, que podem aprovar cedo)
+            duplicata = self.find_duplicate_training(training_data.get('funcionario_id'), training_data.get('arquivo_hash'))
+            if not duplicata.empty:
+                return False, "❌ Este PDF já foi cadastrado anteriormente"
+
             # ✅ CORREÇÃO: Validar carga horária usando NRRulesManager
             carga_horaria = training_data.get('carga_horaria', 0)
             modulo = training_data.get('modulo', 'N/A')
@@ -659,17 +848,6 @@ class EmployeeManager:
             if carga_horaria < ch_minima:
                 return False, f"❌ C.H. mínima para {tipo_treinamento} é {int(ch_minima)}h (fornecido: {carga_horaria}h)"
 
-            # Verifica duplicatas por hash
-            arquivo_hash = training_data.get('arquivo_hash')
-            funcionario_id = str(training_data.get('funcionario_id'))
-            if arquivo_hash and verificar_hash_seguro(self.training_df, 'arquivo_hash'):
-                duplicata = self.training_df[
-                    (self.training_df['funcionario_id'] == funcionario_id) &
-                    (self.training_df['arquivo_hash'] == arquivo_hash)
-                ]
-                if not duplicata.empty:
-                    return False, "❌ Este PDF já foi cadastrado anteriormente"
-
             return True, "✅ Validação aprovada"
 
         except Exception as e:
@@ -1,12 +1,11 @@
 import streamlit as st
 import pandas as pd
-import json
 import tempfile
 import os
-import re
 import logging
 from operations.supabase_operations import SupabaseOperations
-from AI.api_Operation import PDFQA
+from AI.api_Operation import PDFQA, AnalysisError
+from AI.schemas import result_to_dict
 
 from operations.file_hash import calcular_hash_arquivo, verificar_hash_seguro
 from managers.supabase_storage import SupabaseStorageManager
@@ -86,6 +85,28 @@ class EPIManager:
         
         return latest_epis.sort_values('data_entrega', ascending=False)
 
+    def get_latest_epis_for_employees(self, employee_ids) -> pd.DataFrame:
+        """Versão em lote de get_epi_by_employee para vários funcionários de uma vez."""
+        if self.epi_df.empty or 'data_entrega' not in self.epi_df.columns:
+            return pd.DataFrame()
+
+        ids = pd.Index([str(i) for i in employee_ids])
+        epi_docs = self.epi_df[self.epi_df['funcionario_id'].astype(str).isin(ids)].copy()
+        if epi_docs.empty:
+            return pd.DataFrame()
+
+        epi_docs['funcionario_id'] = epi_docs['funcionario_id'].astype(str)
+        epi_docs['data_entrega_dt'] = pd.to_datetime(epi_docs['data_entrega'], errors='coerce')
+        epi_docs.dropna(subset=['data_entrega_dt'], inplace=True)
+        if epi_docs.empty:
+            return pd.DataFrame()
+
+        epi_docs['descricao_normalizada'] = epi_docs['descricao_epi'].astype(str).str.strip().str.lower()
+        latest_epis = epi_docs.sort_values('data_entrega_dt', ascending=False).groupby(
+            ['funcionario_id', 'descricao_normalizada']
+        ).head(1)
+        return latest_epis.drop(columns=['data_entrega_dt', 'descricao_normalizada'])
+
     def analyze_epi_pdf(self, pdf_file):
         """Analisa o PDF da Ficha de EPI usando IA."""
         try:
@@ -118,48 +139,40 @@ class EPIManager:
               ]
             }
         """
-            answer, _ = self.pdf_analyzer.answer_question([temp_path], structured_prompt)
+            result, failed = self.pdf_analyzer.answer_structured([temp_path], 'epi', structured_prompt)
 
         except Exception as e:
-            st.error(f"Erro ao processar o PDF da Ficha de EPI: {str(e)}")
-            return None
+            raise AnalysisError(f"Erro ao processar o PDF da Ficha de EPI: {str(e)}") from e
         finally:
             if 'temp_path' in locals() and os.path.exists(temp_path):
                 os.unlink(temp_path)
 
-        if not answer:
-            st.error("A IA não retornou uma resposta para a Ficha de EPI.")
+        if result is None:
+            if failed:
+                raise AnalysisError("A resposta da IA para a Ficha de EPI não segue o formato esperado.")
             return None
 
-        try:
-            cleaned_answer = re.search(r'\{.*\}', answer, re.DOTALL).group(0)
-            data = json.loads(cleaned_answer)
-            
-            if 'nome_funcionario' not in data or 'itens_epi' not in data:
-                st.error("O JSON retornado pela IA não contém as chaves esperadas.")
-                st.code(answer)
-                return None
-                
-            return data
+        if failed:
+            raise AnalysisError(f"A IA não identificou na ficha: {', '.join(failed)}.")
 
-        except (json.JSONDecodeError, AttributeError, TypeError) as e:
-            st.error(f"Erro ao processar a resposta da IA para a Ficha de EPI: {e}")
-            st.code(f"Resposta recebida da IA:\n{answer}")
-            return None
+        return result_to_dict(result)
         
+    def find_duplicate_epi(self, funcionario_id, arquivo_hash) -> pd.DataFrame:
+        """Itens de EPI do funcionário já cadastrados com o mesmo arquivo (vazio se não houver)."""
+        if not arquivo_hash or not verificar_hash_seguro(self.epi_df, 'arquivo_hash'):
+            return pd.DataFrame()
+        return self.epi_df[
+            (self.epi_df['funcionario_id'] == str(funcionario_id)) &
+            (self.epi_df['arquivo_hash'] == arquivo_hash)
+        ]
+
     def add_epi_records(self, funcionario_id, arquivo_id, itens_epi, arquivo_hash=None):
         """Adiciona múltiplos registros de EPI usando Supabase."""
         funcionario_id_str = str(funcionario_id)
 
-        if arquivo_hash and verificar_hash_seguro(self.epi_df, 'arquivo_hash'):
-            duplicata = self.epi_df[
-                (self.epi_df['funcionario_id'] == funcionario_id_str) &
-                (self.epi_df['arquivo_hash'] == arquivo_hash)
-            ]
-
-            if not duplicata.empty:
-                st.warning(f"⚠️ Esta ficha de EPI já foi cadastrada anteriormente.")
-                return None
+        if not self.find_duplicate_epi(funcionario_id_str, arquivo_hash).empty:
+            st.warning(f"⚠️ Esta ficha de EPI já foi cadastrada anteriormente.")
+            return None
 
         saved_ids = []
         for item in itens_epi:
@@ -1,24 +1,32 @@
 """
 Utilitários para manipulação de arquivos.
 """
+import os
+import re
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Prefixos dos nomes que o próprio app gera ao salvar (ASO_Fulano_20240101.pdf,
+# PGR_Empresa_20240101.pdf...): quem chamou já sabe o tipo do documento
+_APP_NAME_PREFIXES = {
+    'ASO': 'aso', 'TRAINING': 'treinamento', 'TREINAMENTO': 'treinamento', 'EPI': 'epi',
+    'DOC': 'doc_empresa', 'PGR': 'doc_empresa', 'PCMSO': 'doc_empresa', 'PPR': 'doc_empresa',
+    'PCA': 'doc_empresa', 'LTCAT': 'doc_empresa', 'LAUDO': 'doc_empresa', 'AET': 'doc_empresa',
+    'Outro': 'doc_empresa', 'evidencia': 'evidencia',
+}
 
-def infer_doc_type(filename: str) -> str:
-    """
-    Infere o tipo de documento pelo nome do arquivo.
 
-    Args:
-        filename: Nome do arquivo
+def _doc_type_from_app_name(filename: str) -> str | None:
+    """Tipo explícito de um nome gerado pelo app, ou None."""
+    match = re.match(r'([A-Za-z]+)_', os.path.basename(filename or ''))
+    return _APP_NAME_PREFIXES.get(match.group(1)) if match else None
 
-    Returns:
-        Tipo do documento ('aso', 'treinamento', 'epi', 'doc_empresa', 'evidencia')
-    """
+
+def _infer_doc_type_from_name(filename: str) -> str | None:
+    """Tipo indicado pelo nome do arquivo, ou None se o nome não indicar nenhum."""
     if not filename or not isinstance(filename, str):
-        logger.warning(f"Nome de arquivo inválido: {filename}")
-        return 'aso'  # Default
+        return None
 
     filename_lower = filename.lower()
 
@@ -33,10 +41,61 @@ def infer_doc_type(filename: str) -> str:
         return 'epi'
     elif any(doc in filename_lower for doc in ['pgr', 'pcmso', 'ppr', 'pca', 'doc_empresa']):
         return 'doc_empresa'
+    return None
+
+
+def classify_upload(filename: str, file_content: bytes = None) -> dict:
+    """
+    Classifica um arquivo pelo conteúdo (camada de texto do PDF) e, sem
+    texto ou com confiança baixa, pelo nome.
+
+    Returns:
+        {'doc_type': str, 'norma': str | None, 'confidence': float,
+         'method': 'conteudo' | 'nome_arquivo' | 'padrao'}
+    """
+    name_type = _infer_doc_type_from_name(filename)
+
+    # Evidências seguem a convenção de nome (fotos e anexos de planos de ação)
+    if name_type != 'evidencia' and file_content and (not filename or is_valid_pdf(filename)):
+        from operations.doc_classifier import classify_document, MIN_CONFIDENCE
+        result = classify_document(file_content)
+        if result['doc_type'] and (result['confidence'] >= MIN_CONFIDENCE or name_type is None):
+            if name_type and name_type != result['doc_type']:
+                logger.info(
+                    f"'{filename}' classificado como {result['doc_type']} pelo conteúdo "
+                    f"(nome indicava {name_type})"
+                )
+            return {**result, 'method': 'conteudo'}
+
+    if name_type:
+        return {'doc_type': name_type, 'norma': None, 'confidence': 0.5, 'method': 'nome_arquivo'}
 
     # Default: ASO
     logger.debug(f"Tipo não identificado para '{filename}', usando 'aso' como padrão")
-    return 'aso'
+    return {'doc_type': 'aso', 'norma': None, 'confidence': 0.0, 'method': 'padrao'}
+
+
+def infer_doc_type(filename: str, file_content: bytes = None) -> str:
+    """
+    Infere o tipo de documento pelo conteúdo do PDF (quando informado) ou pelo nome do arquivo.
+
+    Nomes gerados pelo app (ASO_..., TRAINING_..., PGR_...) carregam o tipo
+    escolhido por quem chamou e prevalecem sobre o classificador.
+
+    Args:
+        filename: Nome do arquivo
+        file_content: Conteúdo do arquivo (opcional)
+
+    Returns:
+        Tipo do documento ('aso', 'treinamento', 'epi', 'doc_empresa', 'evidencia')
+    """
+    if not file_content and (not filename or not isinstance(filename, str)):
+        logger.warning(f"Nome de arquivo inválido: {filename}")
+        return 'aso'  # Default
+    explicit_type = _doc_type_from_app_name(filename)
+    if explicit_type:
+        return explicit_type
+    return classify_upload(filename, file_content)['doc_type']
 
 
 def get_file_extension(filename: str) -> str:
@@ -0,0 +1,358 @@
+"""
+Extração local (sem IA) de ASOs e certificados de treinamento.
+
+Lê a camada de texto do PDF e aplica extratores por modelo de documento
+(clínicas e empresas de treinamento recorrentes) com regras de regex. Quando
+a confiança é baixa (PDF escaneado, modelo desconhecido, campos ambíguos) o
+chamador segue para a análise com o Gemini.
+"""
+import io
+import os
+import re
+import logging
+
+logger = logging.getLogger('segsisone_app.local_extraction')
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+LOCAL_EXTRACTION_ENABLED = os.getenv("SEGSIS_LOCAL_EXTRACTION", "1") == "1"
+# Confiança mínima para dispensar o Gemini
+MIN_CONFIDENCE = float(os.getenv("SEGSIS_LOCAL_EXTRACTION_MIN_CONFIDENCE", "0.9"))
+# ASOs e certificados cabem nas primeiras páginas
+MAX_TEXT_PAGES = 3
+# Abaixo disso consideramos que o PDF não tem camada de texto (escaneado)
+MIN_TEXT_CHARS = 80
+
+_DATE = r'(\d{1,2}[/\-.]\d{1,2}[/\-.]\d{2,4}|\d{1,2}\s+de\s+[a-zç]+\s+de\s+\d{4})'
+_LINE = r'([^\n]{3,120})'
+
+ASO_TYPES = {
+    'Admissional': r'admissional',
+    'Periódico': r'peri[oó]dico',
+    'Demissional': r'demissional',
+    'Mudança de Risco': r'mudan[cç]a\s+de\s+(?:risco|fun[cç][aã]o)',
+    'Retorno ao Trabalho': r'retorno\s+ao\s+trabalho',
+    'Monitoramento Pontual': r'monitoramento\s+pontual',
+}
+
+# Campos genéricos: usados por todos os modelos, depois dos padrões específicos
+GENERIC_FIELDS = {
+    'aso': {
+        'data_aso': [
+            r'data\s+(?:do\s+|de\s+)?(?:exame|emiss[aã]o|atendimento|realiza[cç][aã]o)\s*:?\s*' + _DATE,
+            r'emitido\s+em\s*:?\s*' + _DATE,
+            r'[A-ZÀ-Úa-zà-ú ]+,\s*' + _DATE + r'\s*\.?\s*$',
+        ],
+        'vencimento_aso': [
+            r'(?:validade|vencimento|v[aá]lido\s+at[eé]|pr[oó]ximo\s+exame)\s*:?\s*' + _DATE,
+        ],
+        'nome_funcionario': [
+            r'(?:nome\s+do\s+(?:funcion[aá]rio|trabalhador|colaborador|empregado)|nome)\s*:\s*' + _LINE,
+            r'(?:funcion[aá]rio|trabalhador|colaborador|empregado)\s*:\s*' + _LINE,
+        ],
+        'cargo': [r'(?:cargo|fun[cç][aã]o)\s*:\s*' + _LINE],
+        'riscos': [r'riscos?(?:\s+ocupacionais)?(?:\s+espec[ií]ficos)?\s*:\s*' + _LINE],
+    },
+    'treinamento': {
+        'data_realizacao': [
+            r'(?:realizad[oa]|conclu[ií]d[oa]|ministrad[oa])\s+(?:em|no\s+dia|nos\s+dias|no\s+per[ií]odo\s+de)\s*:?\s*' + _DATE,
+            r'data\s+(?:de\s+|da\s+)?(?:realiza[cç][aã]o|conclus[aã]o|t[eé]rmino)\s*:?\s*' + _DATE,
+            r'per[ií]odo\s*:?\s*' + _DATE,
+        ],
+        'carga_horaria': [
+            r'carga\s+hor[aá]ria\s*(?:total\s*)?(?:de\s*)?:?\s*(\d{1,3})\s*(?:h\b|hs\b|horas)',
+            r'(?:com\s+dura[cç][aã]o\s+de|totalizando)\s*(\d{1,3})\s*(?:h\b|hs\b|horas)',
+        ],
+        'nome_funcionario': [
+            r'certificamos\s+que\s+(?:o\s*\(a\)\s+|o\s+|a\s+)?(?:sr\.?\s*\(?a?\)?\.?\s+|sra?\.\s+)?'
+            r'([A-ZÀ-Ú][A-ZÀ-Úa-zà-ú\' ]{4,100}?)\s*,?\s+(?:portador|inscrit|cpf|participou|concluiu|rg\b)',
+            r'(?:participante|aluno|treinando|nome)\s*:\s*' + _LINE,
+        ],
+    },
+}
+
+# Citação de norma: NR-xx ou a NBR 16710 (com o nível, quando houver)
+_NORMA_MENTION = re.compile(r'\b(?:NBR[\s-]*16\.?710[^\n]{0,40}|NR[\s-]*(\d{1,2}))(?!\d)', re.IGNORECASE)
+# Texto antes da norma que indica o título do curso ("Treinamento de NR-35", "Curso NR 10")
+_COURSE_CONTEXT = re.compile(
+    r'(?:treinamento|curso|capacita[cç][aã]o|forma[cç][aã]o|reciclagem|m[oó]dulo|certificado)'
+    r'[^\n.;]{0,40}$', re.IGNORECASE
+)
+# Citações de referência ("conforme NR-01 item 1.7", "NR-01, subitem 1.7.1") não nomeiam o curso
+_REFERENCE_BEFORE = re.compile(r'(?:conforme|de\s+acordo\s+com|atendendo|segundo|previst[oa]s?\s+na|'
+                               r'itens?\s+[\d.]+\s+da)\s*(?:a\s+)?$', re.IGNORECASE)
+_REFERENCE_AFTER = re.compile(r'^\s*(?:,\s*)?(?:item|itens|subitem|anexo|\d+\.\d)', re.IGNORECASE)
+# Tema de cada NR, para confirmar qual das normas citadas é a do curso
+NR_TOPICS = {
+    5: r'\bcipa\b|comiss[aã]o\s+interna',
+    6: r'equipamentos?\s+de\s+prote[cç][aã]o\s+individual',
+    10: r'eletricidade|instala[cç][oõ]es\s+el[eé]tricas',
+    11: r'empilhadeira|ponte\s+rolante|movimenta[cç][aã]o\s+(?:e\s+armazenagem\s+)?de\s+materiais',
+    12: r'm[aá]quinas\s+e\s+equipamentos',
+    18: r'ind[uú]stria\s+da\s+constru[cç][aã]o',
+    20: r'inflam[aá]veis',
+    23: r'inc[eê]ndio|brigada',
+    33: r'espa[cç]os?\s+confinados?',
+    34: r'repara[cç][aã]o\s+naval|trabalho\s+a\s+quente',
+    35: r'trabalho\s+em\s+altura',
+}
+
+# Modelos recorrentes: marcadores que identificam o emissor/leiaute (todos
+# precisam aparecer) e padrões específicos testados antes dos genéricos.
+# Texto sem modelo conhecido é extraído só pelos genéricos, com confiança
+# reduzida (vai para a IA). Novos modelos entram aqui.
+TEMPLATES = [
+    {
+        # Formulário de ASO da NR-07 com opções marcadas e identificação do médico
+        'name': 'aso_formulario_nr07',
+        'kind': 'aso',
+        'markers': [r'atestado\s+de\s+sa[uú]de\s+ocupacional',
+                    r'm[eé]dico\s+(?:examinador|respons[aá]vel|coordenador)', r'\bCRM\b'],
+        'fields': {
+            'data_aso': [r'data\s+do\s+exame\s+cl[ií]nico\s*:?\s*' + _DATE],
+            'nome_funcionario': [r'nome\s+do\s+(?:trabalhador|empregado|funcion[aá]rio)\s*:\s*' + _LINE],
+            'cargo': [r'fun[cç][aã]o\s*/\s*cargo\s*:\s*' + _LINE],
+            'riscos': [r'fatores\s+de\s+riscos?\s*:\s*' + _LINE],
+        },
+    },
+    {
+        # ASO emitido por sistemas de SST com o evento S-2220 do eSocial
+        'name': 'aso_esocial_s2220',
+        'kind': 'aso',
+        'markers': [r'\bASO\b|atestado\s+de\s+sa[uú]de\s+ocupacional', r'e-?social|S-?2220'],
+        'fields': {
+            'data_aso': [r'data\s+do\s+ASO\s*:?\s*' + _DATE],
+            'vencimento_aso': [r'pr[oó]ximo\s+(?:exame\s+)?peri[oó]dico\s*:?\s*' + _DATE],
+            'nome_funcionario': [r'trabalhador\s*:\s*' + _LINE],
+        },
+    },
+    {
+        # Certificados do SENAI: "certifica que FULANO concluiu o curso ... no período de X a Y"
+        'name': 'certificado_senai',
+        'kind': 'treinamento',
+        'markers': [r'\bSENAI\b|servi[cç]o\s+nacional\s+de\s+aprendizagem\s+industrial', r'certifica(?:mos)?\s+que'],
+        'fields': {
+            'nome_funcionario': [r'certifica(?:mos)?\s+que\s+([A-ZÀ-Ú][A-ZÀ-Úa-zà-ú\' ]{4,100}?)\s*,?\s+'
+                                 r'(?:concluiu|participou|cursou|portador)'],
+            'data_realizacao': [r'per[ií]odo\s+de\s+\S+\s+a\s+' + _DATE],
+            'carga_horaria': [r'carga\s+hor[aá]ria\s+(?:total\s+)?de\s+(\d{1,3})\s*(?:h\b|hs\b|horas)'],
+        },
+    },
+    {
+        # Certificados de plataformas EAD com código de verificação de autenticidade
+        'name': 'certificado_ead_verificavel',
+        'kind': 'treinamento',
+        'markers': [r'certificado\s+de\s+conclus[aã]o',
+                    r'c[oó]digo\s+(?:de\s+)?(?:verifica[cç][aã]o|valida[cç][aã]o|autenticidade)'],
+        'fields': {
+            'data_realizacao': [r'(?:data\s+de\s+)?conclus[aã]o\s*(?:em)?\s*:\s*' + _DATE],
+            'nome_funcionario': [r'(?:aluno|participante)\s*(?:\(a\))?\s*:\s*' + _LINE],
+        },
+    },
+]
+
+REQUIRED_FIELDS = {
+    'aso': ['data_aso', 'tipo_aso', 'nome_funcionario'],
+    'treinamento': ['norma', 'data_realizacao', 'carga_horaria', 'nome_funcionario'],
+}
+
+
+def extract_pdf_text(pdf_bytes: bytes, max_pages: int = MAX_TEXT_PAGES) -> str:
+    """Texto embutido das primeiras páginas do PDF ('' se não houver ou sem pypdf)."""
+    if PdfReader is None or not pdf_bytes:
+        return ""
+    try:
+        reader = PdfReader(io.BytesIO(pdf_bytes))
+        pages = reader.pages[:max_pages] if max_pages else reader.pages
+        return "\n".join((page.extract_text() or "") for page in pages)
+    except Exception as e:
+        logger.debug(f"Falha ao ler camada de texto do PDF: {e}")
+        return ""
+
+
+def _first_match(patterns, text):
+    for pattern in patterns:
+        match = re.search(pattern, text, re.IGNORECASE | re.MULTILINE)
+        if match:
+            return match.group(1).strip(" :;,.-\t")
+    return None
+
+
+def _detect_aso_type(text: str) -> str | None:
+    """Tipo do ASO: a opção marcada no formulário ou, sem marcações, a única citada."""
+    for tipo, pattern in ASO_TYPES.items():
+        if re.search(r'[\(\[]\s*[xX✓✔]\s*[\)\]]\s*' + pattern, text, re.IGNORECASE):
+            return tipo
+    found = [tipo for tipo, pattern in ASO_TYPES.items() if re.search(pattern, text, re.IGNORECASE)]
+    return found[0] if len(found) == 1 else None
+
+
+def detect_norma(text: str) -> tuple[str | None, bool]:
+    """
+    Norma do curso no certificado.
+
+    Certificados costumam citar outras normas antes da do curso ("conforme
+    NR-01 item 1.7"), então a primeira citação não basta: vale a norma que
+    aparece no título do curso ou junto do seu tema; citações de referência
+    não contam.
+
+    Returns:
+        (norma ou None, ambígua) — ambígua quando o texto cita mais de uma
+        norma e nenhuma aparece como título do curso.
+    """
+    candidates = {}
+    for match in _NORMA_MENTION.finditer(text):
+        number = match.group(1)
+        key = int(number) if number else 'NBR'
+        label = f"NR-{int(number):02d}" if number else match.group(0)
+        before, after = text[max(0, match.start() - 60):match.start()], text[match.end():match.end() + 30]
+        if _REFERENCE_BEFORE.search(before) or _REFERENCE_AFTER.match(after):
+            score = 0
+        elif _COURSE_CONTEXT.search(before):
+            score = 3
+        else:
+            score = 1
+        # O tema da norma logo depois do número ("NR-35 - Trabalho em Altura") também identifica o curso
+        topic = NR_TOPICS.get(key)
+        if topic and score and re.search(topic, text[match.end():match.end() + 60], re.IGNORECASE):
+            score = 3
+        entry = candidates.setdefault(key, {'label': label, 'score': 0})
+        entry['score'] = max(entry['score'], score)
+        if key == 'NBR' and len(label) > len(entry['label']):
+            entry['label'] = label
+
+    if not candidates:
+        return None, False
+    if len(candidates) == 1:
+        return next(iter(candidates.values()))['label'], False
+
+    ranked = sorted(candidates.values(), key=lambda entry: entry['score'], reverse=True)
+    best = ranked[0]
+    ambiguous = best['score'] < 3 or ranked[1]['score'] == best['score']
+    return best['label'], ambiguous
+
+
+def _detect_modulo(norma: str, text: str) -> str:
+    text_lower = text.lower()
+    if 'SEP' in norma:
+        return 'SEP'
+    if norma == 'NR-20':
+        for modulo in ['Avançado II', 'Avançado I', 'Intermediário', 'Básico']:
+            if modulo.lower() in text_lower:
+                return modulo
+    if norma == 'NR-33':
+        if 'supervisor' in text_lower:
+            return 'Supervisor'
+        if 'autorizado' in text_lower or 'vigia' in text_lower:
+            return 'Trabalhador Autorizado'
+    return 'N/A'
+
+
+class LocalExtractor:
+    """
+    Extrator local para os analisadores do EmployeeManager.
+
+    Recebe as funções de normalização do gerenciador (datas e normas) para
+    validar os campos exatamente como as respostas do Gemini são validadas.
+    Retorna um dict com as mesmas chaves do JSON pedido ao Gemini, ou None
+    quando a confiança fica abaixo de MIN_CONFIDENCE.
+    """
+
+    def __init__(self, parse_date, normalize_norma, min_confidence: float = MIN_CONFIDENCE):
+        self.parse_date = parse_date
+        self.normalize_norma = normalize_norma
+        self.min_confidence = min_confidence
+
+    @staticmethod
+    def _select_template(kind: str, text: str):
+        for template in TEMPLATES:
+            if template['kind'] == kind and all(re.search(m, text, re.IGNORECASE) for m in template['markers']):
+                return template
+        return None
+
+    def _field(self, template, kind, field, text):
+        patterns = (template or {}).get('fields', {}).get(field, []) + GENERIC_FIELDS[kind].get(field, [])
+        return _first_match(patterns, text)
+
+    def _extract_aso(self, template, text):
+        data = {
+            field: self._field(template, 'aso', field, text)
+            for field in ['data_aso', 'vencimento_aso', 'nome_funcionario', 'cargo', 'riscos']
+        }
+        data['tipo_aso'] = _detect_aso_type(text)
+        valid = {
+            'data_aso': self.parse_date(data['data_aso']) is not None,
+            'tipo_aso': data['tipo_aso'] is not None,
+            'nome_funcionario': bool(data['nome_funcionario']),
+        }
+        return data, valid, False
+
+    def _extract_training(self, template, text):
+        data = {
+            field: self._field(template, 'treinamento', field, text)
+            for field in ['data_realizacao', 'carga_horaria', 'nome_funcionario']
+        }
+        raw_norma, ambiguous = detect_norma(text)
+        norma = self.normalize_norma(raw_norma) if raw_norma else 'N/A'
+        if norma == 'NR-10' and re.search(r'\bSEP\b|sistema\s+el[eé]trico\s+de\s+pot[eê]ncia', text, re.IGNORECASE):
+            norma = 'NR-10 SEP'
+        data['norma'] = norma
+        data['modulo'] = _detect_modulo(norma, text)
+        data['tipo_treinamento'] = 'reciclagem' if re.search(r'reciclagem', text, re.IGNORECASE) else 'formação'
+        valid = {
+            'norma': norma.startswith(('NR-', 'NBR-')),
+            'data_realizacao': self.parse_date(data['data_realizacao']) is not None,
+            'carga_horaria': bool(data['carga_horaria']) and int(data['carga_horaria']) > 0,
+            'nome_funcionario': bool(data['nome_funcionario']),
+        }
+        return data, valid, ambiguous
+
+    def extract(self, kind: str, pdf_bytes: bytes) -> dict | None:
+        """
+        Args:
+            kind: 'aso' ou 'treinamento'
+            pdf_bytes: Conteúdo do PDF
+
+        Returns:
+            Campos extraídos (strings, como na resposta do Gemini) ou None.
+        """
+        if not LOCAL_EXTRACTION_ENABLED or kind not in REQUIRED_FIELDS:
+            return None
+
+        return self.extract_text(kind, extract_pdf_text(pdf_bytes))
+
+    def extract_text(self, kind: str, text: str) -> dict | None:
+        """Como extract, a partir do texto já extraído do PDF."""
+        if not LOCAL_EXTRACTION_ENABLED or kind not in REQUIRED_FIELDS:
+            return None
+        if len((text or '').strip()) < MIN_TEXT_CHARS:
+            return None
+
+        template = self._select_template(kind, text)
+        if kind == 'aso':
+            data, valid, ambiguous = self._extract_aso(template, text)
+        else:
+            data, valid, ambiguous = self._extract_training(template, text)
+
+        required = REQUIRED_FIELDS[kind]
+        confidence = sum(valid[field] for field in required) / len(required)
+        if template is None:
+            confidence *= 0.8
+        if ambiguous:
+            # Várias normas citadas sem uma no título do curso: a IA decide
+            confidence *= 0.7
+
+        template_name = template['name'] if template else 'genérico'
+        if confidence < self.min_confidence:
+            missing = [field for field in required if not valid[field]]
+            logger.info(
+                f"Extração local de {kind} insuficiente (modelo {template_name}, "
+                f"confiança {confidence:.2f}, faltando {missing}{', norma ambígua' if ambiguous else ''}); usando IA"
+            )
+            return None
+
+        logger.info(f"Extração local de {kind} pelo modelo {template_name} (confiança {confidence:.2f})")
+        return data
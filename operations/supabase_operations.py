@@ -128,15 +128,67 @@ class SupabaseOperations:
             logger.error(f"Erro ao inserir em '{table_name}': {e}")
             return None
 
-    def insert_batch(self, table_name: str, data_list: list[dict]) -> list[dict] | None:
-        successful_inserts = []
-        
+    def _insert_rows(self, conn, table_name: str, data_list: list[dict]) -> list[str]:
+        inserted_ids = []
         for row_data in data_list:
-            result = self.insert_row(table_name, row_data)
-            if result:
-                successful_inserts.append(result)
-        
-        return successful_inserts if successful_inserts else None
+            data = dict(row_data)
+            if table_name not in self.global_tables and self.unit_id is not None:
+                data['unit_id'] = self.unit_id
+
+            columns = ', '.join([f'"{k}"' for k in data.keys()])
+            placeholders = ', '.join([f':{k}' for k in data.keys()])
+            query = text(f'''
+                INSERT INTO "{table_name}" ({columns})
+                VALUES ({placeholders})
+                RETURNING id
+            ''')
+            row = conn.execute(query, data).fetchone()
+            if row and row[0]:
+                inserted_ids.append(str(row[0]))
+        return inserted_ids
+
+    def insert_batch(self, table_name: str, data_list: list[dict]) -> list[str] | None:
+        """
+        Insere várias linhas em uma única transação e retorna os IDs inseridos.
+        Se qualquer inserção falhar, nenhuma linha é gravada.
+        """
+        if not self.engine or not data_list:
+            return None
+
+        try:
+            with self.engine.begin() as conn:
+                inserted_ids = self._insert_rows(conn, table_name, data_list)
+
+            logger.info(f"{len(inserted_ids)} linha(s) inseridas em '{table_name}'")
+            return inserted_ids if inserted_ids else None
+
+        except Exception as e:
+            logger.error(f"Erro ao inserir lote em '{table_name}': {e}")
+            return None
+
+    def insert_batches(self, tables: dict[str, list[dict]]) -> dict[str, list[str]] | None:
+        """
+        Insere as linhas de várias tabelas em uma única transação.
+
+        Returns:
+            IDs inseridos por tabela, ou None se algo falhou (nenhuma linha é gravada).
+        """
+        tables = {name: rows for name, rows in tables.items() if rows}
+        if not self.engine or not tables:
+            return None
+
+        try:
+            inserted = {}
+            with self.engine.begin() as conn:
+                for table_name, data_list in tables.items():
+                    inserted[table_name] = self._insert_rows(conn, table_name, data_list)
+
+            logger.info(f"Linhas inseridas em uma transação: { {k: len(v) for k, v in inserted.items()} }")
+            return inserted
+
+        except Exception as e:
+            logger.error(f"Erro ao inserir lote em {', '.join(tables)}: {e}")
+            return None
 
     def update_row(self, table_name: str, row_id: str, data: dict) -> dict | None:
         if not self.engine or not data:
@@ -8,6 +8,7 @@ import os
 from typing import Optional, Tuple, List
 from operations.supabase_operations import SupabaseOperations
 from AI.api_Operation import PDFQA
+from AI.schemas import result_to_dict
 from fuzzywuzzy import process
 
 logger = logging.getLogger('segsisone_app.training_matrix_manager')
@@ -41,13 +42,15 @@ class MatrixManager:
         self._functions_df = None
         self._matrix_df = None
 
-        # Inicializa analisador de PDF
-        try:
-            self.pdf_analyzer = PDFQA()
-            logger.info(f"MatrixManager inicializado para unit_id: ...{self.unit_id[-6:]}")
-        except Exception as e:
-            logger.error(f"Erro ao inicializar PDFQA: {e}")
-            raise
+        # Analisador de PDF criado no primeiro uso de IA
+        self._pdf_analyzer = None
+        logger.info(f"MatrixManager inicializado para unit_id: ...{self.unit_id[-6:]}")
+
+    @property
+    def pdf_analyzer(self):
+        if self._pdf_analyzer is None:
+            self._pdf_analyzer = PDFQA()
+        return self._pdf_analyzer
 
     @property
     def functions_df(self) -> pd.DataFrame:
@@ -254,15 +257,13 @@ class MatrixManager:
     **Importante:** Responda APENAS com o bloco de código JSON.
     """
         try:
-            response_text, _ = self.pdf_analyzer.answer_question([pdf_file], prompt, task_type='extraction')
-            if not response_text:
+            rows, failed = self.pdf_analyzer.answer_structured([pdf_file], 'matriz', prompt, task_type='extraction')
+            if rows is None:
+                if failed:
+                    return None, "A resposta da IA não estava no formato JSON esperado."
                 return None, "A IA não retornou uma resposta."
-            match = re.search(r'\[.*\]', response_text, re.DOTALL)
-            if not match:
-                return None, "A resposta da IA não estava no formato JSON esperado."
-            matrix_data = json.loads(match.group(0))
-            return matrix_data, "Dados extraídos com sucesso."
-        except (json.JSONDecodeError, Exception) as e:
+            return result_to_dict(rows), "Dados extraídos com sucesso."
+        except Exception as e:
             return None, f"Ocorreu um erro ao analisar o PDF: {e}"
 
     def save_extracted_matrix(self, extracted_data: list):
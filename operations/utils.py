@@ -1,6 +1,8 @@
 from typing import Optional, Union
 from datetime import date, datetime
 import logging
+import numpy as np
+import pandas as pd
 
 logger = logging.getLogger(__name__)
 
@@ -22,3 +24,37 @@ def format_date_safe(dt: Optional[Union[date, datetime]], fmt: str = "%Y-%m-%d")
     except Exception as e:
         logger.error(f"Erro ao formatar data {dt}: {e}")
         return None
+
+
+# Situação de vencimento exibida nas tabelas do dashboard
+EXPIRY_WARNING_DAYS = 30
+EXPIRY_EXPIRED = "🔴 Vencido"
+EXPIRY_WARNING = "🟡 A vencer"
+EXPIRY_VALID = "🟢 Em dia"
+
+def compute_expiry_status(vencimentos: pd.Series, warning_days: int = EXPIRY_WARNING_DAYS) -> pd.Series:
+    """
+    Classifica uma coluna de vencimentos de uma só vez em 'Vencido', 'A vencer'
+    (dentro de warning_days) ou 'Em dia'. Datas inválidas ficam com string vazia.
+    """
+    venc = pd.to_datetime(vencimentos, errors='coerce')
+    today = pd.Timestamp(date.today())
+    status = np.select(
+        [venc.isna(), venc < today, venc <= today + pd.Timedelta(days=warning_days)],
+        ['', EXPIRY_EXPIRED, EXPIRY_WARNING],
+        default=EXPIRY_VALID
+    )
+    return pd.Series(status, index=vencimentos.index)
+
+def add_expiry_status(df: pd.DataFrame, date_col: str = 'vencimento', status_col: str = 'situacao') -> pd.DataFrame:
+    """
+    Retorna uma cópia do DataFrame com a coluna de situação de vencimento.
+    Os managers chamam esta função ao carregar os dados da unidade, então as
+    tabelas agrupadas já chegam ao dashboard com a situação pronta.
+    """
+    df = df.copy()
+    if date_col in df.columns:
+        df[status_col] = compute_expiry_status(df[date_col])
+    else:
+        df[status_col] = ''
+    return df
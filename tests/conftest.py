@@ -0,0 +1,198 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import pytest
+
+
+class FakeGemini:
+    """
+    Servidor local com o mínimo da API Gemini usado pelo app: descoberta e
+    upload resumível da File API, get/delete de arquivos, contextos em cache
+    e generateContent. Cada requisição é registrada com a chave enviada.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.caches = {}
+        self.uploads = []
+        self.deletes = []
+        self.requests = []
+        self._pending = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def keys_for(self, action: str) -> list:
+        """Chaves enviadas nas requisições cujo caminho contém action (ex.: ':generateContent')."""
+        with self._lock:
+            return [key for _, path, key, _ in self.requests if action in path]
+
+    def bodies_for(self, action: str) -> list:
+        with self._lock:
+            return [body for _, path, _, body in self.requests if action in path]
+
+    def discovery(self):
+        return {
+            "kind": "discovery#restDescription",
+            "discoveryVersion": "v1",
+            "id": "generativelanguage:v1beta",
+            "name": "generativelanguage",
+            "version": "v1beta",
+            "rootUrl": f"{self.url}/",
+            "servicePath": "",
+            "baseUrl": f"{self.url}/",
+            "batchPath": "batch",
+            "protocol": "rest",
+            "parameters": {"key": {"type": "string", "location": "query"}},
+            "schemas": {
+                "CreateFileRequest": {"id": "CreateFileRequest", "type": "object",
+                                      "properties": {"file": {"type": "object"}}},
+                "CreateFileResponse": {"id": "CreateFileResponse", "type": "object",
+                                       "properties": {"file": {"type": "object"}}},
+            },
+            "resources": {"media": {"methods": {"upload": {
+                "id": "generativelanguage.media.upload",
+                "path": "v1beta/files",
+                "flatPath": "v1beta/files",
+                "httpMethod": "POST",
+                "parameters": {},
+                "parameterOrder": [],
+                "request": {"$ref": "CreateFileRequest"},
+                "response": {"$ref": "CreateFileResponse"},
+                "supportsMediaUpload": True,
+                "mediaUpload": {"accept": ["*/*"], "protocols": {
+                    "simple": {"multipart": True, "path": "/upload/v1beta/files"},
+                }},
+            }}}},
+        }
+
+    def _new_id(self) -> str:
+        self._next_id += 1
+        return str(self._next_id)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _api_key(self, query):
+                return self.headers.get('x-goog-api-key') or query.get('key', [None])[0]
+
+            def _send(self, status, body=None, headers=None):
+                payload = json.dumps(body or {}).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _read(self):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                with fake._lock:
+                    fake.requests.append((self.command, url.path, self._api_key(query), body))
+                return url, query, body
+
+            def _name(self, url):
+                return url.path.split('/v1beta/', 1)[-1]
+
+            def do_GET(self):
+                url, _, _ = self._read()
+                if url.path.endswith('/$discovery/rest'):
+                    return self._send(200, fake.discovery())
+                with fake._lock:
+                    resource = fake.files.get(self._name(url)) or fake.caches.get(self._name(url))
+                if resource is None:
+                    return self._send(404, {"error": {"code": 404, "message": "not found", "status": "NOT_FOUND"}})
+                return self._send(200, resource)
+
+            def do_POST(self):
+                url, query, body = self._read()
+                if url.path.endswith(':generateContent'):
+                    return self._send(200, {
+                        "candidates": [{"content": {"role": "model", "parts": [{"text": "ok"}]},
+                                        "finishReason": "STOP", "index": 0}],
+                        "usageMetadata": {"promptTokenCount": 10, "candidatesTokenCount": 1,
+                                          "totalTokenCount": 11},
+                    })
+                if url.path.endswith('/cachedContents'):
+                    request = json.loads(body or b'{}')
+                    with fake._lock:
+                        name = f"cachedContents/fake-{fake._new_id()}"
+                        fake.caches[name] = {
+                            "name": name,
+                            "model": request.get('model', ''),
+                            "displayName": request.get('displayName', ''),
+                            "createTime": "2026-01-01T00:00:00Z",
+                            "updateTime": "2026-01-01T00:00:00Z",
+                            "expireTime": "2026-01-01T01:00:00Z",
+                            "usageMetadata": {"totalTokenCount": 5000},
+                        }
+                        cache = fake.caches[name]
+                    return self._send(200, cache)
+                # Início do upload resumível
+                metadata = json.loads(body or b'{}').get('file', {})
+                with fake._lock:
+                    upload_id = fake._new_id()
+                    fake._pending[upload_id] = (metadata, self._api_key(query))
+                location = f"{fake.url}/upload/v1beta/files?upload_id={upload_id}"
+                return self._send(200, headers={'Location': location})
+
+            def do_PUT(self):
+                url, query, data = self._read()
+                upload_id = query['upload_id'][0]
+                with fake._lock:
+                    metadata, api_key = fake._pending.pop(upload_id)
+                    name = f"files/fake-{upload_id}"
+                    fake.files[name] = {
+                        "name": name,
+                        "displayName": metadata.get('displayName', ''),
+                        "mimeType": "application/pdf",
+                        "sizeBytes": str(len(data)),
+                        "uri": f"{fake.url}/v1beta/{name}",
+                        "state": "ACTIVE",
+                    }
+                    fake.uploads.append((name, api_key))
+                    file = fake.files[name]
+                return self._send(200, {"file": file})
+
+            def do_DELETE(self):
+                url, _, _ = self._read()
+                name = self._name(url)
+                with fake._lock:
+                    fake.files.pop(name, None)
+                    fake.caches.pop(name, None)
+                    fake.deletes.append(name)
+                return self._send(200, {})
+
+        return Handler
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def fake_gemini(monkeypatch):
+    """FakeGemini configurado como SEGSIS_GEMINI_ENDPOINT, com os handles do processo zerados."""
+    pytest.importorskip("streamlit")
+    genai_client = pytest.importorskip("google.generativeai.client")
+    from AI import api_load
+
+    fake = FakeGemini()
+    monkeypatch.setattr(api_load, 'GEMINI_ENDPOINT', fake.url)
+    monkeypatch.setattr(api_load, '_configured_key', None)
+    monkeypatch.setattr(api_load, '_model_handles', {})
+    # A biblioteca busca o documento de descoberta do upload num endereço fixo
+    monkeypatch.setattr(genai_client, 'GENAI_API_DISCOVERY_URL', f"{fake.url}/$discovery/rest")
+    yield fake
+    fake.close()
@@ -0,0 +1,109 @@
+import threading
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+from AI import api_Operation  # noqa: E402
+from AI.api_Operation import PDFQA, RateLimiter  # noqa: E402
+from AI.rate_limit_backends import MemoryRateLimitBackend  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        clock.now += seconds
+
+    monkeypatch.setattr(api_Operation.time, 'sleep', sleep)
+    clock.sleeps = sleeps
+    return clock
+
+
+@pytest.fixture
+def qa(monkeypatch):
+    monkeypatch.setattr(api_Operation, 'load_models', lambda: (object(), object()))
+    monkeypatch.setattr(PDFQA, '_record_call', lambda self, *args, **kwargs: None)
+    monkeypatch.setattr(api_Operation.st, 'error', lambda *args, **kwargs: None, raising=False)
+    qa = PDFQA()
+    qa.sent = []
+    lock = threading.Lock()
+
+    def generate(model, pdf_files, question, **kwargs):
+        with lock:
+            qa.sent.append(question)
+        if question.startswith("falha"):
+            qa._report_error(f"Erro na comunicação com a API Gemini: {question}")
+            return None
+        return f"resposta: {question}"
+
+    qa._generate_response = generate
+    return qa
+
+
+def use_plan(monkeypatch, clock, rpm, rpd):
+    limiter = RateLimiter(rpm_limit=rpm, rpd_limit=rpd, name='teste',
+                          backend=MemoryRateLimitBackend(clock=clock))
+    monkeypatch.setitem(PDFQA._rate_limiters, 'pro', limiter)
+    return limiter
+
+
+def test_results_and_errors_come_back_in_input_order(qa, monkeypatch, clock):
+    use_plan(monkeypatch, clock, rpm=10, rpd=100)
+    items = [(["a.pdf"], "p1"), (["b.pdf"], "falha p2"), (["c.pdf"], "p3"), (["d.pdf"], "p4")]
+    progress = []
+
+    with PDFQA.user_context('u1@x', 'editor', 'pro'):
+        results = qa.answer_questions_batch(items, use_cache=False,
+                                            progress_callback=lambda done, total: progress.append((done, total)))
+
+    assert [result['answer'] for result in results] == ["resposta: p1", None, "resposta: p3", "resposta: p4"]
+    assert [bool(result['error']) for result in results] == [False, True, False, False]
+    assert "falha p2" in results[1]['error']
+    assert sorted(qa.sent) == ["falha p2", "p1", "p3", "p4"]
+    assert progress[-1] == (4, 4)
+
+
+def test_batch_waits_for_the_next_minute_window(qa, monkeypatch, clock):
+    limiter = use_plan(monkeypatch, clock, rpm=2, rpd=100)
+    items = [([f"{i}.pdf"], f"p{i}") for i in range(5)]
+
+    with PDFQA.user_context('u1@x', 'editor', 'pro'):
+        results = qa.answer_questions_batch(items, use_cache=False)
+
+    assert [result['error'] for result in results] == [None] * 5
+    assert len(clock.sleeps) == 2
+    assert sum(clock.sleeps) == pytest.approx(120)
+    assert limiter.get_usage_stats('u1@x')['calls_today'] == 5
+
+
+def test_daily_limit_fails_the_remaining_items(qa, monkeypatch, clock):
+    use_plan(monkeypatch, clock, rpm=10, rpd=2)
+    items = [([f"{i}.pdf"], f"p{i}") for i in range(4)]
+
+    with PDFQA.user_context('u1@x', 'editor', 'pro'):
+        results = qa.answer_questions_batch(items, use_cache=False)
+
+    assert [result['answer'] for result in results[:2]] == ["resposta: p0", "resposta: p1"]
+    assert all("diário" in result['error'] for result in results[2:])
+    assert clock.sleeps == []
+    assert len(qa.sent) == 2
+
+
+def test_user_without_plan_gets_an_error_per_item(qa):
+    with PDFQA.user_context('u1@x', 'editor', None):
+        results = qa.answer_questions_batch([(["a.pdf"], "p1"), (["b.pdf"], "p2")], use_cache=False)
+
+    assert all(result['error'] and result['answer'] is None for result in results)
+    assert qa.sent == []
@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("google.generativeai")
+
+from AI import api_load  # noqa: E402
+
+
+def test_handle_sends_its_own_key(fake_gemini):
+    model_a = api_load.get_model_handle("chave-a", "gemini-2.5-flash")
+    model_b = api_load.get_model_handle("chave-b", "gemini-2.5-pro")
+    assert api_load.get_model_handle("chave-a", "gemini-2.5-flash") is model_a
+
+    # Outra chave fica configurada por último (ex.: embeddings do aquecimento do RAG)
+    with api_load.use_api_key("chave-embedding"):
+        pass
+
+    model_a.generate_content("pergunta")
+    model_b.generate_content("pergunta")
+    model_a.generate_content("pergunta")
+
+    assert fake_gemini.keys_for(':generateContent') == ["chave-a", "chave-b", "chave-a"]
+    assert api_load.get_model_api_key(model_b) == "chave-b"
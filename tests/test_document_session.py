@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("google.generativeai")
+
+from AI import api_load  # noqa: E402
+from AI.document_session import DocumentSessionManager  # noqa: E402
+
+PDF_BYTES = b"%PDF-1.4\n% documento de teste\n%%EOF\n"
+
+
+def test_upload_once_and_reuse_across_prompts(fake_gemini):
+    manager = DocumentSessionManager()
+    session = manager.acquire(PDF_BYTES, "aso.pdf")
+
+    first = session.file_for("chave-a")
+    second = session.file_for("chave-a")
+
+    assert first.name == second.name
+    assert fake_gemini.uploads == [(first.name, "chave-a")]
+    assert first.display_name == "aso.pdf"
+    manager.release(session.file_hash)
+    assert fake_gemini.deletes == [first.name]
+
+
+def test_shared_session_is_deleted_only_by_last_release(fake_gemini):
+    manager = DocumentSessionManager()
+    job_a = manager.acquire(PDF_BYTES, "aso.pdf")
+    job_b = manager.acquire(PDF_BYTES, "aso.pdf")
+    assert job_a is job_b
+
+    uploaded = job_a.file_for("chave-a")
+    manager.release(job_a.file_hash)
+    assert fake_gemini.deletes == []
+    assert uploaded.name in fake_gemini.files
+    assert job_b.file_for("chave-a").name == uploaded.name
+    assert len(fake_gemini.uploads) == 1
+
+    manager.release(job_b.file_hash)
+    assert fake_gemini.deletes == [uploaded.name]
+    assert fake_gemini.files == {}
+
+
+def test_cleanup_closes_expired_sessions_that_are_not_held(fake_gemini):
+    manager = DocumentSessionManager(ttl_seconds=0)
+    held = manager.acquire(PDF_BYTES, "aso.pdf")
+    held_file = held.file_for("chave-a")
+    loose = manager.open(b"%PDF-1.4\n% outro\n%%EOF\n", "epi.pdf")
+    loose_file = loose.file_for("chave-a")
+    time.sleep(0.01)
+
+    manager.cleanup()
+
+    assert fake_gemini.deletes == [loose_file.name]
+    assert held_file.name in fake_gemini.files
+    manager.release(held.file_hash)
+    assert fake_gemini.deletes == [loose_file.name, held_file.name]
+
+
+def test_same_key_blocks_run_in_parallel(monkeypatch):
+    configured = []
+    monkeypatch.setattr(api_load, '_configured_key', None)
+    monkeypatch.setattr(api_load, 'GEMINI_ENDPOINT', None)
+    monkeypatch.setattr(api_load.genai, 'configure', lambda **kwargs: configured.append(kwargs['api_key']))
+
+    inside = threading.Event()
+    leave = threading.Event()
+    order = []
+
+    def long_upload():
+        with api_load.use_api_key("chave-a"):
+            order.append("a1")
+            inside.set()
+            leave.wait(5)
+        order.append("a1-fim")
+
+    def other_key():
+        with api_load.use_api_key("chave-b"):
+            order.append("b")
+
+    first = threading.Thread(target=long_upload)
+    first.start()
+    assert inside.wait(5)
+
+    # Mesma chave: entra sem esperar o upload em andamento
+    with api_load.use_api_key("chave-a"):
+        order.append("a2")
+
+    # Outra chave: espera o bloco em andamento terminar
+    switch = threading.Thread(target=other_key)
+    switch.start()
+    time.sleep(0.05)
+    assert "b" not in order
+    leave.set()
+    first.join(5)
+    switch.join(5)
+
+    assert order == ["a1", "a2", "a1-fim", "b"]
+    assert configured == ["chave-a", "chave-b"]
+
+
+def test_generate_uses_the_key_that_uploaded_the_file(fake_gemini, monkeypatch):
+    from AI import api_Operation
+
+    extraction = api_load.get_model_handle("chave-extracao", "gemini-2.5-flash")
+    audit = api_load.get_model_handle("chave-auditoria", "gemini-2.5-pro")
+    monkeypatch.setattr(api_Operation, 'load_models', lambda: (extraction, audit))
+    qa = api_Operation.PDFQA()
+
+    manager = DocumentSessionManager()
+    session = manager.acquire(PDF_BYTES, "aso.pdf")
+    for model in (extraction, audit):
+        part = qa._build_pdf_part(model, session)
+        # Outra chave fica configurada entre o upload e a geração
+        with api_load.use_api_key("chave-embedding"):
+            pass
+        model.generate_content([part, "Resuma o documento."])
+
+    uploads = dict(fake_gemini.uploads)
+    generate_bodies = fake_gemini.bodies_for(':generateContent')
+    assert fake_gemini.keys_for(':generateContent') == ["chave-extracao", "chave-auditoria"]
+    assert sorted(uploads.values()) == ["chave-auditoria", "chave-extracao"]
+    # Cada geração referencia o arquivo enviado com a própria chave
+    for body, key in zip(generate_bodies, ["chave-extracao", "chave-auditoria"]):
+        file_name = next(name for name, owner in uploads.items() if owner == key)
+        assert f"{fake_gemini.url}/v1beta/{file_name}".encode() in body
+
+    manager.release(session.file_hash)
+    assert sorted(fake_gemini.deletes) == sorted(uploads)
+    # get e delete de cada arquivo também usam a chave dona do arquivo
+    for _, path, key, _ in fake_gemini.requests:
+        name = path.split('/v1beta/', 1)[-1]
+        if name in uploads:
+            assert key == uploads[name]
@@ -0,0 +1,76 @@
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+from AI import job_queue  # noqa: E402
+from AI.job_queue import AIJobQueue, JOB_FAILED, JOB_PENDING, JOB_RUNNING  # noqa: E402
+
+
+def dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def insert_job(db_path, job_id, status, owner, heartbeat_at):
+    now = datetime.now().isoformat()
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            "INSERT INTO ai_jobs (id, job_type, user_email, status, owner, heartbeat_at, created_at, updated_at) "
+            "VALUES (?, 'ASO', 'u1@x', ?, ?, ?, ?, ?)",
+            (job_id, status, owner, heartbeat_at, now, now)
+        )
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    AIJobQueue(path, num_workers=1)
+    return path
+
+
+def test_restart_recovers_only_jobs_whose_owner_is_gone(db_path):
+    host = socket.gethostname()
+    fresh = datetime.now().isoformat()
+    stale = (datetime.now() - timedelta(seconds=job_queue.HEARTBEAT_STALE_SECONDS + 1)).isoformat()
+
+    insert_job(db_path, 'dono-vivo', JOB_RUNNING, f"{host}:{os.getpid()}:outro", fresh)
+    insert_job(db_path, 'dono-morto', JOB_RUNNING, f"{host}:{dead_pid()}:antigo", fresh)
+    insert_job(db_path, 'outro-host', JOB_PENDING, "outro-servidor:1234:abc", fresh)
+    insert_job(db_path, 'outro-host-parado', JOB_PENDING, "outro-servidor:1234:abc", stale)
+    insert_job(db_path, 'sem-dono', JOB_PENDING, None, None)
+
+    queue = AIJobQueue(db_path, num_workers=1)
+
+    status = {job_id: queue.get_job(job_id)['status'] for job_id in
+              ('dono-vivo', 'dono-morto', 'outro-host', 'outro-host-parado', 'sem-dono')}
+    assert status == {
+        'dono-vivo': JOB_RUNNING,
+        'dono-morto': JOB_FAILED,
+        'outro-host': JOB_PENDING,
+        'outro-host-parado': JOB_FAILED,
+        'sem-dono': JOB_FAILED,
+    }
+
+
+def test_heartbeat_keeps_own_jobs_alive(db_path):
+    queue = AIJobQueue(db_path, num_workers=1)
+    stale = (datetime.now() - timedelta(seconds=job_queue.HEARTBEAT_STALE_SECONDS + 1)).isoformat()
+    insert_job(db_path, 'meu', JOB_PENDING, queue.owner, stale)
+    insert_job(db_path, 'alheio', JOB_PENDING, "outro-servidor:1234:abc", stale)
+
+    queue._beat()
+    assert queue.get_job('meu')['heartbeat_at'] > stale
+    assert queue.get_job('alheio')['heartbeat_at'] == stale
+
+    # Outro processo que sobe depois recupera só o trabalho sem heartbeat
+    AIJobQueue(db_path, num_workers=1)
+    assert queue.get_job('meu')['status'] == JOB_PENDING
+    assert queue.get_job('alheio')['status'] == JOB_FAILED
@@ -0,0 +1,97 @@
+import re
+from datetime import datetime
+
+import pytest
+
+from operations.local_extraction import LocalExtractor, detect_norma
+
+
+def parse_date(value):
+    if not value:
+        return None
+    match = re.search(r'\d{1,2}[/\-.]\d{1,2}[/\-.]\d{2,4}', value)
+    if not match:
+        return None
+    for fmt in ('%d/%m/%Y', '%d-%m-%Y', '%d.%m.%Y', '%d/%m/%y'):
+        try:
+            return datetime.strptime(match.group(0), fmt).date()
+        except ValueError:
+            continue
+    return None
+
+
+def normalize_norma(value):
+    match = re.search(r'NR\s?-?(\d+)', value.upper())
+    return f"NR-{int(match.group(1)):02d}" if match else value.upper()
+
+
+@pytest.fixture
+def extractor():
+    return LocalExtractor(parse_date, normalize_norma)
+
+
+SENAI_NR35 = """SENAI - Serviço Nacional de Aprendizagem Industrial
+CERTIFICADO
+O SENAI certifica que JOSE CARLOS PEREIRA concluiu o curso de Trabalho em Altura - NR-35,
+com carga horária de 8 horas, no período de 04/03/2024 a 05/03/2024.
+Capacitação realizada conforme NR-01 item 1.7 e Anexo II da NR-35.
+"""
+
+ASO_FORM = """ATESTADO DE SAÚDE OCUPACIONAL
+Nome do trabalhador: Maria Aparecida Souza
+Função/Cargo: Auxiliar de Produção
+Fatores de risco: Ruído contínuo, poeira mineral
+( ) Admissional (X) Periódico ( ) Demissional ( ) Mudança de Risco
+Data do exame clínico: 12/02/2024
+Apto para a função.
+Médico examinador: Dr. João Lima CRM 12345/SP
+"""
+
+
+def test_norma_ignores_reference_citations_before_the_course():
+    text = "Treinamento realizado conforme NR-01 item 1.7.\nCurso de NR-35 Trabalho em Altura"
+    assert detect_norma(text) == ('NR-35', False)
+
+
+def test_norma_from_topic_next_to_number():
+    text = "Em atendimento à NR-01, subitem 1.7.1.\nNR-33 - Espaços Confinados - Vigia"
+    assert detect_norma(text) == ('NR-33', False)
+
+
+def test_several_normas_without_course_title_are_ambiguous():
+    norma, ambiguous = detect_norma("Documento citando NR-10 e NR-35 para os trabalhadores")
+    assert ambiguous
+
+
+def test_senai_certificate_takes_course_norma(extractor):
+    data = extractor.extract_text('treinamento', SENAI_NR35)
+    assert data is not None
+    assert data['norma'] == 'NR-35'
+    assert data['nome_funcionario'] == 'JOSE CARLOS PEREIRA'
+    assert data['carga_horaria'] == '8'
+    assert parse_date(data['data_realizacao']).isoformat() == '2024-03-05'
+
+
+def test_certificate_without_known_template_goes_to_ai(extractor):
+    text = ("CERTIFICADO\nCertificamos que ANA PAULA ROCHA participou do treinamento de NR-35 Trabalho em Altura, "
+            "realizado em 10/03/2024, com carga horária de 8 horas, ministrado pela equipe técnica.")
+    assert extractor.extract_text('treinamento', text) is None
+
+
+def test_ambiguous_norma_goes_to_ai(extractor):
+    text = SENAI_NR35.replace("Trabalho em Altura - NR-35", "Segurança no Trabalho (NR-10 e NR-35)")
+    assert extractor.extract_text('treinamento', text) is None
+
+
+def test_aso_form_template(extractor):
+    data = extractor.extract_text('aso', ASO_FORM)
+    assert data is not None
+    assert data['tipo_aso'] == 'Periódico'
+    assert data['nome_funcionario'] == 'Maria Aparecida Souza'
+    assert data['cargo'] == 'Auxiliar de Produção'
+    assert data['riscos'].startswith('Ruído')
+    assert parse_date(data['data_aso']).isoformat() == '2024-02-12'
+
+
+def test_scanned_pdf_without_text_goes_to_ai(extractor):
+    assert extractor.extract_text('aso', "   ") is None
@@ -0,0 +1,24 @@
+import pytest
+
+pytest.importorskip("streamlit")
+pytest.importorskip("google.generativeai")
+
+from AI import api_load  # noqa: E402
+from AI.prompt_cache import PromptPrefixCache  # noqa: E402
+
+
+def test_cached_context_is_created_and_used_with_the_same_key(fake_gemini):
+    cache = PromptPrefixCache(ttl_seconds=3600)
+    model = cache.get_model("chave-auditoria", "gemini-2.5-pro", "Base normativa " * 50, label="rag")
+    assert model is not None
+    assert cache.get_model("chave-auditoria", "gemini-2.5-pro", "Base normativa " * 50, label="rag") is model
+
+    with api_load.use_api_key("chave-extracao"):
+        pass
+    model.generate_content("Audite o documento.")
+
+    cache_name = next(iter(fake_gemini.caches))
+    assert fake_gemini.keys_for('/cachedContents') == ["chave-auditoria"]
+    assert fake_gemini.keys_for(':generateContent') == ["chave-auditoria"]
+    assert cache_name.encode() in fake_gemini.bodies_for(':generateContent')[0]
+    assert api_load.get_model_api_key(model) == "chave-auditoria"
@@ -0,0 +1,199 @@
+import threading
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+from AI.api_Operation import RateLimiter  # noqa: E402
+from AI.rate_limit_backends import (  # noqa: E402
+    DAY_WINDOW,
+    MINUTE_WINDOW,
+    MemoryRateLimitBackend,
+    SQLiteRateLimitBackend,
+)
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_minute_window_slides(clock):
+    backend = MemoryRateLimitBackend(clock=clock)
+    for _ in range(3):
+        assert backend.try_acquire('flash', 'u1', 3, 100)[0]
+        clock.advance(10)
+
+    # 4ª chamada aos 30s: a primeira (em t=0) só sai da janela em t=60
+    allowed, wait, used_min, used_day = backend.try_acquire('flash', 'u1', 3, 100)
+    assert not allowed
+    assert wait == pytest.approx(30)
+    assert (used_min, used_day) == (3, 3)
+
+    clock.advance(30)
+    allowed, _, used_min, used_day = backend.try_acquire('flash', 'u1', 3, 100)
+    assert allowed
+    assert (used_min, used_day) == (3, 4)
+
+
+def test_day_window_slides(clock):
+    backend = MemoryRateLimitBackend(clock=clock)
+    for _ in range(2):
+        assert backend.try_acquire('flash', 'u1', 10, 2)[0]
+        clock.advance(MINUTE_WINDOW)
+
+    allowed, wait, used_min, used_day = backend.try_acquire('flash', 'u1', 10, 2)
+    assert not allowed
+    assert used_min == 0
+    assert used_day == 2
+    assert wait == pytest.approx(DAY_WINDOW - 2 * MINUTE_WINDOW)
+
+    clock.advance(wait)
+    assert backend.try_acquire('flash', 'u1', 10, 2)[0]
+
+
+def test_usage_does_not_consume(clock):
+    backend = MemoryRateLimitBackend(clock=clock)
+    backend.try_acquire('flash', 'u1', 2, 10)
+    assert backend.usage('flash', 'u1', 2, 10) == (0.0, 1, 1)
+    assert backend.usage('flash', 'u1', 2, 10) == (0.0, 1, 1)
+
+
+def test_idle_users_are_evicted(clock):
+    backend = MemoryRateLimitBackend(clock=clock)
+    backend.try_acquire('flash', 'idle', 10, 100)
+    clock.advance(DAY_WINDOW - 60)
+    backend.try_acquire('flash', 'active', 10, 100)
+    assert ('flash', 'idle') in backend.day_calls
+
+    # Passado um dia da chamada do inativo, a próxima varredura o remove
+    clock.advance(backend.EVICTION_INTERVAL)
+    backend.try_acquire('flash', 'active', 10, 100)
+    assert ('flash', 'idle') not in backend.day_calls
+    assert ('flash', 'idle') not in backend.minute_calls
+    assert ('flash', 'active') in backend.day_calls
+
+
+def test_eviction_runs_at_most_once_per_interval(clock):
+    backend = MemoryRateLimitBackend(clock=clock)
+    backend.try_acquire('flash', 'idle', 10, 100)
+    clock.advance(DAY_WINDOW + 1)
+    backend._last_eviction = clock.now - 1
+    backend.try_acquire('flash', 'active', 10, 100)
+    assert ('flash', 'idle') in backend.day_calls
+
+    clock.advance(backend.EVICTION_INTERVAL)
+    backend.try_acquire('flash', 'active', 10, 100)
+    assert ('flash', 'idle') not in backend.day_calls
+
+
+def test_sqlite_windows(tmp_path, clock):
+    clock.now = 10 * DAY_WINDOW + 30
+    backend = SQLiteRateLimitBackend(str(tmp_path / "limits.db"), clock=clock)
+    assert backend.try_acquire('flash', 'u1', 2, 3)[0]
+    assert backend.try_acquire('flash', 'u1', 2, 3)[0]
+
+    allowed, wait, used_min, used_day = backend.try_acquire('flash', 'u1', 2, 3)
+    assert not allowed
+    assert wait == pytest.approx(30)
+    assert (used_min, used_day) == (2, 2)
+
+    # Meio do minuto seguinte: o anterior ainda pesa metade (1 de 2 vagas)
+    clock.advance(MINUTE_WINDOW)
+    allowed, _, used_min, used_day = backend.try_acquire('flash', 'u1', 2, 3)
+    assert allowed
+    assert (used_min, used_day) == (2, 3)
+
+    clock.advance(2 * MINUTE_WINDOW)
+    allowed, wait, used_min, used_day = backend.try_acquire('flash', 'u1', 2, 3)
+    assert not allowed
+    assert (used_min, used_day) == (0, 3)
+    assert wait == pytest.approx(DAY_WINDOW - 30 - 3 * MINUTE_WINDOW)
+
+    clock.advance(wait)
+    assert backend.try_acquire('flash', 'u1', 2, 3)[0]
+
+
+def test_sqlite_minute_boundary_does_not_double_the_burst(tmp_path, clock):
+    clock.now = 10 * DAY_WINDOW + 50
+    backend = SQLiteRateLimitBackend(str(tmp_path / "limits.db"), clock=clock)
+    for _ in range(4):
+        assert backend.try_acquire('flash', 'u1', 4, 100)[0]
+    assert not backend.try_acquire('flash', 'u1', 4, 100)[0]
+
+    # 15s depois, já no minuto seguinte: janela fixa liberaria mais 4 chamadas
+    clock.advance(15)
+    results = [backend.try_acquire('flash', 'u1', 4, 100) for _ in range(4)]
+    assert [allowed for allowed, _, _, _ in results] == [True, False, False, False]
+
+    # O minuto anterior pesa 55/60 (3,67 chamadas) + 1: vaga quando pesar menos de 3
+    _, wait, used_min, _ = results[-1]
+    assert used_min == 5
+    assert wait == pytest.approx(10)
+    assert backend.usage('flash', 'u1', 4, 100) == (pytest.approx(10), 5, 5)
+
+    clock.advance(wait + 1)
+    assert backend.try_acquire('flash', 'u1', 4, 100)[0]
+    assert not backend.try_acquire('flash', 'u1', 4, 100)[0]
+
+
+def test_try_acquire_returns_wait_and_remaining(clock):
+    limiter = RateLimiter(rpm_limit=2, rpd_limit=5, name='teste',
+                          backend=MemoryRateLimitBackend(clock=clock))
+
+    assert limiter.try_acquire('u1') == (True, 0.0, {'per_minute': 1, 'per_day': 4})
+    clock.advance(15)
+    assert limiter.try_acquire('u1') == (True, pytest.approx(45), {'per_minute': 0, 'per_day': 3})
+
+    allowed, wait, remaining = limiter.try_acquire('u1')
+    assert not allowed
+    assert wait == pytest.approx(45)
+    assert remaining == {'per_minute': 0, 'per_day': 3}
+
+    clock.advance(45)
+    allowed, wait, remaining = limiter.try_acquire('u1')
+    assert allowed
+    assert remaining == {'per_minute': 0, 'per_day': 2}
+    assert limiter.get_remaining_calls('u1') == {'per_minute': 0, 'per_day': 2}
+
+
+def test_try_acquire_unlimited_users(clock):
+    backend = MemoryRateLimitBackend(clock=clock)
+    limiter = RateLimiter(rpm_limit=1, rpd_limit=1, name='teste', backend=backend)
+    limiter.add_unlimited_user('root')
+
+    for _ in range(3):
+        assert limiter.try_acquire('root') == (True, 0.0, 'ilimitado')
+        assert limiter.try_acquire('chefe', user_role='admin') == (True, 0.0, 'ilimitado')
+    assert backend.day_calls == {}
+
+
+def test_try_acquire_is_atomic_under_concurrency(clock):
+    limiter = RateLimiter(rpm_limit=5, rpd_limit=100, name='teste',
+                          backend=MemoryRateLimitBackend(clock=clock))
+    results = []
+    barrier = threading.Barrier(20)
+
+    def call():
+        barrier.wait()
+        results.append(limiter.try_acquire('u1')[0])
+
+    threads = [threading.Thread(target=call) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count(True) == 5
+    assert limiter.get_usage_stats('u1')['calls_last_minute'] == 5
@@ -0,0 +1,115 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("streamlit")
+
+from AI import resilience  # noqa: E402
+from AI.resilience import CircuitBreaker, ResilientCaller  # noqa: E402
+
+
+class TooManyRequests(Exception):
+    code = 429
+
+
+class ServiceUnavailable(Exception):
+    code = 503
+
+
+class InlineExecutor:
+    def run(self, model_key, fn, timeout):
+        return fn(timeout)
+
+    def has_capacity(self, model_key):
+        return True
+
+
+@pytest.fixture(autouse=True)
+def inline_executor(monkeypatch):
+    monkeypatch.setattr(resilience, 'get_model_executor', lambda: InlineExecutor())
+    monkeypatch.setattr(resilience, 'backoff_delay', lambda attempt, kind='transient': 0.0)
+
+
+class Reservations:
+    def __init__(self, allowed):
+        self.allowed = list(allowed)
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.allowed.pop(0) if self.allowed else False
+
+
+def failing(errors, result="ok"):
+    calls = []
+
+    def fn(timeout):
+        calls.append(timeout)
+        if len(calls) <= len(errors):
+            raise errors[len(calls) - 1]
+        return result
+
+    return fn, calls
+
+
+def test_each_retry_reserves_a_slot():
+    caller = ResilientCaller(max_attempts=3)
+    fn, calls = failing([ServiceUnavailable(), ServiceUnavailable()])
+    reserve = Reservations([True, True])
+
+    assert caller.run('flash', fn, timeout=30, reserve=reserve) == "ok"
+    assert len(calls) == 3
+    assert reserve.calls == 2
+
+
+def test_retry_stops_when_the_plan_has_no_slot():
+    caller = ResilientCaller(max_attempts=3)
+    fn, calls = failing([ServiceUnavailable(), ServiceUnavailable()])
+    reserve = Reservations([False])
+
+    with pytest.raises(ServiceUnavailable):
+        caller.run('flash', fn, timeout=30, reserve=reserve)
+    assert len(calls) == 1
+    assert caller.get_metrics()['retry_rate_limited'] == 1
+
+
+def test_quota_errors_do_not_open_the_shared_circuit():
+    caller = ResilientCaller(max_attempts=1)
+    caller._breakers['flash'] = CircuitBreaker('flash', failure_threshold=2)
+    caller._latency['flash'] = resilience.LatencyTracker()
+
+    for _ in range(5):
+        fn, _ = failing([TooManyRequests()])
+        with pytest.raises(TooManyRequests):
+            caller.run('flash', fn, timeout=30)
+    assert caller.breaker('flash').state == CircuitBreaker.CLOSED
+
+    for _ in range(2):
+        fn, _ = failing([ServiceUnavailable()])
+        with pytest.raises(ServiceUnavailable):
+            caller.run('flash', fn, timeout=30)
+    assert caller.breaker('flash').state == CircuitBreaker.OPEN
+
+
+@pytest.mark.parametrize("allowed, expected_calls", [(False, 1), (True, 2)])
+def test_hedge_requires_a_slot(allowed, expected_calls):
+    caller = ResilientCaller(max_attempts=1, hedging=True)
+    caller.breaker('flash')
+    for _ in range(resilience.HEDGE_MIN_SAMPLES):
+        caller._latency['flash'].add(0.01)
+
+    calls = []
+    lock = threading.Lock()
+
+    def slow(timeout):
+        with lock:
+            calls.append(timeout)
+        time.sleep(0.2)
+        return "ok"
+
+    reserve = Reservations([allowed])
+    assert caller.run('flash', slow, timeout=30, reserve=reserve) == "ok"
+    time.sleep(0.25)
+    assert reserve.calls == 1
+    assert len(calls) == expected_calls
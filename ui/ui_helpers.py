@@ -1,9 +1,16 @@
 import logging
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime, date
 from operations.file_hash import calcular_hash_arquivo
+from operations.utils import EXPIRY_EXPIRED, EXPIRY_WARNING
 from auth.auth_utils import check_feature_permission
+from AI.api_Operation import PDFQA
+from AI.job_queue import get_job_queue, JOB_PENDING, JOB_RUNNING, JOB_DONE, JOB_FAILED
+
+# Intervalo de atualização do progresso das análises em segundo plano
+JOB_POLL_SECONDS = 2
 
 logger = logging.getLogger(__name__)
 
@@ -29,25 +36,29 @@ def mostrar_info_normas():
         **Nota**: As cargas horárias e prazos são baseados nas normas vigentes.
         """)
 
-def highlight_expired(row):
-    """Aplica estilo a linhas com documentos vencidos."""
-    try:
-        if 'vencimento_dt' not in row.index:
-            return [''] * len(row)
-        
-        vencimento = row['vencimento_dt']
-        if pd.isna(vencimento):
-            return [''] * len(row)
-        
-        today = date.today()
-        if vencimento < today:
-            return ['background-color: #ffcccc'] * len(row)
-        elif vencimento <= today + pd.Timedelta(days=30):
-            return ['background-color: #fff4cc'] * len(row)
-        else:
-            return [''] * len(row)
-    except Exception:
-        return [''] * len(row)
+# Estilo de fundo por situação de vencimento (a situação é calculada em operations.utils)
+EXPIRY_ROW_STYLES = {
+    EXPIRY_EXPIRED: 'background-color: #ffcccc',
+    EXPIRY_WARNING: 'background-color: #fff4cc',
+}
+
+def style_expired(df: pd.DataFrame, status_col: str = 'situacao'):
+    """
+    Colore as linhas pela situação de vencimento já calculada em status_col.
+    A matriz de estilos é gerada em uma única operação (axis=None), sem
+    chamadas Python por linha.
+    """
+    def _style_matrix(data: pd.DataFrame) -> pd.DataFrame:
+        if status_col not in data.columns:
+            return pd.DataFrame('', index=data.index, columns=data.columns)
+        row_styles = data[status_col].map(EXPIRY_ROW_STYLES).fillna('').to_numpy()
+        return pd.DataFrame(
+            np.repeat(row_styles[:, None], data.shape[1], axis=1),
+            index=data.index,
+            columns=data.columns
+        )
+
+    return df.style.apply(_style_matrix, axis=None)
 
 def style_audit_table(row):
     """Aplica estilo às linhas da tabela de auditoria."""
@@ -62,9 +73,12 @@ def style_audit_table(row):
     except Exception:
         return [''] * len(row)
 
-def _run_analysis_and_audit(manager, analysis_method_name, uploader_key, doc_type_str, employee_id_key=None):
+def _run_analysis_and_audit(manager, analysis_method_name, uploader_key, doc_type_str, employee_id_key=None,
+                            state_prefix=None, with_audit=True):
     """
-    Função auxiliar que executa a análise de PDF e auditoria com IA.
+    Função auxiliar que envia a análise de PDF e a auditoria com IA para a
+    fila de processamento em segundo plano. O resultado é carregado no
+    session_state por render_analysis_job quando o trabalho termina.
 
     Args:
         manager: Manager que contém o método de análise
@@ -72,6 +86,8 @@ def _run_analysis_and_audit(manager, analysis_method_name, uploader_key, doc_typ
         uploader_key: Chave do uploader no session_state
         doc_type_str: Tipo do documento (ex: 'ASO', 'Treinamento')
         employee_id_key: Chave opcional do employee_id no session_state
+        state_prefix: Prefixo das chaves no session_state (padrão: doc_type_str)
+        with_audit: Executa a auditoria de conformidade após a extração
     """
     if not st.session_state.get(uploader_key):
         return
@@ -108,49 +124,109 @@ def _run_analysis_and_audit(manager, analysis_method_name, uploader_key, doc_typ
                     return
 
     anexo = st.session_state[uploader_key]
-    
-    with st.spinner(f"🤖 Analisando {doc_type_str} com IA..."):
-        # Chama o método de análise do manager
-        analysis_method = getattr(manager, analysis_method_name)
-        doc_info = analysis_method(anexo)
-        
-        if not doc_info:
-            st.error(f"❌ Não foi possível extrair informações do {doc_type_str}.")
+    state_prefix = state_prefix or doc_type_str
+
+    nr_analyzer = st.session_state.get('nr_analyzer')
+
+    def run_audit(doc_info, file_content):
+        audit_doc_info = {
+            "type": doc_type_str,
+            "norma": doc_info.get('norma', doc_info.get('tipo_documento', ''))
+        }
+        return nr_analyzer.perform_initial_audit(audit_doc_info, file_content)
+
+    audit = run_audit if with_audit and nr_analyzer else None
+
+    context = {}
+    if employee_id_key and employee_id_key in st.session_state:
+        context['funcionario_id'] = st.session_state[employee_id_key]
+
+    # Descarta uma análise anterior ainda não salva deste tipo de documento
+    _discard_analysis_result(state_prefix)
+
+    job_id = get_job_queue().submit(
+        job_type=state_prefix,
+        uploaded_file=anexo,
+        analyze=getattr(manager, analysis_method_name),
+        audit=audit,
+        unit_id=st.session_state.get('unit_id'),
+        context=context,
+        file_hash=calcular_hash_arquivo(anexo)
+    )
+    st.session_state[f'{state_prefix}_job_id'] = job_id
+    st.toast(f"📤 {doc_type_str} enviado para análise. Você pode continuar usando o sistema.")
+
+def _discard_analysis_result(state_prefix):
+    """Arquiva o trabalho atual e remove o resultado carregado no session_state."""
+    job_id = st.session_state.pop(f'{state_prefix}_job_id', None)
+    if job_id:
+        get_job_queue().archive_job(job_id)
+    for key in list(st.session_state.keys()):
+        if key.startswith(f'{state_prefix}_') and key.endswith('_para_salvar'):
+            del st.session_state[key]
+
+def clear_analysis_state(state_prefix):
+    """
+    Descarta a análise pendente de um tipo de documento: arquiva o trabalho
+    na fila e remove as chaves '{state_prefix}_*' do session_state.
+    """
+    _discard_analysis_result(state_prefix)
+    for key in list(st.session_state.keys()):
+        if key.startswith(f'{state_prefix}_'):
+            del st.session_state[key]
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def _poll_analysis_job(job_id):
+    """Atualiza o progresso do trabalho e recarrega a página quando ele termina."""
+    job = get_job_queue().get_job(job_id)
+    if not job or job['status'] not in (JOB_PENDING, JOB_RUNNING):
+        st.rerun()
+    st.progress(job['progress'] / 100, text=job['message'] or "Processando...")
+
+def render_analysis_job(state_prefix):
+    """
+    Exibe o andamento da análise em segundo plano e, ao concluir, carrega o
+    resultado nas chaves '{state_prefix}_*_para_salvar' usadas pelos
+    formulários de confirmação. Também recupera o trabalho após um reload
+    da página.
+    """
+    if st.session_state.get(f'{state_prefix}_info_para_salvar'):
+        return
+
+    queue = get_job_queue()
+    job_id = st.session_state.get(f'{state_prefix}_job_id')
+    if not job_id:
+        user_email = PDFQA.get_current_user()[0]
+        job = queue.get_active_job(user_email, state_prefix, st.session_state.get('unit_id'))
+        if not job:
             return
-        
-        # Calcula hash do arquivo
-        arquivo_hash = calcular_hash_arquivo(anexo)
-        
-        # Executa auditoria se disponível
-        audit_result = None
-        if hasattr(st.session_state, 'nr_analyzer') and st.session_state.nr_analyzer:
-            try:
-                with st.spinner("🔍 Executando auditoria de conformidade..."):
-                    nr_analyzer = st.session_state.nr_analyzer
-                    
-                    # Prepara informações para auditoria
-                    audit_doc_info = {
-                        "type": doc_type_str,
-                        "norma": doc_info.get('norma', doc_info.get('tipo_documento', ''))
-                    }
-                    
-                    audit_result = nr_analyzer.perform_initial_audit(audit_doc_info, anexo.getvalue())
-                    
-                    if audit_result:
-                        doc_info['audit_result'] = audit_result
-                        st.success("✅ Auditoria concluída!")
-            except Exception as e:
-                st.warning(f"⚠️ Auditoria não disponível: {str(e)}")
-        
-        # Armazena no session_state
-        st.session_state[f'{doc_type_str}_info_para_salvar'] = doc_info
-        st.session_state[f'{doc_type_str}_anexo_para_salvar'] = anexo
-        st.session_state[f'{doc_type_str}_hash_para_salvar'] = arquivo_hash
-        
-        if employee_id_key and employee_id_key in st.session_state:
-            st.session_state[f'{doc_type_str}_funcionario_para_salvar'] = st.session_state[employee_id_key]
-        
-        st.success(f"✅ Análise de {doc_type_str} concluída!")
+        job_id = job['id']
+        st.session_state[f'{state_prefix}_job_id'] = job_id
+    else:
+        job = queue.get_job(job_id)
+        if not job:
+            del st.session_state[f'{state_prefix}_job_id']
+            return
+
+    if job['status'] in (JOB_PENDING, JOB_RUNNING):
+        _poll_analysis_job(job_id)
+    elif job['status'] == JOB_DONE:
+        result = job['result'] or {}
+        st.session_state[f'{state_prefix}_info_para_salvar'] = result.get('doc_info')
+        st.session_state[f'{state_prefix}_anexo_para_salvar'] = queue.get_job_file(job_id)
+        st.session_state[f'{state_prefix}_hash_para_salvar'] = job['file_hash']
+        if 'funcionario_id' in job['context']:
+            st.session_state[f'{state_prefix}_funcionario_para_salvar'] = job['context']['funcionario_id']
+        if result.get('audit_warning'):
+            st.warning(f"⚠️ {result['audit_warning']}")
+        st.success(job['message'])
+    elif job['status'] == JOB_FAILED:
+        st.error(f"❌ {job['message']}" + (f" ({job['error']})" if job.get('error') else ""))
+        if st.button("Descartar", key=f"{state_prefix}_discard_job"):
+            clear_analysis_state(state_prefix)
+            st.rerun()
+    else:
+        del st.session_state[f'{state_prefix}_job_id']
 
 def process_aso_pdf():
     """Função de callback para o uploader de ASO."""
@@ -243,24 +319,15 @@ def process_epi_pdf():
         return
 
     try:
-        if st.session_state.get('epi_uploader_tab'):
-            epi_manager = st.session_state.epi_manager
-            anexo = st.session_state.epi_uploader_tab
-            
-            with st.spinner("🤖 Analisando ficha de EPI com IA..."):
-                epi_info = epi_manager.analyze_epi_pdf(anexo)
-                
-                if epi_info:
-                    arquivo_hash = calcular_hash_arquivo(anexo)
-                    
-                    st.session_state.epi_info_para_salvar = epi_info
-                    st.session_state.epi_anexo_para_salvar = anexo
-                    st.session_state.epi_hash_para_salvar = arquivo_hash
-                    st.session_state.epi_funcionario_para_salvar = st.session_state.get('epi_employee_add')
-                    
-                    st.success("✅ Análise de EPI concluída!")
-                else:
-                    st.error("❌ Não foi possível extrair informações da ficha de EPI.")
+        _run_analysis_and_audit(
+            manager=st.session_state.epi_manager,
+            analysis_method_name='analyze_epi_pdf',
+            uploader_key='epi_uploader_tab',
+            doc_type_str='Ficha de EPI',
+            employee_id_key='epi_employee_add',
+            state_prefix='epi',
+            with_audit=False
+        )
     except Exception as e:
         logger.error(f"Erro ao processar Ficha de EPI: {e}", exc_info=True)
         st.error(f"❌ Erro ao processar Ficha de EPI: {str(e)}")